@@ -1,16 +1,34 @@
-import pandas as pd
-import svgwrite
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PLANO SVG DEL METRO (M4)
+========================
+
+Renderizador del plano esquemático a partir del GTFS de M4:
+- Los trazados se cargan una sola vez: de shapes.txt si el feed lo trae y,
+  si no, uniendo las paradas de un viaje representativo de cada shape_id
+  (stop_times.txt + stops.txt)
+- Se proyectan a píxeles y se simplifican (Douglas-Peucker) por línea al
+  cargar, no en cada petición
+- Cada línea se renderiza una vez como fragmento SVG (normal y resaltado)
+  y se guarda en caché; un plano es solo la concatenación de los
+  fragmentos pedidos, y las combinaciones recientes también se cachean
+
+Desde Flask se sirve en `/map.svg?lines=1,6,R&highlight=6`. Ejecutado como
+script genera plano_metro_oficial.svg con todas las líneas, como antes.
+"""
+
 import os
 import re
+import csv
+import hashlib
+import threading
+from collections import OrderedDict
 
-# --- Configuración ---
-# Directorio de datos GTFS
-GTFS_DIR = os.path.dirname(__file__) # Esto usará la carpeta M4/ donde está el script
+import numpy as np
 
-# Archivos GTFS
-SHAPES_FILE = os.path.join(GTFS_DIR, 'shapes.txt')
-TRIPS_FILE = os.path.join(GTFS_DIR, 'trips.txt')
-ROUTES_FILE = os.path.join(GTFS_DIR, 'routes.txt')
+# Directorio de datos GTFS (la carpeta M4/ donde está el módulo)
+GTFS_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Colores oficiales (consistente con app.py)
 LINEAS_CONFIG = {
@@ -28,78 +46,228 @@ LINEAS_CONFIG = {
     '12': {'color': '#a49a00'},
     'R':  {'color': '#FFFFFF'}
 }
+COLOR_SIN_LINEA = '#808080'
 
-# --- Carga de datos ---
-print("Cargando datos GTFS...")
-shapes = pd.read_csv(SHAPES_FILE)
-trips = pd.read_csv(TRIPS_FILE)
-routes = pd.read_csv(ROUTES_FILE)
+ANCHO_SVG = 1200
+TOLERANCIA_PX = 0.75      # error máximo de la simplificación, en píxeles
+MAX_COMBINACIONES = 256   # planos compuestos que se guardan en caché
 
-# --- Procesamiento ---
-# 1. Crear un mapeo de shape_id -> route_id -> line_number
-# Usamos trips para conectar shapes con routes
-shape_to_route = trips[['shape_id', 'route_id']].drop_duplicates().set_index('shape_id')
-route_to_line = routes[['route_id', 'route_short_name']].set_index('route_id')
-
-shape_to_line = shape_to_route.join(route_to_line, on='route_id')
 
 def get_line_number(short_name):
     """
     Función mejorada para extraer el número de línea base de forma robusta.
     """
-    if pd.isna(short_name):
+    if short_name is None or short_name == '':
         return None
-    
+
     s_name = str(short_name)
-    
+
     # 1. Intenta encontrar el número de línea al principio del nombre.
     match = re.match(r'^(\d+)', s_name)
     if match:
         return match.group(1)
-        
+
     # 2. Maneja casos especiales como 'Ramal' o 'R'.
     if 'ramal' in s_name.lower() or 'r' == s_name.lower():
         return 'R'
-        
+
     # 3. Como fallback, devuelve el nombre original.
     return s_name
 
-shape_to_line['line_number'] = shape_to_line['route_short_name'].apply(get_line_number)
-print("Mapeo de trazados a líneas creado.")
-
-# 2. Normalización de coordenadas
-print("Normalizando coordenadas...")
-lat_min, lat_max = shapes['shape_pt_lat'].min(), shapes['shape_pt_lat'].max()
-lon_min, lon_max = shapes['shape_pt_lon'].min(), shapes['shape_pt_lon'].max()
-
-# Para evitar un mapa aplastado, calculamos un aspect ratio
-width = lon_max - lon_min
-height = lat_max - lat_min
-aspect_ratio = height / width
-svg_width = 1200
-svg_height = svg_width * aspect_ratio
-
-shapes['x'] = (shapes['shape_pt_lon'] - lon_min) / (lon_max - lon_min) * svg_width
-shapes['y'] = (lat_max - shapes['shape_pt_lat']) / (lat_max - lat_min) * svg_height
-print("Coordenadas normalizadas.")
-
-# --- Creación de SVG ---
-print("Creando archivo SVG...")
-dwg = svgwrite.Drawing('plano_metro_oficial.svg', profile='full', size=(svg_width, svg_height))
-dwg.add(dwg.rect(insert=(0, 0), size=('100%', '100%'), fill='black')) # Fondo negro
-
-# Dibuja cada shape_id con su color oficial
-for shape_id, group in shapes.groupby("shape_id"):
-    try:
-        line_info = shape_to_line.loc[shape_id]
-        line_number = line_info['line_number']
-        color = LINEAS_CONFIG.get(line_number, {'color': '#808080'})['color']
-    except (KeyError, TypeError):
-        color = '#808080' # Color gris para trazados sin línea asignada
-
-    points = list(zip(group['x'], group['y']))
-    dwg.add(dwg.polyline(points, stroke=color, fill='none', stroke_width=2, opacity=0.8))
-
-dwg.save()
-
-print(f"✅ SVG mejorado generado: plano_metro_oficial.svg (Tamaño: {int(svg_width)}x{int(svg_height)})")
+
+def linea_desde_route_id(route_id):
+    """'4__10___' -> '10', '4__R___' -> 'R' (cuando no hay routes.txt)"""
+    match = re.match(r'^\d+__([^_]+)', route_id or '')
+    return get_line_number(match.group(1)) if match else None
+
+
+def _leer_csv(ruta):
+    """Filas de un .txt GTFS como diccionarios (sin BOM); vacío si no existe"""
+    if not os.path.exists(ruta):
+        return
+    with open(ruta, 'r', encoding='utf-8-sig', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def simplificar(puntos, tolerancia):
+    """Douglas-Peucker iterativo sobre un array (n, 2); conserva extremos"""
+    n = len(puntos)
+    if n <= 2:
+        return puntos
+    conservar = np.zeros(n, dtype=bool)
+    conservar[0] = conservar[-1] = True
+    pendientes = [(0, n - 1)]
+    while pendientes:
+        inicio, fin = pendientes.pop()
+        if fin - inicio < 2:
+            continue
+        a, b = puntos[inicio], puntos[fin]
+        intermedios = puntos[inicio + 1:fin]
+        dx, dy = b - a
+        longitud = np.hypot(dx, dy)
+        if longitud == 0:
+            distancias = np.hypot(*(intermedios - a).T)
+        else:
+            distancias = np.abs(dx * (intermedios[:, 1] - a[1]) - dy * (intermedios[:, 0] - a[0])) / longitud
+        mayor = int(np.argmax(distancias))
+        if distancias[mayor] > tolerancia:
+            medio = inicio + 1 + mayor
+            conservar[medio] = True
+            pendientes.append((inicio, medio))
+            pendientes.append((medio, fin))
+    return puntos[conservar]
+
+
+def cargar_trazados(gtfs_dir=GTFS_DIR):
+    """
+    {linea: [array (n, 2) lon/lat, ...]} con un trazado por shape_id.
+    Sin shapes.txt, el trazado de cada shape_id sale de las paradas de su
+    primer viaje.
+    """
+    rutas = {fila['route_id']: get_line_number(fila.get('route_short_name'))
+             for fila in _leer_csv(os.path.join(gtfs_dir, 'routes.txt'))}
+
+    # shape_id -> línea y un viaje representativo
+    linea_de_shape, viaje_de_shape = {}, {}
+    for fila in _leer_csv(os.path.join(gtfs_dir, 'trips.txt')):
+        shape_id = fila.get('shape_id') or fila['trip_id']
+        if shape_id not in linea_de_shape:
+            linea_de_shape[shape_id] = rutas.get(fila['route_id']) or linea_desde_route_id(fila['route_id'])
+            viaje_de_shape[shape_id] = fila['trip_id']
+
+    puntos_por_shape = {}
+    for fila in _leer_csv(os.path.join(gtfs_dir, 'shapes.txt')):
+        puntos_por_shape.setdefault(fila['shape_id'], []).append(
+            (int(fila['shape_pt_sequence']), float(fila['shape_pt_lon']), float(fila['shape_pt_lat'])))
+
+    if not puntos_por_shape:
+        paradas = {fila['stop_id']: (float(fila['stop_lon']), float(fila['stop_lat']))
+                   for fila in _leer_csv(os.path.join(gtfs_dir, 'stops.txt'))
+                   if fila.get('stop_lat') and fila.get('stop_lon')}
+        shape_de_viaje = {viaje: shape for shape, viaje in viaje_de_shape.items()}
+        for fila in _leer_csv(os.path.join(gtfs_dir, 'stop_times.txt')):
+            shape_id = shape_de_viaje.get(fila['trip_id'])
+            coordenadas = paradas.get(fila['stop_id'])
+            if shape_id is not None and coordenadas is not None:
+                puntos_por_shape.setdefault(shape_id, []).append((int(fila['stop_sequence']),) + coordenadas)
+
+    trazados = {}
+    for shape_id, puntos in puntos_por_shape.items():
+        if len(puntos) < 2:
+            continue
+        puntos.sort()
+        trazados.setdefault(linea_de_shape.get(shape_id), []).append(
+            np.array([(lon, lat) for _, lon, lat in puntos], dtype=np.float64))
+    return trazados
+
+
+class PlanoMetro:
+    """Trazados proyectados y simplificados, con caché de fragmentos por línea"""
+
+    def __init__(self, trazados, ancho=ANCHO_SVG, tolerancia=TOLERANCIA_PX):
+        todos = np.vstack([t for lista in trazados.values() for t in lista]) if trazados else np.zeros((1, 2))
+        lon_min, lat_min = todos.min(axis=0)
+        lon_max, lat_max = todos.max(axis=0)
+
+        # Para evitar un mapa aplastado, la altura sigue el aspect ratio de los datos
+        self.ancho = ancho
+        self.alto = ancho * ((lat_max - lat_min) / (lon_max - lon_min)) if lon_max > lon_min else ancho
+        escala = np.array([ancho / ((lon_max - lon_min) or 1), self.alto / ((lat_max - lat_min) or 1)])
+
+        self.lineas = OrderedDict()
+        total_antes = total_despues = 0
+        for linea in sorted(trazados, key=self._orden_linea):
+            polilineas = []
+            for trazado in trazados[linea]:
+                pixeles = (trazado - [lon_min, lat_max]) * escala * [1, -1]
+                simplificado = simplificar(pixeles, tolerancia)
+                total_antes += len(pixeles)
+                total_despues += len(simplificado)
+                polilineas.append(' '.join(f'{x:.1f},{y:.1f}' for x, y in simplificado))
+            self.lineas[linea] = polilineas
+        self.puntos = (total_antes, total_despues)
+
+        self.version = hashlib.sha1(repr(list(self.lineas.items())).encode('utf-8')).hexdigest()[:12]
+        self._fragmentos = {}
+        self._combinaciones = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _orden_linea(linea):
+        linea = linea if linea is not None else ''
+        return (0, int(linea), '') if linea.isdigit() else (1, 0, linea)
+
+    @classmethod
+    def desde_gtfs(cls, gtfs_dir=GTFS_DIR, **opciones):
+        return cls(cargar_trazados(gtfs_dir), **opciones)
+
+    def fragmento(self, linea, resaltada=False):
+        """<g> de una línea, renderizado una vez y reutilizado"""
+        clave = (linea, resaltada)
+        fragmento = self._fragmentos.get(clave)
+        if fragmento is None:
+            color = LINEAS_CONFIG.get(linea, {'color': COLOR_SIN_LINEA})['color']
+            grosor, opacidad = (5, 1) if resaltada else (2, 0.8)
+            identificador = f'linea-{linea}' if linea is not None else 'sin-linea'
+            polilineas = ''.join(f'<polyline points="{puntos}"/>' for puntos in self.lineas[linea])
+            fragmento = (f'<g id="{identificador}" stroke="{color}" stroke-width="{grosor}" '
+                         f'opacity="{opacidad}" fill="none" stroke-linejoin="round">{polilineas}</g>')
+            self._fragmentos[clave] = fragmento
+        return fragmento
+
+    def normalizar(self, lineas=None, resaltar=None):
+        """Listas de la petición -> (líneas existentes a dibujar, líneas resaltadas)"""
+        disponibles = [l for l in self.lineas if l is not None] if lineas is None else \
+            [l for l in self.lineas if l in set(lineas)]
+        resaltadas = [l for l in disponibles if l in set(resaltar or ())]
+        return tuple(disponibles), tuple(resaltadas)
+
+    def componer(self, lineas=None, resaltar=None):
+        """SVG completo con `lineas` (None = todas) y `resaltar` destacadas; el resto se atenúa"""
+        clave = self.normalizar(lineas, resaltar)
+        with self._lock:
+            svg = self._combinaciones.get(clave)
+            if svg is not None:
+                self._combinaciones.move_to_end(clave)
+                return svg
+
+        dibujar, resaltadas = clave
+        partes = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.ancho}" height="{self.alto:.0f}" '
+                  f'viewBox="0 0 {self.ancho} {self.alto:.0f}">',
+                  '<rect x="0" y="0" width="100%" height="100%" fill="black"/>']
+        if resaltadas:
+            partes.append('<g opacity="0.3">')
+            partes.extend(self.fragmento(linea) for linea in dibujar if linea not in resaltadas)
+            partes.append('</g>')
+            partes.extend(self.fragmento(linea, resaltada=True) for linea in resaltadas)
+        else:
+            partes.extend(self.fragmento(linea) for linea in dibujar)
+        partes.append('</svg>')
+        svg = ''.join(partes)
+
+        with self._lock:
+            self._combinaciones[clave] = svg
+            if len(self._combinaciones) > MAX_COMBINACIONES:
+                self._combinaciones.popitem(last=False)
+        return svg
+
+    def etag(self, lineas=None, resaltar=None):
+        dibujar, resaltadas = self.normalizar(lineas, resaltar)
+        return f'{self.version}-' + hashlib.sha1(repr((dibujar, resaltadas)).encode('utf-8')).hexdigest()[:12]
+
+
+def main():
+    print("Cargando datos GTFS...")
+    plano = PlanoMetro.desde_gtfs()
+    antes, despues = plano.puntos
+    print(f"Trazados de {len(plano.lineas)} líneas: {antes} puntos, {despues} tras simplificar.")
+
+    salida = 'plano_metro_oficial.svg'
+    with open(salida, 'w', encoding='utf-8') as f:
+        f.write(plano.componer(lineas=list(plano.lineas)))
+
+    print(f"✅ SVG mejorado generado: {salida} (Tamaño: {int(plano.ancho)}x{int(plano.alto)})")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,61 +8,144 @@ Aplicación Flask para mostrar información del Metro de Madrid
 con datos en tiempo real, horarios, mapas y estadísticas.
 """
 
-from flask import Flask, render_template, jsonify, request, redirect, url_for, send_file, flash
 import sqlite3
 import json
 import os
-from datetime import datetime, timedelta, time
-import pandas as pd
-import time
-import threading
-import subprocess
 import sys
 import re
-import requests
-from bs4 import BeautifulSoup
 import random
+import subprocess
+import threading
 import unicodedata
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from flask_bcrypt import Bcrypt
-from forms import RegistrationForm, LoginForm
+import hashlib
+from datetime import datetime, timedelta
+import time
+
+from herramientas.subsistemas_perezosos import perfil_arranque, SubsistemaPerezoso, precalentar
+
+with perfil_arranque.medir('import flask y extensiones'):
+    from flask import Flask, render_template, jsonify, request, redirect, url_for, send_file, flash, Response, stream_with_context
+    from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+    from flask_bcrypt import Bcrypt
+    from forms import RegistrationForm, LoginForm
 
 # Importar rutas de transporte
-try:
-    from transport_routes import add_transport_routes
-    TRANSPORT_ROUTES_AVAILABLE = True
-    print("Rutas de transporte disponibles")
-except ImportError:
-    print("Rutas de transporte no disponibles")
-    TRANSPORT_ROUTES_AVAILABLE = False
+with perfil_arranque.medir('import rutas de transporte'):
+    try:
+        from transport_routes import add_transport_routes
+        TRANSPORT_ROUTES_AVAILABLE = True
+        print("Rutas de transporte disponibles")
+    except ImportError:
+        print("Rutas de transporte no disponibles")
+        TRANSPORT_ROUTES_AVAILABLE = False
 
-# Importar scraper Ninja
-try:
-    sys.path.append('herramientas')
+# ============================================================================
+# SUBSISTEMAS PEREZOSOS (scrapers, GTFS, búsqueda)
+# ============================================================================
+# Los scrapers arrastran requests, BeautifulSoup y pandas: se importan y se
+# instancian la primera vez que una ruta los necesita, no al importar app.py.
+# El scraping periódico lo hace herramientas/trabajador_scraper.py en otro
+# proceso; la web solo lee la BD. METRO_SCRAPING_EN_PROCESO=1 recupera el
+# comportamiento anterior (auto-updater e hilo de estado de líneas con scraper).
+
+SCRAPING_EN_PROCESO = os.environ.get('METRO_SCRAPING_EN_PROCESO') == '1'
+
+def _asegurar_path_herramientas():
+    """Los scrapers importan sus módulos hermanos por nombre"""
+    if 'herramientas' not in sys.path:
+        sys.path.append('herramientas')
+
+def _cargar_scraper_ninja():
+    _asegurar_path_herramientas()
     from scraper_ninja_tiempo_real import ScraperNinjaTiempoReal
-    NINJA_SCRAPER_AVAILABLE = True
-    print("Scraper Ninja disponible")
-except ImportError:
-    print("Scraper Ninja no disponible")
-    NINJA_SCRAPER_AVAILABLE = False
+    return ScraperNinjaTiempoReal()
 
-# Importar scraper de accesos reales
-try:
-    sys.path.append('herramientas')
+def _cargar_scraper_accesos():
+    _asegurar_path_herramientas()
     from scraper_accesos_reales import ScraperAccesosReales
-    ACCESOS_SCRAPER_AVAILABLE = True
-    print("Scraper de accesos reales disponible")
-except ImportError:
-    print("Scraper de accesos reales no disponible")
-    ACCESOS_SCRAPER_AVAILABLE = False
+    return ScraperAccesosReales()
 
-# Importar el scraper de accesos oficiales de MetroMadrid
-try:
+def _cargar_accesos_metromadrid():
+    _asegurar_path_herramientas()
     from herramientas.scraper_accesos_metromadrid import extraer_accesos_metromadrid
-    METROMADRID_ACCESOS_AVAILABLE = True
-except Exception as e:
-    print(f"Scraper de accesos MetroMadrid no disponible: {e}")
-    METROMADRID_ACCESOS_AVAILABLE = False
+    return extraer_accesos_metromadrid
+
+def _cargar_estado_lineas():
+    """
+    Almacén del estado de líneas: se siembra de la BD y se refresca en segundo
+    plano. Sin scraping en proceso solo relee lo que escribe el trabajador.
+    """
+    _asegurar_path_herramientas()
+    from almacen_estado_lineas import AlmacenEstadoLineas
+
+    # Cada cuánto se barren las líneas (el trabajador usa la misma variable)
+    plazo = int(os.environ.get('METRO_INTERVALO_ESTADO_LINEAS', '120'))
+    if not SCRAPING_EN_PROCESO:
+        relectura = int(os.environ.get('METRO_RELECTURA_ESTADO_LINEAS', '15'))
+        return AlmacenEstadoLineas(DB_PATH, intervalo=relectura, plazo=plazo).iniciar()
+
+    def crear_scraper():
+        from scraper_estado_lineas import ScraperEstadoLineas
+        return ScraperEstadoLineas()
+
+    return AlmacenEstadoLineas(DB_PATH, intervalo=plazo).iniciar(crear_scraper)
+
+scraper_ninja = SubsistemaPerezoso('Scraper Ninja', _cargar_scraper_ninja)
+scraper_accesos = SubsistemaPerezoso('Scraper de accesos reales', _cargar_scraper_accesos)
+accesos_metromadrid = SubsistemaPerezoso('Scraper de accesos MetroMadrid', _cargar_accesos_metromadrid)
+estado_lineas = SubsistemaPerezoso('Estado de líneas en memoria', _cargar_estado_lineas)
+
+def _cargar_plano_svg():
+    """Trazados del GTFS de M4 proyectados y simplificados una sola vez"""
+    from M4.mmadrid4 import PlanoMetro
+    return PlanoMetro.desde_gtfs()
+
+plano_svg = SubsistemaPerezoso('Plano SVG', _cargar_plano_svg)
+
+def _cargar_datasets():
+    """Versiones activas del almacén de datasets; se recargan al cambiar el puntero"""
+    _asegurar_path_herramientas()
+    from almacen_datasets import DatasetsActivos
+    return DatasetsActivos()
+
+datasets = SubsistemaPerezoso('Datasets versionados', _cargar_datasets)
+
+# Importar el normalizador de correspondencias
+try:
+    from herramientas.normalizar_correspondencias import (
+        correspondencias_al_dia, formatear_conexion, FUENTE_CORRESPONDENCIAS
+    )
+    CORRESPONDENCIAS_NORMALIZADAS_AVAILABLE = True
+except ImportError as e:
+    print(f"Normalizador de correspondencias no disponible: {e}")
+    CORRESPONDENCIAS_NORMALIZADAS_AVAILABLE = False
+
+# Importar el historial de estado (tablas de último estado, resúmenes y retención)
+try:
+    from herramientas.historial_estado import (
+        asegurar_esquema_una_vez as asegurar_esquema_historial, obtener_estado_linea_actual
+    )
+    HISTORIAL_ESTADO_AVAILABLE = True
+except ImportError as e:
+    print(f"Historial de estado no disponible: {e}")
+    HISTORIAL_ESTADO_AVAILABLE = False
+
+# Demanda de usuarios para el planificador de actualizaciones por prioridad
+try:
+    from herramientas.planificador_prioridad import RegistroDemanda
+    PLANIFICADOR_AVAILABLE = True
+except ImportError as e:
+    print(f"Planificador de prioridad no disponible: {e}")
+    PLANIFICADOR_AVAILABLE = False
+
+# Cola de trabajos del proceso de scraping (solo lectura: latidos y métricas)
+try:
+    from herramientas.cola_trabajos import ColaTrabajos
+    COLA_TRABAJOS_AVAILABLE = True
+except ImportError as e:
+    print(f"Cola de trabajos de scraping no disponible: {e}")
+    COLA_TRABAJOS_AVAILABLE = False
+
 
 # Configuración
 app = Flask(__name__)
@@ -104,6 +187,7 @@ BICIMAD_URL = "https://datos.emtmadrid.es/dataset/5fcc0945-2cbd-46c3-801a-6a83f4
 def load_bicimad_data():
     """Carga los datos de BiciMAD desde la API oficial de EMT Madrid"""
     try:
+        import requests
         print("🔄 Cargando datos de BiciMAD desde API oficial...")
         response = requests.get(BICIMAD_URL, timeout=10)
         
@@ -172,6 +256,7 @@ except ImportError:
 
 # Variables globales para datos clave
 datos_clave_estaciones = None
+datos_clave_registros = []
 datos_clave_cargados = False
 
 # Variables globales para GTFS
@@ -225,35 +310,25 @@ CERCANIAS_CONFIG = {
 # ============================================================================
 
 def cargar_datos_clave():
-    """Carga los datos clave desde el CSV al inicio de la aplicación (OPCIONAL)"""
-    global datos_clave_estaciones, datos_clave_cargados
+    """Carga los datos clave (caché tipada del CSV) al inicio de la aplicación (OPCIONAL)"""
+    global datos_clave_estaciones, datos_clave_registros, datos_clave_cargados
     try:
-        print(f" Intentando cargar datos clave desde: {CSV_DATOS_CLAVE}")
-        print(f" Ruta absoluta: {os.path.abspath(CSV_DATOS_CLAVE)}")
-        print(f"¿Existe el archivo?: {os.path.exists(CSV_DATOS_CLAVE)}")
-        
         if not os.path.exists(CSV_DATOS_CLAVE):
             print(f"No se encontró el CSV de datos clave: {CSV_DATOS_CLAVE}")
             print("El sistema funcionará sin el CSV, usando búsqueda en base de datos")
             return False
         
-        print("Cargando CSV...")
-        # Cargar CSV
-        datos_clave_estaciones = pd.read_csv(CSV_DATOS_CLAVE, encoding='utf-8')
-        print(f"SV cargado: {len(datos_clave_estaciones)} filas")
+        # La caché tipada importa pandas: solo se carga al primer uso de la búsqueda
+        from herramientas.cache_datos_clave import cargar_datos_clave_tipados
         
-        # Recalcular SIEMPRE la columna normalizada
-        print("Calculando columna normalizada...")
-        datos_clave_estaciones['nombre_normalizado'] = (
-            datos_clave_estaciones['nombre']
-            .str.lower()
-            .str.normalize('NFD')
-            .str.encode('ascii', errors='ignore')
-            .str.decode('utf-8')
-        )
+        # Pickle tipado indexado por el hash del CSV (se regenera si el CSV cambia)
+        inicio = time.perf_counter()
+        datos_clave_estaciones, datos_clave_registros, desde_cache = cargar_datos_clave_tipados(CSV_DATOS_CLAVE)
+        ms = (time.perf_counter() - inicio) * 1000
         
         datos_clave_cargados = True
-        print(f" Datos clave cargados exitosamente. Total: {len(datos_clave_estaciones)} estaciones")
+        origen = 'caché' if desde_cache else 'CSV'
+        print(f" Datos clave cargados desde {origen} en {ms:.1f} ms. Total: {len(datos_clave_estaciones)} estaciones")
         return True
     except Exception as e:
         print(f" Error cargando datos clave: {e}")
@@ -262,41 +337,35 @@ def cargar_datos_clave():
         print("El sistema funcionará sin el CSV, usando búsqueda en base de datos")
         return False
 
+busqueda_estaciones = SubsistemaPerezoso('Búsqueda de estaciones (datos clave)', cargar_datos_clave)
+
 def buscar_estacion_por_nombre(nombre_busqueda, limite=10):
     """Busca estaciones por nombre usando los datos clave cargados o base de datos"""
-    global datos_clave_estaciones, datos_clave_cargados
+    busqueda_estaciones.obtener()
     if not datos_clave_cargados or datos_clave_estaciones is None:
         print("Usando busqueda en base de datos (mas lenta pero funcional)")
         return buscar_estacion_por_nombre_db(nombre_busqueda, limite)
     try:
-        # Normalizar nombre de búsqueda
-        nombre_normalizado = nombre_busqueda.lower()
-        nombre_normalizado = unicodedata.normalize('NFD', nombre_normalizado).encode('ascii', errors='ignore').decode('utf-8')
-        
-        # Búsqueda en la columna 'nombre' (que sí existe en el CSV)
-        # Búsqueda exacta
-        exacta = datos_clave_estaciones[datos_clave_estaciones['nombre'].str.lower() == nombre_busqueda.lower()]
-        # Búsqueda parcial
-        parcial = datos_clave_estaciones[datos_clave_estaciones['nombre'].str.lower().str.contains(nombre_busqueda.lower(), na=False)]
+        busqueda = nombre_busqueda.lower()
+        nombres = datos_clave_estaciones['nombre_lower']
         
-        # Combinar resultados
-        resultados = pd.concat([exacta, parcial]).drop_duplicates(subset=['id_fijo', 'linea']).head(limite)
+        # Posiciones de las coincidencias exactas primero y después las parciales
+        exacta = (nombres == busqueda).to_numpy(dtype=bool, na_value=False)
+        parcial = nombres.str.contains(busqueda, regex=False).to_numpy(dtype=bool, na_value=False)
+        posiciones = list(exacta.nonzero()[0]) + list((parcial & ~exacta).nonzero()[0])
         
-        # Convertir a lista de diccionarios
+        # Los registros ya están convertidos a tipos Python; se descartan duplicados (id_fijo, linea)
         estaciones = []
-        for _, row in resultados.iterrows():
-            estacion = {
-                'id_fijo': int(row['id_fijo']),
-                'nombre': row['nombre'],
-                'linea': row['linea'],
-                'orden': int(row['orden']) if pd.notna(row['orden']) else None,
-                'url': row['url'] if pd.notna(row['url']) else None,
-                'id_modal': int(row['id_modal']) if pd.notna(row['id_modal']) else None,
-                'zona_tarifaria': row['zona'] if pd.notna(row['zona']) else None,
-                'estacion_accesible': row['accesible'] if pd.notna(row['accesible']) else None,
-                'tabla_origen': row['tabla_origen']
-            }
-            estaciones.append(estacion)
+        vistos = set()
+        for posicion in posiciones:
+            registro = datos_clave_registros[posicion]
+            clave = (registro['id_fijo'], registro['linea'])
+            if clave in vistos:
+                continue
+            vistos.add(clave)
+            estaciones.append(dict(registro))
+            if len(estaciones) >= limite:
+                break
         return estaciones
     except Exception as e:
         print(f"ERROR en busqueda por nombre: {e}")
@@ -305,6 +374,8 @@ def buscar_estacion_por_nombre(nombre_busqueda, limite=10):
 def buscar_estacion_por_nombre_db(nombre_busqueda, limite=10):
     """Búsqueda alternativa en base de datos si no hay datos clave"""
     try:
+        import pandas as pd
+        
         conn = sqlite3.connect(DB_PATH)
         
         # Normalizar nombre de búsqueda (igual que en la función principal)
@@ -358,6 +429,8 @@ def buscar_estacion_por_nombre_db(nombre_busqueda, limite=10):
 def obtener_datos_estacion_completos(id_fijo, tabla_origen):
     """Obtiene datos completos de una estación desde la base de datos"""
     try:
+        import pandas as pd
+        
         conn = sqlite3.connect(DB_PATH)
         
         query = f"""
@@ -385,8 +458,10 @@ def obtener_datos_estacion_completos(id_fijo, tabla_origen):
 def load_gtfs_data():
     """Carga los datos GTFS desde la base de datos"""
     try:
+        import pandas as pd
+        
         if not os.path.exists(GTFS_DB_PATH):
-            print(f" No se encontró la base de datos GTFS: {GTFS_DB_PATH}")
+            print(f" No se encontró la base de datos GTFS: {GTFS_DB_PATH} (se genera con: python herramientas/importar_gtfs.py M4)")
             return False
         
         conn = sqlite3.connect(GTFS_DB_PATH)
@@ -436,6 +511,8 @@ def load_gtfs_data():
         print(f" Error cargando datos GTFS: {e}")
         return False
 
+gtfs = SubsistemaPerezoso('GTFS', load_gtfs_data)
+
 def time_to_seconds(time_str):
     """Convierte tiempo HH:MM:SS a segundos"""
     try:
@@ -477,6 +554,7 @@ def get_current_service_ids():
 
 def get_active_trips_with_frequencies(target_time):
     """Obtiene viajes activos con frecuencias para una hora específica"""
+    gtfs.obtener()
     active_services = get_current_service_ids()
     target_seconds = time_to_seconds(target_time)
     
@@ -623,6 +701,41 @@ def get_db_connection(db_path=None):
     conn.row_factory = sqlite3.Row
     return conn
 
+CORRESPONDENCIAS_RECOMPROBAR = 60  # segundos
+_correspondencias_comprobadas = {'instante': None, 'al_dia': False}
+
+def correspondencias_normalizadas_al_dia(conn):
+    """
+    Si conexiones_normalizadas salió del contenido actual de estaciones_completas
+    (se comprueba como mucho una vez por minuto y sin escribir). La tabla la
+    regeneran normalizar_correspondencias.py y el mantenimiento del trabajador.
+    """
+    if not CORRESPONDENCIAS_NORMALIZADAS_AVAILABLE:
+        return False
+    ahora = time.monotonic()
+    instante = _correspondencias_comprobadas['instante']
+    if instante is None or ahora - instante >= CORRESPONDENCIAS_RECOMPROBAR:
+        _correspondencias_comprobadas['al_dia'] = correspondencias_al_dia(conn)
+        _correspondencias_comprobadas['instante'] = ahora
+    return _correspondencias_comprobadas['al_dia']
+
+def parsear_correspondencias_texto(corr_str):
+    """Correspondencias desde el texto descriptivo (si la tabla normalizada no está al día)"""
+    if isinstance(corr_str, bytes):
+        corr_str = corr_str.decode('utf-8', errors='ignore')
+    if not corr_str:
+        return []
+    # Buscar patrones como "Línea 1", "Línea 2", etc.
+    correspondencias = re.findall(r'Línea\s+(\d+)', str(corr_str))
+    # También buscar líneas de Cercanías
+    cercanias_encontradas = re.findall(r'Cercanías\s+(\w+)', str(corr_str))
+    correspondencias.extend([f'C{linea}' for linea in cercanias_encontradas])
+    if 'Autobuses' in str(corr_str):
+        correspondencias.append('Autobuses')
+    if 'Intercambiador' in str(corr_str):
+        correspondencias.append('Intercambiador')
+    return correspondencias
+
 def get_all_stations_from_db():
     conn = get_db_connection()
     all_stations = []
@@ -714,22 +827,23 @@ def line_detail_view(line_id):
     if not line_info:
         return "Linea no encontrada", 404
     
-    # Obtener el estado de la línea
+    # Obtener el estado de la línea (último estado materializado, lectura por clave)
     line_status_data = None
     try:
-        conn = get_db_connection('estaciones_fijas_v2.db')
-        cursor = conn.cursor()
-        
-        # Verificar si la tabla existe
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='estado_lineas'")
-        if cursor.fetchone():
-            cursor.execute("SELECT estado, descripcion FROM estado_lineas WHERE linea = ? ORDER BY timestamp DESC LIMIT 1", (line_id,))
-            row = cursor.fetchone()
-            if row:
-                line_status_data = {
-                    'estado': row[0],
-                    'descripcion': row[1]
-                }
+        conn = get_db_connection()
+        row = None
+        if HISTORIAL_ESTADO_AVAILABLE:
+            try:
+                row = obtener_estado_linea_actual(conn, line_id)
+            except sqlite3.OperationalError:
+                pass  # BD sin migrar todavía: se lee el histórico
+        if row is None:
+            row = conn.execute("SELECT estado, descripcion FROM estado_lineas WHERE linea = ? ORDER BY timestamp DESC LIMIT 1", (line_id,)).fetchone()
+        if row:
+            line_status_data = {
+                'estado': row[0],
+                'descripcion': row[1]
+            }
         conn.close()
     except Exception as e:
         print(f"Error al obtener estado de línea {line_id}: {e}")
@@ -748,6 +862,15 @@ def line_detail_view(line_id):
                          line_info=line_info,
                          other_lines=other_lines)
 
+# Las consultas se suman en memoria y un hilo las vuelca en lote a la BD
+registro_demanda = RegistroDemanda(DB_PATH) if PLANIFICADOR_AVAILABLE else None
+
+def registrar_demanda_resultados(resultados):
+    """Cuenta la consulta de cada estación encontrada (sube su prioridad de refresco)"""
+    if registro_demanda is None or not resultados:
+        return
+    registro_demanda.anotar({r.get('id_fijo') for r in resultados if r.get('id_fijo') is not None})
+
 @app.route('/station', methods=['GET', 'POST'])
 @login_required
 def station_page():
@@ -762,6 +885,7 @@ def station_page():
     
     if query:
         resultados = buscar_estacion_por_nombre(query, limite=10)
+        registrar_demanda_resultados(resultados)
     
     return render_template('station.html', resultados=resultados, query=query)
 
@@ -783,27 +907,28 @@ def account():
 def cercanias():
     """Vista del mapa integrado de transporte"""
     try:
+        # Versiones activas del almacén de datasets (en memoria; se recargan
+        # solas cuando construir_datos o un `activar` mueven el puntero)
+        almacen_datos = datasets.obtener()
+
         # Cargar datos de Metro
-        with open('static/data/metro_con_capas.json', 'r', encoding='utf-8') as f:
-            metro_raw = json.load(f)
-            metro_data = transform_metro_data(metro_raw)
-            print("✅ Datos de Metro cargados")
+        metro_raw = almacen_datos.cargar('metro_con_capas.json')
+        metro_data = transform_metro_data(metro_raw)
+        print("✅ Datos de Metro cargados")
 
         # Cargar datos de Metro Ligero
-        with open('static/data/metro_ligero_final.json', 'r', encoding='utf-8') as f:
-            metro_ligero_raw = json.load(f)
-            metro_ligero_data = transform_metro_data_with_layers(metro_ligero_raw)
-            print("✅ Datos de Metro Ligero cargados")
+        metro_ligero_raw = almacen_datos.cargar('metro_ligero_final.json')
+        metro_ligero_data = transform_metro_data_with_layers(metro_ligero_raw)
+        print("✅ Datos de Metro Ligero cargados")
 
         # Cargar datos de Cercanías (rutas reales)
-        with open('static/data/cercanias_completo.json', 'r', encoding='utf-8') as f:
-            cercanias_raw = json.load(f)
-            # Transformar los datos para que el JS use estaciones y tramos
-            cercanias_data = {
-                'estaciones': cercanias_raw['estaciones'],
-                'tramos': cercanias_raw['tramos']  # Usar tramos en lugar de rutas
-            }
-            print("✅ Datos de Cercanías (rutas reales) cargados: {} estaciones, {} tramos".format(len(cercanias_data['estaciones']), len(cercanias_data['tramos'])))
+        cercanias_raw = almacen_datos.cargar('cercanias_completo.json')
+        # Transformar los datos para que el JS use estaciones y tramos
+        cercanias_data = {
+            'estaciones': cercanias_raw['estaciones'],
+            'tramos': cercanias_raw['tramos']  # Usar tramos en lugar de rutas
+        }
+        print("✅ Datos de Cercanías (rutas reales) cargados: {} estaciones, {} tramos".format(len(cercanias_data['estaciones']), len(cercanias_data['tramos'])))
 
         # Cargar datos de BiciMAD
         bicimad_data = load_bicimad_data()
@@ -963,55 +1088,169 @@ def api_lines_all():
 
 @app.route('/api/lines/global-status')
 def api_lines_global_status():
-    """API para obtener el estado global de las líneas usando el scraper"""
+    """
+    Estado global de las líneas desde el almacén en memoria (lo refresca un
+    hilo desde la BD que alimenta el trabajador de scraping). `?since=<version>`
+    devuelve solo las líneas cambiadas desde esa versión, o 304 si no hay cambios.
+    Sin `since` la respuesta es siempre completa: If-None-Match solo sirve
+    para revalidarla (304), nunca para pedir un delta. Las líneas van bajo
+    'lineas', junto a 'version', 'delta' y 'frescura'.
+    """
+    if not estado_lineas.disponible:
+        return jsonify({'error': 'Estado de líneas no disponible', 'version': None}), 503
+
+    almacen = estado_lineas.obtener()
+    desde = request.args.get('since', type=int)
+    cuerpo = almacen.respuesta(desde)
+    if cuerpo is None or (desde is None and str(cuerpo['version']) in request.if_none_match):
+        version = desde if cuerpo is None else cuerpo['version']
+        return '', 304, {'ETag': f'"{version}"', 'Cache-Control': 'no-cache'}
+
+    respuesta = jsonify(cuerpo)
+    respuesta.headers['ETag'] = f'"{cuerpo["version"]}"'
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+DATASETS_MAPA = ('metro_con_capas', 'metro_ligero_final', 'cercanias_completo')
+_datasets_codificados = {}  # (nombre, formato) -> (datos de origen, cuerpo, etag)
+
+def _dataset_codificado(nombre, formato):
+    """Cuerpo JSON compacto o binario de la versión activa; se recodifica solo si cambió"""
+    datos = datasets.obtener().cargar(f'{nombre}.json')
+    guardado = _datasets_codificados.get((nombre, formato))
+    if guardado and guardado[0] is datos:
+        return guardado[1], guardado[2]
+
+    if formato == 'binario':
+        _asegurar_path_herramientas()
+        from red_binaria import codificar
+        cuerpo = codificar(datos)
+    else:
+        cuerpo = json.dumps(datos, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    etag = hashlib.sha256(cuerpo).hexdigest()[:20]
+    _datasets_codificados[(nombre, formato)] = (datos, cuerpo, etag)
+    return cuerpo, etag
+
+@app.route('/api/datasets/<nombre>')
+def api_dataset(nombre):
+    """
+    Datasets del mapa con negociación de contenido: JSON por defecto o el
+    formato binario compacto (herramientas/red_binaria.py, decodificador en
+    static/js/red_binaria.js) si el cliente lo pide en Accept.
+    """
+    if nombre not in DATASETS_MAPA:
+        return jsonify({'error': f'Dataset desconocido: {nombre}', 'disponibles': list(DATASETS_MAPA)}), 404
+    if not datasets.disponible:
+        return jsonify({'error': 'Datasets no disponibles'}), 503
+
+    mime_binario = 'application/vnd.metro-madrid.red+binary'
+    elegido = request.accept_mimetypes.best_match(['application/json', mime_binario], default='application/json')
+    formato = 'binario' if elegido == mime_binario else 'json'
     try:
-        lines_status = {}
-        
-        # Usar el scraper de estado si está disponible
-        if ACCESOS_SCRAPER_AVAILABLE:
-            try:
-                scraper = ScraperAccesosReales()
-                status_data = scraper.obtener_estado_lineas()
-                
-                for line_id in ['1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12', 'R']:
-                    if line_id in status_data:
-                        lines_status[line_id] = {
-                            'status': status_data[line_id].get('estado', 'normal'),
-                            'description': status_data[line_id].get('descripcion', 'Circulación normal'),
-                            'timestamp': datetime.now().isoformat()
-                        }
-                    else:
-                        lines_status[line_id] = {
-                            'status': 'normal',
-                            'description': 'Circulación normal',
-                            'timestamp': datetime.now().isoformat()
-                        }
-                
-                print(f"✅ API lines/global-status: {len(lines_status)} líneas (usando scraper)")
-            except Exception as e:
-                print(f"⚠️ Error usando scraper de estado: {e}")
-                # Fallback a estado simulado
-                for line_id in ['1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12', 'R']:
-                    lines_status[line_id] = {
-                        'status': 'normal',
-                        'description': 'Circulación normal',
-                        'timestamp': datetime.now().isoformat()
-                    }
-        else:
-            # Estado simulado si no hay scraper
-            for line_id in ['1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12', 'R']:
-                lines_status[line_id] = {
-                    'status': 'normal',
-                    'description': 'Circulación normal',
-                    'timestamp': datetime.now().isoformat()
-                }
-        
-        print(f"✅ API lines/global-status: {len(lines_status)} líneas")
-        return jsonify(lines_status)
-        
-    except Exception as e:
-        print(f"❌ Error en API lines/global-status: {e}")
-        return jsonify({})
+        cuerpo, etag = _dataset_codificado(nombre, formato)
+    except (OSError, ValueError) as e:
+        return jsonify({'error': f'Error leyendo {nombre}: {e}'}), 500
+
+    cabeceras = {'ETag': f'"{etag}"', 'Vary': 'Accept', 'Cache-Control': 'no-cache'}
+    if request.headers.get('If-None-Match', '').strip('"') == etag:
+        return '', 304, cabeceras
+    return Response(cuerpo, mimetype=mime_binario if formato == 'binario' else 'application/json', headers=cabeceras)
+
+def _lista_parametro(nombre):
+    """'1, 6,R' -> ['1', '6', 'R']; None si el parámetro no viene"""
+    valor = request.args.get(nombre)
+    if valor is None:
+        return None
+    return [parte.strip().upper() for parte in valor.split(',') if parte.strip()]
+
+@app.route('/map.svg')
+def map_svg():
+    """
+    Plano SVG compuesto al vuelo: `?lines=1,6,R` elige las líneas (todas si
+    falta) y `?highlight=6` resalta unas y atenúa el resto. Cada línea se
+    renderiza una vez; una combinación es solo la unión de sus fragmentos.
+    """
+    if not plano_svg.disponible:
+        return jsonify({'error': 'Plano SVG no disponible'}), 503
+
+    plano = plano_svg.obtener()
+    lineas, resaltar = _lista_parametro('lines'), _lista_parametro('highlight')
+    etag = plano.etag(lineas, resaltar)
+    cabeceras = {'ETag': f'"{etag}"', 'Cache-Control': 'public, max-age=3600'}
+    if request.headers.get('If-None-Match', '').strip('"') == etag:
+        return '', 304, cabeceras
+
+    return Response(plano.componer(lineas, resaltar), mimetype='image/svg+xml', headers=cabeceras)
+
+@app.route('/api/scraper/status')
+def api_scraper_status():
+    """Cola de trabajos de scraping, latidos y métricas de los procesos trabajadores"""
+    if not COLA_TRABAJOS_AVAILABLE:
+        return jsonify({'error': 'Cola de trabajos no disponible'}), 503
+    try:
+        resumen = ColaTrabajos(DB_PATH).resumen()
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Error leyendo la cola de trabajos: {e}'}), 500
+    resumen['scraping_en_proceso'] = SCRAPING_EN_PROCESO
+    return jsonify(resumen)
+
+def _eventos_estado():
+    """Módulo de eventos importado por nombre, como los scrapers (así comparten el bus)"""
+    _asegurar_path_herramientas()
+    import eventos_estado
+    return eventos_estado
+
+@app.route('/api/events')
+def api_events():
+    """Reproducción del outbox de eventos de estado: ?since=<id>&limit=&linea=&tipo="""
+    eventos_estado = _eventos_estado()
+    desde = request.args.get('since', 0, type=int)
+    limite = min(request.args.get('limit', 100, type=int), 1000)
+    tipos = request.args.getlist('tipo') or None
+    conn = get_db_connection()
+    try:
+        eventos = eventos_estado.leer_eventos(conn, desde, limite, request.args.get('linea'), tipos)
+    finally:
+        conn.close()
+    return jsonify({
+        'eventos': [evento.a_dict() for evento in eventos],
+        'ultimo_id': eventos[-1].id if eventos else desde
+    })
+
+@app.route('/api/events/stream')
+def api_events_stream():
+    """
+    Stream SSE de eventos de estado. Reanuda desde Last-Event-ID (o ?since=);
+    sin ninguno empieza por los eventos nuevos. Se despierta con el bus del
+    proceso y relee el outbox cada pocos segundos por si escribe otro proceso.
+    """
+    eventos_estado = _eventos_estado()
+    bus = eventos_estado.obtener_bus()
+    linea = request.args.get('linea')
+    tipos = request.args.getlist('tipo') or None
+    ultimo = request.headers.get('Last-Event-ID', request.args.get('since', ''))
+
+    def generar():
+        conn = get_db_connection()
+        try:
+            desde = int(ultimo) if str(ultimo).isdigit() else eventos_estado.ultimo_id_evento(conn)
+            publicados = bus.publicados
+            ultimo_latido = time.time()
+            yield 'retry: 5000\n\n'
+            while True:
+                for evento in eventos_estado.leer_eventos(conn, desde, 500, linea, tipos):
+                    desde = evento.id
+                    datos = json.dumps(evento.a_dict(), ensure_ascii=False)
+                    yield f'id: {evento.id}\nevent: {evento.tipo}\ndata: {datos}\n\n'
+                if time.time() - ultimo_latido >= 15:
+                    ultimo_latido = time.time()
+                    yield ': latido\n\n'
+                publicados = bus.esperar(publicados, timeout=5)
+        finally:
+            conn.close()
+
+    return Response(stream_with_context(generar()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/v5/route')
 def api_v5_route():
@@ -1100,9 +1339,13 @@ def api_line_stations(line_id):
         
         cursor = conn.cursor()
         
+        # Con la tabla normalizada al día no hace falta el texto de correspondencias
+        normalizadas = correspondencias_normalizadas_al_dia(conn)
+        columna_texto = "NULL" if normalizadas else "correspondencias"
+
         # Usar la tabla estaciones_completas que tiene toda la información
-        query = """
-        SELECT id_fijo, nombre, linea, orden_en_linea, correspondencias, 
+        query = f"""
+        SELECT id_fijo, nombre, linea, orden_en_linea, {columna_texto}, 
                latitud, longitud, zona_tarifaria, estacion_accesible
         FROM estaciones_completas 
         WHERE linea = ? AND latitud IS NOT NULL AND longitud IS NOT NULL
@@ -1111,7 +1354,21 @@ def api_line_stations(line_id):
         
         cursor.execute(query, (line_id,))
         rows = cursor.fetchall()
-        
+
+        # Correspondencias ya normalizadas en la ingesta, agrupadas por id_fijo
+        correspondencias_por_estacion = {}
+        if normalizadas:
+            cursor.execute("""
+                SELECT station_id, modo, linea_conexion
+                FROM conexiones_normalizadas
+                WHERE linea = ? AND fuente = ?
+                ORDER BY station_id, orden
+            """, (line_id, FUENTE_CORRESPONDENCIAS))
+            for station_id, modo, linea_conexion in cursor.fetchall():
+                etiqueta = formatear_conexion(modo, linea_conexion)
+                if etiqueta:
+                    correspondencias_por_estacion.setdefault(station_id, []).append(etiqueta)
+
         stations = []
         for i, row in enumerate(rows):
             # Convertir bytes a string si es necesario
@@ -1120,35 +1377,18 @@ def api_line_stations(line_id):
                 'nombre': row[1] if not isinstance(row[1], bytes) else row[1].decode('utf-8', errors='ignore'),
                 'linea': row[2] if not isinstance(row[2], bytes) else row[2].decode('utf-8', errors='ignore'),
                 'orden_en_linea': row[3],
-                'correspondencias': row[4] if not isinstance(row[4], bytes) else row[4].decode('utf-8', errors='ignore'),
                 'latitud': row[5],
                 'longitud': row[6],
                 'zona_tarifaria': row[7],
                 'estacion_accesible': row[8]
             }
-            
-            # Procesar correspondencias
-            correspondencias = []
-            if station_data['correspondencias']:
-                corr_str = station_data['correspondencias']
-                if corr_str:
-                    # Extraer solo números de línea del texto descriptivo
-                    # Buscar patrones como "Línea 1", "Línea 2", etc.
-                    lineas_encontradas = re.findall(r'Línea\s+(\d+)', str(corr_str))
-                    correspondencias = lineas_encontradas
-                    
-                    # También buscar líneas de Cercanías
-                    cercanias_encontradas = re.findall(r'Cercanías\s+(\w+)', str(corr_str))
-                    correspondencias.extend([f'C{linea}' for linea in cercanias_encontradas])
-                    
-                    # Buscar autobuses
-                    if 'Autobuses' in str(corr_str):
-                        correspondencias.append('Autobuses')
-                    
-                    # Buscar intercambiador
-                    if 'Intercambiador' in str(corr_str):
-                        correspondencias.append('Intercambiador')
-            
+
+            # Correspondencias desde la tabla normalizada (sin regex por petición)
+            if normalizadas:
+                correspondencias = correspondencias_por_estacion.get(station_data['id_fijo'], [])
+            else:
+                correspondencias = parsear_correspondencias_texto(row[4])
+
             # Determinar si es terminal (primera o última estación)
             is_terminus = (i == 0 or i == len(rows) - 1)
             
@@ -1465,13 +1705,59 @@ def transform_cercanias_data(data):
 # BLOQUE PRINCIPAL
 # ============================================================================
 
-if __name__ == '__main__':
-    # Cargar datos clave (opcional)
-    cargar_datos_clave()
+SUBSISTEMAS = [busqueda_estaciones, gtfs, estado_lineas, scraper_accesos, scraper_ninja, accesos_metromadrid]
+
+perfil_arranque.registrar('carga del módulo app', time.perf_counter() - perfil_arranque.inicio)
+
+def migrar_esquema_historial():
+    """Índices, tablas de último estado y triggers del historial, una vez al arrancar"""
+    try:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        try:
+            asegurar_esquema_historial(conn, DB_PATH)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"⚠️ No se pudo migrar el esquema del historial: {e}")
+
+def crear_app(precalentar_subsistemas=None):
+    """
+    Prepara la aplicación para servir. Los subsistemas se inicializan al
+    primer uso; con `precalentar_subsistemas` (o METRO_PRECALENTAR=1) se
+    cargan además en un hilo en segundo plano sin retrasar el arranque.
+    """
+    if precalentar_subsistemas is None:
+        precalentar_subsistemas = os.environ.get('METRO_PRECALENTAR') == '1'
+    
+    # Las escrituras de esquema se hacen aquí (o en el trabajador), nunca en una petición
+    if HISTORIAL_ESTADO_AVAILABLE:
+        migrar_esquema_historial()
     
-    # Iniciar el auto-updater si está disponible
-    if AUTO_UPDATER_AVAILABLE:
+    # El auto-updater solo corre dentro de la web si se pide expresamente;
+    # lo normal es lanzar herramientas/trabajador_scraper.py aparte
+    if AUTO_UPDATER_AVAILABLE and SCRAPING_EN_PROCESO:
         start_auto_updater()
     
+    if precalentar_subsistemas:
+        precalentar(SUBSISTEMAS)
+    
+    return app
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Aplicación web del Metro de Madrid')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Muestra los tiempos de importación e inicialización de cada subsistema y sale')
+    parser.add_argument('--precalentar', action='store_true',
+                        help='Inicializa los subsistemas en segundo plano al arrancar')
+    args = parser.parse_args()
+    
+    if args.profile_startup:
+        for subsistema in SUBSISTEMAS:
+            subsistema.obtener()
+        print(perfil_arranque.informe())
+        sys.exit(0)
+    
     # Iniciar la aplicación
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    crear_app(precalentar_subsistemas=args.precalentar or None).run(host='0.0.0.0', port=5000, debug=True)
@@ -4,11 +4,16 @@
 Script para actualizar la base de datos con los datos corregidos del CSV
 """
 
+import os
+import sys
 import sqlite3
 import pandas as pd
 import re
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'herramientas'))
+from carga_masiva import transaccion, preparar_temporal
+
 def limpiar_nombre(nombre):
     """Limpia el nombre de la estación para hacerlo compatible con la base de datos"""
     # Eliminar caracteres especiales y normalizar
@@ -49,71 +54,58 @@ def actualizar_base_datos_desde_csv():
             count = len(df[df['linea'] == linea])
             print(f"🚇 Línea {linea}: {count} estaciones")
         
-        # Procesar cada línea
+        # Todas las estaciones del CSV a una temporal y, por línea, un único
+        # UPDATE ... FROM; todo en una transacción (o se aplica entero o nada)
+        df = df.dropna(subset=['linea'])
+        df = df[df['linea'].astype(str) != '']
+        carga = df[['linea', 'id_fijo', 'nombre', 'orden']].copy()
+        carga['linea'] = carga['linea'].astype(str)
+        carga['nombre_limpio'] = carga['nombre'].map(limpiar_nombre)
+        
         total_actualizadas = 0
         total_errores = 0
         
-        for linea in sorted(df['linea'].unique()):
-            if linea == 'nan' or linea == '':
-                continue
-                
-            print(f"\n🔄 Procesando Línea {linea}...")
-            
-            # Obtener estaciones de esta línea
-            estaciones_linea = df[df['linea'] == linea].copy()
-            
-            # Buscar la tabla correspondiente
-            tabla_linea = f"linea_{linea}"
-            if tabla_linea not in tablas_lineas:
-                print(f"⚠️ Tabla {tabla_linea} no encontrada, saltando...")
-                continue
-            
-            # Verificar estructura de la tabla
-            cursor.execute(f"PRAGMA table_info({tabla_linea})")
-            columnas_tabla = [row[1] for row in cursor.fetchall()]
-            
-            print(f"📋 Columnas en {tabla_linea}: {columnas_tabla}")
+        with transaccion(conn):
+            preparar_temporal(conn, 'carga_datos_clave', carga)
             
-            # Actualizar cada estación de esta línea
-            for idx, estacion in estaciones_linea.iterrows():
-                try:
-                    id_fijo = estacion['id_fijo']
-                    nombre = estacion['nombre']
-                    orden = estacion['orden']
-                    
-                    # Limpiar nombre para búsqueda
-                    nombre_limpio = limpiar_nombre(nombre)
-                    
-                    # Buscar la estación en la tabla
-                    if 'nombre_limpio' in columnas_tabla:
-                        # Si existe la columna nombre_limpio, usarla
-                        cursor.execute(f"""
-                            UPDATE {tabla_linea} 
-                            SET orden_en_linea = ?, id_fijo = ?
-                            WHERE nombre_limpio = ?
-                        """, (orden, id_fijo, nombre_limpio))
-                    else:
-                        # Si no existe, usar nombre directamente
-                        cursor.execute(f"""
-                            UPDATE {tabla_linea} 
-                            SET orden_en_linea = ?, id_fijo = ?
-                            WHERE nombre = ?
-                        """, (orden, id_fijo, nombre))
-                    
-                    filas_afectadas = cursor.rowcount
-                    if filas_afectadas > 0:
-                        total_actualizadas += 1
-                        print(f"✅ {nombre} (ID: {id_fijo}) - Orden: {orden}")
-                    else:
-                        total_errores += 1
-                        print(f"❌ No se encontró: {nombre} (ID: {id_fijo})")
-                        
-                except Exception as e:
-                    total_errores += 1
-                    print(f"❌ Error actualizando {nombre}: {str(e)}")
-            
-            # Commit después de cada línea
-            conn.commit()
+            for linea in sorted(carga['linea'].unique()):
+                print(f"\n🔄 Procesando Línea {linea}...")
+                
+                # Buscar la tabla correspondiente
+                tabla_linea = f"linea_{linea}"
+                if tabla_linea not in tablas_lineas:
+                    print(f"⚠️ Tabla {tabla_linea} no encontrada, saltando...")
+                    continue
+                
+                # Verificar estructura de la tabla
+                cursor.execute(f"PRAGMA table_info({tabla_linea})")
+                columnas_tabla = [row[1] for row in cursor.fetchall()]
+                
+                print(f"📋 Columnas en {tabla_linea}: {columnas_tabla}")
+                
+                # Si existe la columna nombre_limpio, usarla; si no, el nombre directamente
+                columna = 'nombre_limpio' if 'nombre_limpio' in columnas_tabla else 'nombre'
+                
+                no_encontradas = cursor.execute(f"""
+                    SELECT c.nombre, c.id_fijo FROM temp.carga_datos_clave c
+                    WHERE c.linea = ? AND NOT EXISTS (
+                        SELECT 1 FROM {tabla_linea} t WHERE t.{columna} = c.{columna}
+                    )
+                """, (linea,)).fetchall()
+                
+                cursor.execute(f"""
+                    UPDATE {tabla_linea}
+                    SET orden_en_linea = c.orden, id_fijo = c.id_fijo
+                    FROM temp.carga_datos_clave c
+                    WHERE c.linea = ? AND {tabla_linea}.{columna} = c.{columna}
+                """, (linea,))
+                
+                actualizadas = int((carga['linea'] == linea).sum()) - len(no_encontradas)
+                total_actualizadas += actualizadas
+                total_errores += len(no_encontradas)
+                print(f"✅ {actualizadas} estaciones actualizadas")
+                for nombre, id_fijo in no_encontradas:
+                    print(f"❌ No se encontró: {nombre} (ID: {id_fijo})")
         
         # Estadísticas finales
         print(f"\n{'='*60}")
@@ -139,8 +131,7 @@ def actualizar_base_datos_desde_csv():
             print(f"✅ L3 - {nombre}: orden {orden}, ID {id_fijo}")
         
     except Exception as e:
-        print(f"❌ Error general: {str(e)}")
-        conn.rollback()
+        print(f"❌ Error general (no se ha aplicado ningún cambio): {str(e)}")
     finally:
         conn.close()
 
@@ -9,10 +9,83 @@ Incluye estaciones, accesos, accesibilidad y coordenadas exactas.
 """
 
 import pandas as pd
+import numpy as np
 import sqlite3
 import os
+import sys
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from carga_masiva import transaccion, preparar_temporal, fusionar, reemplazar, indices_suspendidos
+
+INDICES = [
+    "CREATE INDEX IF NOT EXISTS idx_estaciones_tipo ON estaciones_gtfs(tipo_registro)",
+    "CREATE INDEX IF NOT EXISTS idx_estaciones_linea ON estaciones_gtfs(linea)",
+    "CREATE INDEX IF NOT EXISTS idx_estaciones_accesible ON estaciones_gtfs(accesible_silla_ruedas)",
+    "CREATE INDEX IF NOT EXISTS idx_accesos_estacion ON accesos_estaciones(estacion_principal)",
+    "CREATE INDEX IF NOT EXISTS idx_accesos_tipo ON accesos_estaciones(tipo_acceso)",
+    "CREATE INDEX IF NOT EXISTS idx_accesos_coords ON accesos_estaciones(latitud, longitud)"
+]
+
+def preparar_estaciones(df_gtfs, ahora):
+    """Filas de estaciones_gtfs a partir de stops.txt"""
+    stop_id = df_gtfs['stop_id'].astype(str)
+    
+    # Tipo de registro y línea según el prefijo del stop_id
+    tipos = [
+        (stop_id.str.startswith('par_4_'), 'parada', '4'),
+        (stop_id.str.startswith('acc_4_'), 'acceso', '4'),
+        (stop_id.str.startswith('est_90_'), 'intercambio', 'intercambio')
+    ]
+    tipo_registro = np.select([m for m, _, _ in tipos], [t for _, t, _ in tipos], default='otro')
+    linea = np.select([m for m, _, _ in tipos], [l for _, _, l in tipos], default='desconocida')
+    
+    df = pd.DataFrame({
+        'stop_id': stop_id,
+        'stop_code': df_gtfs['stop_code'],
+        'stop_name': df_gtfs['stop_name'],
+        'stop_desc': df_gtfs['stop_desc'],
+        'stop_lat': df_gtfs['stop_lat'],
+        'stop_lon': df_gtfs['stop_lon'],
+        'zone_id': df_gtfs['zone_id'],
+        'stop_url': df_gtfs['stop_url'],
+        'location_type': df_gtfs['location_type'],
+        'parent_station': df_gtfs['parent_station'],
+        'stop_timezone': df_gtfs['stop_timezone'],
+        'wheelchair_boarding': df_gtfs['wheelchair_boarding'],
+        # 0 = No accesible, 2 = Accesible
+        'accesible_silla_ruedas': (df_gtfs['wheelchair_boarding'] == 2).astype(int),
+        'tipo_registro': tipo_registro,
+        'linea': linea,
+        'ultima_actualizacion': ahora
+    })
+    # stop_id repetidos: se queda la última fila, como hacía la carga fila a fila
+    return df.drop_duplicates('stop_id', keep='last')
+
+def preparar_accesos(df_estaciones, ahora):
+    """Filas de accesos_estaciones: las estaciones GTFS de tipo acceso"""
+    df = df_estaciones[df_estaciones['tipo_registro'] == 'acceso']
+    nombre = df['stop_name'].fillna('').str.lower()
+    
+    # Tipo de acceso según el nombre
+    tipo_acceso = np.select(
+        [nombre.str.contains('ascensor'), nombre.str.contains('intercambiador'), nombre.str.contains('rampa')],
+        ['ascensor', 'intercambiador', 'rampa'],
+        default='vestíbulo'
+    )
+    return pd.DataFrame({
+        'stop_id': df['stop_id'],
+        'estacion_principal': df['parent_station'].fillna('Desconocida'),
+        'nombre_acceso': df['stop_name'],
+        'direccion': df['stop_desc'],
+        'latitud': df['stop_lat'],
+        'longitud': df['stop_lon'],
+        'tipo_acceso': tipo_acceso,
+        'accesible_silla_ruedas': df['accesible_silla_ruedas'],
+        'linea': df['linea'],
+        'ultima_actualizacion': ahora
+    })
+
 def actualizar_bd_desde_gtfs():
     """Actualiza la base de datos con información del archivo GTFS"""
     
@@ -90,102 +163,36 @@ def actualizar_bd_desde_gtfs():
         print(f"❌ Error creando tabla accesos: {e}")
         return False
     
-    # 5. Procesar datos GTFS
+    # 5. Procesar datos GTFS (columnas derivadas calculadas por columnas, no fila a fila)
     print("\n🔄 Procesando datos GTFS...")
+    ahora = datetime.now().isoformat()
+    df_estaciones = preparar_estaciones(df_gtfs, ahora)
+    df_accesos = preparar_accesos(df_estaciones, ahora)
     
-    # Limpiar tablas existentes
-    cursor.execute("DELETE FROM estaciones_gtfs")
-    cursor.execute("DELETE FROM accesos_estaciones")
-    
-    estaciones_procesadas = 0
-    accesos_procesados = 0
-    
-    for _, row in df_gtfs.iterrows():
-        stop_id = row['stop_id']
-        stop_name = row['stop_name']
-        stop_desc = row['stop_desc']
-        stop_lat = row['stop_lat']
-        stop_lon = row['stop_lon']
-        location_type = row['location_type']
-        wheelchair_boarding = row['wheelchair_boarding']
-        
-        # Convertir wheelchair_boarding a booleano
-        # 0 = No accesible, 2 = Accesible
-        accesible_silla_ruedas = (wheelchair_boarding == 2)
-        
-        # Determinar tipo de registro y línea
-        if stop_id.startswith('par_4_'):
-            tipo_registro = 'parada'
-            linea = '4'
-        elif stop_id.startswith('acc_4_'):
-            tipo_registro = 'acceso'
-            linea = '4'
-        elif stop_id.startswith('est_90_'):
-            tipo_registro = 'intercambio'
-            linea = 'intercambio'
-        else:
-            tipo_registro = 'otro'
-            linea = 'desconocida'
-        
-        # Insertar en estaciones_gtfs
-        cursor.execute("""
-            INSERT INTO estaciones_gtfs (
-                stop_id, stop_code, stop_name, stop_desc, stop_lat, stop_lon,
-                zone_id, stop_url, location_type, parent_station, stop_timezone,
-                wheelchair_boarding, accesible_silla_ruedas, tipo_registro, linea, ultima_actualizacion
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            stop_id, row['stop_code'], stop_name, stop_desc, stop_lat, stop_lon,
-            row['zone_id'], row['stop_url'], location_type, row['parent_station'],
-            row['stop_timezone'], wheelchair_boarding, accesible_silla_ruedas, tipo_registro, linea,
-            datetime.now().isoformat()
-        ))
-        estaciones_procesadas += 1
-        
-        # Si es un acceso, insertar también en tabla de accesos
-        if tipo_registro == 'acceso':
-            # Extraer nombre de la estación principal del parent_station
-            estacion_principal = row['parent_station'] if row['parent_station'] else 'Desconocida'
-            
-            # Determinar tipo de acceso basado en el nombre
-            nombre_acceso = stop_name
-            if 'ascensor' in nombre_acceso.lower():
-                tipo_acceso = 'ascensor'
-            elif 'intercambiador' in nombre_acceso.lower():
-                tipo_acceso = 'intercambiador'
-            elif 'rampa' in nombre_acceso.lower():
-                tipo_acceso = 'rampa'
-            else:
-                tipo_acceso = 'vestíbulo'
-            
-            cursor.execute("""
-                INSERT INTO accesos_estaciones (
-                    stop_id, estacion_principal, nombre_acceso, direccion,
-                    latitud, longitud, tipo_acceso, accesible_silla_ruedas,
-                    linea, ultima_actualizacion
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                stop_id, estacion_principal, nombre_acceso, stop_desc,
-                stop_lat, stop_lon, tipo_acceso, accesible_silla_ruedas,
-                linea, datetime.now().isoformat()
-            ))
-            accesos_procesados += 1
-    
-    # 6. Crear índices para mejorar rendimiento
-    print("\n🔍 Creando índices...")
+    # 6. Carga masiva en una sola transacción: temporales + upsert, índices al final
     try:
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_estaciones_tipo ON estaciones_gtfs(tipo_registro)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_estaciones_linea ON estaciones_gtfs(linea)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_estaciones_accesible ON estaciones_gtfs(accesible_silla_ruedas)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_accesos_estacion ON accesos_estaciones(estacion_principal)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_accesos_tipo ON accesos_estaciones(tipo_acceso)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_accesos_coords ON accesos_estaciones(latitud, longitud)")
+        with transaccion(conn):
+            preparar_temporal(conn, 'carga_estaciones_gtfs', df_estaciones)
+            preparar_temporal(conn, 'carga_accesos_estaciones', df_accesos)
+            with indices_suspendidos(conn, ['estaciones_gtfs', 'accesos_estaciones']):
+                # accesos referencia a estaciones: se vacía antes de fusionar estaciones
+                conn.execute("DELETE FROM accesos_estaciones")
+                estaciones_procesadas, estaciones_borradas = fusionar(
+                    conn, 'carga_estaciones_gtfs', 'estaciones_gtfs',
+                    list(df_estaciones.columns), ['stop_id'], borrar_ausentes=True)
+                accesos_procesados = reemplazar(
+                    conn, 'carga_accesos_estaciones', 'accesos_estaciones', list(df_accesos.columns))
+            # Índices que aún no existieran
+            for sql in INDICES:
+                conn.execute(sql)
+        print(f"✅ Carga completada ({estaciones_borradas} estaciones que ya no están en el GTFS eliminadas)")
         print("✅ Índices creados")
     except Exception as e:
-        print(f"⚠️ Error creando índices: {e}")
+        print(f"❌ Error cargando datos GTFS (no se ha aplicado ningún cambio): {e}")
+        conn.close()
+        return False
     
-    # 7. Commit y cerrar conexión
-    conn.commit()
+    # 7. Cerrar conexión
     conn.close()
     
     # 8. Mostrar estadísticas
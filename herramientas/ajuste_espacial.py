@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AJUSTE DE PUNTOS A POLILÍNEAS (SNAPPING)
+========================================
+
+Proyecta puntos (estaciones) sobre el segmento más cercano de un conjunto
+de polilíneas (tramos de cada línea), en metros y en una sola llamada:
+- Las coordenadas lon/lat se pasan a metros con una proyección
+  equirrectangular local (centrada en los datos; error < 0,1 % en el
+  ámbito de la Comunidad de Madrid)
+- Todos los segmentos de todos los tramos se indexan en una rejilla
+  uniforme (arrays ordenados por celda, sin dependencias externas)
+- Cada punto solo se compara con los segmentos de las celdas a menos de
+  `max_distancia` metros; la proyección punto-segmento se hace con numpy
+  para todos los pares candidatos a la vez
+
+Para cada punto devuelve la línea más cercana, la distancia en metros, el
+tramo y el punto kilométrico (metros desde el inicio del tramo).
+"""
+
+import math
+
+import numpy as np
+
+RADIO_TIERRA = 6371008.8  # metros
+
+
+class ProyeccionLocal:
+    """lon/lat (grados) -> x/y (metros) alrededor de un origen"""
+
+    def __init__(self, lon0, lat0):
+        self.lon0 = lon0
+        self.lat0 = lat0
+        self.kx = math.radians(1) * RADIO_TIERRA * math.cos(math.radians(lat0))
+        self.ky = math.radians(1) * RADIO_TIERRA
+
+    def a_metros(self, lon, lat):
+        return (np.asarray(lon, dtype=float) - self.lon0) * self.kx, (np.asarray(lat, dtype=float) - self.lat0) * self.ky
+
+
+def _expandir_rangos(inicios, cantidades):
+    """Concatena arange(inicio, inicio + cantidad) de cada rango, vectorizado"""
+    total = int(cantidades.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    desplazamientos = np.repeat(np.cumsum(cantidades) - cantidades, cantidades)
+    return np.repeat(inicios, cantidades) + (np.arange(total) - desplazamientos)
+
+
+class IndiceSegmentos:
+    """
+    Rejilla de segmentos de polilíneas. `polilineas` es una lista de
+    (etiqueta, [[lon, lat], ...]); la etiqueta suele ser la línea.
+    """
+
+    def __init__(self, polilineas, tam_celda=500.0, proyeccion=None):
+        self.tam_celda = float(tam_celda)
+        self.etiquetas = []
+        ax, ay, bx, by, tramo, pk_inicio = [], [], [], [], [], []
+
+        validas = [(etiqueta, np.asarray(coords, dtype=float)[:, :2]) for etiqueta, coords in polilineas
+                   if coords is not None and len(coords) >= 2]
+        if proyeccion is None:
+            todas = np.vstack([coords for _, coords in validas]) if validas else np.zeros((1, 2))
+            proyeccion = ProyeccionLocal(float(todas[:, 0].mean()), float(todas[:, 1].mean()))
+        self.proyeccion = proyeccion
+
+        for i, (etiqueta, coords) in enumerate(validas):
+            x, y = proyeccion.a_metros(coords[:, 0], coords[:, 1])
+            longitudes = np.hypot(np.diff(x), np.diff(y))
+            ax.append(x[:-1]); ay.append(y[:-1]); bx.append(x[1:]); by.append(y[1:])
+            tramo.append(np.full(len(longitudes), i))
+            pk_inicio.append(np.concatenate(([0.0], np.cumsum(longitudes)[:-1])))
+            self.etiquetas.append(etiqueta)
+
+        def unir(partes, dtype=float):
+            return np.concatenate(partes).astype(dtype) if partes else np.empty(0, dtype=dtype)
+
+        self.ax, self.ay, self.bx, self.by = unir(ax), unir(ay), unir(bx), unir(by)
+        self.tramo = unir(tramo, np.int64)
+        self.pk_inicio = unir(pk_inicio)
+        self._construir_rejilla()
+
+    def _celda(self, valor):
+        return np.floor(valor / self.tam_celda).astype(np.int64)
+
+    def _clave(self, cx, cy):
+        # Con celdas de >= 250 m la Tierra entera cabe en menos de 2^20 celdas por eje
+        return (cx + (1 << 20)) * (1 << 21) + (cy + (1 << 20))
+
+    def _construir_rejilla(self):
+        """Cada segmento se apunta en todas las celdas que toca su caja"""
+        cx0 = self._celda(np.minimum(self.ax, self.bx))
+        cx1 = self._celda(np.maximum(self.ax, self.bx))
+        cy0 = self._celda(np.minimum(self.ay, self.by))
+        cy1 = self._celda(np.maximum(self.ay, self.by))
+        nx, ny = cx1 - cx0 + 1, cy1 - cy0 + 1
+        cantidades = nx * ny
+
+        segmento = np.repeat(np.arange(len(self.ax)), cantidades)
+        k = _expandir_rangos(np.zeros(len(cantidades), dtype=np.int64), cantidades)
+        nx_rep = np.repeat(nx, cantidades)
+        cx = np.repeat(cx0, cantidades) + k % nx_rep
+        cy = np.repeat(cy0, cantidades) + k // nx_rep
+
+        claves = self._clave(cx, cy)
+        orden = np.argsort(claves, kind='stable')
+        self._claves = claves[orden]
+        self._segmentos = segmento[orden]
+
+    def ajustar(self, lon, lat, max_distancia=500.0):
+        """
+        Ajusta todos los puntos a la vez. Devuelve un dict de arrays, uno por
+        punto: 'tramo' (índice en `etiquetas`, -1 si no hay nada a menos de
+        `max_distancia`), 'distancia' (m), 'pk' (m desde el inicio del tramo)
+        y 'x', 'y' del punto proyectado.
+        """
+        px, py = self.proyeccion.a_metros(lon, lat)
+        px, py = np.atleast_1d(px), np.atleast_1d(py)
+        n = len(px)
+        resultado = {
+            'tramo': np.full(n, -1, dtype=np.int64),
+            'distancia': np.full(n, np.inf),
+            'pk': np.full(n, np.nan),
+            'x': np.full(n, np.nan),
+            'y': np.full(n, np.nan)
+        }
+        if n == 0 or len(self._claves) == 0:
+            return resultado
+
+        # Claves de las celdas vecinas de cada punto (puntos x vecinos)
+        radio = int(math.ceil(max_distancia / self.tam_celda))
+        desplazamiento = np.arange(-radio, radio + 1)
+        dx, dy = np.meshgrid(desplazamiento, desplazamiento)
+        cx = self._celda(px)[:, None] + dx.ravel()[None, :]
+        cy = self._celda(py)[:, None] + dy.ravel()[None, :]
+        claves = self._clave(cx, cy).ravel()
+        punto_de_clave = np.repeat(np.arange(n), dx.size)
+
+        # Pares (punto, segmento) candidatos
+        inicios = np.searchsorted(self._claves, claves, side='left')
+        finales = np.searchsorted(self._claves, claves, side='right')
+        cantidades = finales - inicios
+        posiciones = _expandir_rangos(inicios, cantidades)
+        if len(posiciones) == 0:
+            return resultado
+        punto = np.repeat(punto_de_clave, cantidades)
+        segmento = self._segmentos[posiciones]
+
+        # Proyección de cada punto sobre su segmento candidato
+        ax, ay = self.ax[segmento], self.ay[segmento]
+        vx, vy = self.bx[segmento] - ax, self.by[segmento] - ay
+        wx, wy = px[punto] - ax, py[punto] - ay
+        longitud2 = vx * vx + vy * vy
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = np.where(longitud2 > 0, (wx * vx + wy * vy) / longitud2, 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        qx, qy = ax + t * vx, ay + t * vy
+        distancia = np.hypot(px[punto] - qx, py[punto] - qy)
+
+        # El más cercano de cada punto (primero tras ordenar por punto y distancia)
+        orden = np.lexsort((distancia, punto))
+        primeros = orden[np.r_[True, punto[orden][1:] != punto[orden][:-1]]]
+        primeros = primeros[distancia[primeros] <= max_distancia]
+
+        p = punto[primeros]
+        s = segmento[primeros]
+        resultado['tramo'][p] = self.tramo[s]
+        resultado['distancia'][p] = distancia[primeros]
+        resultado['pk'][p] = self.pk_inicio[s] + t[primeros] * np.sqrt(longitud2[primeros])
+        resultado['x'][p] = qx[primeros]
+        resultado['y'][p] = qy[primeros]
+        return resultado
+
+
+def ajustar_a_lineas(puntos, tramos_por_linea, max_distancia=500.0):
+    """
+    puntos: [[lon, lat], ...]; tramos_por_linea: {linea: [[[lon, lat], ...], ...]}.
+    Devuelve una lista (una entrada por punto) de None o
+    {'linea', 'tramo', 'distancia_m', 'pk_m'}; 'tramo' es el índice del
+    tramo dentro de su línea.
+    """
+    polilineas, indice_en_linea = [], []
+    for linea, tramos in tramos_por_linea.items():
+        for i, coords in enumerate(tramos):
+            polilineas.append((linea, coords))
+            indice_en_linea.append(i)
+    if not puntos:
+        return []
+
+    indice = IndiceSegmentos(polilineas, tam_celda=max(max_distancia, 250.0))
+    # IndiceSegmentos descarta los tramos de menos de 2 puntos: se recupera su índice original
+    validos = [i for i, (_, coords) in enumerate(polilineas) if coords is not None and len(coords) >= 2]
+    coords = np.asarray(puntos, dtype=float)
+    resultado = indice.ajustar(coords[:, 0], coords[:, 1], max_distancia)
+
+    ajustes = []
+    for tramo, distancia, pk in zip(resultado['tramo'], resultado['distancia'], resultado['pk']):
+        if tramo < 0:
+            ajustes.append(None)
+            continue
+        original = validos[tramo]
+        ajustes.append({
+            'linea': polilineas[original][0],
+            'tramo': indice_en_linea[original],
+            'distancia_m': round(float(distancia), 1),
+            'pk_m': round(float(pk), 1)
+        })
+    return ajustes
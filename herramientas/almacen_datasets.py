@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ALMACÉN VERSIONADO DE DATASETS
+==============================
+
+Sustituye a las copias manuales `*.json.backup_vN` de static/data:
+- Cada versión de un dataset se guarda una sola vez, con su hash como
+  nombre (db/almacen_datos/objetos/ab/abcd....json). Dos versiones iguales
+  ocupan un único objeto, y un objeto no se modifica nunca
+- db/almacen_datos/manifiesto.json apunta a la versión activa de cada
+  dataset y guarda su historial. Activar una versión es copiarla a
+  static/data/<nombre> (escritura_atomica) y reescribir ese puntero
+- Volver atrás es solo activar una versión ya guardada
+- La versión activa vive en static/data: su objeto puede faltar (en el
+  repositorio solo están los del historial) y se guarda en el almacén
+  justo antes de que otra versión la sustituya
+- DatasetsActivos (lo usa app.py) sirve el JSON de static/data y lo
+  recarga en cuanto cambia el archivo, lo escriba el almacén o cualquier
+  generador, sin reiniciar el servidor
+
+construir_datos publica aquí las salidas de cada paso al construirlo.
+
+Uso:
+    python herramientas/almacen_datasets.py lista [dataset]
+    python herramientas/almacen_datasets.py publicar static/data/x.json
+    python herramientas/almacen_datasets.py activar x.json <hash o prefijo>
+    python herramientas/almacen_datasets.py revertir x.json
+    python herramientas/almacen_datasets.py importar-copias    # migra los .backup_vN
+    python herramientas/almacen_datasets.py limpiar [--conservar N]
+"""
+
+import os
+import re
+import glob
+import json
+import shutil
+import hashlib
+import argparse
+import threading
+import time
+from datetime import datetime
+
+from escritura_atomica import archivo_atomico, escribir_json_atomico
+
+DIRECTORIO_ALMACEN = 'db/almacen_datos'
+DIRECTORIO_DATOS = 'static/data'
+
+
+def hash_archivo(ruta):
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+class AlmacenDatasets:
+    """Objetos por hash + manifiesto con el puntero a la versión activa"""
+
+    def __init__(self, directorio=DIRECTORIO_ALMACEN, datos=DIRECTORIO_DATOS):
+        self.directorio = directorio
+        self.datos = datos
+        self.ruta_manifiesto = os.path.join(directorio, 'manifiesto.json')
+
+    # --- Manifiesto ---
+
+    def manifiesto(self):
+        try:
+            with open(self.ruta_manifiesto, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'version': 1, 'datasets': {}}
+
+    def _guardar_manifiesto(self, manifiesto):
+        manifiesto['datasets'] = dict(sorted(manifiesto['datasets'].items()))
+        escribir_json_atomico(self.ruta_manifiesto, manifiesto)
+
+    def ruta_objeto(self, sha, nombre):
+        extension = os.path.splitext(nombre)[1]
+        return os.path.join(self.directorio, 'objetos', sha[:2], f'{sha}{extension}')
+
+    def actual(self, nombre, manifiesto=None):
+        """Entrada del historial activa de un dataset, o None"""
+        dataset = (manifiesto or self.manifiesto())['datasets'].get(nombre)
+        if not dataset:
+            return None
+        return next((v for v in dataset['historial'] if v['sha256'] == dataset['actual']), None)
+
+    # --- Escritura ---
+
+    def guardar_objeto(self, ruta, nombre):
+        """Copia `ruta` al almacén bajo su hash (si no estaba ya); devuelve el hash"""
+        sha = hash_archivo(ruta)
+        destino = self.ruta_objeto(sha, nombre)
+        if not os.path.exists(destino):
+            with open(ruta, 'rb') as origen, archivo_atomico(destino, 'wb') as f:
+                shutil.copyfileobj(origen, f, 1 << 20)
+        return sha
+
+    def publicar(self, ruta, nombre=None, origen=None, activar=True):
+        """
+        Guarda el contenido de `ruta` como versión de `nombre` (por defecto el
+        nombre del archivo) y, si `activar`, la deja como actual. Devuelve el hash.
+        """
+        nombre = nombre or os.path.basename(ruta)
+        sha = self.guardar_objeto(ruta, nombre)
+        manifiesto = self.manifiesto()
+        dataset = manifiesto['datasets'].setdefault(nombre, {'actual': None, 'historial': []})
+        if not any(v['sha256'] == sha for v in dataset['historial']):
+            dataset['historial'].append({
+                'sha256': sha,
+                'tamano': os.path.getsize(ruta),
+                'fecha': datetime.now().isoformat(timespec='seconds'),
+                'origen': origen,
+            })
+        if activar and dataset['actual'] != sha:
+            self._activar(manifiesto, nombre, sha)
+        elif dataset['actual'] is None:
+            dataset['actual'] = sha
+        self._guardar_manifiesto(manifiesto)
+        return sha
+
+    def activar(self, nombre, sha):
+        """Apunta `nombre` a una versión guardada (hash completo o prefijo único)"""
+        manifiesto = self.manifiesto()
+        dataset = manifiesto['datasets'].get(nombre)
+        if not dataset:
+            raise KeyError(f'dataset desconocido: {nombre}')
+        candidatos = [v['sha256'] for v in dataset['historial'] if v['sha256'].startswith(sha)]
+        if len(candidatos) != 1:
+            raise KeyError(f'{nombre}: {len(candidatos)} versiones empiezan por {sha!r}')
+        self._activar(manifiesto, nombre, candidatos[0])
+        self._guardar_manifiesto(manifiesto)
+        return candidatos[0]
+
+    def revertir(self, nombre):
+        """Activa la versión anterior a la actual en el historial"""
+        manifiesto = self.manifiesto()
+        dataset = manifiesto['datasets'].get(nombre)
+        if not dataset:
+            raise KeyError(f'dataset desconocido: {nombre}')
+        versiones = [v['sha256'] for v in dataset['historial']]
+        posicion = versiones.index(dataset['actual'])
+        if posicion == 0:
+            raise ValueError(f'{nombre}: no hay versión anterior a {dataset["actual"][:12]}')
+        return self.activar(nombre, versiones[posicion - 1])
+
+    def _activar(self, manifiesto, nombre, sha):
+        """Copia pública primero, puntero después; la versión sustituida se guarda antes"""
+        publica = os.path.join(self.datos, nombre)
+        sha_publica = hash_archivo(publica) if os.path.exists(publica) else None
+        if sha_publica != sha:
+            objeto = self.ruta_objeto(sha, nombre)
+            if not os.path.exists(objeto):
+                raise FileNotFoundError(f'falta el objeto {objeto}')
+            conocidas = {v['sha256'] for v in manifiesto['datasets'][nombre]['historial']}
+            if sha_publica in conocidas:
+                self.guardar_objeto(publica, nombre)
+            with open(objeto, 'rb') as origen, archivo_atomico(publica, 'wb') as f:
+                shutil.copyfileobj(origen, f, 1 << 20)
+        manifiesto['datasets'][nombre]['actual'] = sha
+
+    # --- Mantenimiento ---
+
+    def importar_copias(self, borrar=True):
+        """
+        Migra las copias `<nombre>.backup[_vN]` de static/data al historial
+        (en orden de versión, antes de la actual) y las borra.
+        """
+        copias = {}
+        for ruta in glob.glob(os.path.join(self.datos, '*.backup*')):
+            nombre, _, sufijo = os.path.basename(ruta).partition('.backup')
+            numero = re.fullmatch(r'(?:_v(\d+))?', sufijo)
+            if numero is not None:
+                copias.setdefault(nombre, []).append((int(numero.group(1) or 1), ruta))
+
+        migradas = []
+        for nombre, rutas in sorted(copias.items()):
+            for _, ruta in sorted(rutas):
+                self.publicar(ruta, nombre, origen=os.path.basename(ruta), activar=False)
+                migradas.append(ruta)
+            actual = os.path.join(self.datos, nombre)
+            if os.path.exists(actual):
+                self.publicar(actual, nombre, origen='copia de trabajo')
+        if borrar:
+            for ruta in migradas:
+                os.remove(ruta)
+        return migradas
+
+    def limpiar(self, conservar=None):
+        """
+        Borra los objetos que ya no referencia el manifiesto. Con `conservar`,
+        recorta antes el historial de cada dataset a sus N últimas versiones
+        (la activa siempre se queda).
+        """
+        manifiesto = self.manifiesto()
+        if conservar is not None:
+            for dataset in manifiesto['datasets'].values():
+                recientes = dataset['historial'][-conservar:] if conservar > 0 else []
+                dataset['historial'] = [v for v in dataset['historial']
+                                        if v in recientes or v['sha256'] == dataset['actual']]
+            self._guardar_manifiesto(manifiesto)
+
+        vivos = {self.ruta_objeto(v['sha256'], nombre)
+                 for nombre, dataset in manifiesto['datasets'].items() for v in dataset['historial']}
+        borrados = 0
+        for ruta in glob.glob(os.path.join(self.directorio, 'objetos', '*', '*')):
+            if ruta not in vivos:
+                os.remove(ruta)
+                borrados += 1
+        return borrados
+
+
+class DatasetsActivos:
+    """
+    JSON de los datasets activos en memoria para el servidor web. Se sirven
+    de static/data, que el almacén y los generadores escriben con
+    escritura_atomica (nunca se lee a medio escribir); cada `intervalo`
+    segundos como mucho se mira el mtime del archivo y, si cambió, se relee.
+    Si falta la copia de static/data se lee el objeto de la versión activa.
+    El JSON devuelto se comparte entre peticiones: no debe modificarse.
+    """
+
+    def __init__(self, almacen=None, intervalo=2.0):
+        self.almacen = almacen or AlmacenDatasets()
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._cache = {}            # nombre -> (firma, datos)
+        self._hashes = {}           # nombre -> (firma, sha256)
+        self._comprobado = {}       # nombre -> (instante, ruta, firma)
+
+    def _origen(self, nombre):
+        """(ruta, firma) de lo que hay que servir para `nombre`"""
+        ahora = time.monotonic()
+        comprobado = self._comprobado.get(nombre)
+        if comprobado and ahora - comprobado[0] < self.intervalo:
+            return comprobado[1:]
+        ruta = os.path.join(self.almacen.datos, nombre)
+        try:
+            info = os.stat(ruta)
+            firma = (info.st_mtime_ns, info.st_size, info.st_ino)
+        except FileNotFoundError:
+            version = self.almacen.actual(nombre)
+            if version is None:
+                raise
+            ruta = self.almacen.ruta_objeto(version['sha256'], nombre)
+            firma = version['sha256']
+        self._comprobado[nombre] = (ahora, ruta, firma)
+        return ruta, firma
+
+    def cargar(self, nombre):
+        """JSON de la versión activa de `nombre` (p. ej. 'metro_con_capas.json')"""
+        with self._lock:
+            ruta, firma = self._origen(nombre)
+            guardado = self._cache.get(nombre)
+            if guardado and guardado[0] == firma:
+                return guardado[1]
+
+        with open(ruta, 'r', encoding='utf-8') as f:
+            datos = json.load(f)
+        with self._lock:
+            self._cache[nombre] = (firma, datos)
+        return datos
+
+    def version(self, nombre):
+        """Hash del contenido que se está sirviendo de `nombre`"""
+        with self._lock:
+            ruta, firma = self._origen(nombre)
+            guardado = self._hashes.get(nombre)
+            if guardado and guardado[0] == firma:
+                return guardado[1]
+        sha = firma if isinstance(firma, str) else hash_archivo(ruta)
+        with self._lock:
+            self._hashes[nombre] = (firma, sha)
+        return sha
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Almacén versionado de datasets de static/data')
+    sub = parser.add_subparsers(dest='orden', required=True)
+    lista = sub.add_parser('lista', help='Datasets y versiones')
+    lista.add_argument('dataset', nargs='?')
+    publicar = sub.add_parser('publicar', help='Guarda un archivo como nueva versión activa')
+    publicar.add_argument('rutas', nargs='+')
+    activar = sub.add_parser('activar', help='Activa una versión guardada')
+    activar.add_argument('dataset')
+    activar.add_argument('sha256')
+    revertir = sub.add_parser('revertir', help='Vuelve a la versión anterior')
+    revertir.add_argument('dataset')
+    sub.add_parser('importar-copias', help='Migra los .backup_vN de static/data')
+    limpiar = sub.add_parser('limpiar', help='Borra objetos sin referencias')
+    limpiar.add_argument('--conservar', type=int, default=None, help='Versiones a conservar por dataset')
+    args = parser.parse_args()
+
+    almacen = AlmacenDatasets()
+    if args.orden == 'lista':
+        for nombre, dataset in almacen.manifiesto()['datasets'].items():
+            if args.dataset and nombre != args.dataset:
+                continue
+            print(f"📦 {nombre}")
+            for version in dataset['historial']:
+                marca = '👉' if version['sha256'] == dataset['actual'] else '  '
+                print(f"   {marca} {version['sha256'][:12]}  {version['tamano']:>10,} B  "
+                      f"{version['fecha']}  {version.get('origen') or ''}")
+    elif args.orden == 'publicar':
+        for ruta in args.rutas:
+            sha = almacen.publicar(ruta, origen='manual')
+            print(f"✅ {os.path.basename(ruta)} -> {sha[:12]}")
+    elif args.orden == 'activar':
+        print(f"✅ {args.dataset} -> {almacen.activar(args.dataset, args.sha256)[:12]}")
+    elif args.orden == 'revertir':
+        print(f"⏪ {args.dataset} -> {almacen.revertir(args.dataset)[:12]}")
+    elif args.orden == 'importar-copias':
+        migradas = almacen.importar_copias()
+        print(f"✅ {len(migradas)} copias migradas al almacén: {', '.join(os.path.basename(r) for r in migradas) or '-'}")
+    elif args.orden == 'limpiar':
+        print(f"🧹 {almacen.limpiar(args.conservar)} objetos borrados")
+
+
+if __name__ == '__main__':
+    main()
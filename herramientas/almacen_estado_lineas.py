@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ALMACÉN EN MEMORIA DEL ESTADO DE LÍNEAS
+=======================================
+
+Estado global de las líneas mantenido en segundo plano para que
+`/api/lines/global-status` responda desde memoria sin lanzar un scraper
+por petición:
+- Al arrancar se siembra con el último estado guardado (estado_lineas_actual)
+- Un hilo refresca con `ScraperEstadoLineas` cada `intervalo` segundos; si
+  el scraper falla se relee la BD (la puede alimentar otro proceso)
+- La versión de cada línea es el id de su último cambio guardado en el
+  histórico (estado_lineas_actual.historial_id; solo se inserta fila si el
+  estado cambia) y la global, el mayor de ellos: es la misma en todos los
+  procesos y sobrevive a reinicios. Los clientes envían `?since=<version>`
+  y reciben solo las líneas cambiadas desde entonces (o nada si están al día)
+- La frescura se informa explícitamente: instante del último barrido
+  correcto (estado_lineas_actual.comprobado, que se anota en cada barrido
+  aunque nada cambie), edad en segundos, fuente y si está dentro del plazo
+  de barrido esperado (`plazo`, que en la web es el del trabajador y no el
+  de relectura de la BD)
+- La respuesta lleva las líneas bajo 'lineas', separadas de los metadatos
+"""
+
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+DB_PATH = 'db/estaciones_fijas_v2.db'
+
+INTERVALO_REFRESCO = 120  # segundos
+LINEAS_API = ['1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12', 'R']
+
+# Identificadores del scraper/BD -> identificadores de la API
+ALIAS_LINEAS = {'Ramal': 'R'}
+
+ESTADOS_API = {
+    'circulación interrumpida': 'interrumpida',
+    'circulación afectada': 'afectada',
+    'atención': 'atencion'
+}
+
+logger = logging.getLogger(__name__)
+
+
+def estado_api(estado):
+    """Texto de estado del scraper -> valor corto de la API ('normal', 'interrumpida'...)"""
+    texto = (estado or '').strip().lower()
+    if not texto or 'normal' in texto:
+        return 'normal'
+    return ESTADOS_API.get(texto, 'incidencia')
+
+
+class AlmacenEstadoLineas:
+    """Estado de líneas versionado, en memoria y compartido por las peticiones"""
+
+    def __init__(self, db_path=DB_PATH, intervalo=INTERVALO_REFRESCO, plazo=None):
+        self.db_path = db_path
+        self.intervalo = intervalo
+        self.plazo = plazo or intervalo  # segundos esperados entre barridos
+        self.version = 0
+        self.lineas = {}           # id API -> {'status', 'description', 'timestamp'}
+        self.version_linea = {}    # id API -> id del histórico de su último cambio
+        self.actualizado = None    # time.time() del último barrido correcto
+        self.fuente = None
+        self.ultimo_error = None
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._parar = threading.Event()
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+
+    def actualizar(self, estados, versiones, fuente, instante=None):
+        """
+        Aplica {linea: {'status', 'description', 'timestamp'}} con la versión
+        guardada de cada línea ({linea: historial_id}). `instante`
+        (time.time()) es cuándo se obtuvieron los datos; por defecto, ahora.
+        Devuelve la versión resultante.
+        """
+        with self._lock:
+            for linea, datos in estados.items():
+                self.lineas[linea] = dict(datos)
+                self.version_linea[linea] = versiones.get(linea) or 0
+            self.version = max(self.version_linea.values(), default=0)
+            self.actualizado = instante or time.time()
+            self.fuente = fuente
+            self.ultimo_error = None
+            return self.version
+
+    def cargar_desde_bd(self, fuente='bd', instante=None):
+        """Siembra/refresca el estado con estado_lineas_actual"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            try:
+                filas = conn.execute(
+                    "SELECT linea, estado, descripcion, timestamp, historial_id, comprobado FROM estado_lineas_actual"
+                ).fetchall()
+            except sqlite3.OperationalError:
+                # BD aún sin la columna comprobado: solo se sabe cuándo cambió cada línea
+                filas = conn.execute(
+                    "SELECT linea, estado, descripcion, timestamp, historial_id, NULL FROM estado_lineas_actual"
+                ).fetchall()
+        finally:
+            conn.close()
+
+        estados, versiones, comprobados = {}, {}, []
+        for linea, estado, descripcion, timestamp, historial_id, comprobado in filas:
+            linea = ALIAS_LINEAS.get(linea, linea)
+            estados[linea] = {
+                'status': estado_api(estado),
+                'description': descripcion or estado or 'Circulación normal',
+                'timestamp': timestamp
+            }
+            versiones[linea] = historial_id
+            comprobados.append(comprobado or timestamp)
+        if not estados:
+            return self.version
+
+        # La frescura de lo leído de BD es la del último barrido, no la de la lectura
+        if instante is None:
+            instantes = []
+            for comprobado in comprobados:
+                try:
+                    instantes.append(datetime.fromisoformat(comprobado).timestamp())
+                except (TypeError, ValueError):
+                    pass
+            instante = max(instantes) if instantes else None
+        return self.actualizar(estados, versiones, fuente, instante)
+
+    def cargar_desde_scraper(self, scraper):
+        """
+        Refresca con un barrido de ScraperEstadoLineas. El scraper guarda los
+        cambios en BD antes de volver, así que el estado (y su versión) se
+        relee de ahí, con la frescura del barrido.
+        """
+        instante = time.time()
+        if not scraper.obtener_estado_todas_lineas():
+            raise RuntimeError("el scraper no devolvió ninguna línea")
+        return self.cargar_desde_bd('scraper', instante)
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    def frescura(self):
+        """Instante del último barrido correcto, edad y si está en plazo"""
+        with self._lock:
+            actualizado, fuente, error = self.actualizado, self.fuente, self.ultimo_error
+        edad = time.time() - actualizado if actualizado else None
+        return {
+            'actualizado': datetime.fromtimestamp(actualizado).isoformat() if actualizado else None,
+            'edad_segundos': round(edad, 1) if edad is not None else None,
+            'fresco': edad is not None and edad <= 2 * self.plazo,
+            'fuente': fuente,
+            'intervalo_segundos': self.plazo,
+            'ultimo_error': error
+        }
+
+    def respuesta(self, desde=None):
+        """
+        Cuerpo de la API: {'lineas': {id: estado}, 'version', 'delta', 'frescura'}.
+        Sin `desde` (o con una versión posterior a la actual) van todas las
+        líneas; con `desde` solo las cambiadas después. Devuelve None si el
+        cliente ya tiene la versión actual.
+        """
+        with self._lock:
+            version = self.version
+            if desde is not None and desde == version:
+                return None
+            delta = desde is not None and 0 <= desde < version
+            if delta:
+                lineas = {linea: dict(datos) for linea, datos in self.lineas.items()
+                          if self.version_linea.get(linea, 0) > desde}
+            else:
+                lineas = {linea: dict(self.lineas.get(linea) or {
+                    'status': 'desconocido', 'description': 'Sin datos', 'timestamp': None
+                }) for linea in LINEAS_API}
+
+        return {
+            'lineas': lineas,
+            'version': version,
+            'delta': delta,
+            'frescura': self.frescura()
+        }
+
+    # ------------------------------------------------------------------
+    # Refresco en segundo plano
+    # ------------------------------------------------------------------
+
+    def refrescar(self, scraper=None):
+        """Un ciclo de refresco: scraper si lo hay; si falla, la BD"""
+        if scraper is not None:
+            try:
+                return self.cargar_desde_scraper(scraper)
+            except Exception as e:
+                logger.warning(f"[ESTADO_LINEAS] Scraper no disponible, se usa la BD: {e}")
+                with self._lock:
+                    self.ultimo_error = str(e)
+        try:
+            return self.cargar_desde_bd()
+        except sqlite3.Error as e:
+            logger.error(f"[ESTADO_LINEAS] Error leyendo estado_lineas_actual: {e}")
+            with self._lock:
+                self.ultimo_error = str(e)
+            return self.version
+
+    def iniciar(self, crear_scraper=None):
+        """
+        Siembra desde la BD y arranca el hilo de refresco. `crear_scraper`
+        se llama dentro del hilo (importar el scraper cuesta requests y bs4).
+        """
+        if self._hilo is not None:
+            return self
+        try:
+            self.cargar_desde_bd()
+        except sqlite3.Error as e:
+            logger.warning(f"[ESTADO_LINEAS] Sin estado previo en BD: {e}")
+
+        def bucle():
+            scraper = None
+            if crear_scraper is not None:
+                try:
+                    scraper = crear_scraper()
+                except Exception as e:
+                    logger.warning(f"[ESTADO_LINEAS] Scraper de estado no disponible: {e}")
+            while not self._parar.is_set():
+                self.refrescar(scraper)
+                self._parar.wait(self.intervalo)
+
+        self._hilo = threading.Thread(target=bucle, name='estado-lineas', daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._parar.set()
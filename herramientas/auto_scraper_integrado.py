@@ -3,27 +3,40 @@
 """
 Auto Scraper Integrado para Metro de Madrid
 Combina auto-updater de estado de estaciones + scraper de estado de líneas
-- Cada 4 minutos: 5 estaciones aleatorias (considerando última actualización)
+- Cada pocos segundos: las estaciones más urgentes según el planificador por
+  prioridad (antigüedad, cambios recientes, incidencias en la línea y demanda),
+  sin pasar del presupuesto de peticiones por minuto
 - Si detecta cambios: ejecuta scraper completo de todas las líneas
 - Control de inicio/parada desde el menú principal
 """
 
 import time
-import schedule
 import logging
 import threading
 import sqlite3
-import random
 import json
 from datetime import datetime, timedelta
 import os
 import sys
 
+# `schedule` solo hace falta para el bucle en hilo; trabajador_scraper.py usa
+# esta clase sin él
+try:
+    import schedule
+    SCHEDULE_AVAILABLE = True
+except ImportError:
+    SCHEDULE_AVAILABLE = False
+
 # Añadir el directorio actual al path para importar módulos
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Importar el scraper de estado de líneas
 from scraper_estado_lineas import ScraperEstadoLineas
+from historial_estado import asegurar_esquema_una_vez, mantenimiento_historial
+from historial_estado import asegurar_esquema as asegurar_esquema_historial
+from persistencia_scrapers import obtener_escritor
+from motor_scraping import obtener_motor
+from planificador_prioridad import PlanificadorPrioridad
 
 # Configurar logging
 logging.basicConfig(
@@ -46,10 +59,26 @@ class AutoScraperIntegrado:
         
         # Scrapers
         self.scraper_estado = ScraperEstadoLineas()
+        self._scraper_detalles = None  # se crean al primer trabajo de estación
+        self._scraper_ninja = None
+
+        # Escritor compartido para el estado de estaciones
+        self.escritor = obtener_escritor()
+        
+        # Motor de scraping compartido (concurrencia acotada y límite por host)
+        self.motor = obtener_motor()
+        self.lock_cambios = threading.Lock()
+        self.lock_scrapers = threading.Lock()
         
         # Configuración
-        self.interval_minutes = 4
-        self.stations_per_update = 5
+        self.interval_minutes = 4  # barrido completo de líneas si hubo cambios
+        self.tick_seconds = 15
+        self.request_budget_per_minute = 20
+        self.stations_per_update = 5  # máximo por tick
+        self.history_maintenance_hours = 1
+        
+        # Cola de prioridad de estaciones con presupuesto de peticiones por minuto
+        self.planificador = PlanificadorPrioridad(presupuesto_por_minuto=self.request_budget_per_minute)
         
         # Historial de actualizaciones por estación
         self.station_update_history = {}
@@ -60,6 +89,7 @@ class AutoScraperIntegrado:
         """Obtiene estaciones con información de última actualización"""
         try:
             conn = sqlite3.connect('db/estaciones_fijas_v2.db')
+            asegurar_esquema_una_vez(conn)
             cursor = conn.cursor()
             
             # Obtener estaciones de todas las líneas con información de última actualización
@@ -70,10 +100,10 @@ class AutoScraperIntegrado:
                 tabla_nombre = f'linea_{linea}'
                 try:
                     cursor.execute(f"""
-                        SELECT id_fijo, nombre, id_modal, 
-                               (SELECT MAX(timestamp) FROM station_status WHERE station_id = id_fijo) as last_update
-                        FROM {tabla_nombre} 
-                        WHERE id_modal IS NOT NULL
+                        SELECT l.id_fijo, l.nombre, l.id_modal, a.timestamp as last_update
+                        FROM {tabla_nombre} l
+                        LEFT JOIN station_status_actual a ON a.station_id = l.id_fijo
+                        WHERE l.id_modal IS NOT NULL
                     """)
                     
                     line_stations = cursor.fetchall()
@@ -99,38 +129,23 @@ class AutoScraperIntegrado:
             return []
     
     def select_stations_for_update(self):
-        """Selecciona estaciones para actualizar basándose en la última actualización"""
-        all_stations = self.get_stations_with_update_history()
-        
-        if not all_stations:
-            logging.warning("⚠️ No se pudieron obtener estaciones")
+        """Saca de la cola de prioridad las estaciones vencidas más urgentes"""
+        self.planificador.presupuesto_por_minuto = self.request_budget_per_minute
+        try:
+            selected_stations = self.planificador.seleccionar(self.stations_per_update)
+        except Exception as e:
+            logging.error(f"❌ Error en el planificador de prioridad: {e}")
             return []
         
-        # Ordenar por última actualización (las más antiguas primero)
-        now = datetime.now()
-        for station in all_stations:
-            if station['last_update']:
-                try:
-                    last_update = datetime.fromisoformat(station['last_update'].replace('Z', '+00:00'))
-                    station['hours_since_update'] = (now - last_update).total_seconds() / 3600
-                except:
-                    station['hours_since_update'] = 999  # Muchas horas si no se puede parsear
-            else:
-                station['hours_since_update'] = 999  # Nunca actualizada
-        
-        # Ordenar por tiempo desde última actualización (más antiguas primero)
-        all_stations.sort(key=lambda x: x['hours_since_update'], reverse=True)
-        
-        # Seleccionar las primeras 5 (las más antiguas)
-        selected_stations = all_stations[:self.stations_per_update]
-        
-        logging.info(f"📊 Seleccionadas {len(selected_stations)} estaciones para actualizar:")
+        if selected_stations:
+            logging.info(f"📊 Seleccionadas {len(selected_stations)} estaciones para actualizar:")
         for station in selected_stations:
-            hours = station['hours_since_update']
-            if hours == 999:
-                logging.info(f"  - {station['nombre']} (Línea {station['linea']}): Nunca actualizada")
-            else:
-                logging.info(f"  - {station['nombre']} (Línea {station['linea']}): {hours:.1f} horas sin actualizar")
+            incidencia = " [incidencia en la línea]" if station['incidencia_linea'] else ""
+            logging.info(
+                f"  - {station['nombre']} (Línea {station['linea']}): "
+                f"{station['minutos_sin_actualizar']:.1f} min sin actualizar, "
+                f"objetivo {station['intervalo_objetivo']:.1f} min{incidencia}"
+            )
         
         return selected_stations
     
@@ -138,15 +153,14 @@ class AutoScraperIntegrado:
         """Verifica si hay cambios en los datos de la estación"""
         try:
             conn = sqlite3.connect('db/estaciones_fijas_v2.db')
+            asegurar_esquema_una_vez(conn)
             cursor = conn.cursor()
             
-            # Obtener datos actuales de la estación
+            # Obtener datos actuales de la estación (último estado materializado)
             cursor.execute("""
                 SELECT estado_ascensores, estado_escaleras, alertas, accesos, servicios
-                FROM station_status 
-                WHERE station_id = ? 
-                ORDER BY timestamp DESC 
-                LIMIT 1
+                FROM station_status_actual 
+                WHERE station_id = ?
             """, (station_data['id_estacion'],))
             
             current_data = cursor.fetchone()
@@ -192,68 +206,80 @@ class AutoScraperIntegrado:
             logging.error(f"❌ Error verificando cambios: {e}")
             return False
     
+    def actualizar_estacion(self, station_data):
+        """
+        Scraping y guardado del estado de una estación. Devuelve si hubo
+        cambios; lanza RuntimeError si el scraper no pudo obtener los datos.
+        Lo usan este auto scraper y los procesos de trabajador_scraper.
+        """
+        nombre = station_data['nombre']
+        logging.info(f"🔄 Actualizando estado: {nombre} (Línea {station_data['linea']})")
+
+        url = station_data.get('url')
+        if not url:
+            raise RuntimeError(f"La estación {nombre} no tiene URL")
+
+        # Una sola descarga (cacheada por línea) para el estado y los detalles
+        detalles, ninja = self._scrapers_estacion()
+        try:
+            soup = detalles.cache_paginas.obtener_soup(url, headers=detalles.headers, timeout=15)
+        except Exception as e:
+            raise RuntimeError(f"No se pudo descargar {url}: {e}")
+
+        datos = detalles.scrape_estacion_detallada(url, soup=soup)
+        if datos is None:
+            raise RuntimeError(f"No se pudieron extraer los datos de {nombre}")
+        ascensores, escaleras = ninja.obtener_estado_servicios(url, soup=soup)
+
+        result = {'resultados': [{
+            'estado_ascensores': ascensores,
+            'estado_escaleras': escaleras,
+            'accesos': datos['accesos'].split('; ') if datos['accesos'] else [],
+            'servicios': datos['servicios'].split('; ') if isinstance(datos['servicios'], str) else datos['servicios']
+        }]}
+
+        # Verificar si hay cambios y guardar datos de estado en la base de datos
+        has_changes = self.check_for_changes(station_data, result)
+        self.save_status_to_db(station_data, result)
+        
+        if has_changes:
+            logging.info(f"✅ Cambios detectados y guardados: {nombre}")
+        else:
+            logging.info(f"✅ Estado actualizado (sin cambios): {nombre}")
+        return has_changes
+    
+    def _scrapers_estacion(self):
+        """Scrapers de detalles y de estado, creados una vez por proceso"""
+        with self.lock_scrapers:
+            if self._scraper_detalles is None:
+                from scraper_datos_detallados import ScraperDatosDetallados
+                from scraper_ninja_tiempo_real import ScraperNinjaTiempoReal
+                self._scraper_ninja = ScraperNinjaTiempoReal()
+                self._scraper_detalles = ScraperDatosDetallados()
+        return self._scraper_detalles, self._scraper_ninja
+
     def update_station_status(self, station_data):
         """Actualiza el estado de una estación específica"""
         try:
-            nombre = station_data['nombre']
-            linea = station_data['linea']
-            id_estacion = station_data['id_estacion']
-            
-            logging.info(f"🔄 Actualizando estado: {nombre} (Línea {linea})")
-            
-            # Importar el scraper de datos detallados
-            from scraper_datos_detallados import MetroDetailedScraper
-            scraper = MetroDetailedScraper()
-            
-            # Hacer scraping de datos de estado
-            result = scraper.scrape_station_details(nombre)
-            
-            if 'error' not in result:
-                # Verificar si hay cambios
-                has_changes = self.check_for_changes(station_data, result)
-                
-                # Guardar datos de estado en la base de datos
-                self.save_status_to_db(station_data, result)
-                
-                if has_changes:
-                    self.changes_detected += 1
-                    logging.info(f"✅ Cambios detectados y guardados: {nombre}")
-                else:
-                    logging.info(f"✅ Estado actualizado (sin cambios): {nombre}")
-                
-                return True
-            else:
-                logging.warning(f"⚠️ Error actualizando {nombre}: {result['error']}")
-                return False
-                
+            has_changes = self.actualizar_estacion(station_data)
+        except RuntimeError as e:
+            logging.warning(f"⚠️ Error actualizando {station_data['nombre']}: {e}")
+            return False
         except Exception as e:
             logging.error(f"❌ Error actualizando estado de {station_data['nombre']}: {e}")
             return False
+        
+        self.planificador.registrar_resultado(station_data['id_estacion'], has_changes)
+        if has_changes:
+            with self.lock_cambios:
+                self.changes_detected += 1
+        return True
     
     def save_status_to_db(self, station_data, scraped_data):
         """Guarda los datos de estado en la base de datos"""
         try:
-            conn = sqlite3.connect('db/estaciones_fijas_v2.db')
-            cursor = conn.cursor()
-            
-            # Crear tabla de estado si no existe
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS station_status (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    station_id INTEGER,
-                    station_name TEXT,
-                    linea TEXT,
-                    estado_ascensores TEXT,
-                    estado_escaleras TEXT,
-                    alertas TEXT,
-                    funcionamiento_linea TEXT,
-                    accesos TEXT,
-                    calles TEXT,
-                    servicios TEXT,
-                    zona_tarifaria TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+            # La tabla station_status (y su historial) la crea el esquema registrado en el escritor
+            self.escritor.registrar_esquema(asegurar_esquema_historial)
             
             # Extraer datos de estado del resultado del scraping
             status_data = {
@@ -301,8 +327,8 @@ class AutoScraperIntegrado:
                     if 'zona_tarifaria' in resultado and resultado['zona_tarifaria']:
                         status_data['zona_tarifaria'] = resultado['zona_tarifaria']
             
-            # Insertar o actualizar estado
-            cursor.execute("""
+            # Encolar el nuevo estado (el escritor lo confirma en lote)
+            self.escritor.encolar("""
                 INSERT OR REPLACE INTO station_status 
                 (station_id, station_name, linea, estado_ascensores, estado_escaleras, alertas, funcionamiento_linea, accesos, calles, servicios, zona_tarifaria)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
@@ -320,9 +346,6 @@ class AutoScraperIntegrado:
                 status_data['zona_tarifaria']
             ))
             
-            conn.commit()
-            conn.close()
-            
         except Exception as e:
             logging.error(f"❌ Error guardando estado en BD: {e}")
     
@@ -335,38 +358,44 @@ class AutoScraperIntegrado:
             stations = self.select_stations_for_update()
             
             if not stations:
-                logging.warning("⚠️ No se pudieron obtener estaciones para actualizar")
+                # Nada vencido o presupuesto del minuto agotado
                 return
             
             logging.info(f"📊 Actualizando estado de {len(stations)} estaciones")
             
-            updated_count = 0
             total_stations = len(stations)
             
-            for i, station in enumerate(stations, 1):
-                logging.info(f"🔄 [{i}/{total_stations}] Actualizando estado: {station['nombre']} (Línea {station['linea']})")
-                
-                if self.update_station_status(station):
+            # Estaciones en paralelo: el motor limita la concurrencia y el ritmo por host
+            resultados = self.motor.mapear(self.update_station_status, stations)
+            
+            updated_count = 0
+            for i, (station, actualizado) in enumerate(zip(stations, resultados), 1):
+                if actualizado:
                     updated_count += 1
                     logging.info(f"✅ [{i}/{total_stations}] Estado actualizado: {station['nombre']}")
                 else:
                     logging.warning(f"⚠️ [{i}/{total_stations}] Error actualizando: {station['nombre']}")
-                
-                time.sleep(random.uniform(2, 5))  # Delay entre estaciones
+            
+            # Confirmar en BD los estados encolados en esta ronda
+            self.escritor.flush()
             
             self.stations_updated = updated_count
             self.last_update = datetime.now()
             
             logging.info(f"✅ Actualización de estaciones completada: {updated_count}/{total_stations} estaciones actualizadas")
             
-            # Si se detectaron cambios, ejecutar scraper completo de líneas
-            if self.changes_detected > 0:
-                logging.info(f"🔄 Cambios detectados ({self.changes_detected}), ejecutando scraper completo de líneas...")
-                self.run_complete_lines_update()
-            
         except Exception as e:
             logging.error(f"❌ Error en actualización automática: {e}")
     
+    def run_lines_update_if_changes(self):
+        """Barrido completo de líneas si las estaciones han detectado cambios"""
+        with self.lock_cambios:
+            cambios = self.changes_detected
+            self.changes_detected = 0
+        if cambios > 0:
+            logging.info(f"🔄 Cambios detectados ({cambios}), ejecutando scraper completo de líneas...")
+            self.run_complete_lines_update()
+    
     def run_complete_lines_update(self):
         """Ejecuta el scraper completo de todas las líneas"""
         try:
@@ -383,17 +412,35 @@ class AutoScraperIntegrado:
         except Exception as e:
             logging.error(f"❌ Error en scraper completo: {e}")
     
+    def run_history_maintenance(self):
+        """Genera los resúmenes horarios/diarios y aplica la retención del historial"""
+        try:
+            borradas = mantenimiento_historial()
+            logging.info(f"🗄️ Mantenimiento del historial completado: {borradas}")
+        except Exception as e:
+            logging.error(f"❌ Error en mantenimiento del historial: {e}")
+    
     def start_background_updates(self):
         """Inicia las actualizaciones en segundo plano"""
         if self.is_running:
             logging.warning("Auto scraper integrado ya está ejecutándose")
             return
+        if not SCHEDULE_AVAILABLE:
+            logging.error("❌ Falta el paquete 'schedule'; usa herramientas/trabajador_scraper.py")
+            return
         
         self.is_running = True
-        logging.info(f"🚇 Iniciando Auto Scraper Integrado en segundo plano... (cada {self.interval_minutes} minutos)")
+        logging.info(f"🚇 Iniciando Auto Scraper Integrado en segundo plano... "
+                     f"(presupuesto {self.request_budget_per_minute} peticiones/minuto)")
+        
+        # Tick corto: el planificador decide qué estaciones tocan y cuántas caben en el presupuesto
+        schedule.every(self.tick_seconds).seconds.do(self.run_station_updates)
+        
+        # Las líneas se repasan enteras solo si ha habido cambios en las estaciones
+        schedule.every(self.interval_minutes).minutes.do(self.run_lines_update_if_changes)
         
-        # Programar actualización cada X minutos
-        schedule.every(self.interval_minutes).minutes.do(self.run_station_updates)
+        # Resúmenes y retención del historial de estado
+        schedule.every(self.history_maintenance_hours).hours.do(self.run_history_maintenance)
         
         # Ejecutar una actualización inicial
         logging.info("🔄 Ejecutando actualización inicial...")
@@ -404,7 +451,7 @@ class AutoScraperIntegrado:
             while self.is_running:
                 try:
                     schedule.run_pending()
-                    time.sleep(30)  # Verificar cada 30 segundos
+                    time.sleep(1)
                 except Exception as e:
                     logging.error(f"❌ Error en bucle de actualización: {e}")
                     time.sleep(60)  # Esperar 1 minuto antes de reintentar
@@ -421,20 +468,24 @@ class AutoScraperIntegrado:
             return
         
         self.is_running = False
-        schedule.clear()
+        if SCHEDULE_AVAILABLE:
+            schedule.clear()
         logging.info("🛑 Auto scraper integrado detenido")
     
     def get_status(self):
         """Obtiene el estado del auto scraper"""
         return {
             'is_running': self.is_running,
-            'next_update': schedule.next_run() if schedule.jobs else None,
+            'next_update': schedule.next_run() if SCHEDULE_AVAILABLE and schedule.jobs else None,
             'last_update': self.last_update.isoformat() if self.last_update else None,
             'stations_updated': self.stations_updated,
             'lines_updated': self.lines_updated,
             'changes_detected': self.changes_detected,
             'interval_minutes': self.interval_minutes,
-            'stations_per_update': self.stations_per_update
+            'stations_per_update': self.stations_per_update,
+            'tick_seconds': self.tick_seconds,
+            'request_budget_per_minute': self.request_budget_per_minute,
+            'planificador': self.planificador.estado()
         }
 
 # Instancia global del auto scraper
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CACHÉ TIPADA DE DATOS CLAVE
+===========================
+
+Convierte datos_clave_estaciones_definitivo.csv en un DataFrame tipado
+(`linea`/`zona` categóricas, `id_modal`/`orden` enteros con nulos) y lo
+guarda en un pickle junto al CSV, indexado por el hash SHA-256 del CSV.
+Mientras el CSV no cambie, el arranque lee el pickle en milisegundos en
+lugar de volver a parsear y normalizar el texto.
+
+Además de las columnas del CSV, la caché incluye:
+- `nombre_normalizado`: minúsculas sin acentos (para búsquedas)
+- `nombre_lower`: minúsculas con acentos (búsqueda original)
+- registros ya convertidos a tipos Python (None en lugar de NaN), listos
+  para devolver en la API sin conversiones por campo.
+"""
+
+import os
+import hashlib
+import pickle
+import unicodedata
+
+import pandas as pd
+
+VERSION_CACHE = 1
+
+# Tipos de las columnas del CSV
+TIPOS_COLUMNAS = {
+    'id_fijo': 'int64',
+    'nombre': 'string',
+    'orden': 'Int64',
+    'url': 'string',
+    'id_modal': 'Int64',
+    'zona': 'category',
+    'accesible': 'string',
+    'linea': 'category',
+    'tabla_origen': 'category',
+    'zona_actualizada': 'category',
+    'correspondencias': 'string'
+}
+
+# Campos que se devuelven en las búsquedas (clave de la API -> columna)
+CAMPOS_REGISTRO = {
+    'id_fijo': 'id_fijo',
+    'nombre': 'nombre',
+    'linea': 'linea',
+    'orden': 'orden',
+    'url': 'url',
+    'id_modal': 'id_modal',
+    'zona_tarifaria': 'zona',
+    'estacion_accesible': 'accesible',
+    'tabla_origen': 'tabla_origen'
+}
+
+
+def normalizar_nombre(texto):
+    """Minúsculas y sin acentos, igual para el CSV y para las búsquedas"""
+    texto = texto.lower()
+    return unicodedata.normalize('NFD', texto).encode('ascii', errors='ignore').decode('utf-8')
+
+
+def ruta_cache(csv_path):
+    """Ruta del pickle asociado al CSV"""
+    return f'{csv_path}.cache.pkl'
+
+
+def hash_archivo(ruta):
+    """SHA-256 del contenido del archivo"""
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 16), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _valor_python(valor):
+    """Convierte escalares de pandas/numpy a tipos Python (NA -> None)"""
+    if valor is None or valor is pd.NA:
+        return None
+    try:
+        if pd.isna(valor):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if hasattr(valor, 'item'):
+        return valor.item()
+    return valor
+
+
+def construir_datos_clave(csv_path):
+    """Lee el CSV y construye el DataFrame tipado y los registros para la API"""
+    df = pd.read_csv(csv_path, encoding='utf-8', dtype={'linea': 'string', 'zona': 'string'})
+
+    for columna, tipo in TIPOS_COLUMNAS.items():
+        if columna not in df.columns:
+            continue
+        if tipo == 'Int64':
+            df[columna] = pd.to_numeric(df[columna], errors='coerce').round().astype('Int64')
+        else:
+            df[columna] = df[columna].astype(tipo)
+
+    nombres = df['nombre'].fillna('')
+    df['nombre_lower'] = nombres.str.lower()
+    df['nombre_normalizado'] = [normalizar_nombre(nombre) for nombre in nombres]
+    df = df.reset_index(drop=True)
+
+    # Registros listos para la API, en el mismo orden que las filas
+    columnas = [c for c in CAMPOS_REGISTRO.values() if c in df.columns]
+    valores = {c: [_valor_python(v) for v in df[c].tolist()] for c in columnas}
+    registros = [
+        {clave: valores[columna][i] for clave, columna in CAMPOS_REGISTRO.items() if columna in valores}
+        for i in range(len(df))
+    ]
+    return df, registros
+
+
+def cargar_datos_clave_tipados(csv_path):
+    """
+    Devuelve (df, registros, desde_cache). Usa el pickle si su hash coincide
+    con el CSV actual; si no, lo reconstruye y lo guarda (escritura atómica).
+    """
+    hash_csv = hash_archivo(csv_path)
+    cache = ruta_cache(csv_path)
+
+    if os.path.exists(cache):
+        try:
+            with open(cache, 'rb') as f:
+                contenido = pickle.load(f)
+            if contenido.get('version') == VERSION_CACHE and contenido.get('hash') == hash_csv:
+                return contenido['df'], contenido['registros'], True
+        except Exception as e:
+            print(f"⚠️ Caché de datos clave no válida, se regenera: {e}")
+
+    df, registros = construir_datos_clave(csv_path)
+
+    try:
+        temporal = f'{cache}.tmp'
+        with open(temporal, 'wb') as f:
+            pickle.dump({
+                'version': VERSION_CACHE,
+                'hash': hash_csv,
+                'df': df,
+                'registros': registros
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, cache)
+    except OSError as e:
+        print(f"⚠️ No se pudo guardar la caché de datos clave: {e}")
+
+    return df, registros, False
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    ruta = sys.argv[1] if len(sys.argv) > 1 else 'datos_clave_estaciones_definitivo.csv'
+    inicio = time.perf_counter()
+    df, registros, desde_cache = cargar_datos_clave_tipados(ruta)
+    ms = (time.perf_counter() - inicio) * 1000
+    origen = 'caché' if desde_cache else 'CSV'
+    print(f"✅ {len(registros)} estaciones cargadas desde {origen} en {ms:.1f} ms")
+    print(df.dtypes)
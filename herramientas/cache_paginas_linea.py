@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CACHÉ DE PÁGINAS DE LÍNEA
+=========================
+
+Las URLs de estación de metromadrid.es son fragmentos de la página de su
+línea (`.../linea/linea-1#estacion-153`): el servidor devuelve la misma
+página para todas las estaciones de la línea. Esta caché guarda cada
+página (y su árbol ya parseado) por URL sin fragmento durante un TTL
+corto, de modo que un barrido completo de una línea hace una sola
+descarga. Peticiones concurrentes a la misma página esperan a la primera
+en lugar de descargarla otra vez.
+
+`extraer_bloques_estaciones` devuelve el bloque HTML de cada estación
+de la página para que los scrapers extraigan todas las estaciones de un
+mismo parseo. `obtener_pagina` devuelve la misma página como
+`PaginaLinea` (lxml directo, ver extraccion_lxml.py).
+
+Los datos en tiempo real (próximos trenes) no pueden esperar al TTL de
+la caché general: `obtener_cache_tiempo_real` da otra caché con un TTL
+de pocos segundos, que solo agrupa las descargas de un mismo barrido.
+"""
+
+import re
+import time
+import threading
+from collections import OrderedDict
+from urllib.parse import urldefrag
+
+from bs4 import BeautifulSoup, FeatureNotFound
+
+from motor_scraping import obtener_motor
+from extraccion_lxml import PaginaLinea
+
+TTL_PAGINAS = 120  # segundos
+TTL_TIEMPO_REAL = 5  # segundos, para los próximos trenes
+MAX_PAGINAS = 32
+
+PATRON_ID_ESTACION = re.compile(r'^estacion-(\d+)$')
+
+def url_sin_fragmento(url):
+    """Clave de la caché: la URL sin '#estacion-N'"""
+    return urldefrag(url)[0]
+
+
+def id_estacion_de_url(url):
+    """Devuelve el id de estación del fragmento de la URL (o None)"""
+    fragmento = urldefrag(url)[1]
+    match = PATRON_ID_ESTACION.match(fragmento or '')
+    return match.group(1) if match else None
+
+
+def parsear_html(contenido):
+    """Árbol BeautifulSoup con lxml si está instalado"""
+    try:
+        return BeautifulSoup(contenido, 'lxml')
+    except FeatureNotFound:
+        return BeautifulSoup(contenido, 'html.parser')
+
+
+def extraer_bloques_estaciones(soup):
+    """Diccionario {id_estacion: bloque} con los bloques `id="estacion-N"` de la página"""
+    bloques = {}
+    for elemento in soup.find_all(id=PATRON_ID_ESTACION):
+        id_estacion = PATRON_ID_ESTACION.match(elemento.get('id')).group(1)
+        bloques.setdefault(id_estacion, elemento)
+    return bloques
+
+
+class _EntradaPagina:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.contenido = None
+        self.soup = None
+        self.pagina = None
+        self.instante = 0.0
+
+
+class CachePaginasLinea:
+    """Caché LRU con TTL de páginas de línea, compartida entre scrapers"""
+
+    def __init__(self, ttl=TTL_PAGINAS, max_paginas=MAX_PAGINAS, session=None):
+        self.ttl = ttl
+        self.max_paginas = max_paginas
+        self.session = session
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.estadisticas = {'descargas': 0, 'aciertos': 0, 'sin_cambios': 0}
+
+    def _entrada(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                entrada = _EntradaPagina()
+                self._entradas[clave] = entrada
+                while len(self._entradas) > self.max_paginas:
+                    self._entradas.popitem(last=False)
+            else:
+                self._entradas.move_to_end(clave)
+            return entrada
+
+    def _vigente(self, entrada):
+        return entrada.contenido is not None and time.time() - entrada.instante < self.ttl
+
+    def _entrada_vigente(self, url, session=None, headers=None, timeout=10):
+        """
+        Entrada de la página de la URL con su HTML al día. Descarga solo si no
+        está en caché o ha caducado; lanza requests.HTTPError si falla. Quien
+        la recibe sigue usando esta entrada aunque otro hilo la expulse o la
+        invalide mientras tanto.
+        """
+        clave = url_sin_fragmento(url)
+        entrada = self._entrada(clave)
+        with entrada.lock:
+            if self._vigente(entrada):
+                self.estadisticas['aciertos'] += 1
+                return entrada
+
+            # El motor aplica el límite por host, los reintentos y la petición condicional
+            response = obtener_motor().obtener(clave, headers=headers, session=session or self.session,
+                                               timeout=timeout)
+            response.raise_for_status()
+
+            # Si el cuerpo no cambió (304 o mismo hash) se conserva el árbol ya parseado
+            if response.sin_cambios and entrada.contenido is not None:
+                self.estadisticas['sin_cambios'] += 1
+            else:
+                entrada.contenido = response.content
+                entrada.soup = None
+                entrada.pagina = None
+            entrada.instante = time.time()
+            self.estadisticas['descargas'] += 1
+            return entrada
+
+    def obtener_contenido(self, url, session=None, headers=None, timeout=10):
+        """HTML (bytes) de la página de la URL, de la caché si sigue vigente"""
+        return self._entrada_vigente(url, session=session, headers=headers, timeout=timeout).contenido
+
+    def obtener_soup(self, url, session=None, headers=None, timeout=10):
+        """Árbol parseado de la página (se parsea una vez por descarga)"""
+        entrada = self._entrada_vigente(url, session=session, headers=headers, timeout=timeout)
+        with entrada.lock:
+            if entrada.soup is None:
+                entrada.soup = parsear_html(entrada.contenido)
+            return entrada.soup
+
+    def obtener_pagina(self, url, session=None, headers=None, timeout=10):
+        """PaginaLinea de la página (lxml, se parsea y recorre una vez por descarga)"""
+        entrada = self._entrada_vigente(url, session=session, headers=headers, timeout=timeout)
+        with entrada.lock:
+            if entrada.pagina is None:
+                entrada.pagina = PaginaLinea(entrada.contenido)
+            return entrada.pagina
+
+    def invalidar(self, url=None):
+        """Elimina una página (o todas) de la caché"""
+        with self._lock:
+            if url is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(url_sin_fragmento(url), None)
+
+
+_cache = None
+_cache_tiempo_real = None
+_cache_lock = threading.Lock()
+
+
+def obtener_cache_paginas():
+    """Caché de páginas de línea compartida por el proceso"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CachePaginasLinea()
+        return _cache
+
+
+def obtener_cache_tiempo_real():
+    """Caché de páginas de línea con TTL de segundos, para el scraper de tiempo real"""
+    global _cache_tiempo_real
+    with _cache_lock:
+        if _cache_tiempo_real is None:
+            _cache_tiempo_real = CachePaginasLinea(ttl=TTL_TIEMPO_REAL)
+        return _cache_tiempo_real
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CARGA MASIVA EN SQLITE
+======================
+
+Utilidades compartidas por los scripts que recargan tablas de
+estaciones_fijas_v2.db desde CSV/GTFS:
+- `transaccion(conn)`: todo el proceso en una sola transacción
+  (BEGIN IMMEDIATE ... COMMIT, o ROLLBACK si algo falla), de modo que
+  nunca queda una recarga aplicada a medias
+- `preparar_temporal(...)`: vuelca un DataFrame (o filas) a una tabla
+  TEMP con un único `executemany`
+- `fusionar(...)`: INSERT ... SELECT ... ON CONFLICT DO UPDATE desde la
+  temporal a la tabla destino, opcionalmente borrando lo que ya no está
+- `reemplazar(...)`: DELETE + INSERT ... SELECT para tablas sin clave natural
+- `indices_suspendidos(conn, tablas)`: quita los índices secundarios
+  durante la carga y los vuelve a crear al final
+
+Uso típico:
+
+    with transaccion(conn):
+        preparar_temporal(conn, 'carga_estaciones', df)
+        with indices_suspendidos(conn, ['estaciones_gtfs']):
+            fusionar(conn, 'carga_estaciones', 'estaciones_gtfs', list(df.columns), ['stop_id'])
+"""
+
+import contextlib
+
+
+def _identificador(nombre):
+    return '"' + str(nombre).replace('"', '""') + '"'
+
+
+def filas_de_dataframe(df):
+    """Filas de un DataFrame como tuplas de tipos Python (NaN -> None) para sqlite3"""
+    df = df.astype(object)
+    return list(df.where(df.notna(), None).itertuples(index=False, name=None))
+
+
+@contextlib.contextmanager
+def transaccion(conn):
+    """Una única transacción explícita; commit al salir, rollback si hay excepción"""
+    nivel = conn.isolation_level
+    if conn.in_transaction:
+        conn.commit()
+    conn.isolation_level = None  # BEGIN/COMMIT los controlamos nosotros
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    finally:
+        conn.isolation_level = nivel
+
+
+def preparar_temporal(conn, nombre, datos, columnas=None):
+    """
+    Crea (o vacía) la tabla TEMP `nombre` y la llena con `datos`: un
+    DataFrame, o un iterable de tuplas con `columnas`. Devuelve las filas cargadas.
+    """
+    if columnas is None:
+        columnas = [str(c) for c in datos.columns]
+    filas = filas_de_dataframe(datos) if hasattr(datos, 'itertuples') else list(datos)
+
+    conn.execute(f'DROP TABLE IF EXISTS temp.{_identificador(nombre)}')
+    conn.execute(f'CREATE TEMP TABLE {_identificador(nombre)} ({", ".join(map(_identificador, columnas))})')
+    marcadores = ', '.join('?' * len(columnas))
+    conn.executemany(f'INSERT INTO temp.{_identificador(nombre)} VALUES ({marcadores})', filas)
+    return len(filas)
+
+
+def fusionar(conn, origen, destino, columnas, clave, actualizar=None, borrar_ausentes=False):
+    """
+    Upsert de `origen` (tabla temporal) en `destino`: inserta las filas
+    nuevas y actualiza `actualizar` (por defecto, todas las columnas que no
+    son clave) en las que chocan con `clave`. Con `borrar_ausentes` se
+    eliminan de `destino` las filas cuya clave ya no está en `origen`.
+    """
+    if actualizar is None:
+        actualizar = [c for c in columnas if c not in clave]
+    lista = ', '.join(map(_identificador, columnas))
+    conflicto = ', '.join(map(_identificador, clave))
+    asignaciones = ', '.join(f'{_identificador(c)} = excluded.{_identificador(c)}' for c in actualizar)
+    accion = f'DO UPDATE SET {asignaciones}' if asignaciones else 'DO NOTHING'
+
+    borradas = 0
+    if borrar_ausentes:
+        claves = ', '.join(f'o.{_identificador(c)}' for c in clave)
+        borradas = conn.execute(
+            f'DELETE FROM {_identificador(destino)} WHERE ({conflicto}) NOT IN '
+            f'(SELECT {claves} FROM temp.{_identificador(origen)} o)'
+        ).rowcount
+    # El "WHERE true" evita la ambigüedad de ON CONFLICT tras un SELECT
+    fusionadas = conn.execute(
+        f'INSERT INTO {_identificador(destino)} ({lista}) '
+        f'SELECT {lista} FROM temp.{_identificador(origen)} WHERE true '
+        f'ON CONFLICT ({conflicto}) {accion}'
+    ).rowcount
+    return fusionadas, borradas
+
+
+def reemplazar(conn, origen, destino, columnas):
+    """Vacía `destino` y copia `origen` en él (para tablas sin clave natural)"""
+    lista = ', '.join(map(_identificador, columnas))
+    conn.execute(f'DELETE FROM {_identificador(destino)}')
+    return conn.execute(
+        f'INSERT INTO {_identificador(destino)} ({lista}) SELECT {lista} FROM temp.{_identificador(origen)}'
+    ).rowcount
+
+
+@contextlib.contextmanager
+def indices_suspendidos(conn, tablas):
+    """
+    Borra los índices secundarios de `tablas` (no los automáticos de
+    PRIMARY KEY/UNIQUE, que hacen falta para ON CONFLICT) y los recrea al
+    salir, de una pasada en lugar de mantenerlos fila a fila.
+    """
+    marcadores = ', '.join('?' * len(tablas))
+    indices = conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        f"AND tbl_name IN ({marcadores})", list(tablas)
+    ).fetchall()
+    for nombre, _ in indices:
+        conn.execute(f'DROP INDEX {_identificador(nombre)}')
+    try:
+        yield [nombre for nombre, _ in indices]
+    finally:
+        for _, sql in indices:
+            conn.execute(sql)
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+COLA DE TRABAJOS DE SCRAPING (SQLITE)
+=====================================
+
+Cola persistente en la BD compartida entre el programador, los procesos
+trabajadores (herramientas/trabajador_scraper.py) y la web, que solo lee:
+- `trabajos_scraper`: un trabajo por fila (tipo, parámetros JSON, prioridad,
+  estado pendiente/en_curso/hecho/error, intentos y resultado). Un índice
+  único parcial sobre `clave` evita encolar dos veces el mismo trabajo
+  mientras esté pendiente o en curso
+- `reclamar` toma el trabajo pendiente más prioritario con un único
+  UPDATE ... RETURNING, atómico aunque haya varios procesos
+- Los fallos se reintentan con espera exponencial hasta `max_intentos`
+- `trabajadores_scraper`: latido de cada proceso con sus métricas. Los
+  trabajos en curso de un proceso sin latido se devuelven a la cola
+
+Los instantes internos son epoch (REAL); el resumen los da en ISO.
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+from datetime import datetime
+
+DB_PATH = 'db/estaciones_fijas_v2.db'
+
+MAX_INTENTOS = 3
+ESPERA_REINTENTO = 30      # segundos, se duplica en cada intento
+LATIDO_CADUCADO = 60       # segundos sin latido para dar un proceso por muerto
+RETENCION_TERMINADOS = 24  # horas
+
+ESQUEMA_COLA = [
+    '''
+    CREATE TABLE IF NOT EXISTS trabajos_scraper (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tipo TEXT NOT NULL,
+        clave TEXT,
+        parametros TEXT,
+        prioridad REAL NOT NULL DEFAULT 0,
+        estado TEXT NOT NULL DEFAULT 'pendiente',
+        intentos INTEGER NOT NULL DEFAULT 0,
+        max_intentos INTEGER NOT NULL DEFAULT 3,
+        disponible_en REAL NOT NULL,
+        creado REAL NOT NULL,
+        reclamado_por TEXT,
+        reclamado_en REAL,
+        terminado REAL,
+        resultado TEXT,
+        error TEXT
+    )
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_trabajos_pendientes
+    ON trabajos_scraper(estado, prioridad DESC, id)
+    ''',
+    '''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_trabajos_clave_activa
+    ON trabajos_scraper(clave) WHERE clave IS NOT NULL AND estado IN ('pendiente', 'en_curso')
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_trabajos_terminados
+    ON trabajos_scraper(tipo, estado, id)
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS trabajadores_scraper (
+        trabajador TEXT PRIMARY KEY,
+        rol TEXT NOT NULL,
+        pid INTEGER,
+        host TEXT,
+        iniciado REAL,
+        latido REAL,
+        estado TEXT,
+        trabajo_actual TEXT,
+        metricas TEXT
+    )
+    '''
+]
+
+logger = logging.getLogger(__name__)
+
+
+def _iso(instante):
+    return datetime.fromtimestamp(instante).isoformat(timespec='seconds') if instante else None
+
+
+def nombre_proceso(rol):
+    """Identificador único de un proceso trabajador: rol@host:pid"""
+    return f'{rol}@{socket.gethostname()}:{os.getpid()}'
+
+
+class Trabajo:
+    """Trabajo reclamado por un proceso"""
+
+    __slots__ = ('id', 'tipo', 'parametros', 'intentos', 'max_intentos')
+
+    def __init__(self, id, tipo, parametros, intentos, max_intentos):
+        self.id = id
+        self.tipo = tipo
+        self.parametros = json.loads(parametros) if parametros else {}
+        self.intentos = intentos
+        self.max_intentos = max_intentos
+
+    def __repr__(self):
+        return f'Trabajo({self.id}, {self.tipo!r}, intento {self.intentos}/{self.max_intentos})'
+
+
+class ColaTrabajos:
+    """Cola de trabajos en SQLite; cada operación abre su propia conexión"""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._esquema_aplicado = False
+
+    def _conectar(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        if not self._esquema_aplicado:
+            conn.execute('PRAGMA journal_mode=WAL')
+            for sentencia in ESQUEMA_COLA:
+                conn.execute(sentencia)
+            conn.commit()
+            self._esquema_aplicado = True
+        return conn
+
+    # ------------------------------------------------------------------
+    # Productores
+    # ------------------------------------------------------------------
+
+    def encolar(self, tipo, parametros=None, clave=None, prioridad=0, retraso=0, max_intentos=MAX_INTENTOS):
+        """
+        Encola un trabajo. Con `clave`, no se duplica mientras otro con la
+        misma clave siga pendiente o en curso. Devuelve el id o None.
+        """
+        ahora = time.time()
+        conn = self._conectar()
+        try:
+            cursor = conn.execute('''
+                INSERT OR IGNORE INTO trabajos_scraper
+                (tipo, clave, parametros, prioridad, max_intentos, disponible_en, creado)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (tipo, clave, json.dumps(parametros or {}, ensure_ascii=False),
+                  prioridad, max_intentos, ahora + retraso, ahora))
+            conn.commit()
+            return cursor.lastrowid if cursor.rowcount else None
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Consumidores
+    # ------------------------------------------------------------------
+
+    def reclamar(self, trabajador, tipos=None):
+        """Marca como en curso el trabajo disponible más prioritario y lo devuelve (o None)"""
+        filtro_tipos = ''
+        parametros = [trabajador, time.time(), time.time()]
+        if tipos:
+            filtro_tipos = f"AND tipo IN ({','.join('?' * len(tipos))})"
+            parametros.extend(tipos)
+        conn = self._conectar()
+        try:
+            fila = conn.execute(f'''
+                UPDATE trabajos_scraper
+                SET estado = 'en_curso', reclamado_por = ?, reclamado_en = ?, intentos = intentos + 1
+                WHERE id = (
+                    SELECT id FROM trabajos_scraper
+                    WHERE estado = 'pendiente' AND disponible_en <= ? {filtro_tipos}
+                    ORDER BY prioridad DESC, id
+                    LIMIT 1
+                )
+                RETURNING id, tipo, parametros, intentos, max_intentos
+            ''', parametros).fetchone()
+            conn.commit()
+            return Trabajo(*fila) if fila else None
+        finally:
+            conn.close()
+
+    def completar(self, id_trabajo, resultado=None):
+        conn = self._conectar()
+        try:
+            conn.execute('''
+                UPDATE trabajos_scraper
+                SET estado = 'hecho', terminado = ?, resultado = ?, error = NULL
+                WHERE id = ?
+            ''', (time.time(), json.dumps(resultado, ensure_ascii=False, default=str), id_trabajo))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def fallar(self, trabajo, error):
+        """Reintenta más tarde (espera exponencial) o lo deja en error si se agotaron los intentos"""
+        ahora = time.time()
+        reintentar = trabajo.intentos < trabajo.max_intentos
+        conn = self._conectar()
+        try:
+            conn.execute('''
+                UPDATE trabajos_scraper
+                SET estado = ?, error = ?, disponible_en = ?, terminado = ?, reclamado_por = NULL
+                WHERE id = ?
+            ''', ('pendiente' if reintentar else 'error', str(error)[:500],
+                  ahora + ESPERA_REINTENTO * 2 ** (trabajo.intentos - 1),
+                  None if reintentar else ahora, trabajo.id))
+            conn.commit()
+        finally:
+            conn.close()
+        return reintentar
+
+    def terminados_desde(self, desde_id, tipo):
+        """[(id, parametros, resultado)] de los trabajos hechos de un tipo con id > desde_id"""
+        conn = self._conectar()
+        try:
+            filas = conn.execute('''
+                SELECT id, parametros, resultado FROM trabajos_scraper
+                WHERE tipo = ? AND estado = 'hecho' AND id > ?
+                ORDER BY id
+            ''', (tipo, desde_id)).fetchall()
+        finally:
+            conn.close()
+        return [(id_trabajo, json.loads(parametros or '{}'), json.loads(resultado or 'null'))
+                for id_trabajo, parametros, resultado in filas]
+
+    # ------------------------------------------------------------------
+    # Latidos y mantenimiento
+    # ------------------------------------------------------------------
+
+    def latido(self, trabajador, rol, estado='activo', trabajo_actual=None, metricas=None, iniciado=None):
+        conn = self._conectar()
+        try:
+            conn.execute('''
+                INSERT INTO trabajadores_scraper
+                (trabajador, rol, pid, host, iniciado, latido, estado, trabajo_actual, metricas)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(trabajador) DO UPDATE SET
+                    latido = excluded.latido,
+                    estado = excluded.estado,
+                    trabajo_actual = excluded.trabajo_actual,
+                    metricas = excluded.metricas
+            ''', (trabajador, rol, os.getpid(), socket.gethostname(), iniciado or time.time(), time.time(),
+                  estado, trabajo_actual, json.dumps(metricas or {}, ensure_ascii=False, default=str)))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def recuperar_huerfanos(self, caducado=LATIDO_CADUCADO):
+        """Devuelve a la cola los trabajos en curso de procesos sin latido reciente"""
+        conn = self._conectar()
+        try:
+            ahora = time.time()
+            cursor = conn.execute('''
+                UPDATE trabajos_scraper
+                SET estado = CASE WHEN intentos < max_intentos THEN 'pendiente' ELSE 'error' END,
+                    terminado = CASE WHEN intentos < max_intentos THEN NULL ELSE ? END,
+                    error = 'trabajador sin latido', reclamado_por = NULL
+                WHERE estado = 'en_curso' AND reclamado_por NOT IN (
+                    SELECT trabajador FROM trabajadores_scraper WHERE latido >= ? AND estado != 'detenido'
+                )
+            ''', (ahora, ahora - caducado))
+            conn.commit()
+            if cursor.rowcount:
+                logger.warning(f"[COLA] {cursor.rowcount} trabajos huérfanos devueltos a la cola")
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def purgar(self, horas=RETENCION_TERMINADOS):
+        """Borra los trabajos terminados hace más de `horas` y los latidos viejos"""
+        limite = time.time() - horas * 3600
+        conn = self._conectar()
+        try:
+            borrados = conn.execute(
+                "DELETE FROM trabajos_scraper WHERE estado IN ('hecho', 'error') AND terminado < ?", (limite,)
+            ).rowcount
+            conn.execute("DELETE FROM trabajadores_scraper WHERE latido < ?", (limite,))
+            conn.commit()
+            return borrados
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Lectura (la usa la web)
+    # ------------------------------------------------------------------
+
+    def resumen(self, caducado=LATIDO_CADUCADO):
+        """Tamaño de la cola, retraso, rendimiento reciente y procesos con su latido y métricas"""
+        ahora = time.time()
+        conn = self._conectar()
+        try:
+            por_estado = {}
+            for tipo, estado, total in conn.execute(
+                    "SELECT tipo, estado, COUNT(*) FROM trabajos_scraper GROUP BY tipo, estado"):
+                por_estado.setdefault(tipo, {})[estado] = total
+
+            mas_antiguo = conn.execute('''
+                SELECT MIN(disponible_en) FROM trabajos_scraper
+                WHERE estado = 'pendiente' AND disponible_en <= ?
+            ''', (ahora,)).fetchone()[0]
+
+            rendimiento = {}
+            for tipo, hechos, errores, duracion in conn.execute('''
+                SELECT tipo, SUM(estado = 'hecho'), SUM(estado = 'error'),
+                       AVG(CASE WHEN estado = 'hecho' THEN terminado - reclamado_en END)
+                FROM trabajos_scraper
+                WHERE terminado >= ?
+                GROUP BY tipo
+            ''', (ahora - 300,)):
+                rendimiento[tipo] = {
+                    'hechos_5min': hechos,
+                    'errores_5min': errores,
+                    'duracion_media_ms': round(duracion * 1000, 1) if duracion is not None else None
+                }
+
+            trabajadores = []
+            for fila in conn.execute('''
+                SELECT trabajador, rol, pid, host, iniciado, latido, estado, trabajo_actual, metricas
+                FROM trabajadores_scraper ORDER BY rol, trabajador
+            '''):
+                trabajador, rol, pid, host, iniciado, latido, estado, trabajo_actual, metricas = fila
+                trabajadores.append({
+                    'trabajador': trabajador,
+                    'rol': rol,
+                    'pid': pid,
+                    'host': host,
+                    'iniciado': _iso(iniciado),
+                    'latido': _iso(latido),
+                    'segundos_desde_latido': round(ahora - latido, 1) if latido else None,
+                    'vivo': bool(latido and ahora - latido <= caducado and estado != 'detenido'),
+                    'estado': estado,
+                    'trabajo_actual': trabajo_actual,
+                    'metricas': json.loads(metricas) if metricas else {}
+                })
+        finally:
+            conn.close()
+
+        return {
+            'cola': por_estado,
+            'retraso_segundos': round(ahora - mas_antiguo, 1) if mas_antiguo else 0,
+            'rendimiento': rendimiento,
+            'trabajadores': trabajadores,
+            'trabajadores_vivos': sum(1 for t in trabajadores if t['vivo'])
+        }
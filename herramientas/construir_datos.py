@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CONSTRUCCIÓN INCREMENTAL DE static/data
+=======================================
+
+Orquestador único de los generadores de artefactos (metro_routes.json,
+metro_con_capas.json, cercanias_con_capas.json...). Cada paso declara sus
+entradas (GTFS, KMZ, CSV, JSON de otros pasos) y sus salidas:
+- Solo se reconstruye un paso si cambió el hash de alguna entrada (o del
+  propio generador) o falta alguna salida. Los hashes se cachean por
+  tamaño y mtime, así que una construcción sin cambios tarda milisegundos
+- Las dependencias salen de las rutas: un paso espera a los que producen
+  sus entradas; los independientes corren en paralelo en procesos aparte
+- Los generadores escriben con escritura_atomica (temporal + os.replace)
+- Las salidas JSON de static/data se publican en almacen_datasets: cada
+  versión queda guardada por su hash y se puede reactivar al instante
+- Los pasos que descargan de internet (`remoto`) solo se ejecutan con
+  --remotos; si no, su salida cuenta como una entrada más
+
+El estado (hashes de entradas y salidas de cada paso) se guarda en
+db/construccion_datos.json.
+
+Uso:
+    python herramientas/construir_datos.py [paso ...] [--forzar] [--remotos] [--procesos N]
+    python herramientas/construir_datos.py --lista
+"""
+
+import io
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import importlib
+import contextlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+DIRECTORIO_HERRAMIENTAS = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(DIRECTORIO_HERRAMIENTAS)
+
+from escritura_atomica import escribir_json_atomico
+from almacen_datasets import AlmacenDatasets
+
+RUTA_ESTADO = 'db/construccion_datos.json'
+DATOS = 'static/data'
+GTFS_CERCANIAS = 'google_transit_M5'
+
+
+class Paso:
+    """Un artefacto (o grupo de artefactos) y cómo se genera"""
+
+    def __init__(self, nombre, entradas, salidas, funcion, argumentos=(), entradas_opcionales=(),
+                 salidas_opcionales=(), codigo=None, remoto=False):
+        self.nombre = nombre
+        self.entradas = list(entradas)      # rutas o patrones glob
+        self.entradas_opcionales = list(entradas_opcionales)  # cuentan en el hash si existen (p. ej. GTFS)
+        self.salidas = list(salidas)
+        self.salidas_opcionales = list(salidas_opcionales)    # pueden no generarse
+        self.modulo, self.funcion = funcion.split(':')
+        self.argumentos = tuple(argumentos)
+        self.codigo = list(codigo or [self.modulo])  # módulos cuyo cambio obliga a reconstruir
+        self.remoto = remoto
+
+    def archivos_generador(self):
+        return [os.path.relpath(os.path.join(DIRECTORIO_HERRAMIENTAS, f'{modulo}.py')) for modulo in self.codigo]
+
+    def __repr__(self):
+        return f'Paso({self.nombre!r})'
+
+
+PASOS = [
+    Paso('metro_routes',
+         entradas=['LINESM4/*.kmz'],
+         salidas=[f'{DATOS}/metro_routes.json'],
+         funcion='generar_json_desde_kmz:generar_json_desde_kmz',
+         argumentos=('LINESM4', f'{DATOS}/metro_routes.json')),
+    Paso('metro_con_capas',
+         entradas=[f'{DATOS}/metro_madrid_completo.json', f'{DATOS}/line_colors.json', f'{DATOS}/metro_routes.json'],
+         salidas=[f'{DATOS}/metro_con_capas.json'],
+         funcion='generar_metro_con_capas:generar_metro_con_capas'),
+    Paso('metro_ligero_final',
+         entradas=[f'{DATOS}/metro_ligero_completo.json', f'{DATOS}/metro_ligero_rutas_gtfs.json',
+                   f'{DATOS}/line_colors.json'],
+         salidas=[f'{DATOS}/metro_ligero_final.json'],
+         funcion='generar_metro_ligero_final:generar_metro_ligero_final'),
+    Paso('cercanias_completo',
+         entradas=[],
+         salidas=[f'{DATOS}/cercanias_completo.json'],
+         funcion='generar_cercanias_completo:main',
+         codigo=['generar_cercanias_completo', 'ajuste_espacial'],
+         remoto=True),
+    Paso('cercanias_con_capas',
+         entradas=[f'{DATOS}/cercanias_completo.json', f'{DATOS}/line_colors.json'],
+         entradas_opcionales=[f'{GTFS_CERCANIAS}/routes.txt', f'{GTFS_CERCANIAS}/stops.txt',
+                              f'{GTFS_CERCANIAS}/trips.txt', f'{GTFS_CERCANIAS}/stop_times.txt'],
+         salidas=[f'{DATOS}/cercanias_con_capas.json'],
+         salidas_opcionales=[f'{DATOS}/cercanias_rutas_gtfs.json'],
+         funcion='construir_datos:generar_cercanias_con_capas_y_rutas',
+         codigo=['generar_cercanias_con_capas', 'extraer_rutas_gtfs_cercanias']),
+    Paso('gtfs_metro',
+         entradas=['M4/*.txt'],
+         salidas=['M4/metro_madrid.db'],
+         funcion='importar_gtfs:importar_gtfs'),
+    Paso('conexiones_cercanias',
+         entradas=[f'{DATOS}/coincidentes cercanias'],
+         salidas=[f'{DATOS}/conexiones_cercanias.json'],
+         funcion='extraer_conexiones_cercanias:extraer_conexiones_cercanias'),
+]
+
+
+def generar_cercanias_con_capas_y_rutas():
+    """
+    Capas de Cercanías y, si está el GTFS, sus rutas reales. Es un solo paso
+    porque extraer_rutas_gtfs_cercanias reescribe cercanias_con_capas.json.
+    """
+    from generar_cercanias_con_capas import generar_cercanias_con_capas
+    generar_cercanias_con_capas()
+
+    if not os.path.isdir(GTFS_CERCANIAS):
+        print(f"ℹ️  Sin {GTFS_CERCANIAS}/: capas sin rutas GTFS")
+        return True
+
+    from extraer_rutas_gtfs_cercanias import extract_cercanias_routes, save_routes_to_json, update_cercanias_layers
+    rutas = extract_cercanias_routes(GTFS_CERCANIAS)
+    if not rutas:
+        return False
+    save_routes_to_json(rutas, f'{DATOS}/cercanias_rutas_gtfs.json')
+    update_cercanias_layers(rutas)
+    return True
+
+
+# ----------------------------------------------------------------------
+# Hashes con caché por (tamaño, mtime)
+# ----------------------------------------------------------------------
+
+class CacheHashes:
+    def __init__(self, previa=None):
+        self.entradas = dict(previa or {})  # ruta -> [tamaño, mtime_ns, sha256]
+
+    def hash(self, ruta):
+        """SHA-256 del archivo, o None si no existe"""
+        try:
+            info = os.stat(ruta)
+        except FileNotFoundError:
+            return None
+        guardada = self.entradas.get(ruta)
+        if guardada and guardada[0] == info.st_size and guardada[1] == info.st_mtime_ns:
+            return guardada[2]
+        sha = hashlib.sha256()
+        with open(ruta, 'rb') as f:
+            for bloque in iter(lambda: f.read(1 << 20), b''):
+                sha.update(bloque)
+        self.entradas[ruta] = [info.st_size, info.st_mtime_ns, sha.hexdigest()]
+        return sha.hexdigest()
+
+
+def expandir(patrones):
+    rutas = []
+    for patron in patrones:
+        if glob.has_magic(patron):
+            rutas.extend(sorted(glob.glob(patron)))
+        else:
+            rutas.append(patron)
+    return rutas
+
+
+# ----------------------------------------------------------------------
+# Ejecución de un paso (en un proceso del pool)
+# ----------------------------------------------------------------------
+
+def _ejecutar_paso(modulo, funcion, argumentos):
+    """Importa y llama al generador; devuelve (correcto, segundos, salida capturada)"""
+    if DIRECTORIO_HERRAMIENTAS not in sys.path:
+        sys.path.append(DIRECTORIO_HERRAMIENTAS)
+    salida = io.StringIO()
+    inicio = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(salida):
+            resultado = getattr(importlib.import_module(modulo), funcion)(*argumentos)
+        correcto = resultado is not False
+    except Exception as e:
+        salida.write(f"\n❌ {type(e).__name__}: {e}\n")
+        correcto = False
+    return correcto, time.perf_counter() - inicio, salida.getvalue()
+
+
+# ----------------------------------------------------------------------
+# Orquestador
+# ----------------------------------------------------------------------
+
+class Construccion:
+    def __init__(self, pasos=PASOS, ruta_estado=RUTA_ESTADO, procesos=None, forzar=False, remotos=False,
+                 almacen=None):
+        self.pasos = {paso.nombre: paso for paso in pasos}
+        self.almacen = almacen or AlmacenDatasets(datos=DATOS)
+        self.ruta_estado = ruta_estado
+        self.procesos = procesos or min(4, os.cpu_count() or 1)
+        self.forzar = forzar
+        self.remotos = remotos
+        estado = {}
+        if os.path.exists(ruta_estado):
+            with open(ruta_estado, 'r', encoding='utf-8') as f:
+                estado = json.load(f)
+        self.estado_pasos = estado.get('pasos', {})
+        self.hashes = CacheHashes(estado.get('hashes'))
+
+        self.productor = {}
+        for paso in pasos:
+            for salida in paso.salidas + paso.salidas_opcionales:
+                self.productor[salida] = paso.nombre
+
+    def dependencias(self, paso):
+        return {self.productor[ruta] for ruta in expandir(paso.entradas + paso.entradas_opcionales)
+                if ruta in self.productor and self.productor[ruta] != paso.nombre}
+
+    def seleccion(self, nombres):
+        """Los pasos pedidos más todo lo que necesitan"""
+        if not nombres:
+            return set(self.pasos)
+        pendientes, elegidos = list(nombres), set()
+        while pendientes:
+            nombre = pendientes.pop()
+            if nombre not in self.pasos:
+                raise KeyError(f'paso desconocido: {nombre}')
+            if nombre not in elegidos:
+                elegidos.add(nombre)
+                pendientes.extend(self.dependencias(self.pasos[nombre]))
+        return elegidos
+
+    def huella(self, paso):
+        """{ruta: hash} de las entradas existentes y del código del generador"""
+        rutas = expandir(paso.entradas + paso.entradas_opcionales) + paso.archivos_generador()
+        huella = {ruta: self.hashes.hash(ruta) for ruta in rutas}
+        return {ruta: sha for ruta, sha in huella.items() if sha is not None}
+
+    def motivo_reconstruir(self, paso, huella):
+        """None si el paso está al día; si no, por qué hay que reconstruirlo"""
+        if self.forzar:
+            return 'forzado'
+        anterior = self.estado_pasos.get(paso.nombre)
+        if anterior is None:
+            return 'nunca construido'
+        faltan = [ruta for ruta in paso.salidas if not os.path.exists(ruta)]
+        if faltan:
+            return f'falta {faltan[0]}'
+        cambiadas = sorted(set(huella.items()) ^ set(anterior.get('entradas', {}).items()))
+        if cambiadas:
+            return f'cambió {cambiadas[0][0]}'
+        return None
+
+    def guardar_estado(self):
+        escribir_json_atomico(self.ruta_estado, {'pasos': self.estado_pasos, 'hashes': self.hashes.entradas})
+
+    def ejecutar(self, nombres=None):
+        """Construye los pasos pedidos (o todos). Devuelve {paso: resultado}"""
+        elegidos = self.seleccion(nombres)
+        dependencias = {nombre: self.dependencias(self.pasos[nombre]) & elegidos for nombre in elegidos}
+        resultados = {}
+        en_curso = {}
+        inicio = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=self.procesos) as pool:
+            while len(resultados) < len(elegidos):
+                lanzados = {nombre for nombre, _ in en_curso.values()}
+                listos = [nombre for nombre in sorted(elegidos)
+                          if nombre not in resultados and nombre not in lanzados
+                          and dependencias[nombre] <= set(resultados)]
+                for nombre in listos:
+                    paso = self.pasos[nombre]
+                    if any(resultados[d] in ('error', 'omitido') for d in dependencias[nombre]):
+                        resultados[nombre] = 'omitido'
+                        print(f"⏭️  {nombre}: omitido (falló una dependencia)")
+                        continue
+                    if paso.remoto and not self.remotos:
+                        resultados[nombre] = 'al día'
+                        print(f"🌐 {nombre}: remoto, se usa la copia local (--remotos para descargar)")
+                        continue
+                    faltan = [ruta for ruta in paso.entradas
+                              if not glob.has_magic(ruta) and not os.path.exists(ruta)]
+                    if faltan:
+                        resultados[nombre] = 'error'
+                        print(f"❌ {nombre}: falta la entrada {faltan[0]}")
+                        continue
+                    huella = self.huella(paso)
+                    motivo = self.motivo_reconstruir(paso, huella)
+                    if motivo is None:
+                        resultados[nombre] = 'al día'
+                        print(f"✅ {nombre}: al día")
+                        continue
+                    print(f"🔨 {nombre}: {motivo}")
+                    futuro = pool.submit(_ejecutar_paso, paso.modulo, paso.funcion, paso.argumentos)
+                    en_curso[futuro] = (nombre, huella)
+
+                if not en_curso:
+                    if not listos and len(resultados) < len(elegidos):
+                        raise RuntimeError(f'dependencias circulares entre {sorted(set(elegidos) - set(resultados))}')
+                    continue
+                terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    nombre, huella = en_curso.pop(futuro)
+                    correcto, segundos, salida = futuro.result()
+                    resultados[nombre] = self._registrar(self.pasos[nombre], huella, correcto, segundos, salida)
+
+        self.guardar_estado()
+        total = time.perf_counter() - inicio
+        construidos = sum(1 for r in resultados.values() if r == 'construido')
+        print(f"\n📊 {construidos} construidos, {sum(1 for r in resultados.values() if r == 'al día')} al día, "
+              f"{sum(1 for r in resultados.values() if r in ('error', 'omitido'))} con errores en {total:.2f}s")
+        return resultados
+
+    def _registrar(self, paso, huella, correcto, segundos, salida):
+        faltan = [ruta for ruta in paso.salidas if not os.path.exists(ruta)]
+        if not correcto or faltan:
+            print(f"❌ {paso.nombre}: falló en {segundos:.2f}s")
+            print('\n'.join(f'   {linea}' for linea in salida.strip().splitlines()[-15:]))
+            return 'error'
+        for ruta in paso.salidas + paso.salidas_opcionales:
+            if os.path.dirname(ruta) == DATOS and ruta.endswith('.json') and os.path.exists(ruta):
+                self.almacen.publicar(ruta, origen=paso.nombre)
+        self.estado_pasos[paso.nombre] = {
+            'entradas': huella,
+            'salidas': {ruta: self.hashes.hash(ruta) for ruta in paso.salidas + paso.salidas_opcionales
+                        if os.path.exists(ruta)},
+            'construido': datetime.now().isoformat(timespec='seconds'),
+            'segundos': round(segundos, 3)
+        }
+        self.guardar_estado()  # tras cada paso: una interrupción no obliga a repetir lo ya hecho
+        print(f"✅ {paso.nombre}: construido en {segundos:.2f}s")
+        return 'construido'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Construcción incremental de static/data')
+    parser.add_argument('pasos', nargs='*', help='Pasos a construir (por defecto todos)')
+    parser.add_argument('--forzar', action='store_true', help='Reconstruir aunque esté al día')
+    parser.add_argument('--remotos', action='store_true', help='Ejecutar también los pasos que descargan de internet')
+    parser.add_argument('--procesos', type=int, default=None)
+    parser.add_argument('--lista', action='store_true', help='Mostrar los pasos y sus dependencias')
+    args = parser.parse_args()
+
+    construccion = Construccion(procesos=args.procesos, forzar=args.forzar, remotos=args.remotos)
+    if args.lista:
+        for paso in PASOS:
+            dependencias = ', '.join(sorted(construccion.dependencias(paso))) or '-'
+            anterior = construccion.estado_pasos.get(paso.nombre, {}).get('construido', 'nunca')
+            print(f"{paso.nombre:22s} depende de: {dependencias:22s} último: {anterior}"
+                  f"{'  (remoto)' if paso.remoto else ''}")
+        return
+
+    print("🏗️  CONSTRUCCIÓN DE static/data")
+    print("=" * 60)
+    resultados = construccion.ejecutar(args.pasos)
+    sys.exit(1 if any(r == 'error' for r in resultados.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
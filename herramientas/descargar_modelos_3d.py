@@ -6,25 +6,226 @@ DESCARGADOR DE MODELOS 3D DE ESTACIONES
 
 Script para descargar automáticamente los modelos 3D de estaciones
 desde http://estacions.albertguillaumes.cat/img/madrid/
+
+Las descargas van en paralelo (GestorDescargas), se reanudan con HTTP
+Range si se cortan y quedan anotadas en static/model_3D/manifiesto_descargas.json:
+una nueva ejecución solo baja lo que falta o ha cambiado en el servidor.
 """
 
 import os
-import requests
 import time
 import json
+import hashlib
+import threading
 from pathlib import Path
+from collections import Counter
+from email.utils import formatdate
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
 import pandas as pd
 from urllib.parse import urljoin, quote
 
+from escritura_atomica import escribir_json_atomico
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+
+class GestorDescargas:
+    """
+    Descargas en paralelo con un pool acotado de hilos. Cada archivo se
+    escribe en streaming a `<destino>.part` y se renombra al completarse;
+    si la descarga se corta, el .part se conserva y la siguiente ejecución
+    la reanuda con HTTP Range (If-Range con el ETag/Last-Modified original).
+    El manifiesto guarda tamaño, sha256 y validadores de cada archivo
+    completo: al repetir solo se piden los que faltan y, de los que ya
+    están, una petición condicional que devuelve 304 si no han cambiado.
+    """
+
+    ESTADOS_OK = ('descargada', 'reanudada', 'sin_cambios', 'existente')
+
+    def __init__(self, directorio, manifiesto=None, trabajadores=4, timeout=30,
+                 cabeceras=None, tam_bloque=64 * 1024, guardar_cada=20, revalidar=True):
+        self.directorio = Path(directorio)
+        self.ruta_manifiesto = Path(manifiesto) if manifiesto else self.directorio / 'manifiesto_descargas.json'
+        self.trabajadores = trabajadores
+        self.timeout = timeout
+        self.cabeceras = dict(cabeceras or {})
+        self.tam_bloque = tam_bloque
+        self.guardar_cada = guardar_cada
+        self.revalidar = revalidar
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pendientes_guardar = 0
+        self.manifiesto = self.cargar_manifiesto()
+
+    # --- Manifiesto ---
+
+    def cargar_manifiesto(self):
+        try:
+            with open(self.ruta_manifiesto, 'r', encoding='utf-8') as f:
+                return json.load(f).get('archivos', {})
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def guardar_manifiesto(self):
+        with self._lock:
+            datos = {'version': 1, 'archivos': dict(sorted(self.manifiesto.items()))}
+            self._pendientes_guardar = 0
+        escribir_json_atomico(self.ruta_manifiesto, datos)
+
+    def _registrar(self, ruta_rel, entrada):
+        with self._lock:
+            if entrada is None:
+                self.manifiesto.pop(ruta_rel, None)
+            else:
+                self.manifiesto[ruta_rel] = entrada
+            self._pendientes_guardar += 1
+            guardar = self._pendientes_guardar >= self.guardar_cada
+        if guardar:
+            self.guardar_manifiesto()
+
+    # --- Descarga de un archivo ---
+
+    def _sesion(self):
+        """requests.Session no es seguro entre hilos: una por trabajador"""
+        sesion = getattr(self._local, 'sesion', None)
+        if sesion is None:
+            sesion = self._local.sesion = requests.Session()
+            sesion.headers.update(self.cabeceras)
+        return sesion
+
+    @staticmethod
+    def _hash_archivo(ruta, hash_=None):
+        hash_ = hash_ or hashlib.sha256()
+        with open(ruta, 'rb') as f:
+            for bloque in iter(lambda: f.read(1024 * 1024), b''):
+                hash_.update(bloque)
+        return hash_
+
+    def descargar(self, url, ruta_rel, forzar=False):
+        """Descarga `url` en `directorio/ruta_rel`; devuelve el estado resultante"""
+        ruta_rel = Path(ruta_rel).as_posix()
+        destino = self.directorio / ruta_rel
+        parcial = destino.with_name(destino.name + '.part')
+        with self._lock:
+            entrada = dict(self.manifiesto.get(ruta_rel) or {})
+        if entrada.get('url') not in (None, url):
+            entrada = {}
+
+        cabeceras = {}
+        if not forzar:
+            if entrada.get('estado') == 'no_disponible':
+                return 'no_disponible'
+            completo = entrada.get('estado') == 'completa' and destino.exists() \
+                and destino.stat().st_size == entrada.get('tamano')
+            if not completo and not entrada and destino.exists():
+                # Descargado antes de existir el manifiesto: se adopta tal cual
+                # y su fecha sirve de validador para revalidarlo en adelante
+                self._registrar(ruta_rel, {
+                    'url': url, 'estado': 'completa', 'tamano': destino.stat().st_size,
+                    'sha256': self._hash_archivo(destino).hexdigest(), 'etag': None,
+                    'modificado': formatdate(destino.stat().st_mtime, usegmt=True)})
+                return 'existente'
+            if completo:
+                if not self.revalidar or not (entrada.get('etag') or entrada.get('modificado')):
+                    return 'sin_cambios'
+                if entrada.get('etag'):
+                    cabeceras['If-None-Match'] = entrada['etag']
+                if entrada.get('modificado'):
+                    cabeceras['If-Modified-Since'] = entrada['modificado']
+
+        # Reanudar un .part solo si sabemos de qué versión del recurso es
+        desplazamiento = 0
+        validador_parcial = (entrada.get('parcial') or {}).get('etag') or (entrada.get('parcial') or {}).get('modificado')
+        if parcial.exists() and validador_parcial and not cabeceras:
+            desplazamiento = parcial.stat().st_size
+            cabeceras['Range'] = f'bytes={desplazamiento}-'
+            cabeceras['If-Range'] = validador_parcial
+
+        try:
+            with self._sesion().get(url, headers=cabeceras, stream=True, timeout=self.timeout) as respuesta:
+                if respuesta.status_code == 304:
+                    return 'sin_cambios'
+                if respuesta.status_code in (404, 410):
+                    self._registrar(ruta_rel, {'url': url, 'estado': 'no_disponible'})
+                    return 'no_disponible'
+                if respuesta.status_code == 416 and desplazamiento:
+                    # El .part ya no cuadra con el recurso: se descarta y se reintenta entero
+                    parcial.unlink(missing_ok=True)
+                    return self.descargar(url, ruta_rel, forzar=True)
+                respuesta.raise_for_status()
+
+                etag = respuesta.headers.get('ETag')
+                modificado = respuesta.headers.get('Last-Modified')
+                reanudando = respuesta.status_code == 206 and desplazamiento > 0
+                if reanudando:
+                    hash_ = self._hash_archivo(parcial)
+                    total = respuesta.headers.get('Content-Range', '').rpartition('/')[2]
+                    total = int(total) if total.isdigit() else None
+                else:
+                    hash_ = hashlib.sha256()
+                    desplazamiento = 0
+                    longitud = respuesta.headers.get('Content-Length')
+                    total = int(longitud) if longitud and longitud.isdigit() \
+                        and 'Content-Encoding' not in respuesta.headers else None
+
+                with self._lock:
+                    self.manifiesto[ruta_rel] = {**entrada, 'url': url,
+                                                 'parcial': {'etag': etag, 'modificado': modificado}}
+                destino.parent.mkdir(parents=True, exist_ok=True)
+                with open(parcial, 'ab' if reanudando else 'wb') as f:
+                    for bloque in respuesta.iter_content(self.tam_bloque):
+                        f.write(bloque)
+                        hash_.update(bloque)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            tamano = parcial.stat().st_size
+            if total is not None and tamano != total:
+                raise IOError(f"descarga incompleta: {tamano} de {total} bytes")
+            os.replace(parcial, destino)
+            self._registrar(ruta_rel, {'url': url, 'estado': 'completa', 'tamano': tamano,
+                                       'sha256': hash_.hexdigest(), 'etag': etag, 'modificado': modificado})
+            return 'reanudada' if reanudando else 'descargada'
+
+        except (requests.exceptions.RequestException, OSError) as e:
+            # El .part y sus validadores se quedan para reanudar en la próxima ejecución
+            print(f"❌ Error descargando {url}: {e}")
+            return 'error'
+
+    # --- Lotes ---
+
+    def descargar_lote(self, tareas, forzar=False):
+        """
+        tareas: [(url, ruta_rel, etiqueta), ...]. Devuelve {ruta_rel: estado}
+        e imprime el progreso según terminan.
+        """
+        resultados = {}
+        total = len(tareas)
+        try:
+            with ThreadPoolExecutor(max_workers=self.trabajadores) as pool:
+                futuros = {pool.submit(self.descargar, url, ruta_rel, forzar): (ruta_rel, etiqueta)
+                           for url, ruta_rel, etiqueta in tareas}
+                for i, futuro in enumerate(as_completed(futuros), 1):
+                    ruta_rel, etiqueta = futuros[futuro]
+                    estado = resultados[ruta_rel] = futuro.result()
+                    icono = '✅' if estado in ('descargada', 'reanudada') else \
+                        '⏭️' if estado in self.ESTADOS_OK else '⚠️' if estado == 'no_disponible' else '❌'
+                    print(f"[{i}/{total}] {icono} {etiqueta}: {estado}")
+        finally:
+            self.guardar_manifiesto()
+        return resultados
+
+
 class DescargadorModelos3D:
-    def __init__(self):
+    def __init__(self, trabajadores=4, csv_estaciones='datos_clave_estaciones.csv'):
         self.base_url = "http://estacions.albertguillaumes.cat/img/madrid/"
         self.output_dir = Path("static/model_3D")
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
-        
+        self.csv_estaciones = csv_estaciones
+        self.gestor = GestorDescargas(self.output_dir, trabajadores=trabajadores,
+                                      cabeceras={'User-Agent': USER_AGENT})
+
     def normalizar_nombre_estacion(self, nombre):
         """Normaliza el nombre de la estación para el formato de URL"""
         if not nombre:
@@ -44,17 +245,9 @@ class DescargadorModelos3D:
     def obtener_estaciones_desde_csv(self):
         """Obtiene la lista de estaciones desde el CSV de datos clave"""
         try:
-            df = pd.read_csv('datos_clave_estaciones.csv')
-            estaciones = []
-            
-            for _, row in df.iterrows():
-                estacion = {
-                    'nombre': row['nombre'],
-                    'linea': row['linea'],
-                    'id_fijo': row['id_fijo']
-                }
-                estaciones.append(estacion)
-            
+            df = pd.read_csv(self.csv_estaciones, usecols=['nombre', 'linea', 'id_fijo'])
+            estaciones = df.to_dict('records')
+
             print(f"✅ Cargadas {len(estaciones)} estaciones desde CSV")
             return estaciones
             
@@ -68,59 +261,40 @@ class DescargadorModelos3D:
         linea_dir.mkdir(parents=True, exist_ok=True)
         return linea_dir
     
-    def descargar_imagen(self, url, output_path):
-        """Descarga una imagen desde la URL"""
-        try:
-            print(f"🔍 Descargando: {url}")
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
-            
-            print(f"✅ Descargada: {output_path}")
-            return True
-            
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Error descargando {url}: {e}")
-            return False
-        except Exception as e:
-            print(f"❌ Error guardando {output_path}: {e}")
-            return False
-    
+    def tarea_estacion(self, estacion):
+        """(url, ruta relativa, etiqueta) del modelo de una estación, o None si el nombre no sirve"""
+        nombre_normalizado = self.normalizar_nombre_estacion(estacion['nombre'])
+        if not nombre_normalizado:
+            print(f"⚠️ Nombre de estación inválido: {estacion['nombre']}")
+            return None
+        url = urljoin(self.base_url, f"{nombre_normalizado}.png")
+        ruta_rel = f"linea_{estacion['linea']}/{nombre_normalizado}.png"
+        return url, ruta_rel, f"{estacion['nombre']} (Línea {estacion['linea']})"
+
     def descargar_modelo_estacion(self, estacion):
         """Descarga el modelo 3D de una estación específica"""
-        nombre = estacion['nombre']
-        linea = estacion['linea']
-        
-        # Normalizar nombre para URL
-        nombre_normalizado = self.normalizar_nombre_estacion(nombre)
-        if not nombre_normalizado:
-            print(f"⚠️ Nombre de estación inválido: {nombre}")
+        tarea = self.tarea_estacion(estacion)
+        if tarea is None:
             return False
-        
-        # Crear directorio de línea
-        linea_dir = self.crear_directorios_linea(linea)
-        
-        # Construir URL y ruta de salida
-        url = urljoin(self.base_url, f"{nombre_normalizado}.png")
-        output_path = linea_dir / f"{nombre_normalizado}.png"
-        
-        # Verificar si ya existe
-        if output_path.exists():
-            print(f"⏭️ Ya existe: {output_path}")
-            return True
-        
-        # Descargar imagen
-        success = self.descargar_imagen(url, output_path)
-        
-        # Pausa para no sobrecargar el servidor
-        time.sleep(0.5)
-        
-        return success
-    
-    def descargar_todos_los_modelos(self):
-        """Descarga todos los modelos 3D disponibles"""
+        url, ruta_rel, _ = tarea
+        estado = self.gestor.descargar(url, ruta_rel)
+        self.gestor.guardar_manifiesto()
+        print(f"{'✅' if estado in GestorDescargas.ESTADOS_OK else '❌'} {ruta_rel}: {estado}")
+        return estado in GestorDescargas.ESTADOS_OK
+
+    def descargar_estaciones(self, estaciones, forzar=False):
+        """Descarga en paralelo; devuelve el recuento por estado"""
+        tareas = {}
+        for estacion in estaciones:
+            tarea = self.tarea_estacion(estacion)
+            if tarea is not None:
+                # Varias filas del CSV (correspondencias) comparten el mismo archivo
+                tareas.setdefault(tarea[1], tarea)
+        resultados = self.gestor.descargar_lote(list(tareas.values()), forzar=forzar)
+        return Counter(resultados.values())
+
+    def descargar_todos_los_modelos(self, forzar=False):
+        """Descarga los modelos 3D que falten o hayan cambiado en el servidor"""
         print("🚀 Iniciando descarga de modelos 3D...")
         print(f"📁 Directorio de salida: {self.output_dir}")
         
@@ -130,50 +304,37 @@ class DescargadorModelos3D:
             print("❌ No se pudieron obtener las estaciones")
             return
         
-        # Estadísticas
-        total_estaciones = len(estaciones)
-        descargadas = 0
-        errores = 0
-        
-        print(f"📊 Total de estaciones a procesar: {total_estaciones}")
-        
-        # Procesar cada estación
-        for i, estacion in enumerate(estaciones, 1):
-            print(f"\n[{i}/{total_estaciones}] Procesando: {estacion['nombre']} (Línea {estacion['linea']})")
-            
-            if self.descargar_modelo_estacion(estacion):
-                descargadas += 1
-            else:
-                errores += 1
+        print(f"📊 Total de estaciones a procesar: {len(estaciones)} ({self.gestor.trabajadores} descargas en paralelo)")
+        inicio = time.time()
+        recuento = self.descargar_estaciones(estaciones, forzar=forzar)
+        total = sum(recuento.values())
+        correctas = sum(recuento[estado] for estado in GestorDescargas.ESTADOS_OK)
         
         # Resumen final
-        print(f"\n🎉 Descarga completada!")
+        print(f"\n🎉 Descarga completada en {time.time() - inicio:.1f}s!")
         print(f"📊 Resumen:")
-        print(f"   - Total procesadas: {total_estaciones}")
-        print(f"   - Descargadas: {descargadas}")
-        print(f"   - Errores: {errores}")
-        print(f"   - Tasa de éxito: {(descargadas/total_estaciones)*100:.1f}%")
+        print(f"   - Total procesadas: {total}")
+        print(f"   - Descargadas: {recuento['descargada'] + recuento['reanudada']} (reanudadas: {recuento['reanudada']})")
+        print(f"   - Sin cambios: {recuento['sin_cambios'] + recuento['existente']}")
+        print(f"   - No disponibles en el servidor: {recuento['no_disponible']}")
+        print(f"   - Errores: {recuento['error']}")
+        if total:
+            print(f"   - Tasa de éxito: {(correctas/total)*100:.1f}%")
     
     def descargar_estaciones_especificas(self, nombres_estaciones):
         """Descarga modelos 3D de estaciones específicas"""
         print(f"🎯 Descargando estaciones específicas: {nombres_estaciones}")
         
-        estaciones = self.obtener_estaciones_desde_csv()
-        estaciones_filtradas = []
-        
-        for estacion in estaciones:
-            if estacion['nombre'].lower() in [n.lower() for n in nombres_estaciones]:
-                estaciones_filtradas.append(estacion)
+        buscados = {n.lower() for n in nombres_estaciones}
+        estaciones_filtradas = [estacion for estacion in self.obtener_estaciones_desde_csv()
+                                if estacion['nombre'].lower() in buscados]
         
         if not estaciones_filtradas:
             print("❌ No se encontraron las estaciones especificadas")
             return
         
         print(f"📊 Estaciones encontradas: {len(estaciones_filtradas)}")
-        
-        for estacion in estaciones_filtradas:
-            print(f"\n🎯 Descargando: {estacion['nombre']} (Línea {estacion['linea']})")
-            self.descargar_modelo_estacion(estacion)
+        self.descargar_estaciones(estaciones_filtradas, forzar=True)
     
     def verificar_modelos_existentes(self):
         """Verifica qué modelos 3D ya están descargados"""
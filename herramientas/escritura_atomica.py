@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESCRITURA ATÓMICA DE ARCHIVOS
+=============================
+
+Los generadores de static/data escriben a un temporal en el mismo
+directorio y lo renombran con `os.replace` al terminar: quien lea el
+archivo (Flask, el navegador, otro paso de la construcción) ve la versión
+anterior completa o la nueva completa, nunca una a medias. Si el
+generador falla, el temporal se borra y el archivo anterior queda intacto.
+"""
+
+import os
+import json
+import stat
+import tempfile
+import contextlib
+
+
+# mkstemp crea con permisos 0600: el resultado conserva los del archivo que
+# sustituye o, si es nuevo, queda legible para el servidor web
+PERMISOS_NUEVOS = 0o644
+
+
+def _permisos_destino(ruta):
+    try:
+        return stat.S_IMODE(os.stat(ruta).st_mode)
+    except FileNotFoundError:
+        return PERMISOS_NUEVOS
+
+
+@contextlib.contextmanager
+def archivo_atomico(ruta, modo='w', encoding='utf-8'):
+    """`with archivo_atomico(ruta) as f:` igual que `open(ruta, 'w')`, pero atómico"""
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    os.makedirs(directorio, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(prefix=f'.{os.path.basename(ruta)}.', suffix='.tmp', dir=directorio)
+    try:
+        os.chmod(temporal, _permisos_destino(ruta))
+        with os.fdopen(descriptor, modo, encoding=None if 'b' in modo else encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temporal)
+        raise
+
+
+def escribir_json_atomico(ruta, datos, indent=2):
+    with archivo_atomico(ruta) as f:
+        json.dump(datos, f, ensure_ascii=False, indent=indent)
+
+
+def escribir_bytes_atomico(ruta, contenido):
+    with archivo_atomico(ruta, 'wb') as f:
+        f.write(contenido)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+EVENTOS DE CAMBIO DE ESTADO (BUS + OUTBOX)
+==========================================
+
+Convierte las diferencias entre el estado guardado de una línea y el nuevo
+en eventos tipados (línea degradada/restablecida, estación cerrada/reabierta,
+acceso cerrado/reabierto, incidencia nueva/resuelta):
+- Se escriben en la tabla `eventos_estado` (outbox duradero) en el mismo
+  lote del escritor que el histórico y con su misma condición (que el
+  estado difiera del guardado), así que outbox e histórico coinciden y se
+  pueden reproducir desde cualquier id (`leer_eventos`)
+- Tras confirmar el lote, los que llegaron al outbox se publican en un bus
+  en memoria del proceso: los suscriptores reciben cada evento y los
+  streams SSE se despiertan al instante en lugar de releer tablas completas
+"""
+
+import json
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+
+DB_PATH = 'db/estaciones_fijas_v2.db'
+
+# Tipos de evento
+LINEA_DEGRADADA = 'linea_degradada'
+LINEA_RESTABLECIDA = 'linea_restablecida'
+ESTACION_CERRADA = 'estacion_cerrada'
+ESTACION_REABIERTA = 'estacion_reabierta'
+ACCESO_CERRADO = 'acceso_cerrado'
+ACCESO_REABIERTO = 'acceso_reabierto'
+INCIDENCIA_NUEVA = 'incidencia_nueva'
+INCIDENCIA_RESUELTA = 'incidencia_resuelta'
+
+TIPOS_EVENTO = [
+    LINEA_DEGRADADA, LINEA_RESTABLECIDA, ESTACION_CERRADA, ESTACION_REABIERTA,
+    ACCESO_CERRADO, ACCESO_REABIERTO, INCIDENCIA_NUEVA, INCIDENCIA_RESUELTA
+]
+
+LONGITUD_ENTIDAD = 120
+
+ESQUEMA_OUTBOX = [
+    '''
+    CREATE TABLE IF NOT EXISTS eventos_estado (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tipo TEXT NOT NULL,
+        linea TEXT NOT NULL,
+        entidad TEXT,
+        detalle TEXT,
+        timestamp TEXT NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_eventos_estado_linea ON eventos_estado (linea, id)'
+]
+
+INSERTAR_EVENTO = '''
+    INSERT INTO eventos_estado (tipo, linea, entidad, detalle, timestamp)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+INSERTAR_EVENTO_SI = '''
+    INSERT INTO eventos_estado (tipo, linea, entidad, detalle, timestamp)
+    SELECT ?, ?, ?, ?, ?
+    WHERE {condicion}
+'''
+
+logger = logging.getLogger(__name__)
+
+
+def asegurar_esquema_outbox(conn):
+    """Crea la tabla de eventos (también sirve como esquema del escritor)"""
+    for sentencia in ESQUEMA_OUTBOX:
+        conn.execute(sentencia)
+
+
+class EventoEstado:
+    """Cambio de estado de una línea, estación o acceso"""
+
+    def __init__(self, tipo, linea, entidad=None, detalle=None, timestamp=None, id=None):
+        self.id = id
+        self.tipo = tipo
+        self.linea = linea
+        self.entidad = entidad
+        self.detalle = detalle or {}
+        self.timestamp = timestamp or datetime.now().isoformat()
+
+    def a_dict(self):
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'linea': self.linea,
+            'entidad': self.entidad,
+            'detalle': self.detalle,
+            'timestamp': self.timestamp
+        }
+
+    def parametros_outbox(self):
+        return (self.tipo, self.linea, self.entidad,
+                json.dumps(self.detalle, ensure_ascii=False), self.timestamp)
+
+    def __repr__(self):
+        return f"EventoEstado({self.tipo}, línea {self.linea}, {self.entidad!r})"
+
+
+# ----------------------------------------------------------------------
+# Diferencias entre estados
+# ----------------------------------------------------------------------
+
+def _es_normal(estado):
+    texto = (estado or '').strip().lower()
+    return not texto or 'normal' in texto
+
+
+def _lista(valor):
+    """Acepta la lista ya decodificada o el JSON guardado en estado_lineas"""
+    if not valor:
+        return []
+    if isinstance(valor, str):
+        try:
+            valor = json.loads(valor)
+        except ValueError:
+            return []
+    return valor if isinstance(valor, list) else []
+
+
+def _por_clave(elementos, clave):
+    return {clave(e): e for e in elementos if isinstance(e, dict) and clave(e)}
+
+
+def calcular_eventos(linea, anterior, nuevo, timestamp=None):
+    """
+    Eventos entre dos estados de una línea. Cada estado es un dict con
+    'estado', 'descripcion', 'estaciones_cerradas', 'accesos_cerrados' e
+    'incidencias' (listas o su JSON). `anterior` None = sin estado previo:
+    solo se emiten las degradaciones, cierres e incidencias presentes.
+    """
+    anterior = anterior or {}
+    eventos = []
+
+    def emitir(tipo, entidad, detalle):
+        # Las incidencias se identifican por su texto completo; la entidad se acorta
+        eventos.append(EventoEstado(tipo, linea, entidad[:LONGITUD_ENTIDAD], detalle, timestamp))
+
+    estado_previo, estado_nuevo = anterior.get('estado'), nuevo.get('estado')
+    if estado_previo != estado_nuevo:
+        detalle = {'anterior': estado_previo, 'nuevo': estado_nuevo, 'descripcion': nuevo.get('descripcion')}
+        if not _es_normal(estado_nuevo):
+            emitir(LINEA_DEGRADADA, f'linea-{linea}', detalle)
+        elif estado_previo is not None and not _es_normal(estado_previo):
+            emitir(LINEA_RESTABLECIDA, f'linea-{linea}', detalle)
+
+    comparaciones = [
+        ('estaciones_cerradas', lambda e: e.get('nombre'), ESTACION_CERRADA, ESTACION_REABIERTA),
+        ('accesos_cerrados', lambda e: f"{e.get('estacion')} / {e.get('acceso')}" if e.get('acceso') else None,
+         ACCESO_CERRADO, ACCESO_REABIERTO),
+        ('incidencias', lambda e: e.get('descripcion'), INCIDENCIA_NUEVA, INCIDENCIA_RESUELTA),
+    ]
+    for campo, clave, tipo_alta, tipo_baja in comparaciones:
+        previos = _por_clave(_lista(anterior.get(campo)), clave)
+        actuales = _por_clave(_lista(nuevo.get(campo)), clave)
+        for entidad in actuales.keys() - previos.keys():
+            emitir(tipo_alta, entidad, actuales[entidad])
+        for entidad in previos.keys() - actuales.keys():
+            emitir(tipo_baja, entidad, previos[entidad])
+
+    return eventos
+
+
+# ----------------------------------------------------------------------
+# Outbox
+# ----------------------------------------------------------------------
+
+def encolar_eventos(escritor, eventos, condicion=None, parametros_condicion=()):
+    """
+    Encola los eventos en el outbox (mismo escritor que el histórico). Con
+    `condicion` (expresión SQL y sus parámetros) cada evento solo se inserta
+    si se cumple al escribirlo: la misma que decide la fila de histórico.
+    """
+    if not eventos:
+        return
+    escritor.registrar_esquema(asegurar_esquema_outbox)
+    if condicion is None:
+        escritor.encolar_muchos(INSERTAR_EVENTO, [e.parametros_outbox() for e in eventos])
+    else:
+        escritor.encolar_muchos(INSERTAR_EVENTO_SI.format(condicion=condicion),
+                                [e.parametros_outbox() + tuple(parametros_condicion) for e in eventos])
+
+
+def leer_eventos(conn, desde_id=0, limite=100, linea=None, tipos=None):
+    """Eventos del outbox con id > desde_id, en orden (reproducción)"""
+    condiciones, parametros = ['id > ?'], [desde_id]
+    if linea is not None:
+        condiciones.append('linea = ?')
+        parametros.append(linea)
+    if tipos:
+        condiciones.append(f"tipo IN ({', '.join('?' * len(tipos))})")
+        parametros.extend(tipos)
+    parametros.append(limite)
+    try:
+        filas = conn.execute(f'''
+            SELECT id, tipo, linea, entidad, detalle, timestamp
+            FROM eventos_estado
+            WHERE {' AND '.join(condiciones)}
+            ORDER BY id
+            LIMIT ?
+        ''', parametros).fetchall()
+    except sqlite3.OperationalError:
+        return []  # todavía no se ha emitido ningún evento
+    return [EventoEstado(tipo, linea_evento, entidad, json.loads(detalle or '{}'), timestamp, id=id_evento)
+            for id_evento, tipo, linea_evento, entidad, detalle, timestamp in filas]
+
+
+def ultimo_id_evento(conn):
+    try:
+        fila = conn.execute('SELECT MAX(id) FROM eventos_estado').fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return fila[0] or 0
+
+
+# ----------------------------------------------------------------------
+# Bus en memoria
+# ----------------------------------------------------------------------
+
+class BusEventos:
+    """Pub/sub en proceso: callbacks por evento y espera para los streams"""
+
+    def __init__(self):
+        self._suscriptores = {}
+        self._siguiente = 0
+        self._lock = threading.Lock()
+        self._condicion = threading.Condition()
+        self.publicados = 0
+
+    def suscribir(self, funcion, tipos=None):
+        """Registra `funcion(evento)`; devuelve el identificador para desuscribir"""
+        with self._lock:
+            self._siguiente += 1
+            self._suscriptores[self._siguiente] = (funcion, set(tipos) if tipos else None)
+            return self._siguiente
+
+    def desuscribir(self, identificador):
+        with self._lock:
+            self._suscriptores.pop(identificador, None)
+
+    def publicar(self, eventos):
+        """Entrega los eventos a los suscriptores y despierta a quien espera"""
+        if not eventos:
+            return
+        with self._lock:
+            suscriptores = list(self._suscriptores.values())
+        for evento in eventos:
+            for funcion, tipos in suscriptores:
+                if tipos is None or evento.tipo in tipos:
+                    try:
+                        funcion(evento)
+                    except Exception as e:
+                        logger.error(f"[EVENTOS] Error en suscriptor de {evento.tipo}: {e}")
+        with self._condicion:
+            self.publicados += len(eventos)
+            self._condicion.notify_all()
+
+    def esperar(self, publicados_vistos, timeout):
+        """Espera a que haya más publicaciones que `publicados_vistos` (o al timeout)"""
+        with self._condicion:
+            self._condicion.wait_for(lambda: self.publicados > publicados_vistos, timeout)
+            return self.publicados
+
+
+_bus = BusEventos()
+
+
+def obtener_bus():
+    """Bus de eventos compartido por el proceso"""
+    return _bus
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+EXTRACCIÓN CON LXML (SELECTORES PRECOMPILADOS)
+==============================================
+
+Capa de extracción para las páginas de línea de metromadrid.es sobre lxml:
+- Un solo parseo (lxml.html, sin BeautifulSoup) por descarga
+- Un solo recorrido del árbol (`PaginaLinea`) que indexa por id y clase lo
+  que usan los scrapers: bloques `estacion-N`, acordeones con el nombre de
+  cada estación, estado de la línea, incidencias, enlaces de modal y
+  contenedores de próximos trenes
+- XPath precompilados para las búsquedas dentro de cada bloque
+
+Los extractores devuelven exactamente lo mismo que los métodos equivalentes
+con BeautifulSoup de ScraperNinjaTiempoReal y que los que usaba
+ScraperEstadoLineas, conservados como referencia en
+herramientas/tests/extraccion_bs4_referencia.py (se comprueba en
+herramientas/tests/test_extraccion_lxml.py y se mide con
+herramientas/tests/benchmark_extraccion.py).
+"""
+
+import re
+
+from lxml import etree, html
+
+PARSER_UTF8 = html.HTMLParser(encoding='utf-8')
+
+PATRON_ID_ESTACION = re.compile(r'^estacion-(\d+)$')
+PATRON_MODAL = re.compile(r'/es/metro_next_trains/modal/\d+')
+PATRON_ACCESO_CERRADO = re.compile(r'De .*?:.*?Cierre|acceso.*?Cierre|vestíbulo.*?Cierre')
+PATRON_MOTIVO_ACCESO = re.compile(r'De (.*?): (.*?Cierre.*?)(?:$|\s|\.)')
+PATRON_TEXTO_PROXIMOS = re.compile(r'próximos|trenes|tiempo|espera', re.IGNORECASE)
+
+# Clases de contenedor de próximos trenes, en orden de preferencia
+CLASES_PROXIMOS = [
+    'proximos-trenes', 'tiempo-espera', 'next-trains', 'train-times',
+    'horarios', 'schedules', 'estacion-horarios', 'station-times'
+]
+SELECTOR_DATA_PROXIMOS = 'proximos-trenes'  # [data-section="proximos-trenes"]
+
+PATRONES_ACTUALIZACION = [
+    re.compile(r'última actualización[^:]*:?\s*([^.\n]+)', re.IGNORECASE),
+    re.compile(r'actualizado[^:]*:?\s*([^.\n]+)', re.IGNORECASE),
+    re.compile(r'última actualización[^:]*:?\s*hace\s+([^.\n]+)', re.IGNORECASE),
+    re.compile(r'actualizado[^:]*:?\s*hace\s+([^.\n]+)', re.IGNORECASE),
+]
+PATRONES_ACTUALIZACION_ASCENSORES = [
+    re.compile(r'última actualización:\s*([^.\n]+)', re.IGNORECASE),
+    re.compile(r'actualizado:\s*([^.\n]+)', re.IGNORECASE),
+    re.compile(r'última actualización[^:]*:?\s*hace\s+([^.\n]+)', re.IGNORECASE),
+    re.compile(r'actualizado[^:]*:?\s*hace\s+([^.\n]+)', re.IGNORECASE),
+]
+
+NS_REGEX = {'re': 'http://exslt.org/regular-expressions'}
+
+
+def _xpath_clase(clase):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {clase} ')"
+
+
+# Textos visibles (sin script/style ni comentarios), como get_text() de BeautifulSoup
+XP_TEXTOS = etree.XPath('.//text()[not(parent::script) and not(parent::style)]', smart_strings=False)
+XP_NODOS_TEXTO = etree.XPath('.//text()[not(parent::script) and not(parent::style)]')  # con getparent()
+XP_ESTADO_SERVICIOS = etree.XPath(f".//p[{_xpath_clase('text__info-estacion--tit-inc')}]")
+XP_TEXTO_ACTUALIZACION = etree.XPath(f".//p[{_xpath_clase('text_act--escaleras')}]")
+XP_ENLACE_MODAL = etree.XPath(".//a[re:test(@href, '/es/metro_next_trains/modal/[0-9]+')]",
+                              namespaces=NS_REGEX)
+XP_NOMBRE_ACORDEON = etree.XPath(f".//p[{_xpath_clase('list-line__btn__text')}]")
+XP_TITULO_ESTADO_SPAN = etree.XPath(f".//span[{_xpath_clase('tit__line-state')}]")
+XP_TITULO_ESTADO_H3 = etree.XPath(f".//h3[{_xpath_clase('tit__line-state')}]")
+XP_TITULO_INCIDENCIA = etree.XPath(f".//*[self::h3 or self::span][{_xpath_clase('tit__line-state')}]")
+XP_DESCRIPCION_ESTADO = etree.XPath(f".//p[{_xpath_clase('text__line-state')}]")
+XP_ESTACION_CERRADA = etree.XPath(f".//strong[{_xpath_clase('close--station')}]")
+XP_PARRAFO_INFO_ANCESTRO = etree.XPath(f"ancestor::p[{_xpath_clase('text__info-estacion')}][1]")
+XP_DESCRIPCION_INCIDENCIA = etree.XPath(f".//div[{_xpath_clase('text__incidencia')}]")
+XP_PARRAFOS_INCIDENCIA = etree.XPath(f".//p[{_xpath_clase('text__info-estacion')}]")
+XP_CANDIDATOS_ACCESO = etree.XPath('.//p | .//div | .//span')
+
+
+def parsear(contenido):
+    """Árbol lxml.html de una página (bytes en UTF-8 o str)"""
+    if isinstance(contenido, bytes):
+        return html.document_fromstring(contenido, parser=PARSER_UTF8)
+    return html.document_fromstring(contenido)
+
+
+def texto(elemento, strip=False):
+    """Texto visible del elemento; con strip=True, como get_text(strip=True)"""
+    if elemento is None:
+        return ''
+    partes = XP_TEXTOS(elemento)
+    if strip:
+        return ''.join(p.strip() for p in partes if p.strip())
+    return ''.join(partes)
+
+
+def _cadena_unica(elemento):
+    """Equivalente a `.string` de BeautifulSoup: el texto si es el único hijo"""
+    while True:
+        if not isinstance(elemento.tag, str):
+            return elemento.text
+        hijos = len(elemento)
+        if hijos == 0:
+            return elemento.text
+        if hijos == 1 and not elemento.text and not elemento[0].tail:
+            elemento = elemento[0]
+            continue
+        return None
+
+
+def _contenedor_ancestro(elemento, etiquetas=('div', 'section', 'article')):
+    while elemento is not None:
+        if elemento.tag in etiquetas:
+            return elemento
+        elemento = elemento.getparent()
+    return None
+
+
+def a_html(elemento):
+    return html.tostring(elemento, encoding='unicode', with_tail=False)
+
+
+class PaginaLinea:
+    """
+    Página de línea parseada una vez y recorrida una vez. Los extractores
+    trabajan sobre los índices construidos en el recorrido.
+    """
+
+    def __init__(self, contenido):
+        self.raiz = parsear(contenido) if not isinstance(contenido, etree._Element) else contenido
+        self._texto_completo = None
+
+        self.bloques = {}                # id estación -> bloque `id="estacion-N"`
+        self.acordeones = []             # <a class="list-line__btn accordion-title">
+        self.bloques_info = []           # <div class="accordion-content station-info">
+        self.estados_linea = []          # (posición, div.box__line-state)
+        self.seccion_incidencias = None  # div#line-incidents
+        self.incidencias = []            # (posición, div.box__incidencias-incidencia)
+        self.enlaces_modal = []          # <a href=".../metro_next_trains/modal/N">
+        self.proximos = {}               # clase -> primer elemento
+        self.proximos_data = None        # primer [data-section="proximos-trenes"]
+
+        for posicion, elemento in enumerate(self.raiz.iter(tag=etree.Element)):
+            etiqueta = elemento.tag
+            id_elemento = elemento.get('id')
+            if id_elemento:
+                match = PATRON_ID_ESTACION.match(id_elemento)
+                if match:
+                    self.bloques.setdefault(match.group(1), elemento)
+                elif id_elemento == 'line-incidents' and etiqueta == 'div' and self.seccion_incidencias is None:
+                    self.seccion_incidencias = elemento
+
+            if etiqueta == 'a':
+                href = elemento.get('href')
+                if href and PATRON_MODAL.search(href):
+                    self.enlaces_modal.append(elemento)
+
+            if elemento.get('data-section') == SELECTOR_DATA_PROXIMOS and self.proximos_data is None:
+                self.proximos_data = elemento
+
+            atributo_clase = elemento.get('class')
+            if not atributo_clase:
+                continue
+            clases = atributo_clase.split()
+
+            if etiqueta == 'a' and 'list-line__btn' in clases and 'accordion-title' in clases:
+                self.acordeones.append(elemento)
+            elif etiqueta == 'div':
+                if ' '.join(clases) == 'accordion-content station-info':
+                    self.bloques_info.append(elemento)
+                if 'box__line-state' in clases:
+                    self.estados_linea.append((posicion, elemento))
+                if 'box__incidencias-incidencia' in clases:
+                    self.incidencias.append((posicion, elemento))
+
+            for clase in clases:
+                if clase in CLASES_PROXIMOS and clase not in self.proximos:
+                    self.proximos[clase] = elemento
+
+    # ------------------------------------------------------------------
+    # Utilidades
+    # ------------------------------------------------------------------
+
+    @property
+    def texto_completo(self):
+        if self._texto_completo is None:
+            self._texto_completo = texto(self.raiz)
+        return self._texto_completo
+
+    def bloque(self, id_estacion):
+        return self.bloques.get(str(id_estacion))
+
+    # ------------------------------------------------------------------
+    # Extractores de ScraperNinjaTiempoReal
+    # ------------------------------------------------------------------
+
+    def proximos_trenes_html(self):
+        """HTML del contenedor de próximos trenes ('' si no hay)"""
+        for clase in CLASES_PROXIMOS[:6]:
+            if clase in self.proximos:
+                return a_html(self.proximos[clase])
+        if self.proximos_data is not None:
+            return a_html(self.proximos_data)
+        for clase in CLASES_PROXIMOS[6:]:
+            if clase in self.proximos:
+                return a_html(self.proximos[clase])
+
+        for nodo in XP_NODOS_TEXTO(self.raiz):
+            if PATRON_TEXTO_PROXIMOS.search(nodo):
+                contenedor = _contenedor_ancestro(nodo.getparent())
+                if contenedor is not None:
+                    return a_html(contenedor)
+        return ''
+
+    @staticmethod
+    def clasificar_estado_bloque(bloque):
+        """(ascensores, escaleras) a partir del bloque de una estación"""
+        parrafos = XP_ESTADO_SERVICIOS(bloque)
+        if not parrafos:
+            return "No disponible", "No disponible"
+        texto_estado = texto(parrafos[0], strip=True).lower()
+        if 'funcionan correctamente' in texto_estado:
+            return "Operativo", "Operativo"
+        elif 'alteraciones' in texto_estado or 'fuera de servicio' in texto_estado or 'avería' in texto_estado:
+            return "Fuera de servicio", "Fuera de servicio"
+        elif 'mantenimiento' in texto_estado:
+            return "En mantenimiento", "En mantenimiento"
+        return texto_estado, texto_estado
+
+    def estado_servicios(self, id_estacion):
+        bloque = self.bloque(id_estacion)
+        if bloque is None:
+            return "No disponible", "No disponible"
+        return self.clasificar_estado_bloque(bloque)
+
+    def estado_servicios_todas(self):
+        """{id_estacion: (ascensores, escaleras)} de todas las estaciones de la página"""
+        return {id_estacion: self.clasificar_estado_bloque(bloque) for id_estacion, bloque in self.bloques.items()}
+
+    def ultima_actualizacion(self):
+        for patron in PATRONES_ACTUALIZACION:
+            match = patron.search(self.texto_completo)
+            if match:
+                return match.group(1).strip()
+        return "No disponible"
+
+    def ultima_actualizacion_ascensores(self):
+        if not self.enlaces_modal:
+            return "No disponible"
+        enlace = self.enlaces_modal[1] if len(self.enlaces_modal) >= 2 else self.enlaces_modal[0]
+
+        # Hermanos siguientes del enlace hasta encontrar el texto o el siguiente modal
+        hermano = enlace.getnext()
+        while hermano is not None:
+            if isinstance(hermano.tag, str):
+                parrafos = XP_TEXTO_ACTUALIZACION(hermano)
+                if parrafos:
+                    texto_actualizacion = texto(parrafos[0], strip=True)
+                    if 'última actualización:' in texto_actualizacion.lower():
+                        return texto_actualizacion.split(':', 1)[1].strip()
+                    return texto_actualizacion
+                if XP_ENLACE_MODAL(hermano):
+                    break
+            hermano = hermano.getnext()
+
+        for patron in PATRONES_ACTUALIZACION_ASCENSORES:
+            match = patron.search(self.texto_completo)
+            if match:
+                return match.group(1).strip()
+        return "No disponible"
+
+    # ------------------------------------------------------------------
+    # Extractores de ScraperEstadoLineas
+    # ------------------------------------------------------------------
+
+    def estado_linea(self):
+        """{'estado', 'clase', 'descripcion', 'texto_original'} de la línea"""
+        estado_div = self.estados_linea[0][1] if self.estados_linea else None
+        if estado_div is None:
+            return {'estado': 'Normal', 'clase': 'state--normal', 'descripcion': ''}
+
+        titulos = XP_TITULO_ESTADO_SPAN(estado_div) or XP_TITULO_ESTADO_H3(estado_div)
+        if not titulos:
+            return {'estado': 'Normal', 'clase': 'state--normal', 'descripcion': ''}
+        titulo = titulos[0]
+
+        estado_texto = texto(titulo, strip=True)
+        estado_clase = ' '.join(titulo.get('class', '').split())
+        descripciones = XP_DESCRIPCION_ESTADO(estado_div)
+        descripcion_texto = texto(descripciones[0], strip=True) if descripciones else ''
+
+        texto_lower = estado_texto.lower()
+        if 'state--red' in estado_clase or 'circulación interrumpida' in texto_lower:
+            estado = 'Circulación interrumpida'
+        elif 'state--orange' in estado_clase or 'circulación afectada' in texto_lower:
+            estado = 'Circulación afectada'
+        elif 'state--yellow' in estado_clase or 'atención' in texto_lower:
+            estado = 'Atención'
+        elif estado_texto:
+            estado = estado_texto
+        else:
+            estado = 'Normal'
+
+        return {
+            'estado': estado,
+            'clase': estado_clase,
+            'descripcion': descripcion_texto,
+            'texto_original': estado_texto
+        }
+
+    @staticmethod
+    def accesos_cerrados_bloque(bloque):
+        """[{'nombre', 'motivo'}] de los accesos cerrados de un bloque de estación"""
+        accesos = []
+        for elemento in XP_CANDIDATOS_ACCESO(bloque):
+            cadena = _cadena_unica(elemento)
+            if cadena is None or not PATRON_ACCESO_CERRADO.search(cadena):
+                continue
+            match = PATRON_MOTIVO_ACCESO.search(texto(elemento, strip=True))
+            if match:
+                accesos.append({'nombre': match.group(1).strip(), 'motivo': match.group(2).strip()})
+        return accesos
+
+    def estaciones_cerradas(self):
+        """(estaciones_cerradas, accesos_cerrados) con el formato de ScraperEstadoLineas"""
+        id_nombre_estacion = {}
+        for enlace in self.acordeones:
+            href = enlace.get('href', '')
+            if href.startswith('#estacion-'):
+                nombres = XP_NOMBRE_ACORDEON(enlace)
+                if nombres:
+                    nombre = texto(nombres[0], strip=True)
+                    if nombre:
+                        id_nombre_estacion[href.replace('#estacion-', '')] = nombre
+
+        estaciones_cerradas = []
+        accesos_cerrados = []
+        for bloque in self.bloques_info:
+            id_est = bloque.get('id', '').replace('estacion-', '')
+            nombre_estacion = id_nombre_estacion.get(id_est)
+            if not nombre_estacion:
+                continue
+
+            cerradas = XP_ESTACION_CERRADA(bloque)
+            if cerradas and 'Estación Cerrada' in texto(cerradas[0]):
+                parrafos = XP_PARRAFO_INFO_ANCESTRO(cerradas[0])
+                motivo = ""
+                if parrafos:
+                    motivo = texto(parrafos[0], strip=True).replace('Estación Cerrada', '').strip()
+                    if not motivo:
+                        motivo = "Estación cerrada temporalmente"
+                estaciones_cerradas.append({
+                    'nombre': nombre_estacion,
+                    'id_estacion': id_est,
+                    'motivo': motivo,
+                    'tipo': 'estacion_cerrada'
+                })
+
+            for acceso in self.accesos_cerrados_bloque(bloque):
+                accesos_cerrados.append({
+                    'estacion': nombre_estacion,
+                    'acceso': acceso['nombre'],
+                    'motivo': acceso['motivo'],
+                    'tipo': 'acceso_cerrado'
+                })
+
+        return estaciones_cerradas, accesos_cerrados
+
+    def incidencias_linea(self):
+        """Incidencias de la sección #line-incidents"""
+        incidencias = []
+        if self.seccion_incidencias is None:
+            return incidencias
+
+        for posicion, elemento in self.incidencias:
+            if not any(ancestro is self.seccion_incidencias for ancestro in elemento.iterancestors()):
+                continue
+            incidencia = {'titulo': '', 'descripcion': '', 'fecha': '', 'tipo': 'General'}
+
+            descripciones = XP_DESCRIPCION_INCIDENCIA(elemento)
+            if descripciones:
+                parrafos = XP_PARRAFOS_INCIDENCIA(descripciones[0])
+                if parrafos:
+                    incidencia['descripcion'] = ' '.join(
+                        t for t in (texto(p, strip=True) for p in parrafos) if t
+                    )
+            if not incidencia['descripcion']:
+                incidencia['descripcion'] = texto(elemento, strip=True)
+
+            # El box__line-state anterior en el documento (como find_previous)
+            anteriores = [div for pos, div in self.estados_linea if pos < posicion]
+            if anteriores:
+                titulos = XP_TITULO_INCIDENCIA(anteriores[-1])
+                if titulos:
+                    incidencia['titulo'] = texto(titulos[0], strip=True)
+
+            if incidencia['descripcion']:
+                incidencias.append(incidencia)
+
+        if not incidencias:
+            texto_seccion = texto(self.seccion_incidencias, strip=True)
+            if texto_seccion and len(texto_seccion) > 50:
+                incidencias.append({
+                    'titulo': 'Información de incidencias',
+                    'descripcion': texto_seccion,
+                    'fecha': '',
+                    'tipo': 'General'
+                })
+        return incidencias
@@ -12,6 +12,8 @@ import json
 import re
 from collections import defaultdict
 
+from escritura_atomica import archivo_atomico
+
 def extraer_conexiones_cercanias():
     """Extrae las conexiones entre estaciones de Cercanías"""
     
@@ -95,7 +97,7 @@ def extraer_conexiones_cercanias():
     }
     
     # Guardar resultados
-    with open('static/data/conexiones_cercanias.json', 'w', encoding='utf-8') as f:
+    with archivo_atomico('static/data/conexiones_cercanias.json') as f:
         json.dump(conexiones, f, ensure_ascii=False, indent=2)
     
     print(f"\n✅ Archivo generado: static/data/conexiones_cercanias.json")
@@ -10,89 +10,99 @@ import json
 import os
 from typing import Dict, List, Tuple
 
+from escritura_atomica import archivo_atomico
+
+def _leer_csv(ruta: str):
+    """Filas de un .txt GTFS como tuplas, con el índice de cada columna (tolera BOM)"""
+    f = open(ruta, 'r', encoding='utf-8-sig', newline='')
+    reader = csv.reader(f)
+    cabecera = [columna.strip() for columna in next(reader, [])]
+    return f, reader, {columna: i for i, columna in enumerate(cabecera)}
+
 def load_gtfs_data(gtfs_dir: str) -> Dict:
-    """Cargar datos GTFS de Cercanías"""
+    """
+    Cargar datos GTFS de Cercanías en índices:
+    - 'routes': lista de rutas (filas de routes.txt)
+    - 'stops': stop_id -> fila de stops.txt
+    - 'route_trip': route_id -> primer trip_id de la ruta (viaje representativo)
+    - 'trip_stops': trip_id -> stop_ids en orden de stop_sequence, solo para
+      los viajes representativos
+
+    stop_times.txt se recorre una sola vez y sin guardarlo entero en memoria.
+    """
     data = {
         'routes': [],
-        'stops': [],
-        'trips': [],
-        'stop_times': []
+        'stops': {},
+        'route_trip': {},
+        'trip_stops': {}
     }
     
     # Cargar routes.txt
     routes_file = os.path.join(gtfs_dir, 'routes.txt')
     if os.path.exists(routes_file):
-        with open(routes_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            data['routes'] = list(reader)
+        with open(routes_file, 'r', encoding='utf-8-sig', newline='') as f:
+            data['routes'] = list(csv.DictReader(f))
         print(f"✅ Rutas cargadas: {len(data['routes'])}")
     
-    # Cargar stops.txt
+    # Cargar stops.txt indexado por stop_id
     stops_file = os.path.join(gtfs_dir, 'stops.txt')
     if os.path.exists(stops_file):
-        with open(stops_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            data['stops'] = list(reader)
+        with open(stops_file, 'r', encoding='utf-8-sig', newline='') as f:
+            data['stops'] = {stop['stop_id']: stop for stop in csv.DictReader(f)}
         print(f"✅ Paradas cargadas: {len(data['stops'])}")
     
-    # Cargar trips.txt
+    # Cargar trips.txt: un viaje representativo por ruta
     trips_file = os.path.join(gtfs_dir, 'trips.txt')
     if os.path.exists(trips_file):
-        with open(trips_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            data['trips'] = list(reader)
-        print(f"✅ Viajes cargados: {len(data['trips'])}")
-    
-    # Cargar stop_times.txt
+        f, reader, columnas = _leer_csv(trips_file)
+        with f:
+            i_ruta, i_viaje = columnas['route_id'], columnas['trip_id']
+            total = 0
+            for fila in reader:
+                total += 1
+                data['route_trip'].setdefault(fila[i_ruta], fila[i_viaje])
+        print(f"✅ Viajes cargados: {total}")
+    
+    # Recorrer stop_times.txt agrupando solo los viajes representativos
     stop_times_file = os.path.join(gtfs_dir, 'stop_times.txt')
     if os.path.exists(stop_times_file):
-        with open(stop_times_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            data['stop_times'] = list(reader)
-        print(f"✅ Horarios cargados: {len(data['stop_times'])}")
+        representativos = set(data['route_trip'].values())
+        agrupados = {}
+        f, reader, columnas = _leer_csv(stop_times_file)
+        with f:
+            i_viaje, i_parada, i_secuencia = columnas['trip_id'], columnas['stop_id'], columnas['stop_sequence']
+            total = 0
+            for fila in reader:
+                total += 1
+                if fila[i_viaje] in representativos:
+                    agrupados.setdefault(fila[i_viaje], []).append((int(fila[i_secuencia]), fila[i_parada]))
+        for trip_id, paradas in agrupados.items():
+            paradas.sort()
+            data['trip_stops'][trip_id] = [stop_id for _, stop_id in paradas]
+        print(f"✅ Horarios cargados: {total}")
     
     return data
 
-def get_stop_coordinates(stop_id: str, stops: List[Dict]) -> Tuple[float, float]:
+def get_stop_coordinates(stop_id: str, stops: Dict[str, Dict]) -> Tuple[float, float]:
     """Obtener coordenadas de una parada"""
-    for stop in stops:
-        if stop['stop_id'] == stop_id:
-            return float(stop['stop_lat']), float(stop['stop_lon'])
-    return None, None
+    stop = stops.get(stop_id)
+    if stop is None:
+        return None, None
+    return float(stop['stop_lat']), float(stop['stop_lon'])
 
-def get_route_stops(route_id: str, trips: List[Dict], stop_times: List[Dict]) -> List[str]:
-    """Obtener las paradas de una ruta en orden"""
-    # Encontrar un viaje de esta ruta
-    route_trip = None
-    for trip in trips:
-        if trip['route_id'] == route_id:
-            route_trip = trip['trip_id']
-            break
-    
+def get_route_stops(route_id: str, gtfs_data: Dict) -> List[str]:
+    """Obtener las paradas de una ruta en orden (las de su viaje representativo)"""
+    route_trip = gtfs_data['route_trip'].get(route_id)
     if not route_trip:
         return []
-    
-    # Obtener las paradas de este viaje en orden
-    trip_stops = []
-    for stop_time in stop_times:
-        if stop_time['trip_id'] == route_trip:
-            trip_stops.append({
-                'stop_id': stop_time['stop_id'],
-                'sequence': int(stop_time['stop_sequence'])
-            })
-    
-    # Ordenar por secuencia
-    trip_stops.sort(key=lambda x: x['sequence'])
-    return [stop['stop_id'] for stop in trip_stops]
+    return gtfs_data['trip_stops'].get(route_trip, [])
 
 def generate_route_path(route_id: str, gtfs_data: Dict) -> List[List[float]]:
     """Generar ruta para una línea de Cercanías"""
     stops = gtfs_data['stops']
-    trips = gtfs_data['trips']
-    stop_times = gtfs_data['stop_times']
     
     # Obtener paradas de la ruta
-    route_stops = get_route_stops(route_id, trips, stop_times)
+    route_stops = get_route_stops(route_id, gtfs_data)
     
     if not route_stops:
         print(f"⚠️ No se encontraron paradas para la ruta {route_id}")
@@ -157,10 +167,15 @@ def extract_cercanias_routes(gtfs_dir: str) -> Dict:
     
     # Crear diccionario de coordenadas GTFS por nombre de estación
     gtfs_coords = {}
-    for stop in gtfs_data['stops']:
+    for stop in gtfs_data['stops'].values():
         stop_name = stop['stop_name'].upper().strip()
         gtfs_coords[stop_name] = (float(stop['stop_lat']), float(stop['stop_lon']))
     
+    # Estaciones de cada capa por tipo de línea (la primera capa de cada tipo)
+    stations_by_line_type = {}
+    for layer_info in cercanias_data['layers'].values():
+        stations_by_line_type.setdefault(layer_info.get('line_type'), layer_info.get('stations', []))
+    
     routes_data = {}
     
     for route in gtfs_data['routes']:
@@ -175,18 +190,14 @@ def extract_cercanias_routes(gtfs_dir: str) -> Dict:
         print(f"🔧 Procesando ruta {route_name} ({line_type})...")
         
         # Buscar la capa correspondiente en los datos existentes
-        layer_stations = []
-        for layer_id, layer_info in cercanias_data['layers'].items():
-            if layer_info.get('line_type') == line_type:
-                layer_stations = layer_info.get('stations', [])
-                break
-        
-        if not layer_stations:
-            print(f"⚠️ No se encontraron estaciones para {line_type}")
-            continue
+        layer_stations = stations_by_line_type.get(line_type, [])
         
         # Generar ruta usando coordenadas GTFS cuando estén disponibles
         path = []
+        if not layer_stations:
+            # Sin estaciones en la capa: las paradas del propio GTFS en orden
+            print(f"⚠️ No se encontraron estaciones para {line_type}, se usa la secuencia GTFS")
+            path = generate_route_path(route_id, gtfs_data)
         for station in layer_stations:
             station_name = station.get('name', '').upper().strip()
             
@@ -219,7 +230,7 @@ def extract_cercanias_routes(gtfs_dir: str) -> Dict:
 def save_routes_to_json(routes_data: Dict, output_file: str):
     """Guardar rutas en formato JSON"""
     try:
-        with open(output_file, 'w', encoding='utf-8') as f:
+        with archivo_atomico(output_file) as f:
             json.dump(routes_data, f, ensure_ascii=False, indent=2)
         print(f"✅ Rutas guardadas en: {output_file}")
     except Exception as e:
@@ -252,22 +263,23 @@ def update_cercanias_layers(routes_data: Dict):
             '5__C10___': 'C-10'
         }
         
+        # Primera capa de cada tipo de línea
+        layers_by_line_type = {}
+        for layer_info in cercanias_data['layers'].values():
+            layers_by_line_type.setdefault(layer_info.get('line_type'), layer_info)
+        
         # Actualizar capas con rutas reales
         layers_updated = 0
         for route_id, route_info in routes_data.items():
-            line_type = route_mapping.get(route_id)
-            if line_type:
-                # Buscar la capa correspondiente
-                for layer_id, layer_info in cercanias_data['layers'].items():
-                    if layer_info.get('line_type') == line_type:
-                        layer_info['paths'] = [route_info['path']]
-                        layer_info['color'] = route_info['color']
-                        layers_updated += 1
-                        print(f"✅ Capa {line_type} actualizada con ruta real")
-                        break
+            layer_info = layers_by_line_type.get(route_mapping.get(route_id))
+            if layer_info is not None:
+                layer_info['paths'] = [route_info['path']]
+                layer_info['color'] = route_info['color']
+                layers_updated += 1
+                print(f"✅ Capa {layer_info.get('line_type')} actualizada con ruta real")
         
         # Guardar datos actualizados
-        with open(cercanias_file, 'w', encoding='utf-8') as f:
+        with archivo_atomico(cercanias_file) as f:
             json.dump(cercanias_data, f, ensure_ascii=False, indent=2)
         
         print(f"✅ Archivo actualizado: {layers_updated} capas con rutas reales")
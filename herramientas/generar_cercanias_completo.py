@@ -14,10 +14,12 @@ import requests
 import json
 import os
 from datetime import datetime
-from math import sqrt
 from collections import defaultdict
 from typing import Dict, List, Tuple, Any
 
+from escritura_atomica import archivo_atomico
+from ajuste_espacial import ajustar_a_lineas
+
 # Datos oficiales de estaciones por línea de Cercanías Madrid
 ESTACIONES_OFICIALES_CERCANIAS = {
     "C-1": [
@@ -179,26 +181,11 @@ def associate_stations_to_lines_by_name_and_proximity(estaciones_data, tramos_da
     print("   1️⃣ Por nombre usando datos oficiales")
     print("   2️⃣ Por proximidad geográfica como respaldo")
     
-    def calculate_distance(coord1, coord2):
-        """Calcula distancia euclidiana aproximada entre dos coordenadas"""
-        try:
-            x1, y1 = coord1
-            x2, y2 = coord2
-            return sqrt((x2 - x1)**2 + (y2 - y1)**2)
-        except:
-            return float('inf')
-    
     def get_coordinates_from_geometry(geometry):
-        """Extrae coordenadas del geometry"""
+        """Extrae coordenadas de un Point"""
         try:
             if geometry.get('type') == 'Point':
                 return geometry['coordinates']
-            elif geometry.get('type') == 'LineString':
-                # Para líneas, usar el punto medio
-                coords = geometry['coordinates']
-                if coords:
-                    mid_idx = len(coords) // 2
-                    return coords[mid_idx]
             return None
         except:
             return None
@@ -212,21 +199,22 @@ def associate_stations_to_lines_by_name_and_proximity(estaciones_data, tramos_da
     
     print(f"📊 Estaciones oficiales cargadas: {len(estaciones_oficiales_normalizadas)}")
     
-    # Organizar tramos por línea con sus coordenadas
+    # Organizar tramos por línea con su geometría completa
     tramos_por_linea = {}
     for linea, tramos in tramos_data.items():
         if linea != 'unknown' and tramos:
             tramos_por_linea[linea] = []
             for tramo in tramos:
-                coords = get_coordinates_from_geometry(tramo.get('geometry', {}))
-                if coords:
-                    tramos_por_linea[linea].append(coords)
+                geometry = tramo.get('geometry') or {}
+                if geometry.get('type') == 'LineString' and len(geometry.get('coordinates') or []) >= 2:
+                    tramos_por_linea[linea].append(geometry['coordinates'])
     
     print(f"📊 Líneas con tramos disponibles: {list(tramos_por_linea.keys())}")
     
     # Procesar estaciones
     estaciones_por_linea = {}
     estaciones_sin_linea = []
+    pendientes = []
     estaciones_asignadas_por_nombre = 0
     estaciones_asignadas_por_proximidad = 0
     
@@ -251,34 +239,30 @@ def associate_stations_to_lines_by_name_and_proximity(estaciones_data, tramos_da
                 print(f"   ✓ {nombre_estacion} → {linea} (nombre oficial)")
                 continue
             
-            # Fase 2: Asignación por proximidad
             estacion_coords = get_coordinates_from_geometry(estacion.get('geometry', {}))
             
             if not estacion_coords:
                 estaciones_sin_linea.append(estacion)
                 continue
             
-            mejor_linea = None
-            menor_distancia = float('inf')
-            
-            # Buscar la línea más cercana
-            for linea, coords_tramos in tramos_por_linea.items():
-                for coords_tramo in coords_tramos:
-                    distancia = calculate_distance(estacion_coords, coords_tramo)
-                    if distancia < menor_distancia:
-                        menor_distancia = distancia
-                        mejor_linea = linea
-            
-            # Si está dentro del rango, asignar a esa línea
-            if mejor_linea and menor_distancia <= max_distance_meters:
-                if mejor_linea not in estaciones_por_linea:
-                    estaciones_por_linea[mejor_linea] = []
-                estaciones_por_linea[mejor_linea].append(estacion)
-                estaciones_asignadas_por_proximidad += 1
-                print(f"   ✓ {nombre_estacion} → {mejor_linea} (proximidad: {menor_distancia:.1f}m)")
-            else:
-                estaciones_sin_linea.append(estacion)
-                print(f"   ⚠️ {nombre_estacion} → No asignada (distancia mínima: {menor_distancia:.1f}m)")
+            pendientes.append((nombre_estacion, estacion, estacion_coords))
+    
+    # Fase 2: Asignación por proximidad, todas las pendientes en una sola
+    # consulta al índice espacial de segmentos (distancias en metros)
+    ajustes = ajustar_a_lineas([coords for _, _, coords in pendientes], tramos_por_linea, max_distance_meters)
+    
+    for (nombre_estacion, estacion, _), ajuste in zip(pendientes, ajustes):
+        if ajuste:
+            linea = ajuste['linea']
+            estacion['ajuste_linea'] = ajuste
+            if linea not in estaciones_por_linea:
+                estaciones_por_linea[linea] = []
+            estaciones_por_linea[linea].append(estacion)
+            estaciones_asignadas_por_proximidad += 1
+            print(f"   ✓ {nombre_estacion} → {linea} (proximidad: {ajuste['distancia_m']:.1f}m, PK {ajuste['pk_m']:.0f}m)")
+        else:
+            estaciones_sin_linea.append(estacion)
+            print(f"   ⚠️ {nombre_estacion} → No asignada (ningún tramo a menos de {max_distance_meters}m)")
     
     # Estadísticas
     total_asociadas = sum(len(estaciones) for estaciones in estaciones_por_linea.values())
@@ -433,7 +417,7 @@ def fetch_all_cercanias_data():
     print(f"\n💾 Guardando en {output_file}...")
     
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    with open(output_file, 'w', encoding='utf-8') as f:
+    with archivo_atomico(output_file) as f:
         json.dump(datos_completos, f, ensure_ascii=False, indent=2)
     
     print(f"✅ Archivo generado exitosamente!")
@@ -446,7 +430,7 @@ def save_json_file(data, filename):
     try:
         os.makedirs(os.path.dirname(filename), exist_ok=True)
         
-        with open(filename, 'w', encoding='utf-8') as f:
+        with archivo_atomico(filename) as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
         
         print(f"✅ Archivo guardado: {filename}")
@@ -10,6 +10,8 @@ Genera un archivo de Cercanías con capas separadas por línea usando los colore
 import json
 import os
 
+from escritura_atomica import archivo_atomico
+
 def generar_cercanias_con_capas():
     """Genera el archivo de Cercanías con capas por línea"""
     
@@ -70,7 +72,7 @@ def generar_cercanias_con_capas():
     
     # Guardar archivo final
     output_path = 'static/data/cercanias_con_capas.json'
-    with open(output_path, 'w', encoding='utf-8') as f:
+    with archivo_atomico(output_path) as f:
         json.dump(cercanias_con_capas, f, ensure_ascii=False, indent=2)
     
     print(f"✅ Archivo generado: {output_path}")
@@ -1,9 +1,15 @@
+import io
 import os
 import zipfile
 import re
+from concurrent.futures import ProcessPoolExecutor
 from xml.etree import ElementTree as ET
 import json
 
+import numpy as np
+
+from escritura_atomica import archivo_atomico
+
 # Diccionario de configuración de líneas (colores y nombres)
 LINEAS_CONFIG = {
     '1':  {'name': 'Línea 1',  'color': '#00AEEF'},
@@ -21,102 +27,149 @@ LINEAS_CONFIG = {
     'R':  {'name': 'Ramal',    'color': '#FFFFFF'}
 }
 
-def extraer_coordenadas_de_kml(kml_content):
-    """Parsea el contenido de un archivo KML y extrae las coordenadas."""
-    # Eliminar el namespace de XML para simplificar el parseo
-    kml_content = re.sub(' xmlns="[^"]+"', '', kml_content, count=1)
-    
-    root = ET.fromstring(kml_content)
-    
-    # Buscar todas las coordenadas en el archivo
-    all_coords_str = []
-    for coordinates_tag in root.findall('.//coordinates'):
-        all_coords_str.append(coordinates_tag.text.strip())
-        
-    # Unir todas las coordenadas encontradas
-    full_coords_str = " ".join(all_coords_str)
-    
-    # Procesar el string de coordenadas
-    coordinates = []
-    for coord_set in full_coords_str.split():
-        parts = coord_set.split(',')
-        if len(parts) >= 2:
+def _nombre_local(tag):
+    """'{http://www.opengis.net/kml/2.2}LineString' -> 'LineString'"""
+    return tag.rsplit('}', 1)[-1]
+
+def parsear_coordenadas(texto):
+    """
+    Texto de un <coordinates> ("lon,lat[,alt] lon,lat[,alt] ...") a un array
+    float64 de forma (n, 2) con columnas lon, lat. El parseo es en bloque
+    con numpy; solo si las tuplas no son homogéneas se cae al recorrido
+    tupla a tupla.
+    """
+    tuplas = (texto or '').split()
+    if not tuplas:
+        return np.empty((0, 2))
+    dimensiones = tuplas[0].count(',') + 1
+    try:
+        valores = np.array(','.join(tuplas).split(','), dtype=np.float64)
+        if dimensiones >= 2 and valores.size == len(tuplas) * dimensiones:
+            return valores.reshape(-1, dimensiones)[:, :2]
+    except ValueError:
+        pass
+    coordenadas = []
+    for tupla in tuplas:
+        partes = tupla.split(',')
+        if len(partes) >= 2:
             try:
-                lon, lat = float(parts[0]), float(parts[1])
-                coordinates.append([lat, lon])
+                coordenadas.append((float(partes[0]), float(partes[1])))
             except ValueError:
                 continue
-        
+    return np.array(coordenadas, dtype=np.float64).reshape(-1, 2)
+
+def extraer_lineas_de_kml(kml_file):
+    """
+    Recorre en streaming (iterparse) un KML abierto en binario y devuelve una
+    lista con un array (n, 2) [lon, lat] por cada LineString, sin fundirlos.
+    Los elementos ya procesados se liberan para no mantener el árbol entero.
+    """
+    lineas = []
+    for _, elemento in ET.iterparse(kml_file, events=('end',)):
+        nombre = _nombre_local(elemento.tag)
+        if nombre == 'LineString':
+            for hijo in elemento:
+                if _nombre_local(hijo.tag) == 'coordinates':
+                    coordenadas = parsear_coordenadas(hijo.text)
+                    if len(coordenadas) >= 2:
+                        lineas.append(coordenadas)
+            elemento.clear()
+        elif nombre == 'Placemark':
+            elemento.clear()
+    return lineas
+
+def extraer_coordenadas_de_kml(kml_content):
+    """Parsea el contenido de un archivo KML y extrae las coordenadas ([lat, lon]) de todas sus líneas."""
+    if isinstance(kml_content, str):
+        kml_content = kml_content.encode('utf-8')
+    coordinates = []
+    for linea in extraer_lineas_de_kml(io.BytesIO(kml_content)):
+        coordinates.extend(linea[:, ::-1].tolist())
     return coordinates
 
-def generar_json_desde_kmz(kmz_dir, output_path):
+def procesar_kmz(kmz_path):
+    """
+    Procesa un KMZ leyendo cada *_TRAMO.kml directamente del zip. Devuelve
+    (número de línea o None, lista de arrays [lon, lat] por LineString,
+    mensajes) para que el proceso principal imprima en orden.
+    """
+    filename = os.path.basename(kmz_path)
+    mensajes = []
+
+    # Extraer el número de línea del nombre del archivo (ej. 'M4_L10A.kmz' -> '10')
+    match = re.search(r'_L(\d+)', filename)
+    if not match:
+        return None, [], mensajes
+    
+    line_num = match.group(1)
+    if not LINEAS_CONFIG.get(line_num):
+        mensajes.append(f"  -> Advertencia: No se encontró configuración para la línea {line_num} en el archivo {filename}")
+        return None, [], mensajes
+
+    try:
+        with zipfile.ZipFile(kmz_path, 'r') as kmz:
+            # Buscar archivos de tramo dentro de la carpeta files/
+            tramo_files = [f for f in kmz.namelist() if f.endswith('_TRAMO.kml') and 'files/' in f]
+            
+            if not tramo_files:
+                mensajes.append(f"  -> Error: No se encontraron archivos de tramo en '{filename}'")
+                return None, [], mensajes
+            
+            paths = []
+            for tramo_file in sorted(tramo_files):
+                with kmz.open(tramo_file) as kml_file:
+                    lineas = extraer_lineas_de_kml(kml_file)
+                if lineas:
+                    paths.extend(lineas)
+                    mensajes.append(f"    -> Tramo {tramo_file}: {len(lineas)} segmentos, {sum(len(l) for l in lineas)} puntos")
+                else:
+                    mensajes.append(f"    -> Advertencia: No se extrajeron coordenadas de {tramo_file}")
+    except Exception as e:
+        mensajes.append(f"  -> Error procesando el archivo '{filename}': {e}")
+        return None, [], mensajes
+
+    return line_num, paths, mensajes
+
+def generar_json_desde_kmz(kmz_dir, output_path, procesos=None):
     """
     Genera el archivo metro_routes.json a partir de archivos KMZ.
+    Cada archivo se procesa en un proceso aparte (procesos=1 para hacerlo en serie)
+    y cada LineString del KML es un path independiente en el JSON.
     """
     print(f"Iniciando generación de JSON desde la carpeta '{kmz_dir}'...")
     
     rutas_data = {"lines": []}
+    archivos = sorted(os.path.join(kmz_dir, f) for f in os.listdir(kmz_dir) if f.endswith('.kmz'))
     
-    for filename in os.listdir(kmz_dir):
-        if not filename.endswith('.kmz'):
-            continue
-            
-        # Extraer el número de línea del nombre del archivo (ej. 'M4_L10A.kmz' -> '10')
-        match = re.search(r'_L(\d+)', filename)
-        if not match:
-            continue
-        
-        line_num = match.group(1)
-        config = LINEAS_CONFIG.get(line_num)
-        
-        if not config:
-            print(f"  -> Advertencia: No se encontró configuración para la línea {line_num} en el archivo {filename}")
+    if procesos == 1 or len(archivos) <= 1:
+        resultados = [procesar_kmz(ruta) for ruta in archivos]
+    else:
+        with ProcessPoolExecutor(max_workers=procesos) as executor:
+            resultados = list(executor.map(procesar_kmz, archivos))
+    
+    for kmz_path, (line_num, paths, mensajes) in zip(archivos, resultados):
+        filename = os.path.basename(kmz_path)
+        for mensaje in mensajes:
+            print(mensaje)
+        if line_num is None:
             continue
-
-        try:
-            kmz_path = os.path.join(kmz_dir, filename)
-            with zipfile.ZipFile(kmz_path, 'r') as kmz:
-                # Buscar archivos de tramo dentro de la carpeta files/
-                tramo_files = [f for f in kmz.namelist() if f.endswith('_TRAMO.kml') and 'files/' in f]
-                
-                if not tramo_files:
-                    print(f"  -> Error: No se encontraron archivos de tramo en '{filename}'")
-                    continue
-                
-                # Extraer coordenadas de cada tramo
-                paths = []
-                total_points = 0
-                
-                for tramo_file in sorted(tramo_files):
-                    with kmz.open(tramo_file) as kml_file:
-                        kml_content = kml_file.read().decode('utf-8')
-                        coordinates = extraer_coordenadas_de_kml(kml_content)
-                        
-                        if coordinates:
-                            paths.append(coordinates)
-                            total_points += len(coordinates)
-                            print(f"    -> Tramo {tramo_file}: {len(coordinates)} puntos")
-                        else:
-                            print(f"    -> Advertencia: No se extrajeron coordenadas de {tramo_file}")
-                
-                if paths:
-                    # Añadir el trazado al JSON con estructura paths
-                    rutas_data["lines"].append({
-                        "line": line_num,
-                        "name": config['name'],
-                        "color": config['color'],
-                        "paths": paths
-                    })
-                    print(f"  -> Procesado '{filename}' para la Línea {line_num} ({len(paths)} tramos, {total_points} puntos total)")
-                else:
-                    print(f"  -> Advertencia: No se extrajeron coordenadas de '{filename}'")
-
-        except Exception as e:
-            print(f"  -> Error procesando el archivo '{filename}': {e}")
+        if paths:
+            config = LINEAS_CONFIG[line_num]
+            # Añadir el trazado al JSON con estructura paths ([lat, lon], un path por LineString)
+            rutas_data["lines"].append({
+                "line": line_num,
+                "name": config['name'],
+                "color": config['color'],
+                "paths": [path[:, ::-1].tolist() for path in paths]
+            })
+            total_points = sum(len(path) for path in paths)
+            print(f"  -> Procesado '{filename}' para la Línea {line_num} ({len(paths)} tramos, {total_points} puntos total)")
+        else:
+            print(f"  -> Advertencia: No se extrajeron coordenadas de '{filename}'")
             
     # Guardar el archivo JSON
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
+        with archivo_atomico(output_path) as f:
             json.dump(rutas_data, f, ensure_ascii=False, indent=2)
         print(f"\n✅ Archivo '{output_path}' generado exitosamente con {len(rutas_data['lines'])} líneas.")
     except IOError as e:
@@ -10,6 +10,8 @@ Genera un archivo de Metro con capas separadas por línea usando los colores ofi
 import json
 import os
 
+from escritura_atomica import archivo_atomico
+
 def generar_metro_con_capas():
     """Genera el archivo de Metro con capas por línea"""
     
@@ -78,18 +80,20 @@ def generar_metro_con_capas():
                     color = colores_lineas.get(linea_id, '#0055A4')
                     
                     if paths:
-                        # Tomar el primer path (ruta principal)
+                        # Cada path es un LineString del KMZ; 'coordinates' conserva
+                        # el primero por compatibilidad y 'paths' lleva el trazado completo
                         coordinates = paths[0] if paths else []
                         if coordinates:
                             line_info = {
                                 'line': linea_id,
                                 'coordinates': coordinates,
+                                'paths': paths,
                                 'color': color,
                                 'name': f'Línea {linea_id}',
                                 'type': 'metro'
                             }
                             lines.append(line_info)
-                            print(f"✅ Ruta de Línea {linea_id} cargada con {len(coordinates)} puntos")
+                            print(f"✅ Ruta de Línea {linea_id} cargada con {len(paths)} tramos, {sum(len(path) for path in paths)} puntos")
     except Exception as e:
         print(f"❌ Error cargando rutas: {e}")
         print("No se encontraron rutas de Metro")
@@ -135,7 +139,7 @@ def generar_metro_con_capas():
     
     # Guardar archivo final
     output_path = 'static/data/metro_con_capas.json'
-    with open(output_path, 'w', encoding='utf-8') as f:
+    with archivo_atomico(output_path) as f:
         json.dump(metro_con_capas, f, ensure_ascii=False, indent=2)
     
     print(f"✅ Archivo generado: {output_path}")
@@ -11,6 +11,8 @@ metro_ligero_rutas_gtfs.json para crear un archivo final con todo integrado.
 import json
 import os
 
+from escritura_atomica import archivo_atomico
+
 def generar_metro_ligero_final():
     """Genera el archivo final de Metro Ligero con estaciones y rutas"""
     
@@ -91,7 +93,7 @@ def generar_metro_ligero_final():
     
     # Guardar archivo final
     output_path = 'static/data/metro_ligero_final.json'
-    with open(output_path, 'w', encoding='utf-8') as f:
+    with archivo_atomico(output_path) as f:
         json.dump(metro_ligero_final, f, ensure_ascii=False, indent=2)
     
     print(f"✅ Archivo generado: {output_path}")
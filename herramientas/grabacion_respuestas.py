@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GRABACIÓN Y REPRODUCCIÓN DE RESPUESTAS HTTP
+===========================================
+
+Permite ejecutar los scrapers sin tocar metromadrid.es:
+- `AlmacenGrabaciones`: respuestas guardadas en disco (índice JSON por URL
+  y cuerpos por hash SHA-256, así páginas idénticas se guardan una vez)
+- `AdaptadorGrabacion`: adaptador de requests que hace la petición real y
+  la guarda (se graba una vez)
+- `AdaptadorReproduccion`: adaptador que sirve las respuestas grabadas
+  (404 para URLs no grabadas, sin red)
+- `montar_grabacion` / `montar_reproduccion`: montan el adaptador en la
+  sesión de un scraper (http:// y https://)
+- `ServidorReproduccion`: servidor HTTP local que sirve las grabaciones
+  por ruta, para probar contra un stub real
+
+Ver herramientas/tests/benchmark_scrapers.py.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from urllib.parse import urldefrag, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+DIRECTORIO_GRABACIONES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'grabaciones')
+INDICE = 'indice.json'
+
+# Cabeceras que no tiene sentido reproducir (el cuerpo se sirve ya descomprimido)
+CABECERAS_IGNORADAS = {'content-encoding', 'transfer-encoding', 'content-length', 'connection', 'set-cookie'}
+
+
+def clave_url(url):
+    """Las grabaciones se indexan por URL sin fragmento"""
+    return urldefrag(url)[0]
+
+
+class AlmacenGrabaciones:
+    """Respuestas grabadas en un directorio (índice + cuerpos por hash)"""
+
+    def __init__(self, directorio=DIRECTORIO_GRABACIONES):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+        self.indice = {}
+        ruta_indice = os.path.join(directorio, INDICE)
+        if os.path.exists(ruta_indice):
+            with open(ruta_indice, 'r', encoding='utf-8') as f:
+                self.indice = json.load(f)
+
+    def _ruta_cuerpo(self, hash_cuerpo):
+        return os.path.join(self.directorio, 'cuerpos', f'{hash_cuerpo}.bin')
+
+    def guardar(self, url, status_code, headers, contenido, origen='red'):
+        """Guarda una respuesta y reescribe el índice (escritura atómica)"""
+        hash_cuerpo = hashlib.sha256(contenido).hexdigest()
+        ruta = self._ruta_cuerpo(hash_cuerpo)
+        with self._lock:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            if not os.path.exists(ruta):
+                with open(ruta, 'wb') as f:
+                    f.write(contenido)
+            self.indice[clave_url(url)] = {
+                'status': status_code,
+                'headers': {k: v for k, v in headers.items() if k.lower() not in CABECERAS_IGNORADAS},
+                'cuerpo': hash_cuerpo,
+                'origen': origen,
+                'grabado': datetime.now().isoformat()
+            }
+            temporal = os.path.join(self.directorio, INDICE + '.tmp')
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(self.indice, f, ensure_ascii=False, indent=2, sort_keys=True)
+            os.replace(temporal, os.path.join(self.directorio, INDICE))
+
+    def importar_html(self, url, ruta_html, origen='fixture'):
+        """Registra un HTML ya guardado en disco como respuesta 200 de `url`"""
+        with open(ruta_html, 'rb') as f:
+            contenido = f.read()
+        self.guardar(url, 200, {'Content-Type': 'text/html; charset=utf-8'}, contenido, origen)
+
+    def cargar(self, url):
+        """(status, headers, contenido) grabados para la URL, o None"""
+        entrada = self.indice.get(clave_url(url))
+        if entrada is None:
+            return None
+        with open(self._ruta_cuerpo(entrada['cuerpo']), 'rb') as f:
+            contenido = f.read()
+        return entrada['status'], entrada['headers'], contenido
+
+    def urls(self):
+        return sorted(self.indice)
+
+
+def _construir_respuesta(peticion, status_code, headers, contenido):
+    respuesta = requests.Response()
+    respuesta.status_code = status_code
+    respuesta.headers = CaseInsensitiveDict(headers)
+    respuesta._content = contenido
+    respuesta.url = peticion.url
+    respuesta.request = peticion
+    respuesta.encoding = requests.utils.get_encoding_from_headers(respuesta.headers)
+    respuesta.reason = 'OK' if status_code < 400 else 'Not Found'
+    return respuesta
+
+
+class AdaptadorReproduccion(BaseAdapter):
+    """Sirve respuestas grabadas; cuenta peticiones servidas y no encontradas"""
+
+    def __init__(self, almacen):
+        super().__init__()
+        self.almacen = almacen
+        self.servidas = 0
+        self.no_encontradas = 0
+        self.bytes_servidos = 0
+        self._lock = threading.Lock()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        grabada = self.almacen.cargar(request.url)
+        with self._lock:
+            if grabada is None:
+                self.no_encontradas += 1
+            else:
+                self.servidas += 1
+                self.bytes_servidos += len(grabada[2])
+        if grabada is None:
+            return _construir_respuesta(request, 404, {'Content-Type': 'text/plain'}, b'no grabada')
+        return _construir_respuesta(request, *grabada)
+
+    def close(self):
+        pass
+
+
+class AdaptadorGrabacion(HTTPAdapter):
+    """Hace la petición real y guarda la respuesta en el almacén"""
+
+    def __init__(self, almacen, **kwargs):
+        super().__init__(**kwargs)
+        self.almacen = almacen
+
+    def send(self, request, **kwargs):
+        respuesta = super().send(request, **kwargs)
+        if request.method == 'GET':
+            self.almacen.guardar(request.url, respuesta.status_code, dict(respuesta.headers), respuesta.content)
+        return respuesta
+
+
+def montar_reproduccion(session, almacen):
+    """Hace que `session` responda desde las grabaciones. Devuelve el adaptador"""
+    adaptador = AdaptadorReproduccion(almacen)
+    session.mount('http://', adaptador)
+    session.mount('https://', adaptador)
+    return adaptador
+
+
+def montar_grabacion(session, almacen):
+    """Hace que `session` grabe todo lo que descargue. Devuelve el adaptador"""
+    adaptador = AdaptadorGrabacion(almacen)
+    session.mount('http://', adaptador)
+    session.mount('https://', adaptador)
+    return adaptador
+
+
+class ServidorReproduccion:
+    """Servidor HTTP local que sirve las grabaciones por ruta (ignora el host)"""
+
+    def __init__(self, almacen, puerto=0):
+        self.servidas = 0
+        self.no_encontradas = 0
+        contador = self
+        por_ruta = {}
+        for url in almacen.urls():
+            partes = urlsplit(url)
+            por_ruta.setdefault(partes.path + (f'?{partes.query}' if partes.query else ''), url)
+
+        class Manejador(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = por_ruta.get(self.path)
+                grabada = almacen.cargar(url) if url else None
+                if grabada is None:
+                    contador.no_encontradas += 1
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                contador.servidas += 1
+                status, headers, contenido = grabada
+                self.send_response(status)
+                for nombre, valor in headers.items():
+                    self.send_header(nombre, valor)
+                self.send_header('Content-Length', str(len(contenido)))
+                self.end_headers()
+                self.wfile.write(contenido)
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', puerto), Manejador)
+        self.url_base = f'http://127.0.0.1:{self.servidor.server_address[1]}'
+        self._hilo = None
+
+    def __enter__(self):
+        self._hilo = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *args):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def url(self, url_original):
+        """URL equivalente en el servidor local"""
+        partes = urlsplit(url_original)
+        return self.url_base + partes.path + (f'?{partes.query}' if partes.query else '')
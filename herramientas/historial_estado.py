@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HISTORIAL DE ESTADO - station_status / estado_lineas
+====================================================
+
+Subsistema de series temporales para las tablas de estado:
+- Tablas "actual" (station_status_actual, estado_lineas_actual) mantenidas
+  por triggers en cada INSERT, para lecturas O(1) del último estado.
+  estado_lineas_actual.comprobado es el último barrido que vio ese estado
+  (el histórico solo recibe fila cuando el estado cambia).
+- Índices (station_id, timestamp) y (linea, timestamp) sobre el histórico.
+- Resúmenes horarios y diarios (estado_lineas_resumen, station_status_resumen).
+- Retención configurable del detalle y de los resúmenes horarios.
+"""
+
+import sqlite3
+import argparse
+from datetime import datetime, timedelta
+
+DB_PATH = 'db/estaciones_fijas_v2.db'
+
+# Retención por defecto (días). Los resúmenes diarios se conservan siempre.
+RETENCION_DETALLE_DIAS = 30
+RETENCION_HORARIA_DIAS = 180
+
+# Formato de inicio de periodo para los resúmenes
+FORMATOS_PERIODO = {
+    'hora': '%Y-%m-%d %H:00:00',
+    'dia': '%Y-%m-%d 00:00:00'
+}
+
+ESQUEMA_HISTORIAL = [
+    # Tablas de histórico (se crean aquí también por si la BD es nueva)
+    '''
+    CREATE TABLE IF NOT EXISTS station_status (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        station_id INTEGER,
+        station_name TEXT,
+        linea TEXT,
+        estado_ascensores TEXT,
+        estado_escaleras TEXT,
+        alertas TEXT,
+        funcionamiento_linea TEXT,
+        accesos TEXT,
+        calles TEXT,
+        servicios TEXT,
+        zona_tarifaria TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS estado_lineas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        linea TEXT NOT NULL,
+        estado TEXT NOT NULL,
+        clase_css TEXT,
+        descripcion TEXT,
+        estaciones_cerradas TEXT,
+        accesos_cerrados TEXT,
+        incidencias TEXT,
+        url_origen TEXT,
+        timestamp TEXT NOT NULL
+    )
+    ''',
+    # Índices de series temporales
+    'CREATE INDEX IF NOT EXISTS idx_station_status_station_ts ON station_status(station_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_station_status_ts ON station_status(timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_estado_lineas_linea_ts ON estado_lineas(linea, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_estado_lineas_ts ON estado_lineas(timestamp)',
+    # Último estado materializado
+    '''
+    CREATE TABLE IF NOT EXISTS station_status_actual (
+        station_id INTEGER PRIMARY KEY,
+        station_name TEXT,
+        linea TEXT,
+        estado_ascensores TEXT,
+        estado_escaleras TEXT,
+        alertas TEXT,
+        funcionamiento_linea TEXT,
+        accesos TEXT,
+        calles TEXT,
+        servicios TEXT,
+        zona_tarifaria TEXT,
+        timestamp DATETIME,
+        historial_id INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS estado_lineas_actual (
+        linea TEXT PRIMARY KEY,
+        estado TEXT NOT NULL,
+        clase_css TEXT,
+        descripcion TEXT,
+        estaciones_cerradas TEXT,
+        accesos_cerrados TEXT,
+        incidencias TEXT,
+        url_origen TEXT,
+        timestamp TEXT NOT NULL,
+        historial_id INTEGER,
+        comprobado TEXT
+    )
+    ''',
+    # Triggers que mantienen el último estado al insertar en el histórico
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_station_status_actual
+    AFTER INSERT ON station_status
+    WHEN NEW.station_id IS NOT NULL
+    BEGIN
+        INSERT OR REPLACE INTO station_status_actual
+        (station_id, station_name, linea, estado_ascensores, estado_escaleras, alertas,
+         funcionamiento_linea, accesos, calles, servicios, zona_tarifaria, timestamp, historial_id)
+        SELECT NEW.station_id, NEW.station_name, NEW.linea, NEW.estado_ascensores, NEW.estado_escaleras,
+               NEW.alertas, NEW.funcionamiento_linea, NEW.accesos, NEW.calles, NEW.servicios,
+               NEW.zona_tarifaria, NEW.timestamp, NEW.id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM station_status_actual
+            WHERE station_id = NEW.station_id AND timestamp > NEW.timestamp
+        );
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_estado_lineas_actual
+    AFTER INSERT ON estado_lineas
+    BEGIN
+        INSERT OR REPLACE INTO estado_lineas_actual
+        (linea, estado, clase_css, descripcion, estaciones_cerradas, accesos_cerrados,
+         incidencias, url_origen, timestamp, historial_id)
+        SELECT NEW.linea, NEW.estado, NEW.clase_css, NEW.descripcion, NEW.estaciones_cerradas,
+               NEW.accesos_cerrados, NEW.incidencias, NEW.url_origen, NEW.timestamp, NEW.id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM estado_lineas_actual
+            WHERE linea = NEW.linea AND timestamp > NEW.timestamp
+        );
+    END
+    ''',
+    # Resúmenes horarios/diarios
+    '''
+    CREATE TABLE IF NOT EXISTS estado_lineas_resumen (
+        linea TEXT NOT NULL,
+        periodo TEXT NOT NULL,
+        inicio TEXT NOT NULL,
+        estado TEXT NOT NULL,
+        muestras INTEGER NOT NULL,
+        primera_muestra TEXT,
+        ultima_muestra TEXT,
+        PRIMARY KEY (linea, periodo, inicio, estado)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS station_status_resumen (
+        station_id INTEGER NOT NULL,
+        periodo TEXT NOT NULL,
+        inicio TEXT NOT NULL,
+        estado_ascensores TEXT NOT NULL,
+        estado_escaleras TEXT NOT NULL,
+        muestras INTEGER NOT NULL,
+        primera_muestra TEXT,
+        ultima_muestra TEXT,
+        PRIMARY KEY (station_id, periodo, inicio, estado_ascensores, estado_escaleras)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_estado_lineas_resumen_inicio ON estado_lineas_resumen(periodo, inicio)',
+    'CREATE INDEX IF NOT EXISTS idx_station_status_resumen_inicio ON station_status_resumen(periodo, inicio)'
+]
+
+_esquemas_preparados = set()
+
+
+def asegurar_esquema(conn):
+    """Crea índices, tablas "actual", triggers y resúmenes. Rellena el último estado si está vacío."""
+    cursor = conn.cursor()
+    for sentencia in ESQUEMA_HISTORIAL:
+        cursor.execute(sentencia)
+    columnas = {fila[1] for fila in cursor.execute("PRAGMA table_info(estado_lineas_actual)")}
+    if 'comprobado' not in columnas:
+        cursor.execute("ALTER TABLE estado_lineas_actual ADD COLUMN comprobado TEXT")
+
+    # Carga inicial del último estado a partir del histórico existente
+    if not cursor.execute("SELECT 1 FROM station_status_actual LIMIT 1").fetchone():
+        cursor.execute('''
+            INSERT OR REPLACE INTO station_status_actual
+            (station_id, station_name, linea, estado_ascensores, estado_escaleras, alertas,
+             funcionamiento_linea, accesos, calles, servicios, zona_tarifaria, timestamp, historial_id)
+            SELECT s.station_id, s.station_name, s.linea, s.estado_ascensores, s.estado_escaleras, s.alertas,
+                   s.funcionamiento_linea, s.accesos, s.calles, s.servicios, s.zona_tarifaria, s.timestamp, s.id
+            FROM station_status s
+            JOIN (
+                SELECT station_id, MAX(id) AS id
+                FROM station_status s2
+                WHERE station_id IS NOT NULL
+                  AND timestamp = (SELECT MAX(timestamp) FROM station_status WHERE station_id = s2.station_id)
+                GROUP BY station_id
+            ) ultimos ON ultimos.id = s.id
+        ''')
+    if not cursor.execute("SELECT 1 FROM estado_lineas_actual LIMIT 1").fetchone():
+        cursor.execute('''
+            INSERT OR REPLACE INTO estado_lineas_actual
+            (linea, estado, clase_css, descripcion, estaciones_cerradas, accesos_cerrados,
+             incidencias, url_origen, timestamp, historial_id)
+            SELECT e.linea, e.estado, e.clase_css, e.descripcion, e.estaciones_cerradas, e.accesos_cerrados,
+                   e.incidencias, e.url_origen, e.timestamp, e.id
+            FROM estado_lineas e
+            JOIN (
+                SELECT linea, MAX(id) AS id
+                FROM estado_lineas e2
+                WHERE timestamp = (SELECT MAX(timestamp) FROM estado_lineas WHERE linea = e2.linea)
+                GROUP BY linea
+            ) ultimos ON ultimos.id = e.id
+        ''')
+    conn.commit()
+
+
+def asegurar_esquema_una_vez(conn, db_path=DB_PATH):
+    """Igual que asegurar_esquema, pero solo la primera vez por proceso y base de datos"""
+    if db_path in _esquemas_preparados:
+        return
+    asegurar_esquema(conn)
+    _esquemas_preparados.add(db_path)
+
+
+def obtener_estado_linea_actual(conn, linea):
+    """Último estado de una línea (lectura por clave primaria)"""
+    return conn.execute('''
+        SELECT estado, descripcion, clase_css, estaciones_cerradas, accesos_cerrados, incidencias, timestamp
+        FROM estado_lineas_actual
+        WHERE linea = ?
+    ''', (linea,)).fetchone()
+
+
+def obtener_estado_estacion_actual(conn, station_id):
+    """Último estado de una estación (lectura por clave primaria)"""
+    return conn.execute('''
+        SELECT estado_ascensores, estado_escaleras, alertas, accesos, servicios, timestamp
+        FROM station_status_actual
+        WHERE station_id = ?
+    ''', (station_id,)).fetchone()
+
+
+def generar_resumenes(conn, desde=None):
+    """
+    Recalcula los resúmenes horarios y diarios a partir de `desde` (ISO).
+    Por defecto continúa desde el último día ya resumido.
+    """
+    cursor = conn.cursor()
+    if desde is None:
+        fila = cursor.execute(
+            "SELECT MAX(inicio) FROM estado_lineas_resumen WHERE periodo = 'dia'"
+        ).fetchone()
+        fila_estaciones = cursor.execute(
+            "SELECT MAX(inicio) FROM station_status_resumen WHERE periodo = 'dia'"
+        ).fetchone()
+        candidatos = [f[0] for f in (fila, fila_estaciones) if f and f[0]]
+        desde = min(candidatos) if candidatos else '0000-00-00 00:00:00'
+
+    with conn:
+        for periodo, formato in FORMATOS_PERIODO.items():
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO estado_lineas_resumen
+                (linea, periodo, inicio, estado, muestras, primera_muestra, ultima_muestra)
+                SELECT linea, ?, strftime('{formato}', timestamp), estado,
+                       COUNT(*), MIN(timestamp), MAX(timestamp)
+                FROM estado_lineas
+                WHERE timestamp >= ?
+                GROUP BY linea, strftime('{formato}', timestamp), estado
+            ''', (periodo, desde))
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO station_status_resumen
+                (station_id, periodo, inicio, estado_ascensores, estado_escaleras, muestras,
+                 primera_muestra, ultima_muestra)
+                SELECT station_id, ?, strftime('{formato}', timestamp),
+                       COALESCE(estado_ascensores, 'Desconocido'), COALESCE(estado_escaleras, 'Desconocido'),
+                       COUNT(*), MIN(timestamp), MAX(timestamp)
+                FROM station_status
+                WHERE timestamp >= ? AND station_id IS NOT NULL
+                GROUP BY station_id, strftime('{formato}', timestamp),
+                         COALESCE(estado_ascensores, 'Desconocido'), COALESCE(estado_escaleras, 'Desconocido')
+            ''', (periodo, desde))
+
+
+def aplicar_retencion(conn, dias_detalle=RETENCION_DETALLE_DIAS, dias_horario=RETENCION_HORARIA_DIAS, ahora=None):
+    """
+    Borra el detalle más antiguo que `dias_detalle` (tras resumirlo) y los resúmenes
+    horarios más antiguos que `dias_horario`. El último estado nunca se borra porque
+    vive en las tablas *_actual. Devuelve un diccionario con las filas borradas.
+    """
+    ahora = ahora or datetime.now()
+    limite_detalle = (ahora - timedelta(days=dias_detalle)).strftime('%Y-%m-%d %H:%M:%S')
+    # estado_lineas guarda timestamps ISO con 'T'
+    limite_detalle_iso = (ahora - timedelta(days=dias_detalle)).isoformat()
+    limite_horario = (ahora - timedelta(days=dias_horario)).strftime('%Y-%m-%d %H:%M:%S')
+
+    # Asegurar que el detalle a borrar ya está resumido
+    generar_resumenes(conn)
+
+    cursor = conn.cursor()
+    with conn:
+        cursor.execute("DELETE FROM station_status WHERE timestamp < ?", (limite_detalle,))
+        borradas_estaciones = cursor.rowcount
+        cursor.execute("DELETE FROM estado_lineas WHERE timestamp < ?", (limite_detalle_iso,))
+        borradas_lineas = cursor.rowcount
+        cursor.execute(
+            "DELETE FROM estado_lineas_resumen WHERE periodo = 'hora' AND inicio < ?", (limite_horario,)
+        )
+        borrados_resumen = cursor.rowcount
+        cursor.execute(
+            "DELETE FROM station_status_resumen WHERE periodo = 'hora' AND inicio < ?", (limite_horario,)
+        )
+        borrados_resumen += cursor.rowcount
+
+    return {
+        'station_status': borradas_estaciones,
+        'estado_lineas': borradas_lineas,
+        'resumenes_horarios': borrados_resumen
+    }
+
+
+def mantenimiento_historial(db_path=DB_PATH, dias_detalle=RETENCION_DETALLE_DIAS, dias_horario=RETENCION_HORARIA_DIAS):
+    """Tarea periódica: resúmenes incrementales + retención"""
+    conn = sqlite3.connect(db_path)
+    try:
+        asegurar_esquema_una_vez(conn, db_path)
+        return aplicar_retencion(conn, dias_detalle, dias_horario)
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mantenimiento del historial de estado')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--dias-detalle', type=int, default=RETENCION_DETALLE_DIAS)
+    parser.add_argument('--dias-horario', type=int, default=RETENCION_HORARIA_DIAS)
+    args = parser.parse_args()
+
+    print("🔄 Mantenimiento del historial de estado...")
+    borradas = mantenimiento_historial(args.db, args.dias_detalle, args.dias_horario)
+    print(f"✅ Resúmenes actualizados. Filas borradas: {borradas}")
+
+
+if __name__ == "__main__":
+    main()
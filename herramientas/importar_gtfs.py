@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+IMPORTADOR GTFS -> SQLITE
+=========================
+
+Construye M4/metro_madrid.db (la base GTFS que leen app.py,
+generar_json_rutas y extraer_coordenadas_gtfs) a partir de los .txt de un
+feed GTFS, ya sea un directorio o un .zip:
+- Cada archivo se recorre en streaming con el módulo csv (utf-8-sig, así
+  que el BOM de stop_times.txt y compañía no ensucia la cabecera) y se
+  inserta por lotes con executemany: la memoria no depende del tamaño de
+  stop_times.txt
+- Los identificadores (stop_id, trip_id, route_id, service_id, shape_id...)
+  se internan a claves enteras; las tablas gtfs_* guardan solo la clave y
+  las referencias son FOREIGN KEY enteras (comprobadas con
+  `PRAGMA foreign_key_check` al terminar, no fila a fila)
+- Las horas HH:MM:SS (pueden pasar de 24:00:00) se guardan en segundos
+  enteros (*_secs) y las fechas YYYYMMDD como enteros
+- Los índices se crean al terminar la carga, y la base se escribe en un
+  temporal que se renombra al final: quien la esté leyendo ve la anterior
+  completa o la nueva completa
+- Para cada archivo hay una vista con el nombre GTFS (stops, trips,
+  stop_times...) y sus columnas originales (ids de texto, horas HH:MM:SS),
+  de modo que `SELECT * FROM stop_times` sigue funcionando como antes
+
+Referencias a ids que no aparecen en su archivo (p. ej. route_id sin
+routes.txt) se completan con una fila con solo el id, y se avisa.
+
+Uso:
+    python herramientas/importar_gtfs.py [origen] [--salida M4/metro_madrid.db]
+"""
+
+import os
+import io
+import csv
+import sys
+import time
+import sqlite3
+import zipfile
+import tempfile
+import argparse
+import contextlib
+
+ORIGEN_POR_DEFECTO = 'M4'
+SALIDA_POR_DEFECTO = os.path.join('M4', 'metro_madrid.db')
+TAM_LOTE = 20000
+
+# entidad -> (tabla, columna id de texto). La clave entera es <entidad>_key
+ENTIDADES = {
+    'agency': ('gtfs_agency', 'agency_id'),
+    'service': ('gtfs_calendar', 'service_id'),
+    'route': ('gtfs_routes', 'route_id'),
+    'stop': ('gtfs_stops', 'stop_id'),
+    'shape': ('gtfs_shapes', 'shape_id'),
+    'trip': ('gtfs_trips', 'trip_id'),
+    'fare': ('gtfs_fare_attributes', 'fare_id'),
+}
+
+# Archivo GTFS -> (tabla, columnas). Cada columna es (nombre en el .txt, tipo[, entidad]):
+# 'id' define la entidad, 'ref' la referencia; 'hora' -> segundos; 'fecha' -> YYYYMMDD entero
+ARCHIVOS = [
+    ('agency', 'gtfs_agency', [
+        ('agency_id', 'id', 'agency'), ('agency_name', 'texto'), ('agency_url', 'texto'),
+        ('agency_timezone', 'texto'), ('agency_lang', 'texto'), ('agency_phone', 'texto'),
+        ('agency_fare_url', 'texto'), ('agency_email', 'texto')]),
+    ('calendar', 'gtfs_calendar', [
+        ('service_id', 'id', 'service'), ('monday', 'entero'), ('tuesday', 'entero'),
+        ('wednesday', 'entero'), ('thursday', 'entero'), ('friday', 'entero'), ('saturday', 'entero'),
+        ('sunday', 'entero'), ('start_date', 'fecha'), ('end_date', 'fecha')]),
+    ('calendar_dates', 'gtfs_calendar_dates', [
+        ('service_id', 'ref', 'service'), ('date', 'fecha'), ('exception_type', 'entero')]),
+    ('routes', 'gtfs_routes', [
+        ('route_id', 'id', 'route'), ('agency_id', 'ref', 'agency'), ('route_short_name', 'texto'),
+        ('route_long_name', 'texto'), ('route_desc', 'texto'), ('route_type', 'entero'),
+        ('route_url', 'texto'), ('route_color', 'texto'), ('route_text_color', 'texto'),
+        ('route_sort_order', 'entero')]),
+    ('stops', 'gtfs_stops', [
+        ('stop_id', 'id', 'stop'), ('stop_code', 'texto'), ('stop_name', 'texto'), ('stop_desc', 'texto'),
+        ('stop_lat', 'real'), ('stop_lon', 'real'), ('zone_id', 'texto'), ('stop_url', 'texto'),
+        ('location_type', 'entero'), ('parent_station', 'ref', 'stop'), ('stop_timezone', 'texto'),
+        ('wheelchair_boarding', 'entero'), ('platform_code', 'texto')]),
+    ('shapes', 'gtfs_shape_points', [
+        ('shape_id', 'ref', 'shape'), ('shape_pt_lat', 'real'), ('shape_pt_lon', 'real'),
+        ('shape_pt_sequence', 'entero'), ('shape_dist_traveled', 'real')]),
+    ('trips', 'gtfs_trips', [
+        ('trip_id', 'id', 'trip'), ('route_id', 'ref', 'route'), ('service_id', 'ref', 'service'),
+        ('trip_headsign', 'texto'), ('trip_short_name', 'texto'), ('direction_id', 'entero'),
+        ('block_id', 'texto'), ('shape_id', 'ref', 'shape'), ('wheelchair_accessible', 'entero'),
+        ('bikes_allowed', 'entero')]),
+    ('stop_times', 'gtfs_stop_times', [
+        ('trip_id', 'ref', 'trip'), ('arrival_time', 'hora'), ('departure_time', 'hora'),
+        ('stop_id', 'ref', 'stop'), ('stop_sequence', 'entero'), ('stop_headsign', 'texto'),
+        ('pickup_type', 'entero'), ('drop_off_type', 'entero'), ('shape_dist_traveled', 'real'),
+        ('timepoint', 'entero')]),
+    ('frequencies', 'gtfs_frequencies', [
+        ('trip_id', 'ref', 'trip'), ('start_time', 'hora'), ('end_time', 'hora'),
+        ('headway_secs', 'entero'), ('exact_times', 'entero')]),
+    ('fare_attributes', 'gtfs_fare_attributes', [
+        ('fare_id', 'id', 'fare'), ('price', 'real'), ('currency_type', 'texto'),
+        ('payment_method', 'entero'), ('transfers', 'entero'), ('agency_id', 'ref', 'agency'),
+        ('transfer_duration', 'entero')]),
+]
+
+INDICES = [
+    ('gtfs_stop_times', ['trip_key', 'stop_sequence']),
+    ('gtfs_stop_times', ['stop_key', 'departure_secs']),
+    ('gtfs_trips', ['route_key']),
+    ('gtfs_trips', ['service_key']),
+    ('gtfs_trips', ['shape_key']),
+    ('gtfs_stops', ['parent_station_key']),
+    ('gtfs_shape_points', ['shape_key', 'shape_pt_sequence']),
+    ('gtfs_frequencies', ['trip_key']),
+    ('gtfs_calendar_dates', ['service_key', 'date']),
+    ('gtfs_routes', ['agency_key']),
+]
+
+
+def columna_bd(nombre, tipo, entidad=None):
+    """Nombre de la columna en la tabla gtfs_*"""
+    if tipo == 'ref':
+        return (nombre[:-3] if nombre.endswith('_id') else nombre) + '_key'
+    if tipo == 'hora':
+        return nombre.replace('_time', '') + '_secs'
+    return nombre
+
+
+def hora_a_segundos(valor):
+    """'25:03:10' -> 90190 (las horas GTFS pueden pasar de 24)"""
+    h, m, s = valor.split(':')
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+
+class Internador:
+    """id de texto -> clave entera, por entidad; recuerda qué ids se han definido"""
+
+    def __init__(self):
+        self.claves = {}
+        self.definidas = set()
+
+    def clave(self, valor):
+        clave = self.claves.get(valor)
+        if clave is None:
+            clave = self.claves[valor] = len(self.claves) + 1
+        return clave
+
+    def definir(self, valor):
+        clave = self.clave(valor)
+        self.definidas.add(clave)
+        return clave
+
+    def sin_definir(self):
+        return [(clave, valor) for valor, clave in self.claves.items() if clave not in self.definidas]
+
+
+class OrigenGTFS:
+    """Directorio o .zip con los .txt del feed (dentro del zip pueden ir en una subcarpeta)"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.zip = zipfile.ZipFile(ruta) if os.path.isfile(ruta) and zipfile.is_zipfile(ruta) else None
+        if self.zip is None and not os.path.isdir(ruta):
+            raise FileNotFoundError(f"No existe el origen GTFS: {ruta}")
+        self.miembros = {}
+        if self.zip is not None:
+            for nombre in self.zip.namelist():
+                self.miembros.setdefault(os.path.basename(nombre), nombre)
+
+    @contextlib.contextmanager
+    def abrir(self, archivo):
+        """Texto del archivo (None si el feed no lo trae), sin BOM"""
+        if self.zip is not None:
+            miembro = self.miembros.get(archivo)
+            if miembro is None:
+                yield None
+                return
+            with self.zip.open(miembro) as binario:
+                yield io.TextIOWrapper(binario, encoding='utf-8-sig', newline='')
+        else:
+            ruta = os.path.join(self.ruta, archivo)
+            if not os.path.exists(ruta):
+                yield None
+                return
+            with open(ruta, 'r', encoding='utf-8-sig', newline='') as f:
+                yield f
+
+    def cerrar(self):
+        if self.zip is not None:
+            self.zip.close()
+
+
+class ImportadorGTFS:
+    def __init__(self, origen, salida=SALIDA_POR_DEFECTO, tam_lote=TAM_LOTE):
+        self.origen = origen
+        self.salida = salida
+        self.tam_lote = tam_lote
+        self.internadores = {entidad: Internador() for entidad in ENTIDADES}
+        self.estadisticas = {}
+        self.valores_invalidos = 0
+        self._caches = {}
+
+    # ------------------------------------------------------------------
+    # Esquema
+    # ------------------------------------------------------------------
+
+    def _crear_esquema(self, conn):
+        definidas = set()
+        for _, tabla, columnas in ARCHIVOS:
+            definiciones = []
+            for nombre, tipo, *entidad in columnas:
+                columna = columna_bd(nombre, tipo)
+                if tipo == 'id':
+                    definiciones.append(f'{entidad[0]}_key INTEGER PRIMARY KEY')
+                    definiciones.append(f'{nombre} TEXT NOT NULL UNIQUE')
+                elif tipo == 'ref':
+                    tabla_ref = ENTIDADES[entidad[0]][0]
+                    definiciones.append(f'{columna} INTEGER REFERENCES {tabla_ref}({entidad[0]}_key)')
+                else:
+                    tipo_sql = {'entero': 'INTEGER', 'hora': 'INTEGER', 'fecha': 'INTEGER', 'real': 'REAL'}.get(tipo, 'TEXT')
+                    definiciones.append(f'{columna} {tipo_sql}')
+            conn.execute(f'CREATE TABLE {tabla} ({", ".join(definiciones)})')
+            definidas.add(tabla)
+
+        # Entidades sin archivo propio (shape): solo el diccionario id <-> clave
+        for entidad, (tabla, columna_id) in ENTIDADES.items():
+            if tabla not in definidas:
+                conn.execute(f'CREATE TABLE {tabla} ({entidad}_key INTEGER PRIMARY KEY, {columna_id} TEXT NOT NULL UNIQUE)')
+
+    def _crear_vistas(self, conn):
+        """Vistas con el nombre y las columnas GTFS originales sobre las tablas internadas"""
+        for archivo, tabla, columnas in ARCHIVOS:
+            seleccion, uniones = [], []
+            for i, (nombre, tipo, *entidad) in enumerate(columnas):
+                columna = columna_bd(nombre, tipo)
+                if tipo == 'ref':
+                    tabla_ref, columna_id = ENTIDADES[entidad[0]]
+                    uniones.append(f'LEFT JOIN {tabla_ref} r{i} ON r{i}.{entidad[0]}_key = t.{columna}')
+                    seleccion.append(f'r{i}.{columna_id} AS {nombre}')
+                elif tipo == 'hora':
+                    seleccion.append(
+                        f"CASE WHEN t.{columna} IS NULL THEN NULL ELSE printf('%02d:%02d:%02d', "
+                        f"t.{columna} / 3600, t.{columna} / 60 % 60, t.{columna} % 60) END AS {nombre}")
+                    seleccion.append(f't.{columna}')
+                else:
+                    seleccion.append(f't.{columna}')
+            conn.execute(f'CREATE VIEW {archivo} AS SELECT {", ".join(seleccion)} FROM {tabla} t {" ".join(uniones)}')
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+
+    def _convertir_columna(self, valores, tipo, entidad):
+        """Convierte una columna entera de un lote (las columnas se tratan juntas, no fila a fila)"""
+        if tipo in ('id', 'ref'):
+            internador = self.internadores[entidad]
+            registrar = internador.definir if tipo == 'id' else internador.clave
+            return [registrar(v) if v else None for v in valores]
+        if tipo == 'texto':
+            return [v if v else None for v in valores]
+
+        # Numéricos y horas: los valores se repiten mucho (horas, secuencias), se cachean
+        convertir = {'entero': int, 'fecha': int, 'real': float, 'hora': hora_a_segundos}[tipo]
+        cache = self._caches.setdefault(tipo, {})
+        resultado = []
+        for v in valores:
+            convertido = cache.get(v, cache)
+            if convertido is cache:
+                try:
+                    convertido = convertir(v.strip()) if v.strip() else None
+                except ValueError:
+                    self.valores_invalidos += 1
+                    convertido = None
+                if len(cache) < 200000:
+                    cache[v] = convertido
+            resultado.append(convertido)
+        return resultado
+
+    def _insertar_lote(self, conn, sql, lote, columnas_presentes, ancho):
+        # Filas cortas (columnas finales vacías omitidas) se rellenan para poder transponer
+        lote = [fila if len(fila) >= ancho else fila + [''] * (ancho - len(fila)) for fila in lote]
+        transpuesto = list(zip(*lote))
+        columnas = []
+        for posicion, nombre, tipo, entidad in columnas_presentes:
+            columnas.append(self._convertir_columna(transpuesto[posicion], tipo, entidad))
+            if tipo == 'id':
+                columnas.append(transpuesto[posicion])
+        filas = [fila for fila in zip(*columnas) if columnas_presentes[0][2] != 'id' or fila[0] is not None]
+        conn.executemany(sql, filas)
+        return len(filas)
+
+    def _cargar_archivo(self, conn, fuente, archivo, tabla, columnas):
+        with fuente.abrir(f'{archivo}.txt') as f:
+            if f is None:
+                return None
+            lector = csv.reader(f)
+            cabecera = next(lector, None)
+            if cabecera is None:
+                return 0
+            posiciones = {nombre.strip(): i for i, nombre in enumerate(cabecera)}
+
+            # Solo las columnas que trae el archivo; la que define la entidad va primero
+            columnas_presentes = [(posiciones[nombre], nombre, tipo, entidad[0] if entidad else None)
+                                  for nombre, tipo, *entidad in columnas if nombre in posiciones]
+            columnas_presentes.sort(key=lambda columna: columna[2] != 'id')
+            if not columnas_presentes:
+                return 0
+            nombres_bd = []
+            for _, nombre, tipo, entidad in columnas_presentes:
+                if tipo == 'id':
+                    # La columna id se guarda dos veces: clave entera y texto
+                    nombres_bd.extend([f'{entidad}_key', nombre])
+                else:
+                    nombres_bd.append(columna_bd(nombre, tipo))
+
+            verbo = 'INSERT OR REPLACE' if columnas_presentes[0][2] == 'id' else 'INSERT'
+            sql = f'{verbo} INTO {tabla} ({", ".join(nombres_bd)}) VALUES ({", ".join("?" * len(nombres_bd))})'
+            ancho = len(cabecera)
+
+            total, lote = 0, []
+            for fila in lector:
+                if fila:
+                    lote.append(fila)
+                if len(lote) >= self.tam_lote:
+                    total += self._insertar_lote(conn, sql, lote, columnas_presentes, ancho)
+                    lote = []
+            if lote:
+                total += self._insertar_lote(conn, sql, lote, columnas_presentes, ancho)
+            return total
+
+    def _completar_referencias(self, conn):
+        """Filas mínimas (solo el id) para los ids referenciados que su archivo no define"""
+        for entidad, (tabla, columna_id) in ENTIDADES.items():
+            pendientes = self.internadores[entidad].sin_definir()
+            if not pendientes:
+                continue
+            conn.executemany(f'INSERT INTO {tabla} ({entidad}_key, {columna_id}) VALUES (?, ?)', pendientes)
+            if tabla != 'gtfs_shapes':
+                print(f"⚠️ {len(pendientes)} {columna_id} referenciados que no están en su archivo (se crean sin atributos)")
+
+    def importar(self):
+        fuente = OrigenGTFS(self.origen)
+        directorio = os.path.dirname(os.path.abspath(self.salida))
+        os.makedirs(directorio, exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(prefix=f'.{os.path.basename(self.salida)}.', suffix='.tmp', dir=directorio)
+        os.close(descriptor)
+        inicio = time.time()
+        try:
+            conn = sqlite3.connect(temporal, isolation_level=None)
+            try:
+                conn.execute('PRAGMA journal_mode = MEMORY')
+                conn.execute('PRAGMA synchronous = OFF')
+                # Las FOREIGN KEY se declaran, pero se comprueban de una pasada al final
+                conn.execute('PRAGMA foreign_keys = OFF')
+                conn.execute('BEGIN')
+                self._crear_esquema(conn)
+                for archivo, tabla, columnas in ARCHIVOS:
+                    filas = self._cargar_archivo(conn, fuente, archivo, tabla, columnas)
+                    self.estadisticas[archivo] = filas
+                    if filas is not None:
+                        print(f"✅ {archivo}.txt: {filas} filas")
+                self._completar_referencias(conn)
+                for tabla, columnas in INDICES:
+                    conn.execute(f'CREATE INDEX idx_{tabla}_{"_".join(columnas)} ON {tabla} ({", ".join(columnas)})')
+                self._crear_vistas(conn)
+                violaciones = conn.execute('PRAGMA foreign_key_check').fetchall()
+                if violaciones:
+                    raise sqlite3.IntegrityError(f"{len(violaciones)} referencias rotas (p. ej. {violaciones[0]})")
+                conn.execute('COMMIT')
+                conn.execute('ANALYZE')
+            finally:
+                conn.close()
+            with open(temporal, 'rb+') as f:
+                os.fsync(f.fileno())
+            os.replace(temporal, self.salida)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temporal)
+            raise
+        finally:
+            fuente.cerrar()
+
+        if self.valores_invalidos:
+            print(f"⚠️ {self.valores_invalidos} valores no numéricos o de hora inválidos guardados como NULL")
+        print(f"✅ {self.salida} generado en {time.time() - inicio:.2f}s")
+        return self.estadisticas
+
+
+def importar_gtfs(origen=ORIGEN_POR_DEFECTO, salida=SALIDA_POR_DEFECTO):
+    """Importa el feed GTFS `origen` (directorio o .zip) a la base SQLite `salida`"""
+    print("🚇 IMPORTANDO GTFS")
+    print("=" * 60)
+    print(f"📂 Origen: {origen}")
+    ImportadorGTFS(origen, salida).importar()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Importa un feed GTFS (directorio o .zip) a SQLite')
+    parser.add_argument('origen', nargs='?', default=ORIGEN_POR_DEFECTO)
+    parser.add_argument('--salida', default=SALIDA_POR_DEFECTO)
+    args = parser.parse_args()
+    try:
+        importar_gtfs(args.origen, args.salida)
+    except (FileNotFoundError, sqlite3.Error) as e:
+        print(f"❌ Error importando GTFS: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MOTOR DE SCRAPING CONCURRENTE
+=============================
+
+Motor común para las descargas de los scrapers de herramientas:
+- Límite de cortesía por host con token bucket (peticiones/segundo y ráfaga)
+- Concurrencia acotada con un pool de hilos
+- Reintentos con backoff exponencial y jitter (errores de red, 429 y 5xx,
+  respetando Retry-After)
+- Peticiones condicionales (If-None-Match / If-Modified-Since): si el
+  servidor responde 304 se devuelve el último cuerpo conocido
+- Hash del cuerpo por URL: `sin_cambios` indica que el contenido es el
+  mismo que en la descarga anterior y el scraper puede no volver a parsear.
+  Con un `AlmacenValidadores` los validadores y hashes sobreviven a
+  reinicios (tabla validadores_http)
+
+El tiempo de un barrido lo marca la tasa permitida por host y no la suma
+de esperas fijas más latencias. Todo se configura por constructor, así que
+se puede probar contra un servidor HTTP local que sirva páginas grabadas
+(ver herramientas/tests/test_motor_scraping.py).
+"""
+
+import json
+import time
+import random
+import logging
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from validadores_http import AlmacenValidadores, hash_cuerpo
+
+logger = logging.getLogger(__name__)
+
+PETICIONES_POR_SEGUNDO = 1.0
+RAFAGA = 2
+MAX_CONCURRENCIA = 4
+REINTENTOS = 3
+BACKOFF_BASE = 0.5  # segundos
+BACKOFF_MAX = 8.0  # segundos
+TIMEOUT = 15
+
+CODIGOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+HEADERS_POR_DEFECTO = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+class LimitadorToken:
+    """Token bucket: `tasa` tokens por segundo con capacidad `rafaga`"""
+
+    def __init__(self, tasa, rafaga):
+        self.tasa = float(tasa)
+        self.capacidad = float(max(1, rafaga))
+        self.tokens = self.capacidad
+        self.ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reponer(self):
+        ahora = time.monotonic()
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+        self.ultimo = ahora
+
+    def adquirir(self):
+        """Bloquea hasta disponer de un token y lo consume. Devuelve lo esperado (s)"""
+        esperado = 0.0
+        while True:
+            with self._lock:
+                self._reponer()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return esperado
+                espera = (1 - self.tokens) / self.tasa
+            time.sleep(espera)
+            esperado += espera
+
+
+class RespuestaMotor:
+    """Resultado de una descarga (posiblemente servido desde la caché condicional)"""
+
+    def __init__(self, url, status_code, content, headers, no_modificado=False, intentos=1,
+                 hash_cuerpo=None, sin_cambios=False):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.no_modificado = no_modificado
+        self.intentos = intentos
+        self.hash_cuerpo = hash_cuerpo
+        # True si el cuerpo es idéntico al de la descarga anterior (304 o mismo hash)
+        self.sin_cambios = sin_cambios
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"Error HTTP {self.status_code} para {self.url}")
+
+
+class MotorScraping:
+    """Descargas concurrentes y corteses para todos los scrapers"""
+
+    def __init__(self, peticiones_por_segundo=PETICIONES_POR_SEGUNDO, rafaga=RAFAGA,
+                 max_concurrencia=MAX_CONCURRENCIA, reintentos=REINTENTOS,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, timeout=TIMEOUT,
+                 session=None, condicional=True, almacen=None):
+        self.peticiones_por_segundo = peticiones_por_segundo
+        self.rafaga = rafaga
+        self.max_concurrencia = max_concurrencia
+        self.reintentos = reintentos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.condicional = condicional
+        self.almacen = almacen
+        self.session = session or requests.Session()
+        if session is None:
+            self.session.headers.update(HEADERS_POR_DEFECTO)
+
+        self._limitadores = {}
+        self._validadores = {}  # url -> {'etag', 'last_modified', 'hash', 'content'} (o None si no hay)
+        self._lock = threading.Lock()
+        self.estadisticas = {'peticiones': 0, 'reintentos': 0, 'no_modificadas': 0, 'sin_cambios': 0,
+                             'errores': 0, 'espera_limite': 0.0}
+
+    def _limitador(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            limitador = self._limitadores.get(host)
+            if limitador is None:
+                limitador = LimitadorToken(self.peticiones_por_segundo, self.rafaga)
+                self._limitadores[host] = limitador
+            return limitador
+
+    def _sumar(self, clave, valor=1):
+        with self._lock:
+            self.estadisticas[clave] += valor
+
+    def _espera_backoff(self, intento, response=None):
+        """Full jitter: aleatorio entre 0 y base*2^intento (o Retry-After si lo envía el servidor)"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return min(self.backoff_max, float(retry_after))
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** intento)))
+
+    def _validadores_de(self, url):
+        """Validadores en memoria; la primera vez se cargan del almacén persistente"""
+        with self._lock:
+            if url in self._validadores:
+                return self._validadores[url]
+        validadores = self.almacen.cargar(url) if self.almacen else None
+        with self._lock:
+            self._validadores.setdefault(url, validadores)
+            return self._validadores[url]
+
+    def _cabeceras_condicionales(self, url):
+        validadores = self._validadores_de(url)
+        if not validadores or not validadores.get('content'):
+            return {}
+        cabeceras = {}
+        if validadores.get('etag'):
+            cabeceras['If-None-Match'] = validadores['etag']
+        if validadores.get('last_modified'):
+            cabeceras['If-Modified-Since'] = validadores['last_modified']
+        return cabeceras
+
+    def _registrar_respuesta(self, url, response):
+        """Guarda validadores y hash de una respuesta 200. Devuelve (hash, sin_cambios)"""
+        anterior = self._validadores_de(url)
+        hash_actual = hash_cuerpo(response.content)
+        sin_cambios = bool(anterior) and anterior.get('hash') == hash_actual
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+        with self._lock:
+            self._validadores[url] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'hash': hash_actual,
+                'content': response.content
+            }
+
+        # Solo se reescribe en BD si cambió algo (cuerpo o validadores)
+        if self.almacen and not (sin_cambios and anterior.get('etag') == etag
+                                 and anterior.get('last_modified') == last_modified):
+            self.almacen.guardar(url, etag, last_modified, hash_actual, response.content)
+        return hash_actual, sin_cambios
+
+    def obtener(self, url, headers=None, session=None, timeout=None, condicional=None, reintentos=None):
+        """
+        Descarga `url` respetando el límite del host, con reintentos y petición
+        condicional. Devuelve una RespuestaMotor (no lanza por códigos HTTP;
+        lanza la última excepción de red si se agotan los reintentos).
+        """
+        cliente = session or self.session
+        usar_condicional = self.condicional if condicional is None else condicional
+        cabeceras = dict(headers or {})
+        if usar_condicional:
+            cabeceras.update(self._cabeceras_condicionales(url))
+
+        max_reintentos = self.reintentos if reintentos is None else reintentos
+        limitador = self._limitador(url)
+        ultimo_error = None
+        for intento in range(max_reintentos + 1):
+            self._sumar('espera_limite', limitador.adquirir())
+            self._sumar('peticiones')
+            try:
+                response = cliente.get(url, headers=cabeceras or None, timeout=timeout or self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                ultimo_error = e
+                response = None
+
+            if response is not None and response.status_code not in CODIGOS_REINTENTABLES:
+                if response.status_code == 304 and usar_condicional:
+                    validadores = self._validadores_de(url)
+                    if validadores and validadores.get('content') is not None:
+                        self._sumar('no_modificadas')
+                        self._sumar('sin_cambios')
+                        return RespuestaMotor(url, 200, validadores['content'], response.headers,
+                                              no_modificado=True, intentos=intento + 1,
+                                              hash_cuerpo=validadores.get('hash'), sin_cambios=True)
+                if response.status_code == 200 and usar_condicional:
+                    hash_actual, sin_cambios = self._registrar_respuesta(url, response)
+                    if sin_cambios:
+                        self._sumar('sin_cambios')
+                    return RespuestaMotor(url, 200, response.content, response.headers,
+                                          intentos=intento + 1, hash_cuerpo=hash_actual,
+                                          sin_cambios=sin_cambios)
+                return RespuestaMotor(url, response.status_code, response.content, response.headers,
+                                      intentos=intento + 1)
+
+            if intento < max_reintentos:
+                self._sumar('reintentos')
+                espera = self._espera_backoff(intento, response)
+                motivo = f"HTTP {response.status_code}" if response is not None else ultimo_error
+                logger.warning(f"[MOTOR] Reintento {intento + 1}/{max_reintentos} para {url} en {espera:.1f}s ({motivo})")
+                time.sleep(espera)
+
+        self._sumar('errores')
+        if response is not None:
+            return RespuestaMotor(url, response.status_code, response.content, response.headers,
+                                  intentos=max_reintentos + 1)
+        raise ultimo_error
+
+    def mapear(self, funcion, elementos, max_concurrencia=None):
+        """
+        Aplica `funcion` a cada elemento en un pool de hilos acotado y devuelve
+        los resultados en el mismo orden. Si una llamada lanza una excepción se
+        registra y su resultado es None.
+        """
+        elementos = list(elementos)
+        if not elementos:
+            return []
+
+        def _seguro(elemento):
+            try:
+                return funcion(elemento)
+            except Exception as e:
+                logger.error(f"[MOTOR] Error procesando {elemento!r}: {e}")
+                return None
+
+        trabajadores = min(max_concurrencia or self.max_concurrencia, len(elementos))
+        with ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix='motor-scraping') as pool:
+            return list(pool.map(_seguro, elementos))
+
+
+_motor = None
+_motor_lock = threading.Lock()
+
+
+def obtener_motor():
+    """Motor compartido del proceso (el límite por host se aplica a todos los scrapers)"""
+    global _motor
+    with _motor_lock:
+        if _motor is None:
+            try:
+                almacen = AlmacenValidadores()
+            except Exception as e:
+                logger.warning(f"[MOTOR] Validadores HTTP solo en memoria: {e}")
+                almacen = None
+            _motor = MotorScraping(almacen=almacen)
+        return _motor
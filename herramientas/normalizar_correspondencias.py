@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+NORMALIZADOR DE CORRESPONDENCIAS
+================================
+
+Parsea una sola vez la columna de texto libre `correspondencias` de
+estaciones_completas (o su variante JSON '["4"]' de las tablas de línea)
+y la guarda como filas tipadas en `conexiones_normalizadas`, con el modo
+de transporte, la línea de destino y flags por modo. La API y el resto de
+consumidores hacen JOIN por station_id en lugar de aplicar regex al texto.
+
+Junto a las filas se guarda la huella (hash) de estaciones_completas de la
+que salieron: `correspondencias_al_dia` la compara sin escribir nada, y la
+tabla se regenera fuera de las peticiones (este script o el mantenimiento
+periódico del trabajador de scraping) cuando el origen cambia.
+"""
+
+import sqlite3
+import hashlib
+import json
+import re
+from datetime import datetime
+
+DB_PATH = 'db/estaciones_fijas_v2.db'
+
+# Valor de la columna `fuente` para las filas generadas por este script
+FUENTE_CORRESPONDENCIAS = 'correspondencias'
+
+# Orden de presentación de los modos (el mismo que usaba la API)
+MODOS = ('metro', 'cercanias', 'autobuses', 'intercambiador')
+
+PATRON_METRO = re.compile(r'Línea\s+(\d+)')
+PATRON_CERCANIAS = re.compile(r'Cercanías\s+(\w+)')
+
+# Columnas añadidas a la tabla existente (tabla creada desde conexiones_completas.csv)
+COLUMNAS_NORMALIZADAS = {
+    'modo': 'TEXT',
+    'linea_conexion': 'TEXT',
+    'orden': 'INTEGER',
+    'fuente': 'TEXT'
+}
+
+
+def parsear_correspondencias(valor):
+    """
+    Convierte el valor de `correspondencias` en una lista de tuplas (modo, linea_conexion).
+    Acepta tanto el texto descriptivo ('Autobuses; Línea 10; Intercambiador')
+    como la lista JSON de las tablas de línea ('["4", "10"]').
+    """
+    if valor is None:
+        return []
+    if isinstance(valor, bytes):
+        valor = valor.decode('utf-8', errors='ignore')
+    texto = str(valor).strip()
+    if not texto:
+        return []
+
+    # Formato JSON: lista de números de línea de metro
+    if texto.startswith('['):
+        try:
+            lista = json.loads(texto)
+            if isinstance(lista, list):
+                return [('metro', str(linea)) for linea in lista if str(linea).strip()]
+        except ValueError:
+            pass
+
+    conexiones = [('metro', linea) for linea in PATRON_METRO.findall(texto)]
+    conexiones.extend(('cercanias', linea) for linea in PATRON_CERCANIAS.findall(texto))
+    if 'Autobuses' in texto:
+        conexiones.append(('autobuses', None))
+    if 'Intercambiador' in texto:
+        conexiones.append(('intercambiador', None))
+    return conexiones
+
+
+def asegurar_esquema(conn):
+    """Crea la tabla, las columnas tipadas, los índices y la vista de flags si no existen"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conexiones_normalizadas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            station_id INTEGER NOT NULL,
+            linea TEXT NOT NULL,
+            estacion_nombre TEXT NOT NULL,
+            tipo_conexion TEXT NOT NULL,
+            nombre_conexion TEXT NOT NULL,
+            icono TEXT,
+            descripcion TEXT,
+            ultima_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (station_id) REFERENCES estaciones_completas (id_fijo)
+        )
+    ''')
+
+    cursor.execute("PRAGMA table_info(conexiones_normalizadas)")
+    existentes = [col[1] for col in cursor.fetchall()]
+    for columna, tipo in COLUMNAS_NORMALIZADAS.items():
+        if columna not in existentes:
+            cursor.execute(f"ALTER TABLE conexiones_normalizadas ADD COLUMN {columna} {tipo}")
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conexiones_normalizadas_origen (
+            fuente TEXT PRIMARY KEY,
+            huella TEXT NOT NULL,
+            generado TEXT
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conexiones_station_linea
+        ON conexiones_normalizadas(station_id, linea, fuente)
+    ''')
+
+    # Flags por modo y estación, calculados por SQL sobre las filas tipadas
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS conexiones_por_estacion AS
+        SELECT station_id,
+               linea,
+               MAX(modo = 'metro') AS tiene_metro,
+               MAX(modo = 'cercanias') AS tiene_cercanias,
+               MAX(modo = 'autobuses') AS tiene_autobuses,
+               MAX(modo = 'intercambiador') AS tiene_intercambiador,
+               COUNT(*) AS total_conexiones
+        FROM conexiones_normalizadas
+        WHERE modo IS NOT NULL
+        GROUP BY station_id, linea
+    ''')
+    conn.commit()
+
+
+CONSULTA_ORIGEN = '''
+    SELECT id_fijo, linea, nombre, correspondencias
+    FROM estaciones_completas
+    ORDER BY id_fijo, linea
+'''
+
+
+def _leer_origen(conn):
+    """Filas de estaciones_completas y su huella"""
+    filas = [tuple(fila) for fila in conn.execute(CONSULTA_ORIGEN)]
+    return filas, hashlib.sha256(repr(filas).encode('utf-8')).hexdigest()
+
+
+def correspondencias_al_dia(conn):
+    """True si las filas normalizadas salieron del contenido actual de estaciones_completas (solo lee)"""
+    try:
+        fila = conn.execute(
+            "SELECT huella FROM conexiones_normalizadas_origen WHERE fuente = ?", (FUENTE_CORRESPONDENCIAS,)
+        ).fetchone()
+        return fila is not None and fila[0] == _leer_origen(conn)[1]
+    except sqlite3.Error:
+        return False
+
+
+def normalizar_correspondencias(conn):
+    """
+    Regenera las filas de `conexiones_normalizadas` a partir de estaciones_completas
+    en una sola transacción, junto con la huella del origen. Devuelve el número
+    de filas insertadas.
+    """
+    asegurar_esquema(conn)
+    cursor = conn.cursor()
+    origen, huella = _leer_origen(conn)
+
+    ahora = datetime.now().isoformat()
+    filas = []
+    for id_fijo, linea, nombre, correspondencias in origen:
+        if correspondencias is None or correspondencias == '':
+            continue
+        vistos = set()
+        orden = 0
+        for modo, linea_conexion in parsear_correspondencias(correspondencias):
+            if (modo, linea_conexion) in vistos:
+                continue
+            vistos.add((modo, linea_conexion))
+            orden += 1
+            nombre_conexion = f'{modo} {linea_conexion}' if linea_conexion else modo
+            filas.append((
+                id_fijo, linea, nombre, modo, nombre_conexion, modo,
+                linea_conexion, orden, FUENTE_CORRESPONDENCIAS, ahora
+            ))
+
+    with conn:
+        # Clasificar también las filas importadas de conexiones_completas.csv
+        cursor.execute('''
+            UPDATE conexiones_normalizadas
+            SET modo = CASE
+                    WHEN tipo_conexion LIKE 'Cercan%' THEN 'cercanias'
+                    WHEN tipo_conexion LIKE 'Autobus%' THEN 'autobuses'
+                    WHEN tipo_conexion LIKE 'Intercambiador%' THEN 'intercambiador'
+                    ELSE 'otros'
+                END,
+                fuente = 'conexiones_completas'
+            WHERE fuente IS NULL
+        ''')
+        cursor.execute("DELETE FROM conexiones_normalizadas WHERE fuente = ?", (FUENTE_CORRESPONDENCIAS,))
+        cursor.executemany('''
+            INSERT INTO conexiones_normalizadas
+            (station_id, linea, estacion_nombre, tipo_conexion, nombre_conexion, modo,
+             linea_conexion, orden, fuente, ultima_actualizacion)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', filas)
+        cursor.execute(
+            "INSERT OR REPLACE INTO conexiones_normalizadas_origen (fuente, huella, generado) VALUES (?, ?, ?)",
+            (FUENTE_CORRESPONDENCIAS, huella, ahora)
+        )
+
+    return len(filas)
+
+
+def asegurar_correspondencias_normalizadas(conn):
+    """Regenera las filas solo si estaciones_completas cambió desde la última normalización"""
+    if correspondencias_al_dia(conn):
+        return 0
+    return normalizar_correspondencias(conn)
+
+
+def formatear_conexion(modo, linea_conexion):
+    """Etiqueta que devuelve la API para una conexión normalizada"""
+    if modo == 'metro':
+        return linea_conexion
+    if modo == 'cercanias':
+        return f'C{linea_conexion}' if linea_conexion else None
+    if modo == 'autobuses':
+        return 'Autobuses'
+    if modo == 'intercambiador':
+        return 'Intercambiador'
+    return None
+
+
+def main():
+    print("🔄 Normalizando correspondencias de estaciones_completas...")
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        total = normalizar_correspondencias(conn)
+        print(f"✅ {total} conexiones normalizadas guardadas en conexiones_normalizadas")
+
+        for modo in MODOS:
+            count = conn.execute(
+                "SELECT COUNT(*) FROM conexiones_normalizadas WHERE fuente = ? AND modo = ?",
+                (FUENTE_CORRESPONDENCIAS, modo)
+            ).fetchone()[0]
+            print(f"   - {modo}: {count}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
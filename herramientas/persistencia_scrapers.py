@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PERSISTENCIA DE SCRAPERS (WRITE-BEHIND)
+=======================================
+
+Capa de escritura compartida por los scrapers. Los scrapers encolan
+sentencias con sus parámetros y un único hilo escritor las agrupa en
+lotes: cada lote se escribe en una sola transacción, con `executemany`
+para las sentencias iguales consecutivas. Los CREATE TABLE / índices se
+registran una vez y se aplican antes del primer lote, no en cada registro.
+Si un lote falla se reintenta registro a registro: solo se pierden (y se
+cuentan en `descartados`) los que fallan por sí mismos.
+
+La conexión del escritor usa WAL para que los lectores de Flask no se
+bloqueen mientras se escribe.
+"""
+
+import sqlite3
+import threading
+import queue
+import logging
+import atexit
+
+DB_PATH = 'db/estaciones_fijas_v2.db'
+
+TAM_LOTE = 500
+INTERVALO_FLUSH = 1.0  # segundos
+
+logger = logging.getLogger(__name__)
+
+
+class _MarcaFlush:
+    """Marca que se encola para esperar a que todo lo anterior esté escrito"""
+    def __init__(self):
+        self.evento = threading.Event()
+
+
+class EscritorBD:
+    """Escritor write-behind: una cola, un hilo, transacciones por lotes"""
+
+    def __init__(self, db_path=DB_PATH, tam_lote=TAM_LOTE, intervalo_flush=INTERVALO_FLUSH):
+        self.db_path = db_path
+        self.tam_lote = tam_lote
+        self.intervalo_flush = intervalo_flush
+        self.cola = queue.Queue()
+        self.esquemas = []
+        self._esquemas_aplicados = 0
+        self._hilo = None
+        self._lock = threading.Lock()
+        self._detener = False
+        self.estadisticas = {'registros': 0, 'lotes': 0, 'errores': 0, 'descartados': 0}
+
+    def registrar_esquema(self, esquema):
+        """
+        Registra una sentencia SQL (o una función que recibe la conexión) que se
+        aplica una sola vez antes del siguiente lote.
+        """
+        with self._lock:
+            if esquema not in self.esquemas:
+                self.esquemas.append(esquema)
+
+    def encolar(self, sql, parametros=()):
+        """Encola una sentencia para escritura diferida"""
+        self._arrancar()
+        self.cola.put((sql, tuple(parametros)))
+
+    def encolar_muchos(self, sql, lista_parametros):
+        """Encola la misma sentencia para varios registros"""
+        self._arrancar()
+        for parametros in lista_parametros:
+            self.cola.put((sql, tuple(parametros)))
+
+    def flush(self, timeout=None):
+        """Bloquea hasta que todo lo encolado hasta ahora esté confirmado en la BD"""
+        if not self._hilo:
+            return True
+        self._arrancar()
+        marca = _MarcaFlush()
+        self.cola.put(marca)
+        return marca.evento.wait(timeout)
+
+    def cerrar(self, timeout=10):
+        """Vacía la cola y detiene el hilo escritor"""
+        if not self._hilo:
+            return
+        self.flush(timeout)
+        self._detener = True
+        self.cola.put(None)
+        self._hilo.join(timeout)
+        self._hilo = None
+        self._detener = False
+
+    def _arrancar(self):
+        with self._lock:
+            if self._hilo and self._hilo.is_alive():
+                return
+            self._hilo = threading.Thread(target=self._bucle, name='escritor-bd', daemon=True)
+            self._hilo.start()
+
+    def _conectar(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _aplicar_esquemas(self, conn):
+        """Aplica los esquemas nuevos; solo cuentan como aplicados si se confirman"""
+        with self._lock:
+            aplicados = self._esquemas_aplicados
+            pendientes = self.esquemas[aplicados:]
+        if not pendientes:
+            return
+        for esquema in pendientes:
+            if callable(esquema):
+                esquema(conn)
+            else:
+                conn.execute(esquema)
+        conn.commit()
+        with self._lock:
+            self._esquemas_aplicados = aplicados + len(pendientes)
+
+    def _bucle(self):
+        conn = self._conectar()
+        try:
+            while not self._detener:
+                try:
+                    primero = self.cola.get(timeout=self.intervalo_flush)
+                except queue.Empty:
+                    continue
+                if primero is None:
+                    break
+
+                lote = [primero]
+                while len(lote) < self.tam_lote:
+                    try:
+                        siguiente = self.cola.get_nowait()
+                    except queue.Empty:
+                        break
+                    if siguiente is None:
+                        self._detener = True
+                        break
+                    lote.append(siguiente)
+
+                self._escribir_lote(conn, lote)
+        finally:
+            conn.close()
+
+    def _escribir_lote(self, conn, lote):
+        registros = [item for item in lote if not isinstance(item, _MarcaFlush)]
+        marcas = [item for item in lote if isinstance(item, _MarcaFlush)]
+        try:
+            if registros:
+                self._escribir_registros(conn, registros)
+        finally:
+            # Pase lo que pase, quien espera en flush() no se queda bloqueado
+            for marca in marcas:
+                marca.evento.set()
+
+    def _escribir_registros(self, conn, registros):
+        # Agrupar sentencias iguales consecutivas para executemany (se respeta el orden)
+        grupos = []
+        for sql, parametros in registros:
+            if grupos and grupos[-1][0] == sql:
+                grupos[-1][1].append(parametros)
+            else:
+                grupos.append((sql, [parametros]))
+
+        try:
+            self._aplicar_esquemas(conn)
+            with conn:
+                for sql, lista in grupos:
+                    conn.executemany(sql, lista)
+        except Exception as e:
+            conn.rollback()
+            self.estadisticas['errores'] += 1
+            logger.error(f"[PERSISTENCIA] Error escribiendo lote de {len(registros)} registros, "
+                         f"se reintenta uno a uno: {e}")
+            self._escribir_uno_a_uno(conn, registros)
+            return
+        self.estadisticas['registros'] += len(registros)
+        self.estadisticas['lotes'] += 1
+
+    def _escribir_uno_a_uno(self, conn, registros):
+        """Tras un lote fallido: cada registro en su transacción, para perder solo los que fallan"""
+        for sql, parametros in registros:
+            try:
+                self._aplicar_esquemas(conn)
+                with conn:
+                    conn.execute(sql, parametros)
+                self.estadisticas['registros'] += 1
+            except Exception as e:
+                conn.rollback()
+                self.estadisticas['descartados'] += 1
+                logger.error(f"[PERSISTENCIA] Registro descartado ({e}): "
+                             f"{' '.join(sql.split())[:80]} {parametros!r:.200}")
+
+
+_escritores = {}
+_escritores_lock = threading.Lock()
+
+
+def obtener_escritor(db_path=DB_PATH):
+    """Devuelve el escritor compartido del proceso para una base de datos"""
+    with _escritores_lock:
+        escritor = _escritores.get(db_path)
+        if escritor is None:
+            escritor = EscritorBD(db_path)
+            _escritores[db_path] = escritor
+        return escritor
+
+
+@atexit.register
+def _cerrar_escritores():
+    for escritor in list(_escritores.values()):
+        escritor.cerrar()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PLANIFICADOR DE ACTUALIZACIONES POR PRIORIDAD
+=============================================
+
+Sustituye el "5 estaciones más antiguas cada 4 minutos" del auto scraper
+por una cola de prioridad (heap). Cada estación tiene un intervalo
+objetivo de refresco que se acorta según:
+- incidencias en su línea (estado_lineas_actual no normal, con el mismo
+  criterio que la API: estado_api)
+- su tasa reciente de cambios (media móvil exponencial de los cambios detectados)
+- la demanda de usuarios (favoritos y consultas registradas en demanda_estaciones)
+
+La prioridad es `minutos sin actualizar / intervalo objetivo`: las que pasan
+de 1 están vencidas. El heap se ordena por el instante en que vence cada
+estación y se mantiene entre ticks: la lista de estaciones se carga una vez
+(y se recarga cada pocos minutos), y en cada tick solo se leen las señales
+y se reprograman las estaciones cuyas señales cambiaron. Se sacan las
+vencidas hasta agotar el presupuesto de peticiones por minuto, de modo que
+las estaciones con incidencias o muy consultadas se refrescan en segundos
+y las tranquilas rara vez.
+
+La demanda la anota la app en memoria (RegistroDemanda) y se vuelca a la
+BD en lote cada pocos segundos, fuera de las peticiones.
+"""
+
+import math
+import heapq
+import atexit
+import sqlite3
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from almacen_estado_lineas import estado_api
+
+DB_PATH = 'db/estaciones_fijas_v2.db'
+
+LINEAS = ['1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12', 'Ramal']
+
+PRESUPUESTO_POR_MINUTO = 20
+INTERVALO_BASE_MIN = 180.0  # estación tranquila: cada 3 horas
+INTERVALO_MINIMO_MIN = 0.5  # nunca más de una vez cada 30 s
+FACTOR_INCIDENCIA = 20.0
+FACTOR_CAMBIOS = 10.0
+FACTOR_DEMANDA = 2.0
+ALFA_CAMBIOS = 0.3  # peso de la última observación en la media móvil
+MINUTOS_NUNCA_ACTUALIZADA = 24 * 60
+RECARGA_ESTACIONES = 600  # segundos entre recargas de la lista de estaciones
+INTERVALO_VOLCADO_DEMANDA = 30  # segundos
+
+ESQUEMA_DEMANDA = '''
+    CREATE TABLE IF NOT EXISTS demanda_estaciones (
+        station_id INTEGER PRIMARY KEY,
+        peticiones INTEGER NOT NULL DEFAULT 0,
+        ultima_peticion TEXT
+    )
+'''
+
+SUMAR_DEMANDA = '''
+    INSERT INTO demanda_estaciones (station_id, peticiones, ultima_peticion)
+    VALUES (?, ?, ?)
+    ON CONFLICT(station_id) DO UPDATE SET
+        peticiones = peticiones + excluded.peticiones,
+        ultima_peticion = excluded.ultima_peticion
+'''
+
+logger = logging.getLogger(__name__)
+
+
+class RegistroDemanda:
+    """
+    Consultas de usuarios por estación. La app solo suma en memoria; un hilo
+    las vuelca a demanda_estaciones en una transacción cada `intervalo`
+    segundos (y al salir).
+    """
+
+    def __init__(self, db_path=DB_PATH, intervalo=INTERVALO_VOLCADO_DEMANDA):
+        self.db_path = db_path
+        self.intervalo = intervalo
+        self._pendientes = Counter()
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._esquema_creado = False
+
+    def anotar(self, station_ids):
+        """Suma una consulta a cada estación de `station_ids`"""
+        with self._lock:
+            self._pendientes.update(station_ids)
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name='demanda-estaciones', daemon=True)
+                self._hilo.start()
+                atexit.register(self.volcar)
+
+    def _bucle(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                self.volcar()
+            except sqlite3.Error as e:
+                logger.warning(f"[PLANIFICADOR] No se pudo volcar la demanda: {e}")
+
+    def volcar(self):
+        """Escribe lo acumulado en una transacción; devuelve las estaciones escritas"""
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, Counter()
+        if not pendientes:
+            return 0
+        ahora = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            if not self._esquema_creado:
+                conn.execute(ESQUEMA_DEMANDA)
+                self._esquema_creado = True
+            with conn:
+                conn.executemany(SUMAR_DEMANDA, [(station_id, total, ahora)
+                                                 for station_id, total in pendientes.items()])
+        except sqlite3.Error:
+            # Se conservan para el siguiente volcado
+            with self._lock:
+                self._pendientes.update(pendientes)
+            raise
+        finally:
+            conn.close()
+        return len(pendientes)
+
+
+def _consulta_estaciones():
+    """Una sola consulta para las 13 tablas de línea"""
+    return ' UNION ALL '.join(
+        f"SELECT '{linea}' AS linea, id_fijo, nombre, id_modal, url FROM linea_{linea} WHERE id_modal IS NOT NULL"
+        for linea in LINEAS
+    )
+
+
+class PlanificadorPrioridad:
+    """Cola de prioridad de estaciones con presupuesto de peticiones por minuto"""
+
+    def __init__(self, db_path=DB_PATH, presupuesto_por_minuto=PRESUPUESTO_POR_MINUTO,
+                 recarga_estaciones=RECARGA_ESTACIONES):
+        self.db_path = db_path
+        self.presupuesto_por_minuto = presupuesto_por_minuto
+        self.recarga_estaciones = recarga_estaciones
+        self.tasa_cambios = {}      # id_fijo -> media móvil de cambios por actualización
+        self.actualizadas = {}      # id_fijo -> instante (time.time()) de la última actualización
+        self._estaciones = {}       # id_fijo -> datos de la estación (con todas sus líneas)
+        self._senales = {}          # id_fijo -> (incidencia, tasa, demanda) con que se programó
+        self._intervalos = {}       # id_fijo -> intervalo objetivo en minutos
+        self._generacion = {}       # id_fijo -> entrada vigente del heap (las demás se ignoran)
+        self._cola = []             # heap de (instante en que vence, id_fijo, generación)
+        self._incidencias = set()
+        self._demanda = {}
+        self._cargado = None
+        self._consumo = []          # instantes de las peticiones del último minuto
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Señales
+    # ------------------------------------------------------------------
+
+    def _lineas_con_incidencias(self, cursor):
+        try:
+            cursor.execute("SELECT linea, estado FROM estado_lineas_actual")
+        except sqlite3.Error:
+            return set()
+        return {linea for linea, estado in cursor.fetchall()
+                if estado_api(estado) != 'normal'}
+
+    def _demanda_leida(self, cursor):
+        demanda = {}
+        for consulta in ("SELECT station_id, COUNT(*) FROM favorite_stations GROUP BY station_id",
+                         "SELECT station_id, peticiones FROM demanda_estaciones"):
+            try:
+                cursor.execute(consulta)
+            except sqlite3.Error:
+                continue  # la tabla aún no existe en esta BD
+            for station_id, total in cursor.fetchall():
+                demanda[station_id] = demanda.get(station_id, 0) + total
+        return demanda
+
+    def _segundos_sin_actualizar(self, cursor):
+        """Antigüedad en BD del último estado de cada estación (UTC en ambos lados)"""
+        try:
+            cursor.execute('''
+                SELECT station_id, (julianday('now') - julianday(timestamp)) * 86400
+                FROM station_status_actual
+            ''')
+        except sqlite3.Error:
+            return {}
+        return {station_id: segundos for station_id, segundos in cursor.fetchall() if segundos is not None}
+
+    def intervalo_objetivo(self, incidencia, tasa_cambios, demanda):
+        """Minutos entre refrescos deseados para una estación"""
+        divisor = 1.0
+        if incidencia:
+            divisor *= FACTOR_INCIDENCIA
+        divisor *= 1.0 + FACTOR_CAMBIOS * tasa_cambios
+        divisor *= 1.0 + FACTOR_DEMANDA * math.log1p(demanda)
+        return max(INTERVALO_MINIMO_MIN, INTERVALO_BASE_MIN / divisor)
+
+    # ------------------------------------------------------------------
+    # Cola de prioridad
+    # ------------------------------------------------------------------
+
+    def _senales_de(self, id_fijo):
+        lineas = self._estaciones[id_fijo]['lineas']
+        return (any(linea in self._incidencias for linea in lineas),
+                self.tasa_cambios.get(id_fijo, 0.0),
+                self._demanda.get(id_fijo, 0))
+
+    def _programar(self, id_fijo):
+        """(Re)inserta la estación en el heap con su intervalo actual (con el lock tomado)"""
+        senales = self._senales_de(id_fijo)
+        intervalo = self.intervalo_objetivo(*senales)
+        generacion = self._generacion.get(id_fijo, 0) + 1
+        self._senales[id_fijo] = senales
+        self._intervalos[id_fijo] = intervalo
+        self._generacion[id_fijo] = generacion
+        heapq.heappush(self._cola, (self.actualizadas[id_fijo] + intervalo * 60, id_fijo, generacion))
+
+    def _cargar_estaciones(self, filas, segundos_sin_actualizar):
+        """Lista de estaciones nueva: se reconstruye el heap (solo al cargar o recargar)"""
+        ahora = time.time()
+        estaciones = {}
+        for linea, id_fijo, nombre, id_modal, url in filas:
+            if id_fijo in estaciones:
+                estaciones[id_fijo]['lineas'].append(linea)  # estación de correspondencia
+                continue
+            estaciones[id_fijo] = {
+                'id_estacion': id_fijo,
+                'nombre': nombre,
+                'id_modal': id_modal,
+                'url': url,
+                'linea': linea,
+                'lineas': [linea]
+            }
+            segundos = segundos_sin_actualizar.get(id_fijo, MINUTOS_NUNCA_ACTUALIZADA * 60)
+            # Lo más reciente entre la BD (otros procesos) y lo elegido aquí (escrituras diferidas)
+            self.actualizadas[id_fijo] = max(self.actualizadas.get(id_fijo, 0), ahora - segundos)
+
+        self._estaciones = estaciones
+        self._cola = []
+        for id_fijo in estaciones:
+            self._programar(id_fijo)
+
+    def refrescar(self):
+        """Lee las señales y reprograma solo las estaciones a las que les cambiaron"""
+        recargar = self._cargado is None or time.monotonic() - self._cargado >= self.recarga_estaciones
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            if recargar:
+                filas = cursor.execute(_consulta_estaciones()).fetchall()
+                segundos = self._segundos_sin_actualizar(cursor)
+            incidencias = self._lineas_con_incidencias(cursor)
+            demanda = self._demanda_leida(cursor)
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._incidencias, self._demanda = incidencias, demanda
+            if recargar:
+                self._cargar_estaciones(filas, segundos)
+                self._cargado = time.monotonic()
+                return
+            for id_fijo in self._estaciones:
+                if self._senales_de(id_fijo) != self._senales.get(id_fijo):
+                    self._programar(id_fijo)
+
+            # Las entradas obsoletas se descartan al salir; si se acumulan, se compacta
+            if len(self._cola) > 2 * len(self._estaciones) + 100:
+                self._cola = [e for e in self._cola if e[2] == self._generacion.get(e[1])]
+                heapq.heapify(self._cola)
+
+    def presupuesto_disponible(self):
+        """Peticiones que quedan en la ventana del último minuto"""
+        limite = time.time() - 60
+        with self._lock:
+            self._consumo = [t for t in self._consumo if t > limite]
+            return max(0, self.presupuesto_por_minuto - len(self._consumo))
+
+    def seleccionar(self, maximo=None):
+        """
+        Saca del heap las estaciones vencidas (prioridad >= 1) que vencieron
+        antes, sin pasar del presupuesto restante del minuto ni de `maximo`.
+        """
+        disponibles = self.presupuesto_disponible()
+        if maximo is not None:
+            disponibles = min(disponibles, maximo)
+        if disponibles <= 0:
+            return []
+
+        self.refrescar()
+        ahora = time.time()
+        seleccionadas = []
+        with self._lock:
+            while self._cola and len(seleccionadas) < disponibles:
+                vence, id_fijo, generacion = self._cola[0]
+                if generacion != self._generacion.get(id_fijo):
+                    heapq.heappop(self._cola)  # entrada reprogramada después
+                    continue
+                if vence > ahora:
+                    break  # el resto aún no está vencido
+                heapq.heappop(self._cola)
+
+                minutos = (ahora - self.actualizadas[id_fijo]) / 60
+                intervalo = self._intervalos[id_fijo]
+                seleccionadas.append(dict(
+                    self._estaciones[id_fijo],
+                    minutos_sin_actualizar=minutos,
+                    intervalo_objetivo=intervalo,
+                    prioridad=minutos / intervalo,
+                    incidencia_linea=self._senales[id_fijo][0]
+                ))
+                self.actualizadas[id_fijo] = ahora
+                self._programar(id_fijo)
+            self._consumo.extend([ahora] * len(seleccionadas))
+        return seleccionadas
+
+    def registrar_resultado(self, id_estacion, hubo_cambios):
+        """Actualiza la media móvil de cambios de la estación tras refrescarla y la reprograma"""
+        with self._lock:
+            anterior = self.tasa_cambios.get(id_estacion, 0.0)
+            observado = 1.0 if hubo_cambios else 0.0
+            self.tasa_cambios[id_estacion] = (1 - ALFA_CAMBIOS) * anterior + ALFA_CAMBIOS * observado
+            if id_estacion in self._estaciones:
+                self._programar(id_estacion)
+
+    def estado(self):
+        return {
+            'presupuesto_por_minuto': self.presupuesto_por_minuto,
+            'presupuesto_disponible': self.presupuesto_disponible(),
+            'estaciones': len(self._estaciones),
+            'estaciones_con_cambios_recientes': sum(1 for t in self.tasa_cambios.values() if t > 0.05)
+        }
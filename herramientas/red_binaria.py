@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FORMATO BINARIO COMPACTO DE LA RED
+==================================
+
+Codificación alternativa a JSON para los datasets del mapa
+(metro_con_capas, metro_ligero_final, cercanias_completo). En esos JSON
+pesan sobre todo las claves repetidas en cada estación/tramo y las
+coordenadas escritas como texto decimal. Aquí:
+- Todas las cadenas (claves y valores) van una sola vez en una tabla
+  inicial; el resto del archivo las referencia por índice
+- Las coordenadas (claves de CLAVES_COORDENADAS y todo lo que cuelga de
+  ellas) van en punto fijo int32 con 7 decimales (~1 cm)
+- Las listas de objetos con las mismas claves (estaciones, tramos...) se
+  guardan por columnas: cada columna homogénea es un array tipado
+  (Int32Array, Float64Array, Uint32Array de índices de cadena...)
+
+Los arrays tipados van alineados y en little-endian, de modo que el
+decodificador JS (static/js/red_binaria.js) los lee con vistas directas
+sobre el ArrayBuffer, sin copiar ni parsear texto. Decodificar devuelve la
+misma estructura que el JSON, salvo por el redondeo de las coordenadas.
+
+Estructura:
+    'MRB1' | varint nº cadenas | (varint bytes + UTF-8)* | valor raíz
+
+Valor (1 byte de etiqueta + datos):
+    0 null | 1 false | 2 true | 3 entero (varint zigzag) | 4 real (float64)
+    5 cadena (varint índice) | 6 lista (varint n, valores)
+    7 objeto (varint n, (varint índice de clave, valor)*)
+    8 lista de coordenadas (varint n, varint dimensiones, relleno a 4, int32[n*dim])
+    9 tabla (varint filas, varint columnas, (varint clave, columna)*)
+    10 coordenada suelta (int32 punto fijo)
+
+Columna (1 byte de tipo + datos): 0 valores sueltos | 1 int32 | 2 float64
+| 3 coordenada int32 | 4 cadena uint32 (0xFFFFFFFF = null) | 5 uint8 lógico (2 = null)
+"""
+
+import json
+import struct
+
+import numpy as np
+
+MAGIA = b'MRB1'
+MIME = 'application/vnd.metro-madrid.red+binary'
+ESCALA = 10_000_000
+CLAVES_COORDENADAS = {'lat', 'lon', 'lng', 'latitud', 'longitud', 'coordinates', 'coordenadas', 'paths'}
+
+NULO, FALSO, CIERTO, ENTERO, REAL, CADENA, LISTA, OBJETO, COORDENADAS, TABLA, COORDENADA = range(11)
+COL_VALORES, COL_ENTERO, COL_REAL, COL_COORDENADA, COL_CADENA, COL_LOGICO = range(6)
+SIN_CADENA = 0xFFFFFFFF
+MIN_FILAS_TABLA = 2
+
+
+def _es_numero(valor):
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+
+def _es_entero32(valor):
+    return isinstance(valor, int) and not isinstance(valor, bool) and -2**31 <= valor < 2**31
+
+
+def _cabe_en_punto_fijo(valor):
+    return _es_numero(valor) and abs(valor) * ESCALA < 2**31 - 1
+
+
+class _Codificador:
+    def __init__(self):
+        self.cadenas = {}
+        self.cuerpo = bytearray()
+
+    def varint(self, n):
+        while n >= 0x80:
+            self.cuerpo.append((n & 0x7F) | 0x80)
+            n >>= 7
+        self.cuerpo.append(n)
+
+    def cadena(self, texto):
+        indice = self.cadenas.get(texto)
+        if indice is None:
+            indice = self.cadenas[texto] = len(self.cadenas)
+        return indice
+
+    def alinear(self, bytes_):
+        # Relativo al cuerpo: la cabecera se rellena a múltiplo de 8 al ensamblar
+        self.cuerpo.extend(b'\0' * (-len(self.cuerpo) % bytes_))
+
+    def array(self, valores, tipo, alineacion):
+        self.alinear(alineacion)
+        self.cuerpo.extend(np.asarray(valores, dtype=tipo).tobytes())
+
+    def valor(self, valor, coordenada=False):
+        if valor is None:
+            self.cuerpo.append(NULO)
+        elif valor is True or valor is False:
+            self.cuerpo.append(CIERTO if valor else FALSO)
+        elif coordenada and _cabe_en_punto_fijo(valor):
+            self.cuerpo.append(COORDENADA)
+            self.cuerpo.extend(struct.pack('<i', round(valor * ESCALA)))
+        elif isinstance(valor, int) and abs(valor) <= 2**53:
+            # Zigzag: los negativos pequeños también ocupan pocos bytes (y JS los lee sin perder precisión)
+            self.cuerpo.append(ENTERO)
+            self.varint(valor * 2 if valor >= 0 else -valor * 2 - 1)
+        elif isinstance(valor, (int, float)):
+            self.cuerpo.append(REAL)
+            self.cuerpo.extend(struct.pack('<d', float(valor)))
+        elif isinstance(valor, str):
+            self.cuerpo.append(CADENA)
+            self.varint(self.cadena(valor))
+        elif isinstance(valor, dict):
+            self.cuerpo.append(OBJETO)
+            self.varint(len(valor))
+            for clave, contenido in valor.items():
+                self.varint(self.cadena(str(clave)))
+                self.valor(contenido, coordenada or clave in CLAVES_COORDENADAS)
+        elif isinstance(valor, (list, tuple)):
+            self.lista(valor, coordenada)
+        else:
+            raise TypeError(f'tipo no serializable: {type(valor).__name__}')
+
+    def lista(self, valores, coordenada):
+        if coordenada and valores and all(isinstance(v, (list, tuple)) for v in valores):
+            dimensiones = len(valores[0])
+            if dimensiones and all(len(v) == dimensiones and all(_cabe_en_punto_fijo(c) for c in v) for v in valores):
+                self.cuerpo.append(COORDENADAS)
+                self.varint(len(valores))
+                self.varint(dimensiones)
+                self.array(np.rint(np.asarray(valores, dtype=np.float64) * ESCALA), '<i4', 4)
+                return
+        if len(valores) >= MIN_FILAS_TABLA and all(isinstance(v, dict) for v in valores):
+            claves = list(valores[0])
+            if claves and all(list(v) == claves for v in valores):
+                self.tabla(valores, claves, coordenada)
+                return
+        self.cuerpo.append(LISTA)
+        self.varint(len(valores))
+        for v in valores:
+            self.valor(v, coordenada)
+
+    def tabla(self, filas, claves, coordenada):
+        self.cuerpo.append(TABLA)
+        self.varint(len(filas))
+        self.varint(len(claves))
+        for clave in claves:
+            columna = [fila[clave] for fila in filas]
+            es_coordenada = coordenada or clave in CLAVES_COORDENADAS
+            self.varint(self.cadena(clave))
+            if es_coordenada and all(_cabe_en_punto_fijo(v) for v in columna):
+                self.cuerpo.append(COL_COORDENADA)
+                self.array(np.rint(np.asarray(columna, dtype=np.float64) * ESCALA), '<i4', 4)
+            elif all(v is None or isinstance(v, str) for v in columna):
+                self.cuerpo.append(COL_CADENA)
+                self.array([SIN_CADENA if v is None else self.cadena(v) for v in columna], '<u4', 4)
+            elif all(v is None or isinstance(v, bool) for v in columna):
+                self.cuerpo.append(COL_LOGICO)
+                self.array([2 if v is None else int(v) for v in columna], 'u1', 1)
+            elif all(_es_entero32(v) for v in columna):
+                self.cuerpo.append(COL_ENTERO)
+                self.array(columna, '<i4', 4)
+            elif all(isinstance(v, float) for v in columna):
+                self.cuerpo.append(COL_REAL)
+                self.array(columna, '<f8', 8)
+            else:
+                self.cuerpo.append(COL_VALORES)
+                for v in columna:
+                    self.valor(v, es_coordenada)
+
+
+def codificar(datos):
+    """Estructura JSON -> bytes en formato binario de la red"""
+    codificador = _Codificador()
+    codificador.valor(datos)
+
+    cabecera = _Codificador()
+    cabecera.cuerpo.extend(MAGIA)
+    cabecera.varint(len(codificador.cadenas))
+    for texto in codificador.cadenas:
+        utf8 = texto.encode('utf-8')
+        cabecera.varint(len(utf8))
+        cabecera.cuerpo.extend(utf8)
+    # Rellenar la cabecera a múltiplo de 8 conserva la alineación del cuerpo
+    cabecera.alinear(8)
+    return bytes(cabecera.cuerpo + codificador.cuerpo)
+
+
+class _Decodificador:
+    def __init__(self, datos):
+        self.datos = memoryview(datos)
+        self.pos = 0
+        if bytes(self.datos[:4]) != MAGIA:
+            raise ValueError('no es un archivo de red binaria (falta MRB1)')
+        self.pos = 4
+        self.cadenas = []
+        for _ in range(self.varint()):
+            longitud = self.varint()
+            self.cadenas.append(str(self.datos[self.pos:self.pos + longitud], 'utf-8'))
+            self.pos += longitud
+        self.alinear(8)
+
+    def varint(self):
+        resultado = desplazamiento = 0
+        while True:
+            byte = self.datos[self.pos]
+            self.pos += 1
+            resultado |= (byte & 0x7F) << desplazamiento
+            if byte < 0x80:
+                return resultado
+            desplazamiento += 7
+
+    def alinear(self, bytes_):
+        self.pos += -self.pos % bytes_
+
+    def array(self, tipo, n, alineacion):
+        self.alinear(alineacion)
+        valores = np.frombuffer(self.datos, dtype=tipo, count=n, offset=self.pos)
+        self.pos += valores.nbytes
+        return valores
+
+    def valor(self):
+        etiqueta = self.datos[self.pos]
+        self.pos += 1
+        if etiqueta == NULO:
+            return None
+        if etiqueta in (FALSO, CIERTO):
+            return etiqueta == CIERTO
+        if etiqueta == ENTERO:
+            n = self.varint()
+            return n // 2 if n % 2 == 0 else -(n + 1) // 2
+        if etiqueta == REAL:
+            self.pos += 8
+            return struct.unpack_from('<d', self.datos, self.pos - 8)[0]
+        if etiqueta == COORDENADA:
+            self.pos += 4
+            return struct.unpack_from('<i', self.datos, self.pos - 4)[0] / ESCALA
+        if etiqueta == CADENA:
+            return self.cadenas[self.varint()]
+        if etiqueta == LISTA:
+            return [self.valor() for _ in range(self.varint())]
+        if etiqueta == OBJETO:
+            return {self.cadenas[self.varint()]: self.valor() for _ in range(self.varint())}
+        if etiqueta == COORDENADAS:
+            n, dimensiones = self.varint(), self.varint()
+            return (self.array('<i4', n * dimensiones, 4).reshape(n, dimensiones) / ESCALA).tolist()
+        if etiqueta == TABLA:
+            filas, n_columnas = self.varint(), self.varint()
+            columnas = {}
+            for _ in range(n_columnas):
+                clave = self.cadenas[self.varint()]
+                columnas[clave] = self.columna(filas)
+            return [dict(zip(columnas, valores)) for valores in zip(*columnas.values())]
+        raise ValueError(f'etiqueta desconocida {etiqueta} en {self.pos - 1}')
+
+    def columna(self, filas):
+        tipo = self.datos[self.pos]
+        self.pos += 1
+        if tipo == COL_VALORES:
+            return [self.valor() for _ in range(filas)]
+        if tipo == COL_ENTERO:
+            return self.array('<i4', filas, 4).tolist()
+        if tipo == COL_REAL:
+            return self.array('<f8', filas, 8).tolist()
+        if tipo == COL_COORDENADA:
+            return (self.array('<i4', filas, 4) / ESCALA).tolist()
+        if tipo == COL_CADENA:
+            return [None if i == SIN_CADENA else self.cadenas[i] for i in self.array('<u4', filas, 4).tolist()]
+        if tipo == COL_LOGICO:
+            return [None if v == 2 else bool(v) for v in self.array('u1', filas, 1).tolist()]
+        raise ValueError(f'tipo de columna desconocido {tipo}')
+
+
+def decodificar(datos):
+    """bytes en formato binario de la red -> estructura JSON"""
+    return _Decodificador(datos).valor()
+
+
+def main():
+    import sys
+    import time
+
+    for ruta in sys.argv[1:] or ['static/data/metro_con_capas.json', 'static/data/metro_ligero_final.json',
+                                 'static/data/cercanias_completo.json']:
+        with open(ruta, 'rb') as f:
+            texto = f.read()
+        datos = json.loads(texto)
+        inicio = time.perf_counter()
+        binario = codificar(datos)
+        segundos = time.perf_counter() - inicio
+        compacto = json.dumps(datos, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        print(f"📦 {ruta}: JSON {len(texto):,} B (compacto {len(compacto):,} B) -> binario {len(binario):,} B "
+              f"({len(binario) / len(texto):.0%}) en {segundos * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -34,18 +34,19 @@ def regenerar_csv_datos_clave():
         print(f"❌ Error conectando a la base de datos: {e}")
         return False
     
-    # 3. Procesar cada estación del archivo original
+    # 3. Procesar cada estación del archivo original (los datos de la base de
+    # datos se leen de una vez por tabla, no con una consulta por estación)
     print("\n🔄 Procesando estaciones...")
-    datos_clave = []
+    lineas = df_original['line_number'].astype(str)
+    nombres = df_original['station_name'].str.strip()
+    ids_fijos = df_original['station_id'].astype(int)
+    indice = cargar_datos_adicionales(conn, lineas.unique())
+    conn.close()
     
-    for idx, row in df_original.iterrows():
-        linea = str(row['line_number'])
-        nombre = row['station_name'].strip()
-        id_fijo = int(row['station_id'])
-        url = row['url']
-        
-        # Buscar datos adicionales en la base de datos
-        datos_adicionales = obtener_datos_adicionales(conn, linea, id_fijo, nombre)
+    datos_clave = []
+    for idx, (linea, nombre, id_fijo, url) in enumerate(zip(lineas, nombres, ids_fijos, df_original['url'])):
+        id_fijo = int(id_fijo)
+        datos_adicionales = obtener_datos_adicionales(indice, linea, id_fijo, nombre)
         
         # Crear entrada para datos clave
         entrada = {
@@ -62,11 +63,8 @@ def regenerar_csv_datos_clave():
         }
         
         datos_clave.append(entrada)
-        
-        if (idx + 1) % 50 == 0:
-            print(f"  Procesadas {idx + 1}/{len(df_original)} estaciones...")
     
-    conn.close()
+    print(f"  Procesadas {len(datos_clave)}/{len(df_original)} estaciones")
     
     # 4. Crear DataFrame
     df_datos_clave = pd.DataFrame(datos_clave)
@@ -94,19 +92,12 @@ def regenerar_csv_datos_clave():
     
     # 8. Verificar que todas las estaciones están incluidas
     print("\n🔍 Verificando inclusión de estaciones...")
-    estaciones_originales = set()
-    for _, row in df_original.iterrows():
-        linea = str(row['line_number'])
-        nombre = row['station_name'].strip()
-        id_fijo = int(row['station_id'])
-        estaciones_originales.add((linea, nombre, id_fijo))
-    
-    estaciones_incluidas = set()
-    for _, row in df_datos_clave.iterrows():
-        linea = str(row['linea'])
-        nombre = row['nombre'].strip()
-        id_fijo = int(row['id_fijo'])
-        estaciones_incluidas.add((linea, nombre, id_fijo))
+    estaciones_originales = set(zip(lineas, nombres, map(int, ids_fijos)))
+    estaciones_incluidas = set(zip(
+        df_datos_clave['linea'].astype(str),
+        df_datos_clave['nombre'].str.strip(),
+        map(int, df_datos_clave['id_fijo'])
+    ))
     
     faltantes = estaciones_originales - estaciones_incluidas
     if faltantes:
@@ -127,52 +118,64 @@ def regenerar_csv_datos_clave():
     
     return True
 
-def obtener_datos_adicionales(conn, linea, id_fijo, nombre):
-    """Obtiene datos adicionales de la base de datos"""
-    datos = {}
+def cargar_datos_adicionales(conn, lineas):
+    """
+    Lee una vez cada tabla linea_X implicada y estaciones_completas y los
+    indexa en memoria: {'lineas': {linea: (por_id, por_nombre)}, 'completas': {(id_fijo, linea): datos}}
+    """
+    indice = {'lineas': {}, 'completas': {}}
     
     try:
-        # Intentar obtener datos de la tabla específica de la línea
-        tabla_linea = f'linea_{linea}'
         cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'linea_%'")
+        tablas = {row[0] for row in cursor.fetchall()}
         
-        # Verificar si la tabla existe
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (tabla_linea,))
-        if cursor.fetchone():
-            # Buscar la estación en la tabla específica
+        for linea in lineas:
+            tabla_linea = f'linea_{linea}'
+            if tabla_linea not in tablas:
+                continue
+            por_id, por_nombre = {}, {}
             cursor.execute(f"""
-                SELECT orden, id_modal, zona_tarifaria, estacion_accesible, correspondencias
+                SELECT id_fijo, nombre, orden_en_linea, id_modal, zona_tarifaria, estacion_accesible, correspondencias
                 FROM {tabla_linea}
-                WHERE id_fijo = ? OR nombre = ?
-            """, (id_fijo, nombre))
-            
-            row = cursor.fetchone()
-            if row:
-                datos['orden'] = row[0] if row[0] else 1
-                datos['id_modal'] = row[1] if row[1] else None
-                datos['zona'] = row[2] if row[2] else 'A'
-                datos['accesible'] = row[3] == 'Sí' if row[3] else False
-                datos['correspondencias'] = row[4] if row[4] else '[]'
+                ORDER BY rowid
+            """)
+            for row in cursor.fetchall():
+                datos = {
+                    'orden': row[2] if row[2] else 1,
+                    'id_modal': row[3] if row[3] else None,
+                    'zona': row[4] if row[4] else 'A',
+                    'accesible': row[5] == 'Sí' if row[5] else False,
+                    'correspondencias': row[6] if row[6] else '[]'
+                }
+                por_id.setdefault(row[0], datos)
+                por_nombre.setdefault(row[1], datos)
+            indice['lineas'][linea] = (por_id, por_nombre)
         
-        # Si no se encontró en la tabla específica, buscar en estaciones_completas
-        if not datos:
-            cursor.execute("""
-                SELECT orden_en_linea, zona_tarifaria, estacion_accesible, correspondencias
-                FROM estaciones_completas
-                WHERE id_fijo = ? AND linea = ?
-            """, (id_fijo, linea))
-            
-            row = cursor.fetchone()
-            if row:
-                datos['orden'] = row[0] if row[0] else 1
-                datos['zona'] = row[1] if row[1] else 'A'
-                datos['accesible'] = row[2] == 'Sí' if row[2] else False
-                datos['correspondencias'] = row[3] if row[3] else '[]'
+        cursor.execute("""
+            SELECT id_fijo, linea, orden_en_linea, zona_tarifaria, estacion_accesible, correspondencias
+            FROM estaciones_completas
+        """)
+        for row in cursor.fetchall():
+            indice['completas'].setdefault((row[0], str(row[1])), {
+                'orden': row[2] if row[2] else 1,
+                'zona': row[3] if row[3] else 'A',
+                'accesible': row[4] == 'Sí' if row[4] else False,
+                'correspondencias': row[5] if row[5] else '[]'
+            })
     
     except Exception as e:
-        print(f"⚠️ Error obteniendo datos adicionales para {nombre}: {e}")
+        print(f"⚠️ Error cargando datos adicionales: {e}")
     
-    return datos
+    return indice
+
+def obtener_datos_adicionales(indice, linea, id_fijo, nombre):
+    """Obtiene datos adicionales de la tabla de la línea o, si no está, de estaciones_completas"""
+    por_id, por_nombre = indice['lineas'].get(linea, ({}, {}))
+    datos = por_id.get(id_fijo) or por_nombre.get(nombre)
+    if datos is None:
+        datos = indice['completas'].get((id_fijo, linea), {})
+    return dict(datos)
 
 if __name__ == "__main__":
     success = regenerar_csv_datos_clave()
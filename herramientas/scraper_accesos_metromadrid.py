@@ -6,12 +6,12 @@ SCRAPER ACCESOS METROMADRID.ES
 
 Extrae accesos de la web oficial de Metro de Madrid usando el id de estación.
 """
-import requests
-from bs4 import BeautifulSoup
 import sys
 import json
 import re
 
+from cache_paginas_linea import obtener_cache_paginas, extraer_bloques_estaciones
+
 # URLs base para diferentes líneas
 LINE_URLS = {
     '1': "https://www.metromadrid.es/es/linea/linea-1#estacion-{}",
@@ -51,75 +51,101 @@ def extraer_accesos_metromadrid(id_estacion, linea=None):
     print(f"🔗 Accediendo a: {url}")
     
     try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.content, 'html.parser')
-
-        # Buscar la tabla de accesos
-        tabla = soup.find('div', class_='box__info-linea--accesos')
-        if not tabla:
-            print("❌ No se encontró la tabla de accesos.")
-            return []
-        table = tabla.find('table')
-        if not table:
-            print("❌ No se encontró la tabla dentro del div.")
-            return []
-        
-        accesos = []
-        tbody = table.find('tbody')
-        if not tbody:
-            print("❌ No se encontró el tbody de la tabla.")
-            return []
-        
-        for row in tbody.find_all('tr'):
-            celdas = row.find_all('td')
-            if len(celdas) != 2:
-                continue
-            
-            # Extraer vestíbulo
-            vestibulo = celdas[0].get_text(strip=True)
-            
-            # Extraer información del acceso desde la segunda celda
-            acceso_celda = celdas[1]
-            
-            # Buscar el nombre del acceso (strong)
-            acceso_nombre_elem = acceso_celda.find('strong')
-            acceso_nombre = acceso_nombre_elem.get_text(strip=True) if acceso_nombre_elem else ''
-            
-            # Buscar la dirección (p)
-            direccion_elem = acceso_celda.find('p')
-            direccion = direccion_elem.get_text(strip=True) if direccion_elem else ''
-            
-            # Si no hay strong, intentar extraer del texto completo
-            if not acceso_nombre:
-                texto_completo = acceso_celda.get_text(strip=True)
-                # Intentar separar nombre y dirección si hay un patrón
-                if direccion and direccion in texto_completo:
-                    acceso_nombre = texto_completo.replace(direccion, '').strip()
-                else:
-                    acceso_nombre = texto_completo
-            
-            # Limpiar y validar datos
-            vestibulo = limpiar_texto(vestibulo)
-            acceso_nombre = limpiar_texto(acceso_nombre)
-            direccion = limpiar_texto(direccion)
-            
-            # Solo agregar si hay información válida
-            if vestibulo or acceso_nombre or direccion:
-                accesos.append({
-                    'vestibulo': vestibulo,
-                    'acceso': acceso_nombre,
-                    'direccion': direccion
-                })
-                print(f"✅ Acceso encontrado: {vestibulo} - {acceso_nombre} - {direccion}")
+        # La página de línea se descarga una vez y se comparte entre estaciones
+        soup = obtener_cache_paginas().obtener_soup(url, timeout=10)
         
-        return accesos
+        # Tabla de accesos del bloque de la estación (o de la página si no hay bloques)
+        bloque = extraer_bloques_estaciones(soup).get(str(id_estacion), soup)
+        return extraer_accesos_de_bloque(bloque)
         
     except Exception as e:
         print(f"❌ Error accediendo a {url}: {e}")
         return []
 
 
+def extraer_accesos_linea(linea):
+    """
+    Extractor masivo: accesos de todas las estaciones de una línea con una
+    sola descarga. Devuelve {id_estacion: [accesos]}.
+    """
+    url = LINE_URLS.get(linea, LINE_URLS['10']).split('#')[0]
+    print(f"🔗 Accediendo a: {url}")
+    
+    try:
+        soup = obtener_cache_paginas().obtener_soup(url, timeout=10)
+    except Exception as e:
+        print(f"❌ Error accediendo a {url}: {e}")
+        return {}
+    
+    return {
+        id_estacion: extraer_accesos_de_bloque(bloque)
+        for id_estacion, bloque in extraer_bloques_estaciones(soup).items()
+    }
+
+
+def extraer_accesos_de_bloque(bloque):
+    """Extrae los accesos de la tabla 'box__info-linea--accesos' contenida en el bloque"""
+    # Buscar la tabla de accesos
+    tabla = bloque.find('div', class_='box__info-linea--accesos')
+    if not tabla:
+        print("❌ No se encontró la tabla de accesos.")
+        return []
+    table = tabla.find('table')
+    if not table:
+        print("❌ No se encontró la tabla dentro del div.")
+        return []
+    
+    accesos = []
+    tbody = table.find('tbody')
+    if not tbody:
+        print("❌ No se encontró el tbody de la tabla.")
+        return []
+    
+    for row in tbody.find_all('tr'):
+        celdas = row.find_all('td')
+        if len(celdas) != 2:
+            continue
+        
+        # Extraer vestíbulo
+        vestibulo = celdas[0].get_text(strip=True)
+        
+        # Extraer información del acceso desde la segunda celda
+        acceso_celda = celdas[1]
+        
+        # Buscar el nombre del acceso (strong)
+        acceso_nombre_elem = acceso_celda.find('strong')
+        acceso_nombre = acceso_nombre_elem.get_text(strip=True) if acceso_nombre_elem else ''
+        
+        # Buscar la dirección (p)
+        direccion_elem = acceso_celda.find('p')
+        direccion = direccion_elem.get_text(strip=True) if direccion_elem else ''
+        
+        # Si no hay strong, intentar extraer del texto completo
+        if not acceso_nombre:
+            texto_completo = acceso_celda.get_text(strip=True)
+            # Intentar separar nombre y dirección si hay un patrón
+            if direccion and direccion in texto_completo:
+                acceso_nombre = texto_completo.replace(direccion, '').strip()
+            else:
+                acceso_nombre = texto_completo
+        
+        # Limpiar y validar datos
+        vestibulo = limpiar_texto(vestibulo)
+        acceso_nombre = limpiar_texto(acceso_nombre)
+        direccion = limpiar_texto(direccion)
+        
+        # Solo agregar si hay información válida
+        if vestibulo or acceso_nombre or direccion:
+            accesos.append({
+                'vestibulo': vestibulo,
+                'acceso': acceso_nombre,
+                'direccion': direccion
+            })
+            print(f"✅ Acceso encontrado: {vestibulo} - {acceso_nombre} - {direccion}")
+    
+    return accesos
+
+
 def detectar_linea_por_id(id_estacion):
     """
     Intenta detectar la línea basándose en el ID de la estación.
@@ -9,14 +9,54 @@ desde la página web oficial de Metro de Madrid.
 """
 
 import requests
-from bs4 import BeautifulSoup
 import json
 import time
 import re
 from datetime import datetime
-import sqlite3
 import os
 
+from persistencia_scrapers import obtener_escritor
+from cache_paginas_linea import obtener_cache_paginas, extraer_bloques_estaciones, id_estacion_de_url
+
+ESQUEMA_ACCESOS_REALES = '''
+    CREATE TABLE IF NOT EXISTS accesos_reales (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        station_id INTEGER,
+        tipo_acceso TEXT,
+        direccion TEXT,
+        vestibulo TEXT,
+        nombre_acceso TEXT,
+        uuid TEXT,
+        timestamp TEXT,
+        url_origen TEXT
+    )
+'''
+
+# Elimina duplicados de versiones anteriores (insert sin clave) antes de crear el índice único
+DEDUPLICAR_ACCESOS_REALES = '''
+    DELETE FROM accesos_reales
+    WHERE id NOT IN (
+        SELECT MAX(id) FROM accesos_reales GROUP BY station_id, tipo_acceso, direccion
+    )
+'''
+
+INDICE_ACCESOS_REALES = '''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_accesos_reales_clave
+    ON accesos_reales(station_id, tipo_acceso, direccion)
+'''
+
+UPSERT_ACCESO_REAL = '''
+    INSERT INTO accesos_reales
+    (station_id, tipo_acceso, direccion, vestibulo, nombre_acceso, uuid, timestamp, url_origen)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(station_id, tipo_acceso, direccion) DO UPDATE SET
+        vestibulo = excluded.vestibulo,
+        nombre_acceso = excluded.nombre_acceso,
+        uuid = excluded.uuid,
+        timestamp = excluded.timestamp,
+        url_origen = excluded.url_origen
+'''
+
 class ScraperAccesosReales:
     def __init__(self):
         self.session = requests.Session()
@@ -32,14 +72,12 @@ class ScraperAccesosReales:
         try:
             print(f"🔍 Scraping accesos para: {station_url}")
             
-            # Hacer la petición a la página de la estación
-            response = self.session.get(station_url, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
+            # Página de línea compartida (la URL de estación es un fragmento de ella)
+            soup = obtener_cache_paginas().obtener_soup(station_url, session=self.session, timeout=10)
             
-            # Buscar la sección de accesos
-            accesos = self.extraer_accesos_desde_html(soup)
+            # Buscar la sección de accesos en el bloque de la estación (o en toda la página)
+            bloque = extraer_bloques_estaciones(soup).get(id_estacion_de_url(station_url), soup)
+            accesos = self.extraer_accesos_desde_html(bloque)
             
             return {
                 'success': True,
@@ -58,6 +96,21 @@ class ScraperAccesosReales:
                 'timestamp': datetime.now().isoformat()
             }
     
+    def scrape_accesos_linea(self, url_linea):
+        """
+        Extractor masivo: accesos de todas las estaciones de la línea a partir de
+        una sola descarga. Devuelve {id_estacion: [accesos]}.
+        """
+        try:
+            soup = obtener_cache_paginas().obtener_soup(url_linea, session=self.session, timeout=10)
+        except Exception as e:
+            print(f"❌ Error scraping accesos de la línea: {e}")
+            return {}
+        return {
+            id_estacion: self.extraer_accesos_desde_html(bloque)
+            for id_estacion, bloque in extraer_bloques_estaciones(soup).items()
+        }
+    
     def extraer_accesos_desde_html(self, soup):
         """
         Extrae los accesos desde el HTML usando las clases y atributos específicos
@@ -165,48 +218,31 @@ class ScraperAccesosReales:
     
     def guardar_accesos_bd(self, station_id, accesos):
         """
-        Guarda los accesos extraídos en la base de datos
+        Encola los accesos extraídos para guardarlos en la base de datos.
+        La escritura la hace el escritor compartido en lotes (upsert por acceso).
         """
         try:
-            conn = sqlite3.connect('db/estaciones_fijas_v2.db')
-            cursor = conn.cursor()
+            escritor = obtener_escritor()
+            escritor.registrar_esquema(ESQUEMA_ACCESOS_REALES)
+            escritor.registrar_esquema(DEDUPLICAR_ACCESOS_REALES)
+            escritor.registrar_esquema(INDICE_ACCESOS_REALES)
             
-            # Crear tabla de accesos si no existe
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS accesos_reales (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    station_id INTEGER,
-                    tipo_acceso TEXT,
-                    direccion TEXT,
-                    vestibulo TEXT,
-                    nombre_acceso TEXT,
-                    uuid TEXT,
-                    timestamp TEXT,
-                    url_origen TEXT
-                )
-            ''')
-            
-            # Insertar accesos
-            for acceso in accesos:
-                cursor.execute('''
-                    INSERT INTO accesos_reales 
-                    (station_id, tipo_acceso, direccion, vestibulo, nombre_acceso, uuid, timestamp, url_origen)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
+            timestamp = datetime.now().isoformat()
+            escritor.encolar_muchos(UPSERT_ACCESO_REAL, [
+                (
                     station_id,
                     acceso['tipo'],
                     acceso['direccion'],
                     acceso['vestibulo'],
                     acceso['nombre_acceso'],
                     acceso['uuid'],
-                    datetime.now().isoformat(),
+                    timestamp,
                     acceso.get('url_origen', '')
-                ))
-            
-            conn.commit()
-            conn.close()
+                )
+                for acceso in accesos
+            ])
             
-            print(f"✅ {len(accesos)} accesos guardados en BD")
+            print(f"✅ {len(accesos)} accesos encolados para guardar en BD")
             return True
             
         except Exception as e:
@@ -8,16 +8,17 @@ Scraper que obtiene datos detallados de las estaciones (dirección, calle, etc.)
 una sola vez y los guarda en la base de datos fija.
 """
 
-import requests
-from bs4 import BeautifulSoup
 import sqlite3
 import json
-import time
 import re
 from datetime import datetime
 import unicodedata
 import pandas as pd
 
+from persistencia_scrapers import obtener_escritor
+from cache_paginas_linea import obtener_cache_paginas, url_sin_fragmento
+from motor_scraping import obtener_motor
+
 class ScraperDatosDetallados:
     def __init__(self):
         """Inicializa el scraper con la base de datos"""
@@ -36,6 +37,13 @@ class ScraperDatosDetallados:
                 'Upgrade-Insecure-Requests': '1'
             }
             
+            # Escritor compartido (escrituras en lote, un solo hilo)
+            self.escritor = obtener_escritor()
+            
+            # Páginas de línea compartidas: todas las estaciones de una línea salen de una descarga
+            self.cache_paginas = obtener_cache_paginas()
+            self.motor = obtener_motor()
+            
             # Lista de tablas de líneas
             self.lineas_tablas = [
                 'linea_1', 'linea_2', 'linea_3', 'linea_4', 'linea_5', 'linea_6',
@@ -86,25 +94,35 @@ class ScraperDatosDetallados:
                         print(f"  [OK] Columna '{columna}' ya existe en {tabla}")
             
             self.conn.commit()
-            self.conn.close()
             print("[OK] Base de datos inicializada correctamente")
             
         except Exception as e:
             print(f"[ERROR] Error inicializando base de datos: {e}")
             raise
     
-    def scrape_estacion_detallada(self, url):
-        """Scrapea datos detallados de una estación desde su URL"""
+    def scrape_linea_detallada(self, urls):
+        """
+        Extrae los datos detallados de varias estaciones de la misma línea con
+        una sola descarga y un solo parseo. Devuelve {url: datos o None}.
+        """
+        resultados = {}
+        for url in urls:
+            try:
+                soup = self.cache_paginas.obtener_soup(url, headers=self.headers, timeout=15)
+            except Exception as e:
+                print(f"[ERROR] Error descargando {url_sin_fragmento(url)}: {e}")
+                resultados[url] = None
+                continue
+            resultados[url] = self.scrape_estacion_detallada(url, soup=soup)
+        return resultados
+    
+    def scrape_estacion_detallada(self, url, soup=None):
+        """Scrapea datos detallados de una estación desde su URL (la página de línea se cachea)"""
         try:
             print(f"[INFO] Consultando: {url}")
             
-            resp = requests.get(url, headers=self.headers, timeout=15)
-            
-            if resp.status_code != 200:
-                print(f"[ERROR] Error HTTP {resp.status_code}")
-                return None
-                
-            soup = BeautifulSoup(resp.content, 'html.parser')
+            if soup is None:
+                soup = self.cache_paginas.obtener_soup(url, headers=self.headers, timeout=15)
             
             # Extraer datos detallados
             datos = {
@@ -316,8 +334,9 @@ class ScraperDatosDetallados:
                         datos['calle'] = match.group(0)
                         break
             
-            # Buscar código postal
-            cp_match = re.search(r'\b\d{5}\b', resp.text)
+            # Buscar código postal: primero en el bloque de la estación, luego en la página
+            cp_match = re.search(r'\b\d{5}\b', estacion_bloque.get_text()) or \
+                re.search(r'\b\d{5}\b', soup.get_text())
             if cp_match:
                 datos['codigo_postal'] = cp_match.group(0)
             
@@ -612,10 +631,11 @@ class ScraperDatosDetallados:
             return None
     
     def actualizar_estacion_detallada(self, tabla, id_fijo, datos):
-        """Actualiza los datos detallados de una estación en la base de datos"""
+        """
+        Encola la actualización de los datos detallados de una estación.
+        El escritor compartido la confirma junto con el resto del lote.
+        """
         try:
-            cursor = self.cursor
-            
             query = f"""
             UPDATE {tabla} 
             SET 
@@ -633,7 +653,7 @@ class ScraperDatosDetallados:
             WHERE id_fijo = ?
             """
             
-            cursor.execute(query, (
+            self.escritor.encolar(query, (
                 datos['direccion_completa'],
                 datos['calle'],
                 datos['codigo_postal'],
@@ -648,8 +668,6 @@ class ScraperDatosDetallados:
                 id_fijo
             ))
             
-            self.conn.commit()
-            
             return True
             
         except Exception as e:
@@ -665,6 +683,8 @@ class ScraperDatosDetallados:
             total_procesadas = 0
             total_exitosas = 0
             
+            # 1. Estaciones pendientes de cada línea (lecturas en este hilo)
+            pendientes = []
             for tabla in self.lineas_tablas:
                 print(f"\n[INFO] Procesando {tabla}...")
                 
@@ -685,14 +705,24 @@ class ScraperDatosDetallados:
                     continue
                 
                 print(f"  [INFO] {len(df)} estaciones pendientes en {tabla}")
-                
+                pendientes.append((tabla, df))
+            
+            # 2. Descarga de las líneas en paralelo; el motor marca el ritmo por host
+            #    (todas las estaciones de una línea comparten página: una descarga por línea)
+            resultados = self.motor.mapear(
+                lambda pendiente: self.scrape_linea_detallada(pendiente[1]['url'].tolist()),
+                pendientes
+            )
+            
+            # 3. Encolar las actualizaciones
+            for (tabla, df), datos_por_url in zip(pendientes, resultados):
+                datos_por_url = datos_por_url or {}
                 for _, row in df.iterrows():
                     total_procesadas += 1
                     
                     print(f"\n  [INFO] Procesando: {row['nombre']} (ID: {row['id_fijo']})")
                     
-                    # Scrapear datos detallados
-                    datos = self.scrape_estacion_detallada(row['url'])
+                    datos = datos_por_url.get(row['url'])
                     
                     if datos:
                         # Actualizar en la base de datos
@@ -703,10 +733,9 @@ class ScraperDatosDetallados:
                             print(f"    [ERROR] Error actualizando en BD")
                     else:
                         print(f"    [ERROR] Sin datos obtenidos")
-                    
-                    # Pausa entre requests
-                    time.sleep(2)
             
+            # Confirmar todas las actualizaciones encoladas
+            self.escritor.flush()
             self.conn.close()
             
             print(f"\n[RESUMEN] SCRAPING COMPLETADO")
@@ -5,9 +5,12 @@ import requests
 import json
 import re
 from datetime import datetime
-from bs4 import BeautifulSoup
 import time
 
+from cache_paginas_linea import obtener_cache_tiempo_real, id_estacion_de_url
+
+PATRON_MODAL = re.compile(r'/es/metro_next_trains/modal/\d+')
+
 class ScraperNinjaTiempoReal:
     """Scraper Ninja para obtener datos dinámicos en tiempo real"""
     
@@ -23,17 +26,36 @@ class ScraperNinjaTiempoReal:
         self.session = requests.Session()
         self.session.headers.update(self.headers)
     
-    def obtener_proximos_trenes(self, url_estacion):
-        """Obtiene los próximos trenes de una estación"""
+    def descargar_pagina(self, url_estacion):
+        """
+        Devuelve el árbol de la página de línea de la URL (o None si la descarga
+        falla). La página se cachea sin el fragmento '#estacion-N', así que todas
+        las estaciones de una línea comparten una descarga y un parseo; el TTL
+        es de pocos segundos para que los próximos trenes sigan siendo actuales.
+        """
+        try:
+            return obtener_cache_tiempo_real().obtener_soup(url_estacion, session=self.session, timeout=10)
+        except Exception as e:
+            print(f"[NINJA] Error descargando {url_estacion}: {e}")
+            return None
+    
+    def descargar_pagina_lxml(self, url_estacion):
+        """Como descargar_pagina, pero devuelve la PaginaLinea (lxml) compartida de la caché"""
+        try:
+            return obtener_cache_tiempo_real().obtener_pagina(url_estacion, session=self.session, timeout=10)
+        except Exception as e:
+            print(f"[NINJA] Error descargando {url_estacion}: {e}")
+            return None
+    
+    def obtener_proximos_trenes(self, url_estacion, soup=None):
+        """Obtiene los próximos trenes de una estación (reutiliza `soup` si se pasa)"""
         try:
             print(f"[NINJA] Obteniendo próximos trenes de: {url_estacion}")
             
-            response = self.session.get(url_estacion, timeout=10)
-            if response.status_code != 200:
-                print(f"[NINJA] Error HTTP {response.status_code}")
-                return None
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
+            if soup is None:
+                soup = self.descargar_pagina(url_estacion)
+                if soup is None:
+                    return None
             
             # Buscar sección de próximos trenes
             proximos_trenes_html = ""
@@ -76,15 +98,14 @@ class ScraperNinjaTiempoReal:
             print(f"[NINJA] Error obteniendo próximos trenes: {e}")
             return None
     
-    def obtener_estado_servicios(self, url_estacion, id_modal=None):
+    def obtener_estado_servicios(self, url_estacion, id_modal=None, soup=None):
         """Obtiene el estado de ascensores y escaleras mecánicas SOLO del bloque de la estación correspondiente."""
         try:
             print(f"[NINJA] Obteniendo estado de servicios de: {url_estacion}")
-            response = self.session.get(url_estacion, timeout=10)
-            if response.status_code != 200:
-                print(f"[NINJA] Error HTTP {response.status_code}")
-                return "No disponible", "No disponible"
-            soup = BeautifulSoup(response.content, 'html.parser')
+            if soup is None:
+                soup = self.descargar_pagina(url_estacion)
+                if soup is None:
+                    return "No disponible", "No disponible"
 
             # 1. Deducir el id del bloque de la estación (ej: estacion-418)
             match = re.search(r'estacion-(\d+)', url_estacion)
@@ -101,37 +122,49 @@ class ScraperNinjaTiempoReal:
                 print(f"[NINJA] No se encontró el bloque de la estación {bloque_id}")
                 return "No disponible", "No disponible"
 
-            # 3. Buscar el texto de estado de ascensores/escaleras dentro del bloque
-            estado_p = bloque_estacion.find('p', class_='text__info-estacion--tit-inc')
-            if not estado_p:
-                print(f"[NINJA] No se encontró el texto de estado en el bloque de la estación {bloque_id}")
-                return "No disponible", "No disponible"
-            texto_estado = estado_p.get_text(strip=True).lower()
-            print(f"[NINJA] Texto de estado encontrado: {texto_estado}")
-
-            # 4. Analizar el texto específico
-            if 'funcionan correctamente' in texto_estado:
-                return "Operativo", "Operativo"
-            elif 'alteraciones' in texto_estado or 'fuera de servicio' in texto_estado or 'avería' in texto_estado:
-                return "Fuera de servicio", "Fuera de servicio"
-            elif 'mantenimiento' in texto_estado:
-                return "En mantenimiento", "En mantenimiento"
-            else:
-                # Si no hay palabras clave específicas, devolver el texto original
-                return texto_estado, texto_estado
+            # 3 y 4. Buscar y analizar el texto de estado dentro del bloque
+            return self.clasificar_estado_bloque(bloque_estacion)
 
         except Exception as e:
             print(f"[NINJA] Error al obtener estado de servicios: {e}")
             return "No disponible", "No disponible"
     
-    def obtener_ultima_actualizacion(self, url_estacion):
+    def clasificar_estado_bloque(self, bloque_estacion):
+        """Estado de ascensores/escaleras a partir del bloque HTML de una estación"""
+        estado_p = bloque_estacion.find('p', class_='text__info-estacion--tit-inc')
+        if not estado_p:
+            print(f"[NINJA] No se encontró el texto de estado en el bloque {bloque_estacion.get('id')}")
+            return "No disponible", "No disponible"
+        texto_estado = estado_p.get_text(strip=True).lower()
+        print(f"[NINJA] Texto de estado encontrado: {texto_estado}")
+
+        if 'funcionan correctamente' in texto_estado:
+            return "Operativo", "Operativo"
+        elif 'alteraciones' in texto_estado or 'fuera de servicio' in texto_estado or 'avería' in texto_estado:
+            return "Fuera de servicio", "Fuera de servicio"
+        elif 'mantenimiento' in texto_estado:
+            return "En mantenimiento", "En mantenimiento"
+        else:
+            # Si no hay palabras clave específicas, devolver el texto original
+            return texto_estado, texto_estado
+    
+    def obtener_estado_servicios_linea(self, url_linea):
+        """
+        Extractor masivo: estado de ascensores/escaleras de todas las estaciones
+        de la línea a partir de una sola descarga. Devuelve {id_estacion: (ascensores, escaleras)}.
+        """
+        pagina = self.descargar_pagina_lxml(url_linea)
+        if pagina is None:
+            return {}
+        return pagina.estado_servicios_todas()
+    
+    def obtener_ultima_actualizacion(self, url_estacion, soup=None):
         """Obtiene la última actualización de los datos"""
         try:
-            response = self.session.get(url_estacion, timeout=10)
-            if response.status_code != 200:
-                return "No disponible"
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
+            if soup is None:
+                soup = self.descargar_pagina(url_estacion)
+                if soup is None:
+                    return "No disponible"
             
             # Buscar patrones de última actualización
             patrones_actualizacion = [
@@ -156,20 +189,18 @@ class ScraperNinjaTiempoReal:
             print(f"[NINJA] Error obteniendo última actualización: {e}")
             return "No disponible"
     
-    def obtener_ultima_actualizacion_ascensores(self, url_estacion):
+    def obtener_ultima_actualizacion_ascensores(self, url_estacion, soup=None):
         """Obtiene la última actualización específica del estado de ascensores y escaleras"""
         try:
             print(f"[NINJA] Obteniendo última actualización de ascensores de: {url_estacion}")
             
-            response = self.session.get(url_estacion, timeout=10)
-            if response.status_code != 200:
-                print(f"[NINJA] Error HTTP {response.status_code}")
-                return "No disponible"
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
+            if soup is None:
+                soup = self.descargar_pagina(url_estacion)
+                if soup is None:
+                    return "No disponible"
             
             # Buscar todos los enlaces de próximos trenes para encontrar el ID modal
-            modal_links = soup.find_all('a', href=re.compile(r'/es/metro_next_trains/modal/\d+'))
+            modal_links = soup.find_all('a', href=PATRON_MODAL)
             
             print(f"[NINJA] Encontrados {len(modal_links)} enlaces de modal para actualización")
             
@@ -211,7 +242,7 @@ class ScraperNinjaTiempoReal:
                         return texto_actualizacion
                 
                 # Si encontramos otro enlace de modal, parar la búsqueda
-                if current_element.find('a', href=re.compile(r'/es/metro_next_trains/modal/\d+')):
+                if current_element.find('a', href=PATRON_MODAL):
                     print(f"[NINJA] Encontrado otro enlace modal, parando búsqueda de actualización")
                     break
             
@@ -247,11 +278,18 @@ class ScraperNinjaTiempoReal:
         try:
             print(f"[NINJA] Iniciando scraper tiempo real para: {url_estacion}")
             
-            # Obtener todos los datos
-            proximos_trenes_html = self.obtener_proximos_trenes(url_estacion)
-            estado_ascensores, estado_escaleras = self.obtener_estado_servicios(url_estacion)
-            ultima_actualizacion_ascensores = self.obtener_ultima_actualizacion_ascensores(url_estacion)
-            ultima_actualizacion_general = self.obtener_ultima_actualizacion(url_estacion)
+            # Una sola descarga, un parseo lxml y un recorrido; los extractores usan sus índices
+            pagina = self.descargar_pagina_lxml(url_estacion)
+            if pagina is None:
+                proximos_trenes_html = None
+                estado_ascensores, estado_escaleras = "No disponible", "No disponible"
+                ultima_actualizacion_ascensores = "No disponible"
+                ultima_actualizacion_general = "No disponible"
+            else:
+                proximos_trenes_html = pagina.proximos_trenes_html()
+                estado_ascensores, estado_escaleras = pagina.estado_servicios(id_estacion_de_url(url_estacion))
+                ultima_actualizacion_ascensores = pagina.ultima_actualizacion_ascensores()
+                ultima_actualizacion_general = pagina.ultima_actualizacion()
             
             # Usar la actualización específica de ascensores si está disponible, sino la general
             ultima_actualizacion = ultima_actualizacion_ascensores if ultima_actualizacion_ascensores != "No disponible" else ultima_actualizacion_general
@@ -290,13 +328,10 @@ class ScraperNinjaTiempoReal:
         try:
             print(f"[NINJA] Obteniendo estado de servicios para {nombre_estacion} en {url_linea}")
             
-            response = self.session.get(url_linea, timeout=10)
-            if response.status_code != 200:
-                print(f"[NINJA] Error HTTP {response.status_code}")
+            soup = self.descargar_pagina(url_linea)
+            if soup is None:
                 return "No disponible", "No disponible"
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
             # Buscar la estación por nombre en la página
             # Las estaciones suelen estar en elementos con el nombre
             estacion_elements = soup.find_all(text=re.compile(re.escape(nombre_estacion), re.IGNORECASE))
@@ -306,7 +341,7 @@ class ScraperNinjaTiempoReal:
                 parent = element.find_parent()
                 if parent:
                     # Buscar todos los enlaces de modal en este contenedor
-                    modal_links = parent.find_all('a', href=re.compile(r'/es/metro_next_trains/modal/\d+'))
+                    modal_links = parent.find_all('a', href=PATRON_MODAL)
                     
                     if len(modal_links) >= 2:
                         # Usar la segunda aparición (estado de accesibilidad)
@@ -356,7 +391,7 @@ class ScraperNinjaTiempoReal:
                                     return "Estado desconocido", "Estado desconocido"
                             
                             # Si encontramos otro enlace de modal, parar
-                            if current_element.find('a', href=re.compile(r'/es/metro_next_trains/modal/\d+')):
+                            if current_element.find('a', href=PATRON_MODAL):
                                 print(f"[NINJA] Encontrado otro enlace modal para {nombre_estacion}, parando búsqueda")
                                 break
                         
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SUBSISTEMAS PEREZOSOS Y PERFIL DE ARRANQUE
+==========================================
+
+Utilidades para que app.py arranque rápido:
+- `SubsistemaPerezoso`: singleton que se inicializa la primera vez que se
+  usa (scrapers, GTFS, búsqueda), protegido por un lock y con su tiempo de
+  inicialización registrado. Si la inicialización falla, el subsistema
+  queda como no disponible y no se reintenta en cada petición.
+- `PerfilArranque`: mide fases de importación/inicialización y genera el
+  informe de `python app.py --profile-startup`.
+- `precalentar`: inicializa subsistemas en un hilo en segundo plano.
+"""
+
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+
+class PerfilArranque:
+    """Registro de tiempos de las fases de arranque"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.fases = []
+        self._lock = threading.Lock()
+
+    def registrar(self, nombre, segundos, detalle=''):
+        with self._lock:
+            self.fases.append((nombre, segundos, detalle))
+
+    @contextmanager
+    def medir(self, nombre):
+        """Context manager que registra lo que tarda el bloque"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(nombre, time.perf_counter() - inicio)
+
+    def informe(self):
+        """Texto con las fases ordenadas tal y como se ejecutaron"""
+        total = time.perf_counter() - self.inicio
+        lineas = ["⏱️  PERFIL DE ARRANQUE", "=" * 60]
+        for nombre, segundos, detalle in self.fases:
+            sufijo = f"  ({detalle})" if detalle else ''
+            lineas.append(f"{segundos * 1000:9.1f} ms  {nombre}{sufijo}")
+        lineas.append("-" * 60)
+        lineas.append(f"{total * 1000:9.1f} ms  total desde el inicio del proceso de app")
+        lineas.append(f"Módulos importados: {len(sys.modules)} (pandas cargado: {'pandas' in sys.modules})")
+        return "\n".join(lineas)
+
+
+perfil_arranque = PerfilArranque()
+
+
+class SubsistemaPerezoso:
+    """Inicializa un recurso costoso la primera vez que se pide"""
+
+    def __init__(self, nombre, inicializador, perfil=perfil_arranque):
+        self.nombre = nombre
+        self.inicializador = inicializador
+        self.perfil = perfil
+        self._valor = None
+        self._estado = 'pendiente'  # pendiente | listo | error
+        self._error = None
+        self._lock = threading.Lock()
+
+    def obtener(self):
+        """Devuelve el recurso (None si no está disponible)"""
+        if self._estado == 'pendiente':
+            with self._lock:
+                if self._estado == 'pendiente':
+                    inicio = time.perf_counter()
+                    try:
+                        self._valor = self.inicializador()
+                        self._estado = 'listo'
+                    except Exception as e:
+                        self._error = e
+                        self._estado = 'error'
+                        print(f"{self.nombre} no disponible: {e}")
+                    if self.perfil:
+                        self.perfil.registrar(f"init {self.nombre}", time.perf_counter() - inicio, self._estado)
+        return self._valor
+
+    @property
+    def disponible(self):
+        """Inicializa si hace falta e indica si el recurso se pudo cargar"""
+        self.obtener()
+        return self._estado == 'listo'
+
+    @property
+    def inicializado(self):
+        return self._estado != 'pendiente'
+
+    def estado(self):
+        return {
+            'nombre': self.nombre,
+            'estado': self._estado,
+            'error': str(self._error) if self._error else None
+        }
+
+
+def precalentar(subsistemas, nombre_hilo='precalentamiento'):
+    """Inicializa los subsistemas en un hilo daemon y devuelve el hilo"""
+    def _precalentar():
+        for subsistema in subsistemas:
+            subsistema.obtener()
+
+    hilo = threading.Thread(target=_precalentar, name=nombre_hilo, daemon=True)
+    hilo.start()
+    return hilo
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de extracción sobre páginas grabadas (fixtures/*.html):
+coste por página de parsear + extraer todo lo que usan los scrapers
+(estado de la línea, estaciones y accesos cerrados, incidencias, estado
+de ascensores de cada estación, próximos trenes y última actualización).
+
+Compara:
+- bs4 + html.parser (lo que hacía ScraperEstadoLineas, ver extraccion_bs4_referencia.py)
+- bs4 + lxml (lo que hacía la caché de páginas)
+- PaginaLinea (lxml directo, un recorrido, XPath precompilados)
+
+Uso: python herramientas/tests/benchmark_extraccion.py [--repeticiones N]
+"""
+
+import io
+import os
+import sys
+import glob
+import time
+import logging
+import argparse
+import contextlib
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+from bs4 import BeautifulSoup
+
+from extraccion_lxml import PaginaLinea
+from scraper_ninja_tiempo_real import ScraperNinjaTiempoReal
+import extraccion_bs4_referencia as referencia
+from cache_paginas_linea import extraer_bloques_estaciones
+
+URL_LINEA = 'https://www.metromadrid.es/es/linea/linea-7'
+
+
+def extraer_bs4(contenido, parser, ninja):
+    soup = BeautifulSoup(contenido, parser)
+    referencia.extraer_estado_linea(soup)
+    referencia.extraer_estaciones_cerradas(soup)
+    referencia.extraer_incidencias(soup)
+    for bloque in extraer_bloques_estaciones(soup).values():
+        ninja.clasificar_estado_bloque(bloque)
+    ninja.obtener_proximos_trenes(URL_LINEA, soup=soup)
+    ninja.obtener_ultima_actualizacion_ascensores(URL_LINEA, soup=soup)
+    ninja.obtener_ultima_actualizacion(URL_LINEA, soup=soup)
+
+
+def extraer_lxml(contenido, *_):
+    pagina = PaginaLinea(contenido)
+    pagina.estado_linea()
+    pagina.estaciones_cerradas()
+    pagina.incidencias_linea()
+    pagina.estado_servicios_todas()
+    pagina.proximos_trenes_html()
+    pagina.ultima_actualizacion_ascensores()
+    pagina.ultima_actualizacion()
+
+
+def medir(funcion, paginas, repeticiones, *args):
+    funcion(paginas[0], *args)  # calentamiento
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for contenido in paginas:
+            funcion(contenido, *args)
+    return (time.perf_counter() - inicio) * 1000 / (repeticiones * len(paginas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de extracción HTML')
+    parser.add_argument('--repeticiones', type=int, default=20)
+    args = parser.parse_args()
+
+    paginas = []
+    for ruta in sorted(glob.glob(os.path.join(DIRECTORIO, 'fixtures', '*.html'))):
+        with open(ruta, 'rb') as f:
+            paginas.append(f.read())
+    if not paginas:
+        print("❌ No hay páginas en fixtures/")
+        return
+
+    logging.disable(logging.CRITICAL)
+    ninja = ScraperNinjaTiempoReal()
+
+    print(f"📊 BENCHMARK DE EXTRACCIÓN ({len(paginas)} páginas, {args.repeticiones} repeticiones)")
+    print("=" * 60)
+    with contextlib.redirect_stdout(io.StringIO()):
+        html_parser = medir(extraer_bs4, paginas, args.repeticiones, 'html.parser', ninja)
+        bs4_lxml = medir(extraer_bs4, paginas, args.repeticiones, 'lxml', ninja)
+        lxml_directo = medir(extraer_lxml, paginas, args.repeticiones)
+
+    print(f"bs4 + html.parser : {html_parser:8.2f} ms/página")
+    print(f"bs4 + lxml        : {bs4_lxml:8.2f} ms/página")
+    print(f"PaginaLinea (lxml): {lxml_directo:8.2f} ms/página")
+    print(f"Mejora frente a html.parser: x{html_parser / lxml_directo:.1f}; frente a bs4 + lxml: x{bs4_lxml / lxml_directo:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de rendimiento de los scrapers contra respuestas grabadas.
+
+Modo reproducción (por defecto, sin red): sirve las respuestas de
+tests/grabaciones (o, si no hay grabaciones, las páginas de fixtures/) con
+un adaptador de requests, o con un servidor HTTP local (--stub), y ejecuta
+cada scraper sobre ellas. Informa de páginas/s, ms por página y pico de
+memoria (tracemalloc) por scraper.
+
+Modo grabación (--grabar, con red): descarga una vez las páginas de todas
+las líneas a través de los scrapers y las guarda en tests/grabaciones.
+
+Uso:
+    python herramientas/tests/benchmark_scrapers.py [--repeticiones N] [--stub]
+    python herramientas/tests/benchmark_scrapers.py --grabar
+"""
+
+import io
+import os
+import sys
+import time
+import glob
+import logging
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+import requests
+
+import motor_scraping
+from motor_scraping import MotorScraping
+from cache_paginas_linea import obtener_cache_paginas, obtener_cache_tiempo_real
+from grabacion_respuestas import (
+    AlmacenGrabaciones, ServidorReproduccion, DIRECTORIO_GRABACIONES,
+    montar_reproduccion, montar_grabacion
+)
+
+# Las fixtures se registran con la URL real de la página que reproducen
+FIXTURES = {
+    'metromadrid_linea_7.html': 'https://www.metromadrid.es/es/linea/linea-7',
+}
+
+
+def almacen_de_fixtures():
+    """Almacén temporal con las páginas de fixtures/ (si aún no se ha grabado nada)"""
+    almacen = AlmacenGrabaciones(tempfile.mkdtemp(prefix='grabaciones_'))
+    for ruta in sorted(glob.glob(os.path.join(DIRECTORIO, 'fixtures', '*.html'))):
+        url = FIXTURES.get(os.path.basename(ruta))
+        if url:
+            almacen.importar_html(url, ruta)
+    return almacen
+
+
+def preparar_motor(session):
+    """Motor sin límite de cortesía ni peticiones condicionales: se mide el scraper, no la espera"""
+    motor_scraping._motor = MotorScraping(peticiones_por_segundo=1e6, rafaga=1e6, condicional=False,
+                                          session=session)
+    obtener_cache_paginas().invalidar()
+    obtener_cache_tiempo_real().invalidar()
+
+
+def crear_escenarios(session, urls_lineas):
+    """{nombre: función que recorre todas las líneas una vez}"""
+    from scraper_estado_lineas import ScraperEstadoLineas
+    from scraper_ninja_tiempo_real import ScraperNinjaTiempoReal
+    from scraper_accesos_reales import ScraperAccesosReales
+
+    estado = ScraperEstadoLineas()
+    estado.session = session
+    estado.lineas_urls = {url.rsplit('-', 1)[-1]: url for url in urls_lineas}
+
+    ninja = ScraperNinjaTiempoReal()
+    ninja.session = session
+
+    accesos = ScraperAccesosReales()
+    accesos.session = session
+
+    def escenario_estado():
+        for numero_linea in estado.lineas_urls:
+            estado.obtener_estado_linea(numero_linea)
+
+    def escenario_ninja():
+        for url in urls_lineas:
+            obtener_cache_tiempo_real().invalidar(url)
+            for id_estacion in ninja.obtener_estado_servicios_linea(url):
+                ninja.scrape_estacion_tiempo_real(f'{url}#estacion-{id_estacion}')
+
+    def escenario_accesos():
+        for url in urls_lineas:
+            obtener_cache_paginas().invalidar(url)
+            accesos.scrape_accesos_linea(url)
+
+    return {
+        'ScraperEstadoLineas': escenario_estado,
+        'ScraperNinjaTiempoReal': escenario_ninja,
+        'ScraperAccesosReales': escenario_accesos,
+    }
+
+
+def medir(escenario, origen, repeticiones):
+    """(páginas, segundos, pico de memoria en MB); `origen` cuenta las páginas servidas"""
+    escenario()  # calentamiento (imports, cachés de regex...)
+
+    servidas_antes = origen.servidas
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        escenario()
+    segundos = time.perf_counter() - inicio
+    paginas = origen.servidas - servidas_antes
+
+    # Memoria en una pasada aparte: tracemalloc distorsiona los tiempos
+    tracemalloc.start()
+    escenario()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return paginas, segundos, pico / (1024 * 1024)
+
+
+def grabar(directorio):
+    from scraper_estado_lineas import ScraperEstadoLineas
+
+    almacen = AlmacenGrabaciones(directorio)
+    session = requests.Session()
+    session.headers.update(motor_scraping.HEADERS_POR_DEFECTO)
+    montar_grabacion(session, almacen)
+    motor_scraping._motor = MotorScraping(session=session, condicional=False)
+
+    urls = list(ScraperEstadoLineas().lineas_urls.values())
+    print(f"📥 Grabando {len(urls)} páginas de línea en {directorio}")
+    for url in urls:
+        respuesta = motor_scraping._motor.obtener(url, session=session)
+        print(f"  {respuesta.status_code} {url}")
+    print(f"✅ {len(almacen.urls())} respuestas grabadas")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de scrapers contra respuestas grabadas')
+    parser.add_argument('--grabar', action='store_true', help='Descargar y grabar las páginas (necesita red)')
+    parser.add_argument('--directorio', default=DIRECTORIO_GRABACIONES)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--stub', action='store_true', help='Servir las grabaciones con un servidor HTTP local')
+    args = parser.parse_args()
+
+    if args.grabar:
+        grabar(args.directorio)
+        return
+
+    almacen = AlmacenGrabaciones(args.directorio)
+    if not almacen.urls():
+        almacen = almacen_de_fixtures()
+        print("ℹ️  Sin grabaciones: se usan las páginas de fixtures/")
+    urls_lineas = [url for url in almacen.urls() if '/es/linea/' in url]
+
+    logging.disable(logging.CRITICAL)
+    session = requests.Session()
+    servidor = None
+    if args.stub:
+        servidor = origen = ServidorReproduccion(almacen).__enter__()
+        urls_lineas = [servidor.url(url) for url in urls_lineas]
+    else:
+        origen = montar_reproduccion(session, almacen)
+    preparar_motor(session)
+
+    print(f"📊 BENCHMARK DE SCRAPERS ({len(urls_lineas)} páginas de línea, {args.repeticiones} repeticiones"
+          f"{', stub HTTP local' if args.stub else ', adaptador de reproducción'})")
+    print("=" * 72)
+    print(f"{'Scraper':26s} {'páginas':>8s} {'páginas/s':>10s} {'ms/página':>10s} {'pico MB':>9s}")
+    try:
+        with tempfile.TemporaryDirectory() as trabajo, contextlib.redirect_stdout(io.StringIO()):
+            # Los scrapers escriben ficheros de depuración relativos al directorio actual
+            directorio_original = os.getcwd()
+            os.chdir(trabajo)
+            try:
+                resultados = []
+                for nombre, escenario in crear_escenarios(session, urls_lineas).items():
+                    paginas, segundos, pico = medir(escenario, origen, args.repeticiones)
+                    resultados.append((nombre, paginas, segundos, pico))
+            finally:
+                os.chdir(directorio_original)
+    finally:
+        if servidor:
+            servidor.__exit__(None, None, None)
+
+    for nombre, paginas, segundos, pico in resultados:
+        por_segundo = paginas / segundos if segundos else 0
+        ms_pagina = segundos * 1000 / paginas if paginas else 0
+        print(f"{nombre:26s} {paginas:8d} {por_segundo:10.1f} {ms_pagina:10.2f} {pico:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
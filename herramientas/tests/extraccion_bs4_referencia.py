@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Extractores de referencia con BeautifulSoup para el estado de línea: los
+que usaba ScraperEstadoLineas antes de pasar a PaginaLinea (extraccion_lxml).
+Ya no se usan en producción; solo sirven para comprobar que la capa lxml
+devuelve lo mismo (test_extraccion_lxml.py) y para medirla
+(benchmark_extraccion.py).
+"""
+
+import re
+
+
+def extraer_estado_linea(soup):
+    """Extrae el estado general de la línea"""
+    # Buscar el div de estado de la línea (puede estar en diferentes lugares)
+    estado_div = soup.find('div', class_='box__line-state')
+    if not estado_div:
+        # Buscar también en la sección de incidencias
+        seccion_incidencias = soup.find('div', id='line-incidents')
+        if seccion_incidencias:
+            estado_div = seccion_incidencias.find('div', class_='box__line-state')
+
+    if not estado_div:
+        return {'estado': 'Normal', 'clase': 'state--normal', 'descripcion': ''}
+
+    # Buscar el título del estado (puede ser span o h3)
+    titulo_estado = estado_div.find('span', class_='tit__line-state')
+    if not titulo_estado:
+        titulo_estado = estado_div.find('h3', class_='tit__line-state')
+
+    if not titulo_estado:
+        return {'estado': 'Normal', 'clase': 'state--normal', 'descripcion': ''}
+
+    estado_texto = titulo_estado.get_text(strip=True)
+    estado_clase = ' '.join(titulo_estado.get('class', []))
+
+    # Buscar descripción adicional
+    descripcion = estado_div.find('p', class_='text__line-state')
+    descripcion_texto = descripcion.get_text(strip=True) if descripcion else ''
+
+    # Determinar el estado basándose en la clase CSS y el texto
+    if 'state--red' in estado_clase or 'circulación interrumpida' in estado_texto.lower():
+        estado = 'Circulación interrumpida'
+    elif 'state--orange' in estado_clase or 'circulación afectada' in estado_texto.lower():
+        estado = 'Circulación afectada'
+    elif 'state--yellow' in estado_clase or 'atención' in estado_texto.lower():
+        estado = 'Atención'
+    elif estado_texto:
+        estado = estado_texto
+    else:
+        estado = 'Normal'
+
+    return {
+        'estado': estado,
+        'clase': estado_clase,
+        'descripcion': descripcion_texto,
+        'texto_original': estado_texto
+    }
+
+
+def extraer_estaciones_cerradas(soup):
+    """(estaciones_cerradas, accesos_cerrados) de la línea"""
+    estaciones_cerradas = []
+    accesos_cerrados = []
+
+    # 1. Crear diccionario {id_estacion: nombre} desde la lista de acordeones
+    id_nombre_estacion = {}
+    for a in soup.select('a.list-line__btn.accordion-title'):
+        href = a.get('href', '')
+        if href.startswith('#estacion-'):
+            id_est = href.replace('#estacion-', '')
+            nombre_elem = a.find('p', class_='list-line__btn__text')
+            if nombre_elem:
+                nombre = nombre_elem.get_text(strip=True)
+                if nombre:
+                    id_nombre_estacion[id_est] = nombre
+
+    # 2. Recorrer los bloques de detalles de estación
+    for bloque in soup.find_all('div', class_='accordion-content station-info'):
+        id_est = bloque.get('id', '').replace('estacion-', '')
+        nombre_estacion = id_nombre_estacion.get(id_est, None)
+        if not nombre_estacion:
+            continue
+
+        # Buscar <strong class="close--station">Estación Cerrada</strong>
+        estacion_cerrada = bloque.find('strong', class_='close--station')
+        if estacion_cerrada and 'Estación Cerrada' in estacion_cerrada.get_text():
+            # Buscar el motivo en el párrafo padre
+            p_info = estacion_cerrada.find_parent('p', class_='text__info-estacion')
+            motivo = ""
+            if p_info:
+                texto_completo = p_info.get_text(strip=True)
+                motivo = texto_completo.replace('Estación Cerrada', '').strip()
+                # Si no hay motivo específico, usar uno genérico
+                if not motivo:
+                    motivo = "Estación cerrada temporalmente"
+
+            estaciones_cerradas.append({
+                'nombre': nombre_estacion,
+                'id_estacion': id_est,
+                'motivo': motivo,
+                'tipo': 'estacion_cerrada'
+            })
+
+        # Buscar accesos cerrados dentro del bloque
+        for acceso in extraer_accesos_cerrados(bloque):
+            accesos_cerrados.append({
+                'estacion': nombre_estacion,
+                'acceso': acceso['nombre'],
+                'motivo': acceso['motivo'],
+                'tipo': 'acceso_cerrado'
+            })
+
+    return estaciones_cerradas, accesos_cerrados
+
+
+def extraer_accesos_cerrados(estacion_element):
+    """Extrae los accesos cerrados de una estación específica"""
+    accesos_cerrados = []
+    elementos_acceso = estacion_element.find_all(
+        ['p', 'div', 'span'], string=re.compile(r'De .*?:.*?Cierre|acceso.*?Cierre|vestíbulo.*?Cierre')
+    )
+    for elemento in elementos_acceso:
+        texto = elemento.get_text(strip=True)
+        # Buscar patrones como "De acceso X: Cierre temporal" o "De vestíbulo a: Cierre temporal"
+        match = re.search(r'De (.*?): (.*?Cierre.*?)(?:$|\s|\.)', texto)
+        if match:
+            accesos_cerrados.append({
+                'nombre': match.group(1).strip(),
+                'motivo': match.group(2).strip()
+            })
+    return accesos_cerrados
+
+
+def extraer_incidencias(soup):
+    """Extrae las incidencias de la línea"""
+    incidencias = []
+
+    # Buscar la sección de incidencias
+    seccion_incidencias = soup.find('div', id='line-incidents')
+    if not seccion_incidencias:
+        return incidencias
+
+    for elemento in seccion_incidencias.find_all('div', class_='box__incidencias-incidencia'):
+        incidencia = {
+            'titulo': '',
+            'descripcion': '',
+            'fecha': '',
+            'tipo': 'General'
+        }
+
+        # Extraer descripción de la incidencia
+        desc_elem = elemento.find('div', class_='text__incidencia')
+        if desc_elem:
+            # Buscar párrafos con información de estación
+            parrafos = desc_elem.find_all('p', class_='text__info-estacion')
+            if parrafos:
+                descripcion_texto = ' '.join([p.get_text(strip=True) for p in parrafos if p.get_text(strip=True)])
+                incidencia['descripcion'] = descripcion_texto
+
+        # Si no hay descripción específica, buscar cualquier texto
+        if not incidencia['descripcion']:
+            texto_general = elemento.get_text(strip=True)
+            if texto_general:
+                incidencia['descripcion'] = texto_general
+
+        # Extraer título del estado si está disponible
+        estado_div = elemento.find_previous('div', class_='box__line-state')
+        if estado_div:
+            titulo_elem = estado_div.find(['h3', 'span'], class_='tit__line-state')
+            if titulo_elem:
+                incidencia['titulo'] = titulo_elem.get_text(strip=True)
+
+        if incidencia['descripcion']:
+            incidencias.append(incidencia)
+
+    # Si no se encontraron incidencias específicas, buscar en toda la sección
+    if not incidencias:
+        texto_completo = seccion_incidencias.get_text(strip=True)
+        if texto_completo and len(texto_completo) > 50:  # Solo si hay texto significativo
+            incidencias.append({
+                'titulo': 'Información de incidencias',
+                'descripcion': texto_completo,
+                'fecha': '',
+                'tipo': 'General'
+            })
+
+    return incidencias
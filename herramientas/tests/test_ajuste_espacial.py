@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba del ajuste de estaciones a tramos (ajuste_espacial) con líneas
+sintéticas alrededor de Madrid: distancias en metros frente a haversine,
+punto kilométrico a lo largo del tramo y corte por distancia máxima.
+Compara además con la búsqueda por fuerza bruta. No necesita red.
+"""
+
+import os
+import sys
+import math
+import random
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+from ajuste_espacial import ajustar_a_lineas, IndiceSegmentos
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371008.8 * math.asin(math.sqrt(a))
+
+
+# Una línea este-oeste en la latitud de Sol y otra norte-sur, en dos tramos
+TRAMOS = {
+    'C-1': [[[-3.75, 40.4168], [-3.70, 40.4168], [-3.65, 40.4168]]],
+    'C-2': [[[-3.60, 40.30], [-3.60, 40.40]], [[-3.60, 40.40], [-3.60, 40.50]]],
+}
+
+
+def test_distancias_y_pk():
+    # 0,002º de latitud al norte de C-1, a la altura del vértice central
+    punto = [-3.70, 40.4188]
+    lejano = [-3.40, 40.70]
+    sobre_c2 = [-3.6005, 40.45]
+    ajustes = ajustar_a_lineas([punto, lejano, sobre_c2], TRAMOS, max_distancia=500)
+
+    assert ajustes[0]['linea'] == 'C-1' and ajustes[0]['tramo'] == 0
+    esperado = haversine(-3.70, 40.4168, -3.70, 40.4188)
+    assert abs(ajustes[0]['distancia_m'] - esperado) < 1.0
+    pk_esperado = haversine(-3.75, 40.4168, -3.70, 40.4168)
+    assert abs(ajustes[0]['pk_m'] - pk_esperado) / pk_esperado < 0.002
+
+    assert ajustes[1] is None
+
+    assert ajustes[2]['linea'] == 'C-2' and ajustes[2]['tramo'] == 1
+    assert abs(ajustes[2]['distancia_m'] - haversine(-3.6005, 40.45, -3.60, 40.45)) < 1.0
+    assert abs(ajustes[2]['pk_m'] - haversine(-3.60, 40.40, -3.60, 40.45)) < 10.0
+
+    assert ajustar_a_lineas([], TRAMOS) == []
+    print("✅ Distancias y puntos kilométricos en metros correctos")
+
+
+def test_igual_que_fuerza_bruta():
+    aleatorio = random.Random(7)
+    polilineas = []
+    for i in range(40):
+        lon, lat = -3.9 + aleatorio.random() * 0.6, 40.2 + aleatorio.random() * 0.4
+        coords = [[lon, lat]]
+        for _ in range(aleatorio.randint(1, 15)):
+            lon += (aleatorio.random() - 0.5) * 0.02
+            lat += (aleatorio.random() - 0.5) * 0.02
+            coords.append([lon, lat])
+        polilineas.append((f'L{i}', coords))
+    puntos = [[-3.9 + aleatorio.random() * 0.6, 40.2 + aleatorio.random() * 0.4] for _ in range(300)]
+
+    indice = IndiceSegmentos(polilineas, tam_celda=300)
+    resultado = indice.ajustar([p[0] for p in puntos], [p[1] for p in puntos], max_distancia=800)
+
+    # Fuerza bruta en la misma proyección
+    for n, (lon, lat) in enumerate(puntos):
+        px, py = indice.proyeccion.a_metros(lon, lat)
+        mejor = math.inf
+        for ax, ay, bx, by in zip(indice.ax, indice.ay, indice.bx, indice.by):
+            vx, vy = bx - ax, by - ay
+            l2 = vx * vx + vy * vy
+            t = max(0.0, min(1.0, ((px - ax) * vx + (py - ay) * vy) / l2)) if l2 else 0.0
+            mejor = min(mejor, math.hypot(px - ax - t * vx, py - ay - t * vy))
+        if mejor <= 800:
+            assert abs(resultado['distancia'][n] - mejor) < 1e-6
+        else:
+            assert resultado['tramo'][n] == -1
+    print("✅ Mismo resultado que la búsqueda por fuerza bruta")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO AJUSTE ESPACIAL DE ESTACIONES A LÍNEAS")
+    print("=" * 50)
+    test_distancias_y_pk()
+    test_igual_que_fuerza_bruta()
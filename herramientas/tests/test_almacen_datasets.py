@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba del almacén versionado de datasets: migración de las copias
+.backup_vN, objetos deduplicados por hash, activación y vuelta atrás del
+puntero, y recarga en caliente de DatasetsActivos al moverlo o al
+reescribir static/data por fuera del almacén.
+"""
+
+import os
+import io
+import sys
+import json
+import glob
+import tempfile
+import contextlib
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+from almacen_datasets import AlmacenDatasets, DatasetsActivos
+
+
+def escribir(ruta, datos):
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(datos, f)
+
+
+def test_versiones_y_recarga():
+    with tempfile.TemporaryDirectory() as directorio, contextlib.redirect_stdout(io.StringIO()):
+        datos = os.path.join(directorio, 'static_data')
+        os.makedirs(datos)
+        escribir(os.path.join(datos, 'lineas.json.backup_v2'), {'v': 1})
+        escribir(os.path.join(datos, 'lineas.json.backup_v3'), {'v': 1})
+        escribir(os.path.join(datos, 'lineas.json.backup'), {'v': 0})
+        escribir(os.path.join(datos, 'lineas.json'), {'v': 2})
+        almacen = AlmacenDatasets(os.path.join(directorio, 'almacen'), datos)
+
+        # Migración: v2 y v3 son iguales -> un solo objeto; la copia de trabajo queda activa
+        assert len(almacen.importar_copias()) == 3
+        assert os.listdir(datos) == ['lineas.json']
+        historial = almacen.manifiesto()['datasets']['lineas.json']['historial']
+        assert [v['origen'] for v in historial] == ['lineas.json.backup', 'lineas.json.backup_v2', 'copia de trabajo']
+        assert len(glob.glob(os.path.join(directorio, 'almacen', 'objetos', '*', '*'))) == 3
+
+        activos = DatasetsActivos(almacen, intervalo=0)
+        assert activos.cargar('lineas.json') == {'v': 2}
+        assert activos.cargar('lineas.json') is activos.cargar('lineas.json')
+
+        # Vuelta atrás: el puntero cambia, la copia pública también y se recarga en caliente
+        almacen.revertir('lineas.json')
+        assert activos.cargar('lineas.json') == {'v': 1}
+        with open(os.path.join(datos, 'lineas.json'), encoding='utf-8') as f:
+            assert json.load(f) == {'v': 1}
+
+        # Publicar un contenido ya visto no crea objetos ni versiones nuevas
+        escribir(os.path.join(datos, 'lineas.json'), {'v': 2})
+        sha = almacen.publicar(os.path.join(datos, 'lineas.json'))
+        assert almacen.actual('lineas.json')['sha256'] == sha and activos.cargar('lineas.json') == {'v': 2}
+        assert len(almacen.manifiesto()['datasets']['lineas.json']['historial']) == 3
+
+        # Limpieza: se conserva la activa y se borran los objetos que quedan sin referencia
+        assert almacen.limpiar(conservar=1) == 2
+        assert activos.cargar('lineas.json') == {'v': 2}
+
+        # Un generador reescribe static/data sin pasar por el almacén: se sirve lo nuevo
+        escribir(os.path.join(datos, 'lineas.json'), {'v': 3})
+        assert activos.cargar('lineas.json') == {'v': 3}
+        assert activos.version('lineas.json') != almacen.actual('lineas.json')['sha256']
+
+        # Sin entrada en el almacén se lee de static/data
+        escribir(os.path.join(datos, 'suelto.json'), [1])
+        assert activos.cargar('suelto.json') == [1]
+    print("✅ Versiones por hash, vuelta atrás instantánea y recarga en caliente")
+
+
+
+def test_version_activa_sin_objeto():
+    """Como en el repositorio: la versión activa solo está en static/data"""
+    with tempfile.TemporaryDirectory() as directorio, contextlib.redirect_stdout(io.StringIO()):
+        datos = os.path.join(directorio, 'static_data')
+        os.makedirs(datos)
+        escribir(os.path.join(datos, 'lineas.json.backup'), {'v': 1})
+        escribir(os.path.join(datos, 'lineas.json'), {'v': 2})
+        almacen = AlmacenDatasets(os.path.join(directorio, 'almacen'), datos)
+        almacen.importar_copias()
+        actual = almacen.actual('lineas.json')['sha256']
+        os.remove(almacen.ruta_objeto(actual, 'lineas.json'))
+
+        activos = DatasetsActivos(almacen, intervalo=0)
+        assert activos.cargar('lineas.json') == {'v': 2}
+        assert activos.version('lineas.json') == actual
+
+        # Al sustituirla se guarda su objeto, así que se puede volver a ella
+        almacen.revertir('lineas.json')
+        assert activos.cargar('lineas.json') == {'v': 1}
+        assert os.path.exists(almacen.ruta_objeto(actual, 'lineas.json'))
+        almacen.activar('lineas.json', actual[:12])
+        assert activos.cargar('lineas.json') == {'v': 2}
+
+        # Sin copia en static/data se sirve el objeto de la versión activa
+        os.remove(os.path.join(datos, 'lineas.json'))
+        assert activos.cargar('lineas.json') == {'v': 2}
+    print("✅ Versión activa servida desde static/data aunque falte su objeto")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO ALMACÉN DE DATASETS")
+    print("=" * 50)
+    test_versiones_y_recarga()
+    test_version_activa_sin_objeto()
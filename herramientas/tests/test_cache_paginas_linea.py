@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba de la caché de páginas de línea: si otro hilo expulsa o invalida la
+página mientras se descarga, obtener_soup/obtener_pagina siguen devolviendo
+el árbol de lo descargado en lugar de fallar con una entrada vacía.
+"""
+
+import os
+import sys
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+import motor_scraping
+from cache_paginas_linea import CachePaginasLinea
+
+FIXTURE = os.path.join(DIRECTORIO, 'fixtures', 'metromadrid_linea_7.html')
+URL_ESTACION = 'https://www.metromadrid.es/es/linea/linea-7#estacion-{}'
+
+
+class RespuestaGrabada:
+    def __init__(self, contenido):
+        self.content = contenido
+        self.sin_cambios = False
+
+    def raise_for_status(self):
+        pass
+
+
+class MotorQueInvalida:
+    """Devuelve la página grabada e invalida la caché durante la 'descarga'"""
+
+    def __init__(self, cache, contenido):
+        self.cache = cache
+        self.contenido = contenido
+        self.peticiones = 0
+
+    def obtener(self, url, **kwargs):
+        self.peticiones += 1
+        self.cache.invalidar()
+        return RespuestaGrabada(self.contenido)
+
+
+def test_invalidar_durante_la_descarga():
+    with open(FIXTURE, 'rb') as f:
+        contenido = f.read()
+    cache = CachePaginasLinea()
+    motor = MotorQueInvalida(cache, contenido)
+    anterior, motor_scraping._motor = motor_scraping._motor, motor
+    try:
+        soup = cache.obtener_soup(URL_ESTACION.format(740))
+        assert soup.find(id='estacion-740') is not None
+        pagina = cache.obtener_pagina(URL_ESTACION.format(741))
+        assert '740' in pagina.bloques
+        assert motor.peticiones == 2
+    finally:
+        motor_scraping._motor = anterior
+    print("✅ La página descargada se usa aunque se invalide a la vez")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO CACHÉ DE PÁGINAS DE LÍNEA")
+    print("=" * 50)
+    test_invalidar_durante_la_descarga()
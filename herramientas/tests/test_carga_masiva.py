@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba del cargador masivo (carga_masiva) sobre una base en memoria:
+upsert desde tabla temporal con borrado de ausentes, índices recreados
+tras la carga y rollback completo si la carga falla a medias.
+"""
+
+import os
+import sys
+import sqlite3
+
+import pandas as pd
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+from carga_masiva import transaccion, preparar_temporal, fusionar, reemplazar, indices_suspendidos
+
+
+def crear_base():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE estaciones (stop_id TEXT PRIMARY KEY, nombre TEXT, lat REAL)")
+    conn.execute("CREATE INDEX idx_estaciones_nombre ON estaciones(nombre)")
+    conn.execute("CREATE TABLE accesos (id INTEGER PRIMARY KEY AUTOINCREMENT, stop_id TEXT, nombre TEXT)")
+    conn.executemany("INSERT INTO estaciones VALUES (?, ?, ?)", [('a', 'Antigua', 1.0), ('b', 'Beta', 2.0)])
+    conn.commit()
+    return conn
+
+
+def test_upsert_e_indices():
+    conn = crear_base()
+    df = pd.DataFrame({'stop_id': ['b', 'c'], 'nombre': ['Beta 2', 'Gamma'], 'lat': [2.5, float('nan')]})
+    with transaccion(conn):
+        preparar_temporal(conn, 'carga', df)
+        with indices_suspendidos(conn, ['estaciones']) as suspendidos:
+            assert suspendidos == ['idx_estaciones_nombre']
+            fusionadas, borradas = fusionar(conn, 'carga', 'estaciones', list(df.columns), ['stop_id'],
+                                            borrar_ausentes=True)
+        preparar_temporal(conn, 'carga_accesos', [('c', 'Acceso 1'), ('c', 'Acceso 2')], ['stop_id', 'nombre'])
+        assert reemplazar(conn, 'carga_accesos', 'accesos', ['stop_id', 'nombre']) == 2
+
+    assert (fusionadas, borradas) == (2, 1)
+    assert conn.execute("SELECT * FROM estaciones ORDER BY stop_id").fetchall() == [('b', 'Beta 2', 2.5), ('c', 'Gamma', None)]
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'idx_estaciones_nombre'").fetchone()
+    assert conn.execute("SELECT COUNT(*) FROM accesos").fetchone()[0] == 2
+    print("✅ Upsert, borrado de ausentes e índices recreados")
+
+
+def test_rollback_si_falla():
+    conn = crear_base()
+    try:
+        with transaccion(conn):
+            preparar_temporal(conn, 'carga', [('z', 'Zeta', 9.0)], ['stop_id', 'nombre', 'lat'])
+            with indices_suspendidos(conn, ['estaciones']):
+                fusionar(conn, 'carga', 'estaciones', ['stop_id', 'nombre', 'lat'], ['stop_id'], borrar_ausentes=True)
+                raise RuntimeError("fallo a mitad de carga")
+    except RuntimeError:
+        pass
+    # Nada aplicado: ni las filas ni el borrado de índices
+    assert conn.execute("SELECT stop_id FROM estaciones ORDER BY stop_id").fetchall() == [('a',), ('b',)]
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'idx_estaciones_nombre'").fetchone()
+    print("✅ Una carga fallida no deja cambios a medias")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO CARGA MASIVA EN SQLITE")
+    print("=" * 50)
+    test_upsert_e_indices()
+    test_rollback_si_falla()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba de ScraperDatosDetallados.scrape_estacion_detallada sobre la página de
+línea grabada en fixtures/: cada estación debe devolver sus datos (no None).
+No necesita red ni base de datos.
+"""
+
+import io
+import os
+import sys
+import contextlib
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+from bs4 import BeautifulSoup
+
+from scraper_datos_detallados import ScraperDatosDetallados
+
+FIXTURE = os.path.join(DIRECTORIO, 'fixtures', 'metromadrid_linea_7.html')
+URL_ESTACION = 'https://www.metromadrid.es/es/linea/linea-7#estacion-{}'
+
+
+def test_scrape_estacion_detallada():
+    with open(FIXTURE, 'rb') as f:
+        soup = BeautifulSoup(f.read(), 'html.parser')
+    scraper = ScraperDatosDetallados.__new__(ScraperDatosDetallados)  # sin BD: solo extracción
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        datos = scraper.scrape_estacion_detallada(URL_ESTACION.format(740), soup=soup)
+
+    assert isinstance(datos, dict)
+    assert datos['ultima_actualizacion_detalles']
+    assert datos['codigo_postal'] is None or len(datos['codigo_postal']) == 5
+    print(f"✅ Datos detallados extraídos: {sorted(k for k, v in datos.items() if v)}")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO DATOS DETALLADOS CONTRA FIXTURE")
+    print("=" * 50)
+    test_scrape_estacion_detallada()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba del gestor de descargas de descargar_modelos_3d contra un servidor
+HTTP local con ETag y Range: descarga en paralelo, corte a mitad que se
+reanuda desde el .part, 304 en la segunda pasada, 404 recordado en el
+manifiesto y recurso cambiado que se vuelve a bajar.
+"""
+
+import os
+import io
+import sys
+import json
+import hashlib
+import tempfile
+import threading
+import contextlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+from descargar_modelos_3d import GestorDescargas
+
+RECURSOS = {f'/img/{i}.png': bytes([i]) * (300000 + i) for i in range(6)}
+CORTAR = set()        # rutas que se cortan a mitad en la próxima petición
+PETICIONES = []
+
+
+class Servidor(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cuerpo = RECURSOS.get(self.path)
+        if cuerpo is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = '"%s"' % hashlib.md5(cuerpo).hexdigest()
+        PETICIONES.append((self.path, self.headers.get('Range')))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        inicio = 0
+        if self.headers.get('Range') and self.headers.get('If-Range') == etag:
+            inicio = int(self.headers['Range'].split('=')[1].rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {inicio}-{len(cuerpo) - 1}/{len(cuerpo)}')
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(cuerpo) - inicio))
+        self.end_headers()
+        if self.path in CORTAR:
+            CORTAR.discard(self.path)
+            self.wfile.write(cuerpo[inicio:inicio + 200000])
+            self.close_connection = True
+            return
+        self.wfile.write(cuerpo[inicio:])
+
+
+def test_descargas_reanudables():
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), Servidor)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{servidor.server_port}'
+    tareas = [(f'{base}{ruta}', f'linea_1{ruta[4:]}', ruta) for ruta in RECURSOS]
+    tareas.append((f'{base}/img/falta.png', 'linea_1/falta.png', 'falta'))
+    try:
+        with tempfile.TemporaryDirectory() as directorio, contextlib.redirect_stdout(io.StringIO()):
+            # 1. Primera pasada con un corte a mitad de /img/3.png
+            CORTAR.add('/img/3.png')
+            gestor = GestorDescargas(directorio, trabajadores=3, guardar_cada=1)
+            resultados = gestor.descargar_lote(tareas)
+            assert resultados['linea_1/3.png'] == 'error' and resultados['linea_1/falta.png'] == 'no_disponible'
+            # Se conserva lo recibido en bloques completos antes del corte
+            recibido = os.path.getsize(os.path.join(directorio, 'linea_1', '3.png.part'))
+            assert 0 < recibido < 200000
+
+            # 2. Nueva ejecución: reanuda con Range, el resto responde 304
+            del PETICIONES[:]
+            gestor = GestorDescargas(directorio, trabajadores=3)
+            resultados = gestor.descargar_lote(tareas)
+            assert resultados['linea_1/3.png'] == 'reanudada'
+            assert ('/img/3.png', f'bytes={recibido}-') in PETICIONES
+            assert sorted(set(resultados.values())) == ['no_disponible', 'reanudada', 'sin_cambios']
+            with open(os.path.join(directorio, 'linea_1', '3.png'), 'rb') as f:
+                assert f.read() == RECURSOS['/img/3.png']
+
+            with open(os.path.join(directorio, 'manifiesto_descargas.json'), encoding='utf-8') as f:
+                entrada = json.load(f)['archivos']['linea_1/3.png']
+            assert entrada['sha256'] == hashlib.sha256(RECURSOS['/img/3.png']).hexdigest()
+            assert entrada['tamano'] == len(RECURSOS['/img/3.png'])
+
+            # 3. Un recurso cambiado se vuelve a bajar; el 404 no se repite
+            RECURSOS['/img/0.png'] = b'nuevo'
+            del PETICIONES[:]
+            resultados = GestorDescargas(directorio).descargar_lote(tareas)
+            assert resultados['linea_1/0.png'] == 'descargada'
+            assert sum(1 for estado in resultados.values() if estado == 'sin_cambios') == 5
+            assert len(PETICIONES) == 6 and not any(n.endswith('.part') for n in os.listdir(os.path.join(directorio, 'linea_1')))
+    finally:
+        servidor.shutdown()
+    print("✅ Descargas en paralelo, reanudadas con Range y revalidadas con ETag")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO GESTOR DE DESCARGAS")
+    print("=" * 50)
+    test_descargas_reanudables()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba del almacén en memoria del estado de líneas: la versión sale del
+histórico guardado, así que dos procesos (dos almacenes sobre la misma BD)
+y un reinicio dan la misma, y `since` devuelve solo lo cambiado. La
+frescura es la del último barrido (comprobado), no la del último cambio.
+"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+from historial_estado import asegurar_esquema
+from almacen_estado_lineas import AlmacenEstadoLineas
+
+
+def insertar(db_path, linea, estado, timestamp):
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO estado_lineas (linea, estado, descripcion, timestamp) VALUES (?, ?, ?, ?)",
+                 (linea, estado, estado, timestamp))
+    conn.commit()
+    conn.close()
+
+
+def test_version_persistida_y_deltas():
+    with tempfile.TemporaryDirectory() as directorio:
+        db_path = os.path.join(directorio, 'estado.db')
+        conn = sqlite3.connect(db_path)
+        asegurar_esquema(conn)
+        conn.close()
+        insertar(db_path, '1', 'Circulación normal', '2026-10-19T10:00:00')
+        insertar(db_path, 'Ramal', 'Circulación normal', '2026-10-19T10:00:00')
+
+        web_1, web_2 = AlmacenEstadoLineas(db_path), AlmacenEstadoLineas(db_path)
+        version = web_1.cargar_desde_bd()
+        assert version == web_2.cargar_desde_bd() == 2
+
+        completa = web_1.respuesta()
+        assert completa['delta'] is False and completa['lineas']['R']['status'] == 'normal'
+        assert completa['lineas']['5']['status'] == 'desconocido'
+        assert set(completa) == {'lineas', 'version', 'delta', 'frescura'}
+        assert web_1.respuesta(version) is None
+
+        # Un cambio guardado por el trabajador: ambos procesos ven la misma versión
+        insertar(db_path, '1', 'Circulación interrumpida', '2026-10-19T10:05:00')
+        assert web_1.cargar_desde_bd() == web_2.cargar_desde_bd() == 3
+        delta = web_2.respuesta(version)
+        assert delta['delta'] is True and delta['version'] == 3
+        assert set(delta['lineas']) == {'1'}
+        assert delta['lineas']['1']['status'] == 'interrumpida'
+
+        # Tras un reinicio la versión sigue siendo la misma
+        reiniciado = AlmacenEstadoLineas(db_path)
+        assert reiniciado.cargar_desde_bd() == 3 and reiniciado.respuesta(3) is None
+
+        # Una versión posterior a la actual (otra BD) recibe todo
+        assert web_1.respuesta(99)['delta'] is False
+    print("✅ Versión del histórico compartida entre procesos y deltas por `since`")
+
+
+def test_frescura_del_ultimo_barrido():
+    with tempfile.TemporaryDirectory() as directorio:
+        db_path = os.path.join(directorio, 'estado.db')
+        conn = sqlite3.connect(db_path)
+        asegurar_esquema(conn)
+        conn.close()
+        # El estado no cambia desde hace un día...
+        insertar(db_path, '1', 'Circulación normal', (datetime.now() - timedelta(days=1)).isoformat())
+        almacen = AlmacenEstadoLineas(db_path, intervalo=15, plazo=120)
+        almacen.cargar_desde_bd()
+        assert almacen.frescura()['fresco'] is False
+
+        # ...pero el trabajador lo acaba de comprobar en su barrido
+        conn = sqlite3.connect(db_path)
+        conn.execute("UPDATE estado_lineas_actual SET comprobado = ? WHERE linea = '1'",
+                     (datetime.now().isoformat(),))
+        conn.commit()
+        conn.close()
+        almacen.cargar_desde_bd()
+        frescura = almacen.frescura()
+        assert frescura['fresco'] is True and frescura['edad_segundos'] < 60
+        assert frescura['intervalo_segundos'] == 120
+    print("✅ Frescura medida desde el último barrido y con el plazo del trabajador")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO ESTADO DE LÍNEAS EN MEMORIA")
+    print("=" * 50)
+    test_version_persistida_y_deltas()
+    test_frescura_del_ultimo_barrido()
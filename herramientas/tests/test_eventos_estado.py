@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba de la coherencia entre outbox de eventos e histórico de líneas: si
+dos procesos guardan el mismo cambio, solo uno escribe la fila de histórico
+y sus eventos; el otro no deja eventos sin histórico ni duplicados.
+"""
+
+import os
+import sys
+import sqlite3
+import logging
+import tempfile
+from datetime import datetime
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+import persistencia_scrapers
+from persistencia_scrapers import EscritorBD
+from historial_estado import asegurar_esquema
+from scraper_estado_lineas import ScraperEstadoLineas
+from eventos_estado import LINEA_DEGRADADA
+
+
+def datos_linea(estado):
+    return {
+        'linea': '1',
+        'estado_linea': {'estado': estado, 'clase': 'state--alert', 'descripcion': estado},
+        'estaciones_cerradas': [],
+        'accesos_cerrados': [],
+        'incidencias': [],
+        'url': 'https://www.metromadrid.es/es/linea/linea-1',
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+def proceso():
+    """Scraper sin sesión ni motor: solo la parte de guardado"""
+    scraper = ScraperEstadoLineas.__new__(ScraperEstadoLineas)
+    scraper.estados_guardados = None
+    return scraper
+
+
+def test_eventos_solo_con_historico():
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as directorio:
+        db_path = os.path.join(directorio, 'eventos.db')
+        conn = sqlite3.connect(db_path)
+        asegurar_esquema(conn)
+        conn.close()
+
+        escritor = EscritorBD(db_path, intervalo_flush=0.05)
+        anterior = persistencia_scrapers._escritores.get(persistencia_scrapers.DB_PATH)
+        persistencia_scrapers._escritores[persistencia_scrapers.DB_PATH] = escritor
+        try:
+            # Los dos leen el mismo estado previo (ninguno) antes de guardar
+            web, trabajador = proceso(), proceso()
+            web.cargar_estados_guardados()
+            trabajador.cargar_estados_guardados()
+            ultimo = web.ultimo_evento_guardado()
+
+            web.guardar_estado_linea(datos_linea('Circulación interrumpida'))
+            trabajador.guardar_estado_linea(datos_linea('Circulación interrumpida'))
+            assert escritor.flush(timeout=5)
+
+            conn = sqlite3.connect(db_path)
+            historico = conn.execute("SELECT COUNT(*) FROM estado_lineas").fetchone()[0]
+            conn.close()
+            eventos = web.eventos_guardados_desde(ultimo)
+            assert historico == 1
+            assert [e.tipo for e in eventos] == [LINEA_DEGRADADA]
+
+            # El mismo estado otra vez: ni histórico ni eventos
+            web.estados_guardados = None
+            web.guardar_estado_linea(datos_linea('Circulación interrumpida'))
+            assert escritor.flush(timeout=5)
+            assert len(web.eventos_guardados_desde(ultimo)) == 1
+            escritor.cerrar()
+        finally:
+            if anterior is None:
+                persistencia_scrapers._escritores.pop(persistencia_scrapers.DB_PATH, None)
+            else:
+                persistencia_scrapers._escritores[persistencia_scrapers.DB_PATH] = anterior
+            logging.disable(logging.NOTSET)
+    print("✅ Eventos en el outbox solo cuando se guarda la fila de histórico")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO OUTBOX DE EVENTOS E HISTÓRICO")
+    print("=" * 50)
+    test_eventos_solo_con_historico()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba de equivalencia de la capa de extracción lxml: sobre la página de
+línea grabada en fixtures/ debe devolver lo mismo que los extractores con
+BeautifulSoup de ScraperNinjaTiempoReal y los de referencia que usaba
+ScraperEstadoLineas (extraccion_bs4_referencia.py). No necesita red.
+"""
+
+import io
+import os
+import re
+import sys
+import contextlib
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+from bs4 import BeautifulSoup
+
+from extraccion_lxml import PaginaLinea
+from scraper_ninja_tiempo_real import ScraperNinjaTiempoReal
+import extraccion_bs4_referencia as referencia
+
+FIXTURE = os.path.join(DIRECTORIO, 'fixtures', 'metromadrid_linea_7.html')
+URL_ESTACION = 'https://www.metromadrid.es/es/linea/linea-7#estacion-{}'
+
+
+def cargar():
+    with open(FIXTURE, 'rb') as f:
+        contenido = f.read()
+    return BeautifulSoup(contenido, 'html.parser'), PaginaLinea(contenido)
+
+
+def sin_espacios(texto_html):
+    return re.sub(r'\s+', ' ', re.sub(r'>\s+<', '><', texto_html or '')).strip()
+
+
+def test_extractores_ninja():
+    soup, pagina = cargar()
+    ninja = ScraperNinjaTiempoReal()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for id_estacion in pagina.bloques:
+            url = URL_ESTACION.format(id_estacion)
+            assert ninja.obtener_estado_servicios(url, soup=soup) == pagina.estado_servicios(id_estacion)
+        url = URL_ESTACION.format(740)
+        assert sin_espacios(ninja.obtener_proximos_trenes(url, soup=soup)) == sin_espacios(pagina.proximos_trenes_html())
+        assert ninja.obtener_ultima_actualizacion_ascensores(url, soup=soup) == pagina.ultima_actualizacion_ascensores()
+        assert ninja.obtener_ultima_actualizacion(url, soup=soup) == pagina.ultima_actualizacion()
+    print(f"✅ Extractores Ninja equivalentes ({len(pagina.bloques)} estaciones)")
+
+
+def test_extractores_estado_lineas():
+    soup, pagina = cargar()
+    assert referencia.extraer_estado_linea(soup) == pagina.estado_linea()
+    assert referencia.extraer_estaciones_cerradas(soup) == pagina.estaciones_cerradas()
+    assert referencia.extraer_incidencias(soup) == pagina.incidencias_linea()
+    cerradas, accesos = pagina.estaciones_cerradas()
+    assert len(cerradas) == 6 and len(accesos) == 2
+    print(f"✅ Extractores de estado de línea equivalentes ({len(cerradas)} estaciones cerradas)")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO EXTRACCIÓN LXML CONTRA FIXTURE")
+    print("=" * 50)
+    test_extractores_ninja()
+    test_extractores_estado_lineas()
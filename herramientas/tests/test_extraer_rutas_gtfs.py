@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba del extractor de rutas GTFS de Cercanías sobre un GTFS sintético
+(con BOM y stop_times desordenados): índices por stop_id, viaje
+representativo por ruta y paradas en orden de stop_sequence. No necesita red.
+"""
+
+import os
+import sys
+import io
+import tempfile
+import contextlib
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+from extraer_rutas_gtfs_cercanias import load_gtfs_data, get_route_stops, generate_route_path
+
+
+def escribir(directorio, nombre, filas):
+    with open(os.path.join(directorio, nombre), 'w', encoding='utf-8-sig', newline='') as f:
+        f.write('\n'.join(','.join(fila) for fila in filas) + '\n')
+
+
+def crear_gtfs(directorio):
+    escribir(directorio, 'routes.txt', [
+        ['route_id', 'route_short_name', 'route_long_name'],
+        ['5__C1___', 'C1', 'Príncipe Pío - Aeropuerto T4'],
+        ['5__C2___', 'C2', 'Guadalajara - Chamartín'],
+    ])
+    escribir(directorio, 'stops.txt', [
+        ['stop_id', 'stop_name', 'stop_lat', 'stop_lon'],
+        ['A', 'Alfa', '40.1', '-3.1'],
+        ['B', 'Beta', '40.2', '-3.2'],
+        ['C', 'Gamma', '40.3', '-3.3'],
+    ])
+    escribir(directorio, 'trips.txt', [
+        ['route_id', 'service_id', 'trip_id'],
+        ['5__C1___', 'S', 'T1'],
+        ['5__C1___', 'S', 'T2'],
+        ['5__C2___', 'S', 'T3'],
+    ])
+    escribir(directorio, 'stop_times.txt', [
+        ['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence'],
+        ['T1', '08:10:00', '08:10:00', 'C', '10'],
+        ['T3', '09:00:00', '09:00:00', 'B', '1'],
+        ['T1', '08:00:00', '08:00:00', 'A', '2'],
+        ['T2', '08:30:00', '08:30:00', 'B', '1'],
+        ['T1', '08:05:00', '08:05:00', 'B', '3'],
+        ['T3', '09:05:00', '09:05:00', 'X', '2'],
+    ])
+
+
+def test_indices_y_orden():
+    with tempfile.TemporaryDirectory() as directorio, contextlib.redirect_stdout(io.StringIO()):
+        crear_gtfs(directorio)
+        gtfs = load_gtfs_data(directorio)
+
+    assert len(gtfs['routes']) == 2 and gtfs['routes'][0]['route_id'] == '5__C1___'
+    assert set(gtfs['stops']) == {'A', 'B', 'C'}
+    # Viaje representativo: el primero de cada ruta; solo se agrupan esos
+    assert gtfs['route_trip'] == {'5__C1___': 'T1', '5__C2___': 'T3'}
+    assert set(gtfs['trip_stops']) == {'T1', 'T3'}
+
+    assert get_route_stops('5__C1___', gtfs) == ['A', 'B', 'C']
+    assert get_route_stops('no_existe', gtfs) == []
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert generate_route_path('5__C1___', gtfs) == [[40.1, -3.1], [40.2, -3.2], [40.3, -3.3]]
+        # Paradas sin coordenadas se omiten
+        assert generate_route_path('5__C2___', gtfs) == [[40.2, -3.2]]
+    print("✅ Índices GTFS y orden de paradas correctos")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO EXTRACTOR DE RUTAS GTFS DE CERCANÍAS")
+    print("=" * 50)
+    test_indices_y_orden()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba del importador GTFS -> SQLite sobre un feed sintético en .zip (con
+BOM, subcarpeta, horas de más de 24h, una parada padre definida después
+de su hija y un route_id sin routes.txt): claves enteras, horas en
+segundos, vistas con las columnas GTFS y FOREIGN KEY íntegras.
+"""
+
+import os
+import io
+import sys
+import sqlite3
+import zipfile
+import tempfile
+import contextlib
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+from importar_gtfs import ImportadorGTFS, hora_a_segundos
+
+
+def crear_feed(ruta):
+    with zipfile.ZipFile(ruta, 'w') as z:
+        z.writestr('feed/stops.txt', '﻿stop_id,stop_name,stop_lat,stop_lon,parent_station\n'
+                                     'S2,Andén,40.1,-3.1,S1\nS1,Estación,40.0,-3.0,\n')
+        z.writestr('feed/trips.txt', '﻿route_id,service_id,trip_id\nR1,LAB,T1\nR1,LAB,T2\n')
+        z.writestr('feed/stop_times.txt', '﻿trip_id,arrival_time,departure_time,stop_id,stop_sequence\n'
+                                          'T1,23:59:00,23:59:30,S2,1\nT1,25:03:10,25:03:10,S1,2\nT2,x,,S2,1\n')
+
+
+def test_importar_zip():
+    with tempfile.TemporaryDirectory() as directorio, contextlib.redirect_stdout(io.StringIO()):
+        feed = os.path.join(directorio, 'feed.zip')
+        salida = os.path.join(directorio, 'metro_madrid.db')
+        crear_feed(feed)
+        importador = ImportadorGTFS(feed, salida, tam_lote=2)
+        estadisticas = importador.importar()
+
+        conn = sqlite3.connect(salida)
+        assert estadisticas['stop_times'] == 3 and estadisticas['routes'] is None
+        assert importador.valores_invalidos == 1
+
+        # Tablas internadas: enteros y segundos
+        fila = conn.execute("SELECT trip_key, stop_key, arrival_secs FROM gtfs_stop_times WHERE stop_sequence = 2").fetchone()
+        assert all(isinstance(valor, int) for valor in fila) and fila[2] == 90190
+
+        # Vistas con los nombres y formatos GTFS de siempre
+        assert conn.execute("SELECT trip_id, arrival_time, departure_time, stop_id FROM stop_times "
+                            "ORDER BY trip_id, stop_sequence").fetchall() == [
+            ('T1', '23:59:00', '23:59:30', 'S2'), ('T1', '25:03:10', '25:03:10', 'S1'), ('T2', None, None, 'S2')]
+        assert conn.execute("SELECT parent_station FROM stops WHERE stop_id = 'S2'").fetchone() == ('S1',)
+        assert conn.execute("SELECT route_id FROM routes").fetchall() == [('R1',)]
+        assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+        conn.close()
+        # Sin temporales abandonados junto a la salida
+        assert sorted(os.listdir(directorio)) == ['feed.zip', 'metro_madrid.db']
+    assert hora_a_segundos('01:03:10') == 3790
+    print("✅ Feed importado con claves enteras, horas en segundos y vistas GTFS")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO IMPORTADOR GTFS")
+    print("=" * 50)
+    test_importar_zip()
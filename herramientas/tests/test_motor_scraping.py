@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba del motor de scraping contra un servidor HTTP local (stub)
+que sirve páginas grabadas: límite por host, reintentos, peticiones
+condicionales y concurrencia acotada. No necesita red.
+"""
+
+import os
+import sys
+import time
+import threading
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from motor_scraping import MotorScraping
+from validadores_http import AlmacenValidadores
+
+PAGINA = '<html><body><div id="estacion-152">Bambú</div></body></html>'.encode('utf-8')
+ETAG = '"v1"'
+
+
+class StubMetro(BaseHTTPRequestHandler):
+    """Sirve /linea (con ETag), /inestable (falla las dos primeras veces) y /lenta"""
+    contadores = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        ruta = urlsplit(self.path).path
+        StubMetro.contadores[ruta] = StubMetro.contadores.get(ruta, 0) + 1
+
+        if ruta == '/inestable' and StubMetro.contadores[ruta] <= 2:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        if ruta == '/lenta':
+            time.sleep(0.2)
+
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(PAGINA)))
+        self.end_headers()
+        self.wfile.write(PAGINA)
+
+
+def arrancar_stub():
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), StubMetro)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f'http://127.0.0.1:{servidor.server_address[1]}'
+
+
+def test_peticion_condicional():
+    servidor, base = arrancar_stub()
+    try:
+        motor = MotorScraping(peticiones_por_segundo=100, rafaga=10)
+        primera = motor.obtener(f'{base}/linea')
+        segunda = motor.obtener(f'{base}/linea')
+        assert primera.status_code == 200 and not primera.no_modificado
+        assert segunda.no_modificado and segunda.content == PAGINA
+        assert motor.estadisticas['no_modificadas'] == 1
+        print("✅ Petición condicional: 304 servido con el último cuerpo")
+    finally:
+        servidor.shutdown()
+
+
+def test_validadores_persistentes(tmp_path=None):
+    import tempfile
+    servidor, base = arrancar_stub()
+    carpeta = tmp_path or tempfile.mkdtemp()
+    db_path = os.path.join(str(carpeta), 'validadores.db')
+    try:
+        # Primer proceso: descarga completa y guarda ETag + hash en BD
+        almacen = AlmacenValidadores(db_path)
+        motor = MotorScraping(peticiones_por_segundo=100, rafaga=10, almacen=almacen)
+        primera = motor.obtener(f'{base}/linea')
+        almacen.escritor.flush()
+        assert not primera.sin_cambios
+
+        # "Reinicio": motor nuevo con el mismo almacén -> petición condicional y 304
+        motor = MotorScraping(peticiones_por_segundo=100, rafaga=10, almacen=AlmacenValidadores(db_path))
+        segunda = motor.obtener(f'{base}/linea')
+        assert segunda.no_modificado and segunda.sin_cambios
+        assert segunda.content == PAGINA and segunda.hash_cuerpo == primera.hash_cuerpo
+        print("✅ Validadores persistentes: 304 tras reiniciar, sin volver a parsear")
+    finally:
+        servidor.shutdown()
+
+
+def test_reintentos_con_backoff():
+    servidor, base = arrancar_stub()
+    try:
+        motor = MotorScraping(peticiones_por_segundo=100, rafaga=10, reintentos=3, backoff_base=0.01)
+        respuesta = motor.obtener(f'{base}/inestable')
+        assert respuesta.status_code == 200
+        assert respuesta.intentos == 3
+        print(f"✅ Reintentos: éxito en el intento {respuesta.intentos}")
+    finally:
+        servidor.shutdown()
+
+
+def test_limite_por_host():
+    servidor, base = arrancar_stub()
+    try:
+        # 5 peticiones a 10/s con ráfaga 1: al menos 0.4 s aunque haya 4 hilos
+        motor = MotorScraping(peticiones_por_segundo=10, rafaga=1, max_concurrencia=4, condicional=False)
+        inicio = time.perf_counter()
+        motor.mapear(lambda i: motor.obtener(f'{base}/linea?i={i}'), range(5))
+        duracion = time.perf_counter() - inicio
+        assert duracion >= 0.35, duracion
+        print(f"✅ Límite por host: 5 peticiones en {duracion:.2f}s")
+    finally:
+        servidor.shutdown()
+
+
+def test_concurrencia_acotada():
+    servidor, base = arrancar_stub()
+    try:
+        # 8 páginas lentas (0.2 s) con 4 hilos: ~0.4 s en lugar de 1.6 s en serie
+        motor = MotorScraping(peticiones_por_segundo=1000, rafaga=100, max_concurrencia=4, condicional=False)
+        inicio = time.perf_counter()
+        resultados = motor.mapear(lambda i: motor.obtener(f'{base}/lenta?i={i}').status_code, range(8))
+        duracion = time.perf_counter() - inicio
+        assert resultados == [200] * 8
+        assert 0.35 <= duracion < 1.2, duracion
+        print(f"✅ Concurrencia acotada: 8 páginas lentas en {duracion:.2f}s")
+    finally:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO MOTOR DE SCRAPING CONTRA STUB LOCAL")
+    print("=" * 50)
+    test_peticion_condicional()
+    test_validadores_persistentes()
+    test_reintentos_con_backoff()
+    test_limite_por_host()
+    test_concurrencia_acotada()
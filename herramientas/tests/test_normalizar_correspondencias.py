@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba del normalizador de correspondencias: la comprobación de vigencia no
+escribe, detecta los cambios de estaciones_completas y la regeneración solo
+ocurre cuando el origen cambió.
+"""
+
+import os
+import sys
+import sqlite3
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+from normalizar_correspondencias import (
+    asegurar_correspondencias_normalizadas, correspondencias_al_dia, FUENTE_CORRESPONDENCIAS
+)
+
+
+def crear_base():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE estaciones_completas (id_fijo INTEGER, linea TEXT, nombre TEXT, correspondencias TEXT)")
+    conn.executemany("INSERT INTO estaciones_completas VALUES (?, ?, ?, ?)", [
+        (1, '1', 'Sol', 'Línea 2; Línea 3; Cercanías C3'),
+        (2, '1', 'Pinar de Chamartín', 'Línea 4; Autobuses; Intercambiador'),
+        (3, '1', 'Bambú', None)
+    ])
+    conn.commit()
+    return conn
+
+
+def conexiones(conn, station_id):
+    return [tuple(fila) for fila in conn.execute(
+        "SELECT modo, linea_conexion FROM conexiones_normalizadas WHERE station_id = ? AND fuente = ? ORDER BY orden",
+        (station_id, FUENTE_CORRESPONDENCIAS)
+    )]
+
+
+def test_regenera_solo_si_cambia_el_origen():
+    conn = crear_base()
+    # Sin tablas normalizadas: no está al día y comprobarlo no crea nada
+    assert not correspondencias_al_dia(conn)
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'conexiones%'").fetchone()[0] == 0
+
+    assert asegurar_correspondencias_normalizadas(conn) == 6
+    assert correspondencias_al_dia(conn)
+    assert conexiones(conn, 1) == [('metro', '2'), ('metro', '3'), ('cercanias', 'C3')]
+    assert asegurar_correspondencias_normalizadas(conn) == 0
+
+    # Cambia el origen: deja de estar al día y se regenera
+    conn.execute("UPDATE estaciones_completas SET correspondencias = 'Línea 10' WHERE id_fijo = 3")
+    conn.commit()
+    assert not correspondencias_al_dia(conn)
+    assert asegurar_correspondencias_normalizadas(conn) == 7
+    assert correspondencias_al_dia(conn)
+    assert conexiones(conn, 3) == [('metro', '10')]
+    conn.close()
+    print("✅ Correspondencias regeneradas solo cuando cambia estaciones_completas")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO NORMALIZADOR DE CORRESPONDENCIAS")
+    print("=" * 50)
+    test_regenera_solo_si_cambia_el_origen()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba del escritor write-behind ante fallos: un registro que no se puede
+escribir no bloquea flush() ni se lleva por delante al resto del lote, y un
+esquema que falla se vuelve a intentar en el lote siguiente.
+"""
+
+import os
+import sys
+import sqlite3
+import logging
+import tempfile
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+from persistencia_scrapers import EscritorBD
+
+INSERTAR = "INSERT INTO medidas (valor) VALUES (?)"
+
+
+def contar(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM medidas").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_lote_con_registro_invalido():
+    logging.disable(logging.CRITICAL)
+    try:
+        with tempfile.TemporaryDirectory() as directorio:
+            db_path = os.path.join(directorio, 'escritor.db')
+            escritor = EscritorBD(db_path, intervalo_flush=0.05)
+            escritor.registrar_esquema("CREATE TABLE IF NOT EXISTS medidas (valor INTEGER)")
+
+            # 2**70 no cabe en un INTEGER de SQLite: OverflowError, no sqlite3.Error
+            escritor.encolar_muchos(INSERTAR, [(1,), (2,), (2 ** 70,), (3,)])
+            assert escritor.flush(timeout=5)
+            assert contar(db_path) == 3
+            assert escritor.estadisticas['descartados'] == 1
+
+            # El hilo sigue vivo y escribiendo
+            escritor.encolar(INSERTAR, (4,))
+            assert escritor.flush(timeout=5) and contar(db_path) == 4
+            escritor.cerrar()
+    finally:
+        logging.disable(logging.NOTSET)
+    print("✅ Un registro inválido no bloquea flush() ni descarta el lote")
+
+
+def test_esquema_fallido_se_reintenta():
+    logging.disable(logging.CRITICAL)
+    intentos = []
+
+    def esquema(conn):
+        intentos.append(1)
+        if len(intentos) == 1:
+            raise RuntimeError("fallo transitorio")
+        conn.execute("CREATE TABLE IF NOT EXISTS medidas (valor INTEGER)")
+
+    try:
+        with tempfile.TemporaryDirectory() as directorio:
+            db_path = os.path.join(directorio, 'escritor.db')
+            escritor = EscritorBD(db_path, intervalo_flush=0.05)
+            escritor.registrar_esquema(esquema)
+            escritor.encolar(INSERTAR, (1,))
+            assert escritor.flush(timeout=5)
+            assert len(intentos) == 2 and contar(db_path) == 1
+
+            escritor.encolar(INSERTAR, (2,))
+            assert escritor.flush(timeout=5)
+            assert len(intentos) == 2 and contar(db_path) == 2
+            escritor.cerrar()
+    finally:
+        logging.disable(logging.NOTSET)
+    print("✅ El esquema se aplica de nuevo hasta que se confirma, y solo entonces")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO ESCRITOR WRITE-BEHIND ANTE FALLOS")
+    print("=" * 50)
+    test_lote_con_registro_invalido()
+    test_esquema_fallido_se_reintenta()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba del planificador por prioridad sobre una BD mínima: funciona sin
+favorite_stations, respeta el presupuesto, adelanta las estaciones de
+líneas con incidencias, compara antigüedades en UTC y mantiene el heap
+entre ticks sin volver a leer las tablas de línea. También el volcado en
+lote de la demanda.
+"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+import planificador_prioridad
+from planificador_prioridad import PlanificadorPrioridad, RegistroDemanda, LINEAS
+
+
+def crear_base(db_path):
+    conn = sqlite3.connect(db_path)
+    for linea in LINEAS:
+        conn.execute(f"CREATE TABLE linea_{linea} (id_fijo INTEGER, nombre TEXT, id_modal INTEGER, url TEXT)")
+    conn.executemany("INSERT INTO linea_1 VALUES (?, ?, ?, ?)",
+                     [(i, f'Estación {i}', i, f'https://www.metromadrid.es/es/linea/linea-1#estacion-{i}')
+                      for i in range(1, 6)])
+    conn.execute("INSERT INTO linea_2 VALUES (3, 'Estación 3', 3, NULL)")  # correspondencia
+    conn.execute("INSERT INTO linea_2 VALUES (6, 'Estación 6', 6, NULL)")
+    conn.execute("CREATE TABLE station_status_actual (station_id INTEGER PRIMARY KEY, timestamp DATETIME)")
+    # Actualizada ahora mismo (CURRENT_TIMESTAMP es UTC): no puede estar vencida
+    conn.execute("INSERT INTO station_status_actual VALUES (5, CURRENT_TIMESTAMP)")
+    conn.execute("CREATE TABLE estado_lineas_actual (linea TEXT PRIMARY KEY, estado TEXT)")
+    # 'Normal' es el estado por defecto del scraper: tampoco es una incidencia
+    conn.execute("INSERT INTO estado_lineas_actual VALUES ('1', 'Normal')")
+    conn.execute("INSERT INTO estado_lineas_actual VALUES ('2', 'Circulación normal')")
+    conn.commit()
+    conn.close()
+
+
+def test_seleccion_incremental():
+    with tempfile.TemporaryDirectory() as directorio:
+        db_path = os.path.join(directorio, 'planificador.db')
+        crear_base(db_path)
+        planificador = PlanificadorPrioridad(db_path, presupuesto_por_minuto=3)
+
+        # Sin favorite_stations ni demanda_estaciones: se planifica igual
+        primeras = planificador.seleccionar()
+        assert len(primeras) == 3
+        assert len({e['id_estacion'] for e in primeras}) == 3
+        assert all(e['prioridad'] >= 1 for e in primeras)
+        assert planificador.estado()['estaciones'] == 6
+
+        # Sin presupuesto no se elige nada; con más, las que quedan vencidas (no la 5)
+        assert planificador.seleccionar() == []
+        planificador.presupuesto_por_minuto = 100
+        resto = planificador.seleccionar()
+        elegidas = {e['id_estacion'] for e in primeras + resto}
+        assert elegidas == {1, 2, 3, 4, 6}
+        correspondencia = next(e for e in primeras + resto if e['id_estacion'] == 3)
+        assert correspondencia['lineas'] == ['1', '2']
+
+        # Entre ticks no se vuelven a leer las tablas de línea
+        consultas = []
+        original = planificador_prioridad._consulta_estaciones
+        planificador_prioridad._consulta_estaciones = lambda: consultas.append(1) or original()
+        try:
+            assert planificador.seleccionar() == []
+
+            # Una incidencia en la línea 2 acorta el intervalo de sus estaciones
+            conn = sqlite3.connect(db_path)
+            conn.execute("UPDATE estado_lineas_actual SET estado = 'Circulación interrumpida' WHERE linea = '2'")
+            conn.commit()
+            conn.close()
+            planificador.refrescar()
+            assert consultas == []
+        finally:
+            planificador_prioridad._consulta_estaciones = original
+        assert planificador._intervalos[6] < planificador._intervalos[1]
+        assert planificador._intervalos[3] == planificador._intervalos[6]
+    print("✅ Selección por vencimiento con heap incremental y presupuesto")
+
+
+def test_registro_demanda_en_lote():
+    with tempfile.TemporaryDirectory() as directorio:
+        db_path = os.path.join(directorio, 'demanda.db')
+        registro = RegistroDemanda(db_path, intervalo=3600)
+        registro.anotar({1, 2})
+        registro.anotar({2})
+        assert not os.path.exists(db_path)  # nada se escribe al anotar
+        assert registro.volcar() == 2
+        registro.anotar({2})
+        registro.volcar()
+
+        conn = sqlite3.connect(db_path)
+        filas = dict(conn.execute("SELECT station_id, peticiones FROM demanda_estaciones"))
+        conn.close()
+        assert filas == {1: 1, 2: 3}
+    print("✅ Demanda acumulada en memoria y volcada en una transacción")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO PLANIFICADOR POR PRIORIDAD")
+    print("=" * 50)
+    test_seleccion_incremental()
+    test_registro_demanda_en_lote()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba del renderizador del plano SVG (M4/mmadrid4.py) sobre un feed
+sintético sin shapes.txt: trazados sacados de las paradas de cada viaje,
+simplificación que conserva extremos y composición por fragmentos cacheados.
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..', '..'))
+
+from M4.mmadrid4 import PlanoMetro, cargar_trazados, simplificar
+
+
+def crear_feed(directorio):
+    archivos = {
+        'stops.txt': 'stop_id,stop_lat,stop_lon\nA,40.0,-3.7\nB,40.05,-3.65\nC,40.1,-3.6\nD,40.0,-3.6\n',
+        'trips.txt': 'route_id,service_id,trip_id,shape_id\n4__1___,LAB,T1,S1\n4__1___,LAB,T2,S1\n4__R___,LAB,T3,S2\n',
+        'stop_times.txt': 'trip_id,stop_id,stop_sequence\nT1,C,3\nT1,A,1\nT1,B,2\nT3,D,1\nT3,C,2\n',
+    }
+    for nombre, contenido in archivos.items():
+        with open(os.path.join(directorio, nombre), 'w', encoding='utf-8') as f:
+            f.write('﻿' + contenido)
+
+
+def test_simplificar():
+    recta = np.array([[0, 0], [1, 0.1], [2, 0], [3, 5], [4, 0]], dtype=float)
+    assert simplificar(recta, 0.5).tolist() == [[0, 0], [2, 0], [3, 5], [4, 0]]
+    print("✅ Douglas-Peucker conserva extremos y vértices significativos")
+
+
+def test_componer_plano():
+    with tempfile.TemporaryDirectory() as directorio:
+        crear_feed(directorio)
+        trazados = cargar_trazados(directorio)
+        assert sorted(trazados) == ['1', 'R']
+        assert trazados['1'][0].tolist() == [[-3.7, 40.0], [-3.65, 40.05], [-3.6, 40.1]]
+
+        plano = PlanoMetro(trazados)
+        svg = plano.componer(['1', 'R'], ['R'])
+        assert svg.startswith('<svg') and svg.endswith('</svg>')
+        # La línea resaltada va fuera del grupo atenuado y con su fragmento grueso
+        assert svg.index('<g opacity="0.3"><g id="linea-1"') < svg.index('<g id="linea-R" stroke="#FFFFFF" stroke-width="5"')
+        assert plano.componer(['1', 'R'], ['R']) is svg
+        assert 'linea-R' not in plano.componer(['1', 'X'])
+        assert plano.etag(['R', '1']) == plano.etag() != plano.etag(['1'])
+    print("✅ Plano compuesto desde fragmentos por línea")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO PLANO SVG DEL METRO")
+    print("=" * 50)
+    test_simplificar()
+    test_componer_plano()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba del formato binario de la red (red_binaria): ida y vuelta de un
+dataset sintético con tablas, nulos, columnas mixtas y coordenadas en
+punto fijo, alineación de los arrays tipados y tamaño frente al JSON real.
+"""
+
+import os
+import sys
+import json
+
+import numpy as np
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DIRECTORIO, '..'))
+
+from red_binaria import codificar, decodificar, ESCALA
+
+
+def parecido(a, b):
+    """Igualdad salvo el redondeo de las coordenadas a 7 decimales"""
+    if isinstance(a, dict):
+        return isinstance(b, dict) and list(a) == list(b) and all(parecido(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return isinstance(b, list) and len(a) == len(b) and all(parecido(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) or isinstance(b, float):
+        return not isinstance(b, bool) and abs(a - b) <= 0.6 / ESCALA
+    return a == b and type(a) is type(b)
+
+
+def test_ida_y_vuelta():
+    datos = {
+        'estaciones': [
+            {'id': 'sol', 'nombre': 'Sol', 'lat': 40.416775, 'lon': -3.703790, 'lineas': ['1', '2', '3'],
+             'orden': 1, 'accesible': True, 'zona': None},
+            {'id': 'ñ', 'nombre': 'Cañada 🚇', 'lat': 40.5, 'lon': -3.6, 'lineas': [],
+             'orden': -7, 'accesible': None, 'zona': 'A'},
+        ],
+        'tramos': [{'coordenadas': [[40.1, -3.1], [40.2, -3.2]], 'codigo': 2**40},
+                   {'coordenadas': [], 'codigo': 1.5}],
+        'metadata': {'total': 2, 'version': '2.1', 'ratio': 0.25, 'activo': False, 'vacio': {}},
+    }
+    binario = codificar(datos)
+    assert binario[:4] == b'MRB1'
+    resultado = decodificar(binario)
+    assert parecido(datos, resultado)
+    # Solo las coordenadas se redondean; el resto vuelve idéntico
+    assert resultado['metadata'] == datos['metadata'] and resultado['tramos'][0]['codigo'] == 2**40
+    assert resultado['estaciones'][1]['nombre'] == 'Cañada 🚇' and resultado['estaciones'][0]['zona'] is None
+    print("✅ Ida y vuelta con tablas, nulos y coordenadas en punto fijo")
+
+
+def test_arrays_alineados():
+    # 1000 puntos en una lista de coordenadas: int32 alineados a 4 bytes desde el inicio
+    puntos = np.column_stack([np.linspace(40, 41, 1000), np.linspace(-4, -3, 1000)]).tolist()
+    binario = codificar({'x': 'desalinea', 'coordinates': puntos})
+    posicion = binario.index(np.int32(round(puntos[0][0] * ESCALA)).tobytes())
+    assert posicion % 4 == 0
+    assert len(binario) < 8 * 1000 + 64
+    print("✅ Coordenadas como int32 alineados (8 bytes por punto)")
+
+
+def test_dataset_real():
+    ruta = os.path.join(DIRECTORIO, '..', '..', 'static', 'data', 'metro_ligero_final.json')
+    if not os.path.exists(ruta):
+        print("⚠️ Sin static/data/metro_ligero_final.json")
+        return
+    with open(ruta, 'rb') as f:
+        texto = f.read()
+    datos = json.loads(texto)
+    binario = codificar(datos)
+    assert parecido(datos, decodificar(binario))
+    assert len(binario) < len(texto) / 4
+    print(f"✅ metro_ligero_final: {len(texto):,} B de JSON -> {len(binario):,} B")
+
+
+if __name__ == "__main__":
+    print("🔍 PROBANDO FORMATO BINARIO DE LA RED")
+    print("=" * 50)
+    test_ida_y_vuelta()
+    test_arrays_alineados()
+    test_dataset_real()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TRABAJADOR DE SCRAPING FUERA DEL PROCESO WEB
+============================================
+
+Proceso independiente que hace todo el scraping periódico, para que el
+parseo no compita por el GIL con las peticiones de Flask. La web solo lee
+lo que se escribe en la BD compartida.
+
+- Programador (proceso principal): cada `tick` segundos saca del
+  planificador de prioridad las estaciones vencidas (respetando el
+  presupuesto de peticiones por minuto) y las encola; encola el repaso de
+  todas las líneas cada `intervalo_lineas` segundos (o antes si alguna
+  estación cambió) y el mantenimiento del historial (y de las
+  correspondencias normalizadas) cada hora. También devuelve a la cola los
+  trabajos de procesos caídos y purga los viejos
+- Trabajadores (N procesos hijos): reclaman trabajos de la cola SQLite, los
+  ejecutan con los scrapers de siempre y escriben por el escritor
+  compartido. Cada uno publica un latido con sus métricas
+- El supervisor relanza los trabajadores que mueran
+
+Uso:
+    python herramientas/trabajador_scraper.py [--procesos N]
+    python herramientas/trabajador_scraper.py --solo-trabajador
+    python herramientas/trabajador_scraper.py --estado
+    python herramientas/trabajador_scraper.py --encolar lineas
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import sqlite3
+import logging
+import argparse
+import threading
+import multiprocessing
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cola_trabajos import ColaTrabajos, nombre_proceso, DB_PATH
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+# Mismos valores que el auto scraper integrado
+TICK_SEGUNDOS = 15
+PRESUPUESTO_POR_MINUTO = 20
+ESTACIONES_POR_TICK = 5
+INTERVALO_LINEAS = int(os.environ.get('METRO_INTERVALO_ESTADO_LINEAS', '120'))  # segundos
+MANTENIMIENTO_HORAS = 1
+INTERVALO_LATIDO = 10  # segundos
+PRIORIDAD_LINEAS = 1e6  # el estado de líneas va por delante de cualquier estación
+
+TIPOS_TRABAJO = ('estacion', 'lineas', 'mantenimiento_historial')
+
+logger = logging.getLogger(__name__)
+
+
+def _memoria_pico_mb():
+    if not RESOURCE_AVAILABLE:
+        return None
+    # ru_maxrss está en KB en Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class TrabajadorScraper:
+    """Consume la cola de trabajos y ejecuta los scrapers"""
+
+    def __init__(self, db_path=DB_PATH, tipos=None, espera=1.0):
+        self.cola = ColaTrabajos(db_path)
+        self.tipos = tipos
+        self.espera = espera
+        self.nombre = nombre_proceso('trabajador')
+        self.iniciado = time.time()
+        self.parar = threading.Event()
+        self.trabajo_actual = None
+        self.metricas = {}  # tipo -> {'ok', 'error', 'ms_total', 'ms_max'}
+        self._manejadores = None
+        self._lock = threading.Lock()
+
+    def manejadores(self):
+        """tipo -> función(parámetros) -> resultado. Los scrapers se importan aquí, no en el programador"""
+        if self._manejadores is None:
+            from auto_scraper_integrado import auto_scraper
+            from historial_estado import mantenimiento_historial
+            from normalizar_correspondencias import asegurar_correspondencias_normalizadas
+            from persistencia_scrapers import obtener_escritor
+
+            escritor = obtener_escritor()
+
+            def estacion(parametros):
+                cambios = auto_scraper.actualizar_estacion(parametros)
+                escritor.flush(timeout=30)
+                return {'cambios': cambios}
+
+            def lineas(parametros):
+                resultados = auto_scraper.scraper_estado.obtener_estado_todas_lineas()
+                if not resultados:
+                    raise RuntimeError('sin resultados del scraper de líneas')
+                return {'lineas': len(resultados)}
+
+            def mantenimiento(parametros):
+                resultado = {'borradas': mantenimiento_historial()}
+                # De paso, regenerar las correspondencias normalizadas si cambió su origen
+                conn = sqlite3.connect(self.cola.db_path, timeout=30)
+                try:
+                    resultado['conexiones'] = asegurar_correspondencias_normalizadas(conn)
+                except sqlite3.Error as e:
+                    logger.warning(f"[TRABAJADOR] No se pudieron normalizar las correspondencias: {e}")
+                finally:
+                    conn.close()
+                return resultado
+
+            self._manejadores = {
+                'estacion': estacion,
+                'lineas': lineas,
+                'mantenimiento_historial': mantenimiento
+            }
+        return self._manejadores
+
+    def ejecutar_trabajo(self, trabajo):
+        """Ejecuta un trabajo reclamado y lo marca como hecho o fallido"""
+        self.trabajo_actual = repr(trabajo)
+        inicio = time.perf_counter()
+        try:
+            manejador = self.manejadores().get(trabajo.tipo)
+            if manejador is None:
+                raise ValueError(f'tipo de trabajo desconocido: {trabajo.tipo}')
+            resultado = manejador(trabajo.parametros)
+            correcto = True
+        except Exception as e:
+            correcto = False
+            # Si la cola no se puede actualizar (BD bloqueada...) el trabajo queda
+            # reclamado hasta que recuperar_huerfanos lo devuelva; el trabajador sigue
+            try:
+                reintentar = self.cola.fallar(trabajo, e)
+                logger.warning(f"[TRABAJADOR] {trabajo} falló ({'se reintentará' if reintentar else 'descartado'}): {e}")
+            except Exception as error_cola:
+                logger.error(f"[TRABAJADOR] {trabajo} falló ({e}) y no se pudo registrar en la cola: {error_cola}")
+        finally:
+            self.trabajo_actual = None
+        ms = (time.perf_counter() - inicio) * 1000
+
+        if correcto:
+            try:
+                self.cola.completar(trabajo.id, resultado)
+            except Exception as e:
+                logger.error(f"[TRABAJADOR] {trabajo} terminó pero no se pudo marcar como hecho: {e}")
+        with self._lock:
+            metrica = self.metricas.setdefault(trabajo.tipo, {'ok': 0, 'error': 0, 'ms_total': 0.0, 'ms_max': 0.0})
+            metrica['ok' if correcto else 'error'] += 1
+            metrica['ms_total'] += ms
+            metrica['ms_max'] = max(metrica['ms_max'], ms)
+        return correcto
+
+    def resumen_metricas(self):
+        with self._lock:
+            por_tipo = {
+                tipo: {**m, 'ms_total': round(m['ms_total'], 1), 'ms_max': round(m['ms_max'], 1),
+                       'ms_medio': round(m['ms_total'] / max(1, m['ok'] + m['error']), 1)}
+                for tipo, m in self.metricas.items()
+            }
+        metricas = {'trabajos': por_tipo, 'memoria_pico_mb': _memoria_pico_mb()}
+        if 'motor_scraping' in sys.modules:
+            metricas['motor'] = dict(sys.modules['motor_scraping'].obtener_motor().estadisticas)
+        return metricas
+
+    def _latir(self, estado='activo'):
+        try:
+            self.cola.latido(self.nombre, 'trabajador', estado, self.trabajo_actual,
+                             self.resumen_metricas(), self.iniciado)
+        except Exception as e:
+            logger.warning(f"[TRABAJADOR] No se pudo registrar el latido: {e}")
+
+    def ejecutar(self):
+        """Bucle principal hasta que se pida parar (SIGTERM / Ctrl+C)"""
+        logger.info(f"[TRABAJADOR] {self.nombre} esperando trabajos")
+
+        def bucle_latidos():
+            while not self.parar.wait(INTERVALO_LATIDO):
+                self._latir()
+
+        self._latir()
+        threading.Thread(target=bucle_latidos, name='latidos', daemon=True).start()
+        try:
+            while not self.parar.is_set():
+                try:
+                    trabajo = self.cola.reclamar(self.nombre, self.tipos)
+                except Exception as e:
+                    logger.error(f"[TRABAJADOR] Error leyendo la cola: {e}")
+                    trabajo = None
+                if trabajo is None:
+                    self.parar.wait(self.espera)
+                    continue
+                self.ejecutar_trabajo(trabajo)
+        finally:
+            if 'persistencia_scrapers' in sys.modules:
+                sys.modules['persistencia_scrapers'].obtener_escritor().flush(timeout=30)
+            self._latir('detenido')
+            logger.info(f"[TRABAJADOR] {self.nombre} detenido")
+
+
+class ProgramadorTrabajos:
+    """Decide qué hay que refrescar y lo encola (no hace scraping)"""
+
+    def __init__(self, db_path=DB_PATH, tick=TICK_SEGUNDOS, presupuesto_por_minuto=PRESUPUESTO_POR_MINUTO,
+                 estaciones_por_tick=ESTACIONES_POR_TICK, intervalo_lineas=INTERVALO_LINEAS,
+                 mantenimiento_horas=MANTENIMIENTO_HORAS):
+        from planificador_prioridad import PlanificadorPrioridad
+        from historial_estado import asegurar_esquema_una_vez
+
+        # El planificador lee station_status_actual / estado_lineas_actual
+        conn = sqlite3.connect(db_path)
+        try:
+            asegurar_esquema_una_vez(conn, db_path)
+        finally:
+            conn.close()
+
+        self.cola = ColaTrabajos(db_path)
+        self.planificador = PlanificadorPrioridad(db_path, presupuesto_por_minuto=presupuesto_por_minuto)
+        self.tick = tick
+        self.estaciones_por_tick = estaciones_por_tick
+        self.intervalo_lineas = intervalo_lineas
+        self.mantenimiento_horas = mantenimiento_horas
+        self.nombre = nombre_proceso('programador')
+        self.iniciado = time.time()
+        self.ultimo_visto = 0  # último trabajo de estación terminado ya contado
+        self.ultimas_lineas = 0
+        self.ultimo_mantenimiento = time.time()
+        self.cambios_pendientes = 0
+        self.encolados = {tipo: 0 for tipo in TIPOS_TRABAJO}
+
+    def _encolar(self, tipo, parametros=None, clave=None, prioridad=0):
+        if self.cola.encolar(tipo, parametros, clave=clave or tipo, prioridad=prioridad) is not None:
+            self.encolados[tipo] += 1
+
+    def registrar_terminados(self):
+        """Realimenta el planificador con los resultados de los trabajadores"""
+        for id_trabajo, parametros, resultado in self.cola.terminados_desde(self.ultimo_visto, 'estacion'):
+            self.ultimo_visto = id_trabajo
+            cambios = bool(resultado and resultado.get('cambios'))
+            self.planificador.registrar_resultado(parametros.get('id_estacion'), cambios)
+            if cambios:
+                self.cambios_pendientes += 1
+
+    def ejecutar_tick(self):
+        ahora = time.time()
+        self.cola.recuperar_huerfanos()
+        self.registrar_terminados()
+
+        for estacion in self.planificador.seleccionar(self.estaciones_por_tick):
+            self._encolar('estacion', estacion, clave=f"estacion:{estacion['id_estacion']}",
+                          prioridad=estacion['prioridad'])
+
+        if self.cambios_pendientes or ahora - self.ultimas_lineas >= self.intervalo_lineas:
+            self._encolar('lineas', prioridad=PRIORIDAD_LINEAS)
+            self.ultimas_lineas = ahora
+            self.cambios_pendientes = 0
+
+        if ahora - self.ultimo_mantenimiento >= self.mantenimiento_horas * 3600:
+            self._encolar('mantenimiento_historial', prioridad=-1)
+            self.cola.purgar()
+            self.ultimo_mantenimiento = ahora
+
+        self.cola.latido(self.nombre, 'programador', 'activo', None, {
+            'encolados': self.encolados,
+            'planificador': self.planificador.estado(),
+            'memoria_pico_mb': _memoria_pico_mb()
+        }, self.iniciado)
+
+    def detener(self):
+        self.cola.latido(self.nombre, 'programador', 'detenido', None, {'encolados': self.encolados}, self.iniciado)
+
+
+def ejecutar_trabajador(db_path=DB_PATH):
+    """Punto de entrada de cada proceso trabajador"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    trabajador = TrabajadorScraper(db_path)
+    signal.signal(signal.SIGTERM, lambda *_: trabajador.parar.set())
+    signal.signal(signal.SIGINT, lambda *_: trabajador.parar.set())
+    trabajador.ejecutar()
+
+
+def supervisar(db_path, procesos, programar=True):
+    """Programador en este proceso y `procesos` trabajadores hijos (se relanzan si mueren)"""
+    parar = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: parar.set())
+    signal.signal(signal.SIGINT, lambda *_: parar.set())
+
+    def lanzar():
+        proceso = multiprocessing.Process(target=ejecutar_trabajador, args=(db_path,), daemon=False)
+        proceso.start()
+        return proceso
+
+    hijos = [lanzar() for _ in range(procesos)]
+    programador = ProgramadorTrabajos(db_path) if programar else None
+    print(f"🚇 Trabajador de scraping: {procesos} procesos"
+          f"{', programador activo' if programador else ''} (PID {os.getpid()})")
+
+    try:
+        while not parar.is_set():
+            if programador:
+                try:
+                    programador.ejecutar_tick()
+                except Exception as e:
+                    logger.error(f"[PROGRAMADOR] Error en el tick: {e}")
+            for i, hijo in enumerate(hijos):
+                if not hijo.is_alive():
+                    logger.warning(f"[SUPERVISOR] Trabajador {hijo.pid} terminó ({hijo.exitcode}), relanzando")
+                    hijos[i] = lanzar()
+            parar.wait(programador.tick if programador else INTERVALO_LATIDO)
+    finally:
+        print("🛑 Deteniendo trabajadores...")
+        for hijo in hijos:
+            if hijo.is_alive():
+                hijo.terminate()  # SIGTERM: terminan el trabajo en curso
+        for hijo in hijos:
+            hijo.join(timeout=120)
+        if programador:
+            programador.detener()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Trabajador de scraping fuera del proceso web')
+    parser.add_argument('--procesos', type=int, default=1, help='Procesos trabajadores (por defecto 1)')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--solo-trabajador', action='store_true',
+                        help='Solo consumir la cola (otro proceso hace de programador)')
+    parser.add_argument('--solo-programador', action='store_true', help='Solo encolar trabajos')
+    parser.add_argument('--estado', action='store_true', help='Mostrar cola, latidos y métricas y salir')
+    parser.add_argument('--encolar', choices=TIPOS_TRABAJO, help='Encolar un trabajo y salir')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.estado:
+        print(json.dumps(ColaTrabajos(args.db).resumen(), ensure_ascii=False, indent=2))
+    elif args.encolar:
+        id_trabajo = ColaTrabajos(args.db).encolar(args.encolar, clave=args.encolar, prioridad=PRIORIDAD_LINEAS)
+        print(f"✅ Trabajo {id_trabajo} encolado" if id_trabajo else "ℹ️  Ya había uno igual pendiente")
+    elif args.solo_trabajador:
+        ejecutar_trabajador(args.db)
+    else:
+        supervisar(args.db, 0 if args.solo_programador else args.procesos)
+
+
+if __name__ == "__main__":
+    main()
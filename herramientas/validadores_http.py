@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VALIDADORES HTTP PERSISTENTES
+=============================
+
+Guarda por URL los validadores de la última respuesta 200 (ETag y
+Last-Modified), el hash SHA-256 del cuerpo y el cuerpo comprimido, en la
+tabla `validadores_http`. Con ellos el motor de scraping envía peticiones
+condicionales también tras reiniciar el proceso, y los scrapers pueden
+saltarse el parseo cuando el cuerpo no ha cambiado.
+
+Las lecturas usan una conexión propia; las escrituras van por el escritor
+compartido (write-behind) para no bloquear a los hilos de descarga.
+"""
+
+import zlib
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+
+from persistencia_scrapers import obtener_escritor
+
+DB_PATH = 'db/estaciones_fijas_v2.db'
+
+ESQUEMA_VALIDADORES = '''
+    CREATE TABLE IF NOT EXISTS validadores_http (
+        url TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        hash_cuerpo TEXT NOT NULL,
+        cuerpo BLOB,
+        actualizado TEXT
+    )
+'''
+
+UPSERT_VALIDADORES = '''
+    INSERT INTO validadores_http (url, etag, last_modified, hash_cuerpo, cuerpo, actualizado)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(url) DO UPDATE SET
+        etag = excluded.etag,
+        last_modified = excluded.last_modified,
+        hash_cuerpo = excluded.hash_cuerpo,
+        cuerpo = excluded.cuerpo,
+        actualizado = excluded.actualizado
+'''
+
+
+def hash_cuerpo(contenido):
+    """SHA-256 del cuerpo de la respuesta"""
+    return hashlib.sha256(contenido or b'').hexdigest()
+
+
+class AlmacenValidadores:
+    """Validadores y hash del cuerpo por URL, persistidos en SQLite"""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.escritor = obtener_escritor(db_path)
+        self.escritor.registrar_esquema(ESQUEMA_VALIDADORES)
+        self._local = threading.local()
+        self._esquema_lectura = False
+
+    def _conexion(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            if not self._esquema_lectura:
+                conn.execute(ESQUEMA_VALIDADORES)
+                conn.commit()
+                self._esquema_lectura = True
+            self._local.conn = conn
+        return conn
+
+    def cargar(self, url):
+        """Devuelve {'etag', 'last_modified', 'hash', 'content'} o None"""
+        try:
+            fila = self._conexion().execute(
+                "SELECT etag, last_modified, hash_cuerpo, cuerpo FROM validadores_http WHERE url = ?",
+                (url,)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if not fila:
+            return None
+        etag, last_modified, hash_guardado, cuerpo = fila
+        return {
+            'etag': etag,
+            'last_modified': last_modified,
+            'hash': hash_guardado,
+            'content': zlib.decompress(cuerpo) if cuerpo else None
+        }
+
+    def guardar(self, url, etag, last_modified, hash_guardado, contenido):
+        """Encola la actualización de los validadores de la URL"""
+        self.escritor.encolar(UPSERT_VALIDADORES, (
+            url, etag, last_modified, hash_guardado,
+            sqlite3.Binary(zlib.compress(contenido)) if contenido else None,
+            datetime.now().isoformat()
+        ))
@@ -22,6 +22,7 @@ def mostrar_menu():
     print("5. Forzar actualizacion completa")
     print("6. Verificar sistema completo")
     print("7. Menu de herramientas avanzadas")
+    print("8. Iniciar trabajador de scraping (proceso aparte)")
     print("0. Salir")
     print("=" * 60)
 
@@ -140,6 +141,19 @@ def main():
         elif opcion == "7":
             menu_herramientas_avanzadas()
             
+        elif opcion == "8":
+            print("\nIniciando trabajador de scraping...")
+            print("La aplicacion web lee lo que escribe este proceso en la base de datos")
+            print("Presiona Ctrl+C para detenerlo")
+            print("-" * 40)
+            
+            try:
+                subprocess.run([sys.executable, "herramientas/trabajador_scraper.py"])
+            except KeyboardInterrupt:
+                print("\nTrabajador detenido")
+            except Exception as e:
+                print(f"ERROR iniciando el trabajador: {e}")
+            
         elif opcion == "0":
             print("\nHasta luego!")
             break
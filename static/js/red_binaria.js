@@ -0,0 +1,185 @@
+// RED BINARIA - DECODIFICADOR DEL FORMATO COMPACTO DE LOS DATASETS DEL MAPA
+// ==========================================================================
+// Lee lo que genera herramientas/red_binaria.py: tabla de cadenas,
+// coordenadas en punto fijo int32 y columnas como arrays tipados, todo en
+// little-endian y alineado, así que los arrays se leen con vistas directas
+// sobre el ArrayBuffer. Devuelve la misma estructura que el JSON.
+//
+// Uso:
+//   RedBinaria.cargar('/api/datasets/metro_con_capas').then(function (datos) { ... });
+// cargar() pide el binario con Accept y, si el servidor responde JSON, lo usa tal cual.
+
+(function (global) {
+    'use strict';
+
+    var MIME = 'application/vnd.metro-madrid.red+binary';
+    var ESCALA = 10000000;
+    var SIN_CADENA = 0xFFFFFFFF;
+    var LITTLE_ENDIAN = new Uint8Array(new Uint32Array([1]).buffer)[0] === 1;
+
+    function Lector(buffer) {
+        this.buffer = buffer;
+        this.bytes = new Uint8Array(buffer);
+        this.vista = new DataView(buffer);
+        this.pos = 0;
+        this.cadenas = [];
+    }
+
+    Lector.prototype.varint = function () {
+        // Con multiplicaciones en vez de desplazamientos: vale hasta 2^53
+        var resultado = 0, factor = 1, byte;
+        do {
+            byte = this.bytes[this.pos++];
+            resultado += (byte & 0x7F) * factor;
+            factor *= 128;
+        } while (byte >= 0x80);
+        return resultado;
+    };
+
+    Lector.prototype.alinear = function (tam) {
+        this.pos += (tam - this.pos % tam) % tam;
+    };
+
+    Lector.prototype.array = function (Tipo, n) {
+        var tam = Tipo.BYTES_PER_ELEMENT, valores, i;
+        this.alinear(tam);
+        if (LITTLE_ENDIAN || tam === 1) {
+            valores = new Tipo(this.buffer, this.pos, n);
+        } else {
+            valores = new Tipo(n);
+            for (i = 0; i < n; i++) {
+                valores[i] = tam === 8 ? this.vista.getFloat64(this.pos + i * 8, true)
+                    : Tipo === Uint32Array ? this.vista.getUint32(this.pos + i * 4, true)
+                    : this.vista.getInt32(this.pos + i * 4, true);
+            }
+        }
+        this.pos += n * tam;
+        return valores;
+    };
+
+    Lector.prototype.valor = function () {
+        var etiqueta = this.bytes[this.pos++], n, i, resultado, clave;
+        switch (etiqueta) {
+            case 0: return null;
+            case 1: return false;
+            case 2: return true;
+            case 3:
+                n = this.varint();
+                return n % 2 === 0 ? n / 2 : -(n + 1) / 2;
+            case 4:
+                this.pos += 8;
+                return this.vista.getFloat64(this.pos - 8, true);
+            case 5: return this.cadenas[this.varint()];
+            case 6:
+                n = this.varint();
+                resultado = new Array(n);
+                for (i = 0; i < n; i++) resultado[i] = this.valor();
+                return resultado;
+            case 7:
+                n = this.varint();
+                resultado = {};
+                for (i = 0; i < n; i++) {
+                    clave = this.cadenas[this.varint()];
+                    resultado[clave] = this.valor();
+                }
+                return resultado;
+            case 8: return this.coordenadas();
+            case 9: return this.tabla();
+            case 10:
+                this.pos += 4;
+                return this.vista.getInt32(this.pos - 4, true) / ESCALA;
+        }
+        throw new Error('RedBinaria: etiqueta desconocida ' + etiqueta + ' en ' + (this.pos - 1));
+    };
+
+    Lector.prototype.coordenadas = function () {
+        var n = this.varint(), dimensiones = this.varint();
+        var enteros = this.array(Int32Array, n * dimensiones);
+        var resultado = new Array(n), i, d, punto;
+        for (i = 0; i < n; i++) {
+            punto = new Array(dimensiones);
+            for (d = 0; d < dimensiones; d++) punto[d] = enteros[i * dimensiones + d] / ESCALA;
+            resultado[i] = punto;
+        }
+        return resultado;
+    };
+
+    Lector.prototype.columna = function (filas) {
+        var tipo = this.bytes[this.pos++], valores, resultado, i;
+        if (tipo === 0) {
+            resultado = new Array(filas);
+            for (i = 0; i < filas; i++) resultado[i] = this.valor();
+            return resultado;
+        }
+        if (tipo === 1) return this.array(Int32Array, filas);
+        if (tipo === 2) return this.array(Float64Array, filas);
+        if (tipo === 3) {
+            valores = this.array(Int32Array, filas);
+            resultado = new Array(filas);
+            for (i = 0; i < filas; i++) resultado[i] = valores[i] / ESCALA;
+            return resultado;
+        }
+        if (tipo === 4) {
+            valores = this.array(Uint32Array, filas);
+            resultado = new Array(filas);
+            for (i = 0; i < filas; i++) resultado[i] = valores[i] === SIN_CADENA ? null : this.cadenas[valores[i]];
+            return resultado;
+        }
+        if (tipo === 5) {
+            valores = this.array(Uint8Array, filas);
+            resultado = new Array(filas);
+            for (i = 0; i < filas; i++) resultado[i] = valores[i] === 2 ? null : valores[i] === 1;
+            return resultado;
+        }
+        throw new Error('RedBinaria: tipo de columna desconocido ' + tipo);
+    };
+
+    Lector.prototype.tabla = function () {
+        var filas = this.varint(), numColumnas = this.varint();
+        var claves = new Array(numColumnas), columnas = new Array(numColumnas);
+        var resultado = new Array(filas), i, c, fila;
+        for (c = 0; c < numColumnas; c++) {
+            claves[c] = this.cadenas[this.varint()];
+            columnas[c] = this.columna(filas);
+        }
+        for (i = 0; i < filas; i++) {
+            fila = {};
+            for (c = 0; c < numColumnas; c++) fila[claves[c]] = columnas[c][i];
+            resultado[i] = fila;
+        }
+        return resultado;
+    };
+
+    function decodificar(entrada) {
+        var buffer = entrada instanceof ArrayBuffer ? entrada
+            : entrada.buffer.slice(entrada.byteOffset, entrada.byteOffset + entrada.byteLength);
+        var lector = new Lector(buffer);
+        var texto = new TextDecoder('utf-8');
+        var n, i, longitud;
+
+        if (String.fromCharCode(lector.bytes[0], lector.bytes[1], lector.bytes[2], lector.bytes[3]) !== 'MRB1') {
+            throw new Error('RedBinaria: no es un archivo de red binaria');
+        }
+        lector.pos = 4;
+        n = lector.varint();
+        for (i = 0; i < n; i++) {
+            longitud = lector.varint();
+            lector.cadenas.push(texto.decode(lector.bytes.subarray(lector.pos, lector.pos + longitud)));
+            lector.pos += longitud;
+        }
+        lector.alinear(8);
+        return lector.valor();
+    }
+
+    function cargar(url) {
+        return fetch(url, { headers: { 'Accept': MIME + ', application/json;q=0.5' } })
+            .then(function (respuesta) {
+                if (!respuesta.ok) throw new Error('RedBinaria: HTTP ' + respuesta.status + ' en ' + url);
+                var tipo = respuesta.headers.get('Content-Type') || '';
+                if (tipo.indexOf(MIME) === 0) return respuesta.arrayBuffer().then(decodificar);
+                return respuesta.json();
+            });
+    }
+
+    global.RedBinaria = { MIME: MIME, decodificar: decodificar, cargar: cargar };
+})(typeof window !== 'undefined' ? window : this);